@@ -8,7 +8,7 @@ import sys
 import traceback
 from pathlib import Path
 
-# Add the parent directory to Python path so we can import main
+# Add the parent directory to Python path so we can import the providers
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 # Set environment for serverless
@@ -51,9 +51,9 @@ try:
     except Exception as e:
         logger.warning("Failed to load dotenv", error=str(e))
     
-    # Try to import main components
+    # Import only the cloud providers (no torch/transformers, no main.py app)
     try:
-        from main import OpenAIProvider, AnthropicProvider
+        from providers import OpenAIProvider, AnthropicProvider
         
         # Initialize only cloud providers for Vercel
         if os.getenv('OPENAI_API_KEY'):
@@ -77,7 +77,7 @@ try:
         logger.info("Providers initialized", available=list(providers_available.keys()))
         
     except Exception as e:
-        logger.error("Failed to import main providers", error=str(e), traceback=traceback.format_exc())
+        logger.error("Failed to import providers", error=str(e), traceback=traceback.format_exc())
     
     @app.get("/")
     async def health_check():
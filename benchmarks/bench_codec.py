@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Microbenchmark: per-request CPU of the standard vs fast-path chat codec.
+
+Run from the repository root:
+
+    python benchmarks/bench_codec.py [--iterations 2000]
+
+The standard path mirrors what FastAPI does for `/api/chat`: `json.loads`,
+`ChatRequest` validation, `ChatResponse.build` and response-model
+re-validation plus serialization. The fast path is `decode_chat_request` +
+`encode_chat_response` as used when `SPECTRA_FAST_CODEC=true`.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic import TypeAdapter  # noqa: E402
+
+from main import ChatRequest, ChatResponse, decode_chat_request, encode_chat_response  # noqa: E402
+
+REPLY = "I hear you, and I'm right here with you. " * 8
+REQUEST_ADAPTER = TypeAdapter(ChatRequest)
+RESPONSE_ADAPTER = TypeAdapter(ChatResponse)
+
+
+def make_body(history_len: int) -> bytes:
+    """Build a realistic /api/chat body with `history_len` prior messages."""
+    history = [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"Message {i}: " + "lorem ipsum " * 20}
+        for i in range(history_len - 1)
+    ]
+    return json.dumps({"message": "How do I write a chorus that lands?", "history": history}).encode()
+
+
+def standard_path(body: bytes) -> bytes:
+    request = REQUEST_ADAPTER.validate_python(json.loads(body), from_attributes=True)
+    response = ChatResponse.build(response=REPLY, model="openai:gpt-4o-mini", processing_time=0.5)
+    value = RESPONSE_ADAPTER.validate_python(response, from_attributes=True)
+    assert request.message
+    return RESPONSE_ADAPTER.dump_json(value)
+
+
+def fast_path(body: bytes) -> bytes:
+    request = decode_chat_request(body)
+    assert request.message
+    return encode_chat_response(response=REPLY, model="openai:gpt-4o-mini", processing_time=0.5)
+
+
+def measure(fn, body: bytes, iterations: int) -> float:
+    """Return CPU microseconds per call."""
+    for _ in range(min(iterations, 100)):
+        fn(body)
+    start = time.process_time()
+    for _ in range(iterations):
+        fn(body)
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    results = []
+    for history_len in (1, 10, 50):
+        body = make_body(history_len)
+        standard = measure(standard_path, body, args.iterations)
+        fast = measure(fast_path, body, args.iterations)
+        results.append({
+            "history": history_len,
+            "body_bytes": len(body),
+            "standard_us": round(standard, 2),
+            "fast_us": round(fast, 2),
+            "speedup": round(standard / fast, 2) if fast else None,
+        })
+
+    print(f"{'history':>8} {'bytes':>8} {'standard(us)':>13} {'fast(us)':>10} {'speedup':>8}")
+    for row in results:
+        print(f"{row['history']:>8} {row['body_bytes']:>8} {row['standard_us']:>13} {row['fast_us']:>10} {row['speedup']:>8}")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
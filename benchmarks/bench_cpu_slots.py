@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Benchmark: CPU slot layouts (slots x threads per slot) for concurrent local generation.
+
+Run from the repository root:
+
+    python benchmarks/bench_cpu_slots.py [--slots 1,2,4] [--threads 0] [--pin cores] [--concurrency 8]
+
+For each layout a CPUResourceManager (cpu_slots.py) partitions the host's
+cores and a BlockingExecutor runs one thread per slot, as the Hugging Face
+provider does with SPECTRA_CPU_SLOTS. `--concurrency` greedy generations on
+a randomly initialised GPT-2 are submitted at once; aggregate tokens/s and
+per-request latency pick the layout. `--threads 0` means an equal share of
+the cores per slot; layouts needing more cores than the host has are skipped.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch  # noqa: E402
+import transformers  # noqa: E402
+
+from cpu_slots import CPUResourceManager, available_cpus, numa_nodes  # noqa: E402
+from executors import BlockingExecutor  # noqa: E402
+
+
+def build_model(path: str, layers: int, hidden: int) -> None:
+    config = transformers.GPT2Config(vocab_size=8192, n_layer=layers, n_head=max(hidden // 64, 1),
+                                     n_embd=hidden, n_positions=1024, bos_token_id=0, eos_token_id=1)
+    transformers.GPT2LMHeadModel(config).save_pretrained(path)
+
+
+async def run_layout(model, slots: int, threads: int, pin: str, concurrency: int,
+                     prompt_tokens: int, new_tokens: int) -> dict:
+    manager = CPUResourceManager(slots, threads, pin=pin)
+    executor = BlockingExecutor("bench", manager.slot_count, manager.bind_thread)
+    input_ids = torch.randint(2, 8192, (1, prompt_tokens), generator=torch.Generator().manual_seed(0))
+    kwargs = {"attention_mask": torch.ones_like(input_ids), "max_new_tokens": new_tokens,
+              "min_new_tokens": new_tokens, "do_sample": False, "pad_token_id": 1}
+
+    def generate() -> float:
+        start = time.perf_counter()
+        with manager.busy():
+            with torch.no_grad():
+                model.generate(input_ids=input_ids, **kwargs)
+        return time.perf_counter() - start
+
+    await asyncio.gather(*(executor.run(generate) for _ in range(manager.slot_count)))  # warm-up, binds threads
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(executor.run(generate) for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    executor.shutdown()
+    utilization = [slot["busy_seconds"] for slot in manager.snapshot()["slots"]]
+    return {
+        "slots": manager.slot_count,
+        "threads": manager.threads_per_slot,
+        "pin": pin,
+        "tokens_per_s": round(concurrency * new_tokens / wall, 1),
+        "latency_p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "latency_max_ms": round(max(latencies) * 1000, 1),
+        "slot_busy_s": [round(busy, 2) for busy in utilization],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--slots", default="1,2,4", help="comma-separated slot counts")
+    parser.add_argument("--threads", default="0", help="comma-separated threads per slot (0: equal share)")
+    parser.add_argument("--pin", default="cores", choices=["off", "cores", "numa"])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--hidden", type=int, default=256)
+    parser.add_argument("--prompt-tokens", type=int, default=64)
+    parser.add_argument("--new-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    cpus = available_cpus()
+    print(f"{len(cpus)} cpus in {len(numa_nodes(cpus))} NUMA node(s)")
+    with tempfile.TemporaryDirectory() as tmp:
+        build_model(tmp, args.layers, args.hidden)
+        model = transformers.AutoModelForCausalLM.from_pretrained(tmp).eval()
+
+    rows = []
+    for slots in (int(s) for s in args.slots.split(",")):
+        for threads in (int(t) for t in args.threads.split(",")):
+            if slots * max(threads, 1) > len(cpus):
+                continue
+            rows.append(asyncio.run(run_layout(model, slots, threads, args.pin, args.concurrency,
+                                               args.prompt_tokens, args.new_tokens)))
+
+    best = max(rows, key=lambda row: row["tokens_per_s"]) if rows else None
+    print(f"{'slots':>5} {'threads':>7} {'tokens/s':>9} {'p50_ms':>9} {'max_ms':>9}  slot busy s")
+    for row in rows:
+        marker = "  <- best" if row is best else ""
+        print(f"{row['slots']:>5} {row['threads']:>7} {row['tokens_per_s']:>9} {row['latency_p50_ms']:>9} "
+              f"{row['latency_max_ms']:>9}  {row['slot_busy_s']}{marker}")
+    print(json.dumps({"config": vars(args), "cpus": len(cpus), "results": rows}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Benchmark: torch vs ONNX Runtime (fp32 / int8) generation on a tiny local model.
+
+Run from the repository root:
+
+    python benchmarks/bench_engines.py [--layers 4] [--hidden 256] [--new-tokens 64]
+
+A randomly initialised GPT-2 is saved to a temp directory and loaded through
+each engine in inference_engines.py (the ONNX export is timed separately).
+Generation is greedy with a fixed length so every engine does identical work.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch  # noqa: E402
+import transformers  # noqa: E402
+
+from inference_engines import ONNX_AVAILABLE, OnnxRuntimeEngine, TorchEngine  # noqa: E402
+
+
+def build_model(path: str, layers: int, hidden: int) -> None:
+    config = transformers.GPT2Config(vocab_size=8192, n_layer=layers, n_head=max(hidden // 64, 1),
+                                     n_embd=hidden, n_positions=1024, bos_token_id=0, eos_token_id=1)
+    transformers.GPT2LMHeadModel(config).save_pretrained(path)
+
+
+def run(engine, model_dir: str, prompt_tokens: int, new_tokens: int, repeats: int) -> dict:
+    start = time.perf_counter()
+    model = engine.load(model_dir, "cpu")
+    load_s = time.perf_counter() - start
+
+    input_ids = torch.randint(2, 8192, (1, prompt_tokens), generator=torch.Generator().manual_seed(0))
+    kwargs = {"attention_mask": torch.ones_like(input_ids), "max_new_tokens": new_tokens,
+              "min_new_tokens": new_tokens, "do_sample": False, "pad_token_id": 1}
+    model.generate(input_ids=input_ids, **kwargs)  # warm-up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.generate(input_ids=input_ids, **kwargs)
+        timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    return {
+        "engine": engine.name,
+        "load_s": round(load_s, 2),
+        "generate_ms": round(median * 1000, 1),
+        "tokens_per_s": round(new_tokens / median, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--hidden", type=int, default=256)
+    parser.add_argument("--prompt-tokens", type=int, default=128)
+    parser.add_argument("--new-tokens", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_dir = os.path.join(tmp, "model")
+        build_model(model_dir, args.layers, args.hidden)
+        engines = [TorchEngine()]
+        if ONNX_AVAILABLE:
+            cache = os.path.join(tmp, "onnx")
+            engines += [OnnxRuntimeEngine(cache, quantize=False), OnnxRuntimeEngine(cache, quantize=True)]
+        else:
+            print("onnxruntime/optimum not installed: torch only")
+        rows = [run(engine, model_dir, args.prompt_tokens, args.new_tokens, args.repeats) for engine in engines]
+
+    base = rows[0]["generate_ms"]
+    print(f"{'engine':<10} {'load_s':>7} {'generate_ms':>12} {'tokens/s':>9} {'speedup':>8}")
+    for row in rows:
+        row["speedup"] = round(base / row["generate_ms"], 2)
+        print(f"{row['engine']:<10} {row['load_s']:>7} {row['generate_ms']:>12} "
+              f"{row['tokens_per_s']:>9} {row['speedup']:>7}x")
+    print(json.dumps({"config": vars(args), "results": rows}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Benchmark: the Hugging Face provider's local generation path, stage by stage.
+
+Run from the repository root:
+
+    python benchmarks/bench_generation.py [--prompt-lengths 32,128,512] [--batch-sizes 1,4]
+    python benchmarks/bench_generation.py --update-baseline   # record this host's numbers
+    python benchmarks/bench_generation.py --threshold 0.2     # exit 1 on a >20% regression
+
+A tiny randomly initialised GPT-2 with a word-level tokenizer is saved to a
+temp directory (no downloads) and loaded through HuggingFaceProvider. For
+each prompt length and batch size it times, separately:
+ - format: `_format_chat_to_prompt` (compiled template render),
+ - tokenize: the tokenizer on the rendered prompt, and assemble: the
+   cached-segment token IDs actually used by `chat()`,
+ - prefill: one forward pass over the prompt (time to first token is
+   format + assemble + prefill),
+ - decode: greedy steps on the KV cache, as ms/token and batch tokens/s,
+ - peak RSS while the case runs.
+
+Results are compared with the JSON baseline (default
+benchmarks/baselines/generation.json, written by --update-baseline). Each
+host keeps its own baseline; a metric regresses when it is worse by more
+than --threshold and by more than its noise floor.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psutil  # noqa: E402
+import torch  # noqa: E402
+import transformers  # noqa: E402
+
+from hf_provider import HuggingFaceProvider  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "generation.json")
+VOCAB = 2048
+
+# metric -> (higher is better, absolute change ignored as noise)
+METRICS = {
+    "format_us": (False, 20.0),
+    "tokenize_us": (False, 20.0),
+    "assemble_us": (False, 20.0),
+    "prefill_ms": (False, 0.5),
+    "ttft_ms": (False, 0.5),
+    "decode_ms_per_token": (False, 0.1),
+    "tokens_per_s": (True, 0.0),
+    "peak_rss_mb": (False, 16.0),
+}
+
+
+def build_model(path: str, layers: int, hidden: int, positions: int) -> None:
+    from tokenizers import Tokenizer, models, pre_tokenizers
+
+    vocab = {"<eos>": 0, "<unk>": 1, **{f"w{i}": i + 2 for i in range(VOCAB - 2)}}
+    backend = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer = transformers.PreTrainedTokenizerFast(tokenizer_object=backend, eos_token="<eos>", unk_token="<unk>")
+    config = transformers.GPT2Config(vocab_size=VOCAB, n_layer=layers, n_head=max(hidden // 64, 1), n_embd=hidden,
+                                     n_positions=positions, bos_token_id=0, eos_token_id=0)
+    transformers.GPT2LMHeadModel(config).save_pretrained(path)
+    tokenizer.save_pretrained(path)
+
+
+def conversation(words: int) -> List[Dict[str, str]]:
+    """A system prompt plus alternating turns totalling about `words` words."""
+    messages = [{"role": "system", "content": " ".join(f"w{i % 500}" for i in range(16))}]
+    total = 16
+    while total < words:
+        n = min(32, words - total)
+        role = "user" if len(messages) % 2 else "assistant"
+        messages.append({"role": role, "content": " ".join(f"w{(total + i) % (VOCAB - 2)}" for i in range(n))})
+        total += n
+    if messages[-1]["role"] != "user":
+        messages.append({"role": "user", "content": "w7"})
+    return messages
+
+
+class PeakRSS:
+    """Samples the process RSS on a thread while the block runs."""
+
+    def __init__(self, interval: float = 0.002):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self) -> None:
+        process = psutil.Process()
+        while not self._stop.is_set():
+            self.peak = max(self.peak, process.memory_info().rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "PeakRSS":
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def _median_us(fn, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1e6
+
+
+def run_case(provider: HuggingFaceProvider, model_name: str, prompt_words: int, batch: int,
+             new_tokens: int, repeats: int) -> Dict[str, Any]:
+    model, tokenizer = provider.model_cache[model_name]
+    assembler = provider.prompt_assemblers[model_name]
+    messages = conversation(prompt_words)
+    prompt = provider._format_chat_to_prompt(messages, model_name)
+    input_ids = assembler.input_ids(messages)
+    batch_ids = torch.tensor([input_ids] * batch)
+
+    format_us = _median_us(lambda: provider._format_chat_to_prompt(messages, model_name), repeats * 10)
+    tokenize_us = _median_us(lambda: tokenizer(prompt)["input_ids"], repeats * 10)
+    assemble_us = _median_us(lambda: assembler.input_ids(messages), repeats * 10)
+
+    prefill, decode = [], []
+    with PeakRSS() as rss, torch.no_grad():
+        for _ in range(repeats + 1):  # the first run is a warm-up
+            start = time.perf_counter()
+            out = model(input_ids=batch_ids, use_cache=True)
+            prefill.append(time.perf_counter() - start)
+            past, token = out.past_key_values, out.logits[:, -1:].argmax(-1)
+            start = time.perf_counter()
+            for _ in range(new_tokens):
+                out = model(input_ids=token, past_key_values=past, use_cache=True)
+                past, token = out.past_key_values, out.logits[:, -1:].argmax(-1)
+            decode.append(time.perf_counter() - start)
+    prefill_ms = statistics.median(prefill[1:]) * 1000
+    decode_s = statistics.median(decode[1:])
+    return {
+        "prompt_tokens": len(input_ids),
+        "batch": batch,
+        "format_us": round(format_us, 1),
+        "tokenize_us": round(tokenize_us, 1),
+        "assemble_us": round(assemble_us, 1),
+        "prefill_ms": round(prefill_ms, 2),
+        "ttft_ms": round(prefill_ms + (format_us + assemble_us) / 1000, 2),
+        "decode_ms_per_token": round(decode_s / new_tokens * 1000, 3),
+        "tokens_per_s": round(batch * new_tokens / decode_s, 1),
+        "peak_rss_mb": round(rss.peak / 2**20, 1),
+    }
+
+
+def find_regressions(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """Metrics in `current` worse than `baseline` by more than threshold (relative) and the noise floor."""
+    regressions = []
+    for case, metrics in current.items():
+        base = baseline.get(case)
+        if base is None:
+            continue
+        for metric, (higher_is_better, floor) in METRICS.items():
+            old, new = base.get(metric), metrics.get(metric)
+            if not old or new is None:
+                continue
+            worse = old - new if higher_is_better else new - old
+            if worse > floor and worse / old > threshold:
+                regressions.append(f"{case} {metric}: {old} -> {new} ({worse / old:+.0%})")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prompt-lengths", default="32,128,512", help="comma-separated prompt lengths (words)")
+    parser.add_argument("--batch-sizes", default="1,4", help="comma-separated batch sizes")
+    parser.add_argument("--new-tokens", type=int, default=32)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--hidden", type=int, default=256)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="write these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative regression that fails the run")
+    args = parser.parse_args()
+
+    lengths = [int(n) for n in args.prompt_lengths.split(",")]
+    batches = [int(n) for n in args.batch_sizes.split(",")]
+    with tempfile.TemporaryDirectory() as model_dir:
+        build_model(model_dir, args.layers, args.hidden, max(lengths) * 2 + args.new_tokens + 64)
+        provider = HuggingFaceProvider()
+        start = time.perf_counter()
+        provider._load_model(model_dir)
+        load_s = time.perf_counter() - start
+        results = {f"p{words}_b{batch}": run_case(provider, model_dir, words, batch, args.new_tokens, args.repeats)
+                   for words in lengths for batch in batches}
+
+    print(f"load: {load_s:.2f}s")
+    print(f"{'case':<10} {'tokens':>6} {'format_us':>9} {'tok_us':>8} {'asm_us':>8} {'prefill_ms':>10} "
+          f"{'ttft_ms':>8} {'ms/token':>8} {'tokens/s':>9} {'rss_mb':>7}")
+    for case, row in results.items():
+        print(f"{case:<10} {row['prompt_tokens']:>6} {row['format_us']:>9} {row['tokenize_us']:>8} "
+              f"{row['assemble_us']:>8} {row['prefill_ms']:>10} {row['ttft_ms']:>8} "
+              f"{row['decode_ms_per_token']:>8} {row['tokens_per_s']:>9} {row['peak_rss_mb']:>7}")
+
+    host = {"cpus": os.cpu_count(), "machine": platform.machine(), "torch": torch.__version__}
+    report = {"config": vars(args), "host": host, "load_s": round(load_s, 2), "results": results}
+    print(json.dumps(report))
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline} (run with --update-baseline)")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("host") != host:
+        print(f"warning: baseline recorded on {baseline.get('host')}, this host is {host}")
+    regressions = find_regressions(baseline["results"], results, args.threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if regressions:
+        sys.exit(1)
+    print(f"no regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Benchmark: event-loop (calling thread) time spent logging per chat request.
+
+Run from the repository root:
+
+    python benchmarks/bench_logging.py [--requests 20000]
+
+Each simulated request logs what `/api/chat` logs on success:
+`chat_request` and `response_generated`. Output goes to /dev/null so the
+numbers reflect rendering + write cost on the caller, not terminal speed.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import structlog  # noqa: E402
+
+from structured_logging import configure_logging  # noqa: E402
+
+
+def simulate(requests: int) -> float:
+    """Return calling-thread microseconds per simulated request."""
+    log = structlog.get_logger("bench")
+    start = time.perf_counter()
+    for i in range(requests):
+        log.info("chat_request", preview="How do I write a chorus that lands?", history=10)
+        log.info("response_generated", provider="openai", model="gpt-4o-mini",
+                 processing_time=0.42, message_length=35, response_length=812)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def run(mode: str, sampling: str, requests: int, devnull) -> dict:
+    root = logging.getLogger()
+    root.handlers.clear()
+    if mode == 'sync':
+        # Sync mode writes through the stdlib handler installed on the root logger.
+        root.addHandler(logging.StreamHandler(devnull))
+        root.setLevel(logging.INFO)
+    pipeline = configure_logging(mode=mode, sampling=sampling, queue_size=100000, stream=devnull)
+    per_request = simulate(requests)
+    pipeline.stop()
+    return {"mode": mode, "sampling": sampling or "-", "us_per_request": round(per_request, 2), **{
+        k: v for k, v in pipeline.stats().items() if k in ("dropped", "sampled_out")
+    }}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    with open(os.devnull, "w") as devnull:
+        rows = [
+            run('sync', '', args.requests, devnull),
+            run('async', '', args.requests, devnull),
+            run('async', 'chat_request=0.01,response_generated=0.1', args.requests, devnull),
+        ]
+    baseline = rows[0]["us_per_request"]
+    for row in rows:
+        saved = baseline - row["us_per_request"]
+        print(f"{row['mode']:>6} sampling={row['sampling']:<45} {row['us_per_request']:>8} us/request "
+              f"(saved {saved:.2f} us) dropped={row.get('dropped', 0)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""Benchmark: /ws/chat under many concurrent connections and streams.
+
+Run from the repository root:
+
+    python benchmarks/bench_websocket.py [--connections 200] [--streams 4] [--rounds 3]
+    python benchmarks/bench_websocket.py --url ws://127.0.0.1:8000/ws/chat --message "Hi"
+
+By default the app is served in-process by uvicorn with generation replaced
+by a stub that streams `--tokens` deltas `--token-ms` apart, so the numbers
+are the transport's own cost (framing, multiplexing, the single writer per
+connection) rather than a model's. With `--url` a running server is loaded
+instead, e.g. `main.py --workers N`: each connection's hello frame names the
+worker that accepted it, so the report shows how connections spread across
+workers.
+
+Every connection sends `--streams` chat frames at once, `--rounds` times, and
+the report gives time to first delta, time to done, frames per stream and
+errors, as a table plus JSON.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import websockets  # noqa: E402
+
+
+def serve_stub(tokens: int, token_ms: float) -> str:
+    """Serve main.app on a free port with a streaming stub in place of generation."""
+    import uvicorn
+
+    import main
+
+    async def generate(message, history=None, *, cancel_token=None, user_id=None, on_delta=None):
+        start = time.perf_counter()
+        for i in range(tokens):
+            await asyncio.sleep(token_ms / 1000)
+            on_delta(f"w{i} ")
+        return {"response": " ".join(f"w{i}" for i in range(tokens)), "model": "stub:stream",
+                "processing_time": time.perf_counter() - start}
+
+    main.spectra.generate_response = generate
+    main.spectra.ready = True
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning",
+                                           lifespan="off"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"ws://127.0.0.1:{port}/ws/chat"
+
+
+async def run_connection(url: str, index: int, streams: int, rounds: int, message: str, results: dict) -> None:
+    try:
+        async with websockets.connect(url, max_size=None, open_timeout=30) as ws:
+            hello = json.loads(await ws.recv())
+            results["workers"][hello.get("worker_pid")] += 1
+            for round_ in range(rounds):
+                sent: dict = {}
+                for stream in range(streams):
+                    request_id = f"{index}-{round_}-{stream}"
+                    sent[request_id] = {"start": time.perf_counter(), "first": None, "frames": 0}
+                    await ws.send(json.dumps({"type": "chat", "id": request_id, "message": message}))
+                while sent:
+                    frame = json.loads(await ws.recv())
+                    stream = sent.get(frame.get("id"))
+                    if frame["type"] == "ping":
+                        await ws.send(json.dumps({"type": "pong"}))
+                    elif stream is None:
+                        continue
+                    elif frame["type"] == "delta":
+                        stream["frames"] += 1
+                        if stream["first"] is None:
+                            stream["first"] = time.perf_counter()
+                    else:
+                        del sent[frame["id"]]
+                        if frame["type"] != "done":
+                            results["errors"][str(frame.get("status", frame["type"]))] += 1
+                            continue
+                        now = time.perf_counter()
+                        results["ttft"].append((stream["first"] or now) - stream["start"])
+                        results["latency"].append(now - stream["start"])
+                        results["frames"].append(stream["frames"])
+    except (OSError, websockets.WebSocketException, asyncio.TimeoutError) as e:
+        results["errors"][type(e).__name__] += 1
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+async def run(args: argparse.Namespace, url: str) -> dict:
+    results = {"workers": collections.Counter(), "errors": collections.Counter(),
+               "ttft": [], "latency": [], "frames": []}
+    start = time.perf_counter()
+    await asyncio.gather(*(run_connection(url, i, args.streams, args.rounds, args.message, results)
+                           for i in range(args.connections)))
+    wall = time.perf_counter() - start
+    completed = len(results["latency"])
+    return {
+        "connections": args.connections,
+        "streams": completed,
+        "expected_streams": args.connections * args.streams * args.rounds,
+        "streams_per_s": round(completed / wall, 1),
+        "ttft_p50_ms": round(percentile(results["ttft"], 0.5) * 1000, 1),
+        "ttft_p99_ms": round(percentile(results["ttft"], 0.99) * 1000, 1),
+        "latency_p50_ms": round(percentile(results["latency"], 0.5) * 1000, 1),
+        "latency_p99_ms": round(percentile(results["latency"], 0.99) * 1000, 1),
+        "frames_per_stream": round(statistics.mean(results["frames"]), 1) if results["frames"] else 0,
+        "errors": dict(results["errors"]),
+        "connections_per_worker": {str(pid): n for pid, n in sorted(results["workers"].items(), key=str)},
+        "wall_s": round(wall, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=None, help="ws:// URL of a running server (default: serve the app here)")
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--streams", type=int, default=4, help="concurrent chat requests per connection")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--message", default="Hello!")
+    parser.add_argument("--tokens", type=int, default=32, help="stub server: deltas per response")
+    parser.add_argument("--token-ms", type=float, default=5.0, help="stub server: delay between deltas")
+    args = parser.parse_args()
+
+    url = args.url or serve_stub(args.tokens, args.token_ms)
+    result = asyncio.run(run(args, url))
+
+    print(f"{'conns':>6} {'streams':>8} {'streams/s':>10} {'ttft_p50':>9} {'ttft_p99':>9} "
+          f"{'p50_ms':>9} {'p99_ms':>9} {'frames':>7}  errors")
+    print(f"{result['connections']:>6} {result['streams']:>8} {result['streams_per_s']:>10} "
+          f"{result['ttft_p50_ms']:>9} {result['ttft_p99_ms']:>9} {result['latency_p50_ms']:>9} "
+          f"{result['latency_p99_ms']:>9} {result['frames_per_stream']:>7}  {result['errors'] or '-'}")
+    for pid, count in result["connections_per_worker"].items():
+        print(f"  worker {pid}: {count} connections")
+    print(json.dumps({"config": vars(args), "url": url, "result": result}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Per-request deadlines and cancellation for Spectra AI generations.
+
+Each chat request carries a CancellationToken. The endpoint cancels it when
+the client disconnects or the deadline passes; providers observe it:
+ - Hugging Face generation through a stopping criterion checked every step
+   (the worker thread can't be interrupted any other way).
+ - Cloud calls through asyncio task cancellation of the async SDK request.
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Reasons a token can be cancelled with.
+CLIENT_DISCONNECTED = "client_disconnected"
+CLIENT_CANCELLED = "client_cancelled"
+DEADLINE_EXCEEDED = "deadline_exceeded"
+
+
+class GenerationCancelled(Exception):
+    """Raised when a request's generation was cancelled."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"generation cancelled: {reason}")
+        self.reason = reason
+
+
+class CancellationToken:
+    """Thread-safe cancellation flag with an optional monotonic deadline."""
+
+    def __init__(self, deadline: Optional[float] = None, metrics: Optional["CancellationMetrics"] = None):
+        self.deadline = deadline
+        self.metrics = metrics
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._reported = False
+
+    @classmethod
+    def with_timeout(cls, seconds: Optional[float],
+                     metrics: Optional["CancellationMetrics"] = None) -> "CancellationToken":
+        return cls(time.monotonic() + seconds if seconds and seconds > 0 else None, metrics)
+
+    def cancel(self, reason: str) -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.expired():
+            self.cancel(DEADLINE_EXCEEDED)
+        return self._event.is_set()
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def remaining(self) -> Optional[float]:
+        """Seconds until the deadline (None when there is no deadline)."""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise GenerationCancelled(self.reason or "cancelled")
+
+    def report_saved(self, provider: str, tokens_saved: Optional[int] = None,
+                     compute_seconds_saved: float = 0.0) -> None:
+        """Record (once) the work avoided by this cancellation.
+
+        Without ``tokens_saved`` (a remote call whose progress isn't known) the
+        cancellation is counted but adds no savings sample.
+        """
+        if self._reported or self.metrics is None:
+            return
+        self._reported = True
+        self.metrics.record(self.reason or "cancelled", provider=provider, tokens_saved=tokens_saved,
+                            compute_seconds_saved=compute_seconds_saved)
+
+
+class JointCancellationToken(CancellationToken):
+    """Token for work shared by several requests: cancelled once every member is."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.members: List[CancellationToken] = []
+
+    def add(self, token: Optional[CancellationToken]) -> None:
+        # A request without a token never gives up, so the shared work never does either
+        token = token or CancellationToken()
+        self.members.append(token)
+        if self.metrics is None:
+            self.metrics = token.metrics
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.members and all(m.cancelled for m in self.members):
+            self.cancel(self.members[-1].reason or "cancelled")
+        return self._event.is_set()
+
+    def expired(self) -> bool:
+        return bool(self.members) and all(m.expired() for m in self.members)
+
+    def remaining(self) -> Optional[float]:
+        remaining = [m.remaining() for m in self.members]
+        if not remaining or None in remaining:
+            return None
+        return max(remaining)
+
+
+class CancellationMetrics:
+    """Counters for cancelled generations and the work they avoided.
+
+    Savings are averaged over the cancellations that measured them (local
+    generation); remote calls cancelled mid-flight are counted in
+    ``cancelled_remote`` only.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.cancelled: Dict[str, int] = {}
+        self.tokens_saved = 0
+        self.compute_seconds_saved = 0.0
+        self.savings_samples = 0
+        self.cancelled_remote = 0
+        self.cloud_calls_cancelled = 0
+
+    def record(self, reason: str, *, provider: str, tokens_saved: Optional[int] = None,
+               compute_seconds_saved: float = 0.0) -> None:
+        with self._lock:
+            self.cancelled[reason] = self.cancelled.get(reason, 0) + 1
+            if tokens_saved is None:
+                self.cancelled_remote += 1
+            else:
+                self.savings_samples += 1
+                self.tokens_saved += max(tokens_saved, 0)
+                self.compute_seconds_saved += max(compute_seconds_saved, 0.0)
+            if provider != "huggingface":
+                self.cloud_calls_cancelled += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = self.savings_samples
+            return {
+                "cancelled": dict(self.cancelled),
+                "tokens_saved": self.tokens_saved,
+                "compute_seconds_saved": round(self.compute_seconds_saved, 3),
+                "savings_samples": samples,
+                "avg_tokens_saved": round(self.tokens_saved / samples, 1) if samples else None,
+                "avg_compute_seconds_saved": round(self.compute_seconds_saved / samples, 3) if samples else None,
+                "cancelled_remote": self.cancelled_remote,
+                "cloud_calls_cancelled": self.cloud_calls_cancelled,
+            }
+
+
+def cancel_stopping_criteria(token: CancellationToken) -> Any:
+    """Build a transformers StoppingCriteria that halts decoding once `token` is cancelled.
+
+    Imported lazily so this module stays free of torch/transformers.
+    """
+    import torch
+    from transformers import StoppingCriteria
+
+    class _CancelCriteria(StoppingCriteria):
+        def __call__(self, input_ids: Any, scores: Any, **kwargs: Any) -> Any:
+            return torch.full((input_ids.shape[0],), token.cancelled, dtype=torch.bool, device=input_ids.device)
+
+    return _CancelCriteria()
+
+
+async def run_cancellable(
+    coro: Awaitable[T],
+    token: CancellationToken,
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    poll_interval: float = 0.5,
+) -> T:
+    """Await `coro`, cancelling it on client disconnect or when the deadline passes.
+
+    Raises GenerationCancelled with the reason; the token is cancelled first so
+    work running in threads (HF generation) stops at its next check.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            timeout = poll_interval
+            remaining = token.remaining()
+            if remaining is not None:
+                timeout = min(timeout, remaining)
+            done, _ = await asyncio.wait({task}, timeout=timeout)
+            if done:
+                return task.result()
+            if token.expired():
+                token.cancel(DEADLINE_EXCEEDED)
+            elif is_disconnected is not None and await is_disconnected():
+                token.cancel(CLIENT_DISCONNECTED)
+            if token.cancelled:
+                task.cancel()
+                raise GenerationCancelled(token.reason or "cancelled")
+    except asyncio.CancelledError:
+        # The request itself was cancelled (e.g. server shutdown): propagate to the work.
+        token.cancel(CLIENT_DISCONNECTED)
+        task.cancel()
+        raise
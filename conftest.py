@@ -1,6 +1,9 @@
 # Test configuration for Spectra AI
 import pytest
 import asyncio
+import socket
+import threading
+import time
 from fastapi.testclient import TestClient
 import sys
 import os
@@ -8,6 +11,9 @@ import os
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# Set before main is imported: the app's job queue must not persist (or recover) jobs in the working directory
+os.environ.setdefault('SPECTRA_JOBS_DB', ':memory:')
+
 @pytest.fixture(scope="session")
 def event_loop():
     """Create an instance of the default event loop for the test session."""
@@ -17,6 +23,133 @@ def event_loop():
 
 @pytest.fixture
 def client():
-    """Create a test client for the FastAPI app."""
+    """Create a test client for the FastAPI app (runs the startup lifespan)."""
     from main import app
-    return TestClient(app)
+    with TestClient(app) as test_client:
+        yield test_client
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture
+def free_port():
+    """An unused local TCP port."""
+    return _free_port()
+
+@pytest.fixture
+def serve_app():
+    """Serve ASGI apps on local ports (stand-ins for external HTTP services)."""
+    import uvicorn
+    servers = []
+
+    def serve(app) -> str:
+        port = _free_port()
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.01)
+        servers.append((server, thread))
+        return f"http://127.0.0.1:{port}"
+
+    yield serve
+    for server, thread in servers:
+        server.should_exit = True
+        thread.join()
+
+@pytest.fixture
+def streaming_cloud(serve_app):
+    """OpenAI and Anthropic providers streaming from local stand-ins.
+
+    Each stand-in streams the words of the last user message, one event per
+    word. With `hold` set, it stops after the first word until `release` is set.
+    """
+    import json
+    from types import SimpleNamespace
+
+    import anthropic
+    import openai
+    from fastapi import FastAPI, Request
+    from fastapi.responses import StreamingResponse
+
+    from providers import AnthropicProvider, OpenAIProvider
+
+    state = SimpleNamespace(hold=False, release=threading.Event(), requests=[])
+    app = FastAPI()
+
+    async def words(body):
+        state.requests.append(body)
+        for i, word in enumerate(body["messages"][-1]["content"].split()):
+            yield ("" if i == 0 else " ") + word
+            while state.hold and not state.release.is_set():
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.01)
+
+    def sse(events, named=False):
+        async def body():
+            async for event in events:
+                # Anthropic names each event after its type; OpenAI sends bare data lines
+                name = f"event: {event['type']}\n" if named else ""
+                yield f"{name}data: {json.dumps(event)}\n\n"
+        return StreamingResponse(body(), media_type="text/event-stream",
+                                 headers={"x-ratelimit-remaining-requests": "99"})
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        body = await request.json()
+
+        async def events():
+            chunk = {"id": "chatcmpl-1", "object": "chat.completion.chunk", "created": 0, "model": body["model"]}
+            async for text in words(body):
+                yield {**chunk, "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}]}
+            yield {**chunk, "choices": [],
+                   "usage": {"prompt_tokens": 12, "completion_tokens": 3, "total_tokens": 15}}
+        return sse(events())
+
+    @app.post("/v1/messages")
+    async def anthropic_messages(request: Request):
+        body = await request.json()
+
+        async def events():
+            yield {"type": "message_start", "message": {
+                "id": "msg_1", "type": "message", "role": "assistant", "model": body["model"], "content": [],
+                "stop_reason": None, "stop_sequence": None,
+                "usage": {"input_tokens": 10, "output_tokens": 1, "cache_read_input_tokens": 2}}}
+            yield {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}
+            async for text in words(body):
+                yield {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}}
+            yield {"type": "content_block_stop", "index": 0}
+            yield {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                   "usage": {"output_tokens": 3}}
+            yield {"type": "message_stop"}
+        return sse(events(), named=True)
+
+    base_url = serve_app(app)
+    openai_provider = OpenAIProvider()
+    openai_provider.available = True
+    openai_provider.client = openai.AsyncOpenAI(api_key="test", base_url=f"{base_url}/v1", max_retries=0)
+    anthropic_provider = AnthropicProvider()
+    anthropic_provider.available = True
+    anthropic_provider.client = anthropic.AsyncAnthropic(api_key="test", base_url=base_url, max_retries=0)
+    state.providers = {"openai": openai_provider, "anthropic": anthropic_provider}
+    yield state
+    state.release.set()
+
+@pytest.fixture
+def tiny_chat_model_dir(tmp_path):
+    """A tiny random GPT-2 with a word-level tokenizer, saved locally (no downloads)."""
+    transformers = pytest.importorskip("transformers")
+    from tokenizers import Tokenizer, models, pre_tokenizers
+
+    vocab = {"<eos>": 0, "<unk>": 1, **{f"w{i}": i + 2 for i in range(254)}}
+    backend = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer = transformers.PreTrainedTokenizerFast(tokenizer_object=backend, eos_token="<eos>", unk_token="<unk>")
+    model = transformers.GPT2LMHeadModel(transformers.GPT2Config(
+        vocab_size=256, n_layer=2, n_head=4, n_embd=256, n_positions=128, bos_token_id=0, eos_token_id=0))
+    path = tmp_path / "model"
+    model.save_pretrained(path)
+    tokenizer.save_pretrained(path)
+    return str(path)
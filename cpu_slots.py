@@ -0,0 +1,237 @@
+"""CPU partitioning for local inference.
+
+torch sizes its intra-op pool to every core by default, so two concurrent
+generations (or two prefork workers) each try to use all cores and spend
+their time contending for them. With SPECTRA_CPU_SLOTS set, the cores this
+process may use are split into that many inference slots:
+ - each slot gets SPECTRA_CPU_THREADS_PER_SLOT cores (default: the cores
+   divided by the slots), planned so a slot stays inside one NUMA node when
+   it fits;
+ - the Hugging Face executor runs one thread per slot, and each thread can
+   be pinned (SPECTRA_CPU_PIN) to its slot's cores, or to the NUMA nodes
+   those cores are in, so its allocations stay node-local (first touch).
+
+torch's intra-op thread count is process-wide, not per thread, so slots
+cannot each have their own pool size: it is set once, when the first slot
+is bound, to the per-slot share, and every concurrent generation uses that
+size. What keeps slots apart is pinning; without it they share the cores.
+
+Under the prefork server the cores are first divided between the workers
+(SPECTRA_WORKERS / SPECTRA_WORKER_INDEX). `benchmarks/bench_cpu_slots.py`
+sweeps layouts on the host to pick the numbers.
+"""
+import glob
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import structlog
+
+PIN_MODES = ("off", "cores", "numa")
+
+logger = structlog.get_logger()
+
+
+def parse_cpulist(text: str) -> List[int]:
+    """Parse a kernel cpulist (``0-3,8,10-11``)."""
+    cpus: List[int] = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def available_cpus() -> List[int]:
+    """CPUs this process may run on (its affinity mask)."""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # not Linux
+        return list(range(os.cpu_count() or 1))
+
+
+def numa_nodes(cpus: Optional[Sequence[int]] = None) -> List[List[int]]:
+    """Allowed CPUs grouped by NUMA node (a single group without NUMA info)."""
+    allowed = set(available_cpus() if cpus is None else cpus)
+    nodes = []
+    for path in sorted(glob.glob("/sys/devices/system/node/node*/cpulist"),
+                       key=lambda p: int(re.search(r"node(\d+)", p).group(1))):
+        with open(path) as f:
+            node = [cpu for cpu in parse_cpulist(f.read()) if cpu in allowed]
+        if node:
+            nodes.append(node)
+    grouped = {cpu for node in nodes for cpu in node}
+    rest = sorted(allowed - grouped)
+    return nodes + [rest] if rest else nodes
+
+
+def plan_slots(cpus: Sequence[int], slots: int, threads_per_slot: int = 0,
+               nodes: Optional[Sequence[Sequence[int]]] = None) -> List[List[int]]:
+    """Assign cores to `slots` slots, keeping each slot inside one NUMA node when it fits.
+
+    Slots are spread over the nodes (each takes from the node with the most
+    free cores that can hold it whole). Asking for more cores than exist
+    wraps around, so slots then share cores.
+    """
+    slots = max(slots, 1)
+    cpus = sorted(cpus)
+    threads = min(threads_per_slot or max(len(cpus) // slots, 1), len(cpus))
+    groups = [[cpu for cpu in node if cpu in cpus] for node in (nodes or [cpus])]
+    groups = [group for group in groups if group]
+    free = [list(group) for group in groups]
+    plan = []
+    for _ in range(slots):
+        if sum(map(len, free)) < threads:  # oversubscribed: start again from the first core
+            free = [list(group) for group in groups]
+        cores: List[int] = []
+        while len(cores) < threads:
+            need = threads - len(cores)
+            fitting = [group for group in free if len(group) >= need]
+            group = max(fitting or free, key=len)
+            cores += group[:need]
+            del group[:need]
+        plan.append(sorted(cores))
+    return plan
+
+
+class CPUSlot:
+    """One inference slot: its cores, the thread bound to it and its usage."""
+
+    def __init__(self, index: int, cpus: List[int], numa: List[int]):
+        self.index = index
+        self.cpus = cpus
+        self.numa = numa
+        self.thread: Optional[threading.Thread] = None
+        self.jobs = 0
+        self.busy_seconds = 0.0
+        self.busy_since: Optional[float] = None
+
+    def snapshot(self, elapsed: float) -> Dict[str, Any]:
+        busy = self.busy_seconds + (time.perf_counter() - self.busy_since if self.busy_since else 0.0)
+        return {
+            "cpus": self.cpus,
+            "numa_nodes": self.numa,
+            "bound": self.thread is not None and self.thread.is_alive(),
+            "active": self.busy_since is not None,
+            "jobs": self.jobs,
+            "busy_seconds": round(busy, 3),
+            "utilization": round(min(busy / elapsed, 1.0), 3),
+        }
+
+
+class CPUResourceManager:
+    """Partitions the process's cores into inference slots, one worker thread each."""
+
+    def __init__(self, slots: int, threads_per_slot: int = 0, pin: str = "off", interop_threads: int = 1,
+                 cpus: Optional[Sequence[int]] = None, nodes: Optional[Sequence[Sequence[int]]] = None):
+        if pin not in PIN_MODES:
+            raise ValueError(f"unknown pin mode {pin!r} (expected one of {', '.join(PIN_MODES)})")
+        self.cpus = sorted(available_cpus() if cpus is None else cpus)
+        self.nodes = [list(node) for node in (numa_nodes(self.cpus) if nodes is None else nodes)]
+        plan = plan_slots(self.cpus, slots, threads_per_slot, self.nodes)
+        self.threads_per_slot = len(plan[0])
+        self.pin = pin
+        self.interop_threads = interop_threads
+        self.slots = [CPUSlot(i, cores, self._nodes_of(cores)) for i, cores in enumerate(plan)]
+        self.oversubscribed = len(plan) * self.threads_per_slot > len(self.cpus)
+        self.created = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._torch_configured = False
+        if self.oversubscribed:
+            logger.warning("cpu_slots_oversubscribed", slots=len(plan), threads_per_slot=self.threads_per_slot,
+                           cpus=len(self.cpus))
+
+    @classmethod
+    def from_env(cls) -> Optional["CPUResourceManager"]:
+        """Manager configured from SPECTRA_CPU_*, or None to keep torch's defaults."""
+        slots = int(os.getenv('SPECTRA_CPU_SLOTS', '0'))
+        if slots <= 0:
+            return None
+        cpus = available_cpus()
+        nodes = numa_nodes(cpus)
+        workers = int(os.getenv('SPECTRA_WORKERS', '1'))
+        if workers > 1 and len(cpus) >= workers:
+            # This prefork worker's share of the host
+            index = int(os.getenv('SPECTRA_WORKER_INDEX', '0')) % workers
+            cpus = plan_slots(cpus, workers, 0, nodes)[index]
+            nodes = [[cpu for cpu in node if cpu in cpus] for node in nodes]
+        return cls(
+            slots,
+            threads_per_slot=int(os.getenv('SPECTRA_CPU_THREADS_PER_SLOT', '0')),
+            pin=os.getenv('SPECTRA_CPU_PIN', 'off').lower(),
+            interop_threads=int(os.getenv('SPECTRA_CPU_INTEROP_THREADS', '1')),
+            cpus=cpus,
+            nodes=[node for node in nodes if node],
+        )
+
+    @property
+    def slot_count(self) -> int:
+        return len(self.slots)
+
+    def _nodes_of(self, cores: List[int]) -> List[int]:
+        return [i for i, node in enumerate(self.nodes) if set(node) & set(cores)]
+
+    def _affinity(self, slot: CPUSlot) -> List[int]:
+        if self.pin == "numa":
+            return sorted(cpu for i in slot.numa for cpu in self.nodes[i])
+        return slot.cpus
+
+    def configure_torch(self) -> None:
+        """Size torch's thread pools to the per-slot share, once for the whole process."""
+        with self._lock:
+            if self._torch_configured:
+                return
+            import torch
+
+            torch.set_num_threads(self.threads_per_slot)
+            try:
+                torch.set_num_interop_threads(self.interop_threads)
+            except RuntimeError:  # inter-op pool already started: size is fixed
+                pass
+            self._torch_configured = True
+
+    def bind_thread(self) -> CPUSlot:
+        """Bind the calling thread to a free slot (executor thread initializer)."""
+        slot = getattr(self._local, "slot", None)
+        if slot is not None:
+            return slot
+        self.configure_torch()
+        with self._lock:
+            free = [s for s in self.slots if s.thread is None or not s.thread.is_alive()]
+            # More threads than slots: share the least used slot
+            slot = free[0] if free else min(self.slots, key=lambda s: s.jobs)
+            slot.thread = threading.current_thread()
+        if self.pin != "off" and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, self._affinity(slot))  # 0: the calling thread on Linux
+        self._local.slot = slot
+        logger.info("cpu_slot_bound", slot=slot.index, cpus=slot.cpus, pin=self.pin,
+                    threads=self.threads_per_slot)
+        return slot
+
+    @contextmanager
+    def busy(self) -> Iterator[CPUSlot]:
+        """Account the enclosed work to the calling thread's slot."""
+        slot = self.bind_thread()
+        slot.jobs += 1
+        slot.busy_since = time.perf_counter()
+        try:
+            yield slot
+        finally:
+            slot.busy_seconds += time.perf_counter() - slot.busy_since
+            slot.busy_since = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = max(time.perf_counter() - self.created, 1e-9)
+        return {
+            "cpus": len(self.cpus),
+            "numa_nodes": len(self.nodes),
+            "threads_per_slot": self.threads_per_slot,
+            "pin": self.pin,
+            "oversubscribed": self.oversubscribed,
+            "slots": [slot.snapshot(elapsed) for slot in self.slots],
+        }
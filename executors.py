@@ -0,0 +1,154 @@
+"""Dedicated thread pools for blocking work, one per provider (bulkheads).
+
+``asyncio.to_thread`` shares the loop's default executor, so a handful of
+30-second local generations could take every worker and queue unrelated
+blocking work (and cloud calls waiting on it) behind them. Each provider
+instead runs its blocking calls on its own bounded pool, sized with
+SPECTRA_EXECUTORS (``huggingface=2,memory=2``), and reports how saturated
+it is: active and queued jobs, queue-wait percentiles and utilization.
+
+Threads rather than processes: torch releases the GIL while it computes,
+and loaded models can't be shared with a process pool without copying them.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from latency_stats import RollingWindow
+
+T = TypeVar("T")
+
+# CPU-bound local generation gains little from more threads than this
+DEFAULT_WORKERS = {"huggingface": 2, "memory": 2, "profiler": 1, "jobs": 1, "debug": 1}
+FALLBACK_WORKERS = 4
+
+
+def parse_executor_sizes(spec: str) -> Dict[str, int]:
+    """Parse ``name=workers,name=workers`` (invalid entries are skipped)."""
+    sizes: Dict[str, int] = {}
+    for item in (spec or "").split(","):
+        name, sep, workers = item.rpartition("=")
+        if sep and name.strip() and workers.strip().isdigit() and int(workers) > 0:
+            sizes[name.strip().lower()] = int(workers)
+    return sizes
+
+
+class BlockingExecutor:
+    """Bounded thread pool for one provider, with saturation statistics."""
+
+    def __init__(self, name: str, max_workers: int, initializer: Optional[Callable[[], Any]] = None):
+        self.name = name
+        self.max_workers = max_workers
+        self.initializer = initializer
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.created = time.monotonic()
+        self.submitted = 0
+        self.completed = 0
+        self.saturated = 0
+        self.active = 0
+        self.queued = 0
+        self.busy_seconds = 0.0
+        self.queue_wait = RollingWindow(200)
+
+    def _executor(self) -> ThreadPoolExecutor:
+        # Created on first use, so forked workers (prefork.py) start their own threads
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix=f"spectra-{self.name}",
+                                                initializer=self.initializer)
+            return self._pool
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run `fn` on this pool (like asyncio.to_thread, context variables included)."""
+        submitted = time.perf_counter()
+        context = contextvars.copy_context()
+        with self._lock:
+            self.submitted += 1
+            if self.active + self.queued >= self.max_workers:
+                self.saturated += 1
+            self.queued += 1
+
+        def call() -> T:
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+                self.queue_wait.record(started - submitted)
+            try:
+                return context.run(fn, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+                    self.busy_seconds += time.perf_counter() - started
+
+        future = self._executor().submit(call)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if future.cancelled():  # never started: no longer queued
+                with self._lock:
+                    self.queued -= 1
+            raise
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = max(time.monotonic() - self.created, 1e-9)
+            return {
+                "workers": self.max_workers,
+                "active": self.active,
+                "queued": self.queued,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "saturated": self.saturated,
+                "utilization": round(min(self.busy_seconds / (elapsed * self.max_workers), 1.0), 3),
+                "queue_wait": self.queue_wait.snapshot(),
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+_lock = threading.Lock()
+_executors: Dict[str, BlockingExecutor] = {}
+
+
+def get_executor(name: str) -> BlockingExecutor:
+    """The shared executor for a provider (or other subsystem) name."""
+    with _lock:
+        executor = _executors.get(name)
+        if executor is None:
+            sizes = parse_executor_sizes(os.getenv('SPECTRA_EXECUTORS', ''))
+            workers = sizes.get(name, DEFAULT_WORKERS.get(name, FALLBACK_WORKERS))
+            executor = _executors[name] = BlockingExecutor(name, workers)
+        return executor
+
+
+def configure_executor(name: str, max_workers: int,
+                       initializer: Optional[Callable[[], Any]] = None) -> BlockingExecutor:
+    """Replace a name's executor, e.g. with one thread per CPU slot (see cpu_slots.py)."""
+    executor = BlockingExecutor(name, max_workers, initializer)
+    with _lock:
+        _executors[name] = executor
+    return executor
+
+
+def executor_stats() -> Dict[str, Any]:
+    with _lock:
+        executors = dict(_executors)
+    return {name: executor.snapshot() for name, executor in executors.items()}
+
+
+def shutdown_executors() -> None:
+    with _lock:
+        executors = list(_executors.values())
+    for executor in executors:
+        executor.shutdown()
@@ -0,0 +1,114 @@
+"""Early stopping for local (Hugging Face) generation.
+
+Sampling otherwise runs to ``max_new_tokens``: models run past the end of
+their turn and invent "User:" lines, or loop on the same phrase, and that
+text is decoded only to be thrown away. A RunawayGuard checks every new
+token and stops decoding at
+
+ - a stop sequence: the model family's end-of-turn and role markers
+   (CompiledTemplate.stop_sequences) plus HF_STOP_SEQUENCES, matched on the
+   decoded tail of the output, special tokens included;
+ - repetition: the same n-gram of HF_REPETITION_NGRAM tokens produced
+   HF_REPETITION_LIMIT times.
+
+GuardMetrics counts why generations stopped early and the decode steps
+(tokens) that saved, per request on average.
+"""
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+STOP_SEQUENCE = "stop_sequence"
+REPETITION = "repetition"
+
+
+class RunawayGuard:
+    """Per-generation state: fed one token per decode step, says when to stop."""
+
+    def __init__(self, tokenizer: Any, stop_sequences: Sequence[str] = (), ngram: int = 0, max_repeats: int = 3):
+        self.tokenizer = tokenizer
+        self.stop_sequences = [stop for stop in stop_sequences if stop]
+        self.ngram = ngram
+        self.max_repeats = max_repeats
+        self.tokens: List[int] = []
+        self.reason: Optional[str] = None
+        self._ngrams: Dict[Tuple[int, ...], int] = {}
+        # Every token decodes to at least one character, so this many trailing tokens cover any stop
+        self._window = max((len(stop) for stop in self.stop_sequences), default=0) + 1
+
+    def push(self, token: int) -> bool:
+        """Add the newest generated token; True once generation should stop."""
+        self.tokens.append(token)
+        if self.ngram and len(self.tokens) >= self.ngram:
+            gram = tuple(self.tokens[-self.ngram:])
+            count = self._ngrams[gram] = self._ngrams.get(gram, 0) + 1
+            if count >= self.max_repeats:
+                self.reason = REPETITION
+                return True
+        if self.stop_sequences:
+            tail = self.tokenizer.decode(self.tokens[-self._window:], skip_special_tokens=False)
+            if any(stop in tail for stop in self.stop_sequences):
+                self.reason = STOP_SEQUENCE
+                return True
+        return False
+
+    def trim(self, text: str) -> str:
+        """Cut generated text at the first stop sequence it contains."""
+        cut = min((index for index in (text.find(stop) for stop in self.stop_sequences) if index >= 0),
+                  default=len(text))
+        return text[:cut]
+
+
+def guard_stopping_criteria(guard: RunawayGuard) -> Any:
+    """Build a transformers StoppingCriteria feeding each new token to `guard` (batch size 1).
+
+    Imported lazily so this module stays free of torch/transformers.
+    """
+    import torch
+    from transformers import StoppingCriteria
+
+    class _GuardCriteria(StoppingCriteria):
+        def __call__(self, input_ids: Any, scores: Any, **kwargs: Any) -> Any:
+            stop = guard.reason is not None or guard.push(int(input_ids[0, -1]))
+            return torch.full((input_ids.shape[0],), stop, dtype=torch.bool, device=input_ids.device)
+
+    return _GuardCriteria()
+
+
+def held_back(text: str, stop_sequences: Sequence[str]) -> int:
+    """Length of the longest suffix of `text` that could be the start of a stop sequence.
+
+    Streaming withholds that much so a stop sequence is never sent in part.
+    """
+    longest = 0
+    for stop in stop_sequences:
+        for size in range(min(len(stop) - 1, len(text)), longest, -1):
+            if text.endswith(stop[:size]):
+                longest = size
+                break
+    return longest
+
+
+class GuardMetrics:
+    """Why local generations stopped early and the decode steps that saved."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.stopped: Dict[str, int] = {}
+        self.tokens_saved = 0
+
+    def record(self, reason: Optional[str], tokens_saved: int = 0) -> None:
+        with self._lock:
+            self.requests += 1
+            if reason is not None:
+                self.stopped[reason] = self.stopped.get(reason, 0) + 1
+                self.tokens_saved += max(tokens_saved, 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "stopped_early": dict(self.stopped),
+                "tokens_saved": self.tokens_saved,
+                "avg_tokens_saved_per_request": round(self.tokens_saved / self.requests, 1) if self.requests else 0.0,
+            }
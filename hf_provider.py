@@ -0,0 +1,352 @@
+"""Hugging Face (local model) provider for Spectra AI.
+
+torch and transformers are imported lazily, on the first model load, so
+importing this module (and main.py) stays cheap when local models are not
+actually used.
+"""
+import importlib.util
+import os
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional
+
+import structlog
+from fastapi import HTTPException
+
+import shared_weights
+from cancellation import CancellationToken, GenerationCancelled, cancel_stopping_criteria
+from cpu_slots import CPUResourceManager
+from executors import configure_executor
+from generation_guards import GuardMetrics, RunawayGuard, guard_stopping_criteria, held_back
+from inference_engines import InferenceEngine, create_engine, parse_model_engines
+from memory_tracker import model_memory
+from prompt_templates import CompiledTemplate, TokenAssembler, builtin_template
+from providers import AIProvider
+from singleflight import SingleFlight
+
+HUGGINGFACE_AVAILABLE = (
+    importlib.util.find_spec("torch") is not None
+    and importlib.util.find_spec("transformers") is not None
+)
+
+logger = structlog.get_logger()
+
+# Stripped from the start of local generations
+_ASSISTANT_PREFIX = "Assistant: "
+
+def _first_token_timer(tokenizer: Any = None, on_delta: Optional[Callable[[str], None]] = None,
+                       guard: Optional[RunawayGuard] = None) -> Any:
+    """transformers streamer that notes when the first new token is produced.
+    
+    With `on_delta`, newly generated text is also decoded and passed to it as
+    it is produced (from the generation thread). Text that may be the start
+    of one of the guard's stop sequences is held back until it isn't, and
+    nothing from a stop sequence on is sent. The deltas add up to the final
+    `content`: leading whitespace and an "Assistant: " prefix are dropped and
+    whitespace is sent only once more text follows it.
+    """
+    from transformers.generation.streamers import BaseStreamer
+    
+    stops = guard.stop_sequences if guard is not None else []
+    
+    class _FirstTokenTimer(BaseStreamer):
+        def __init__(self) -> None:
+            self.puts = 0
+            self.first_token_at: Optional[float] = None
+            self.tokens: List[int] = []
+            self.emitted = 0
+            self.stopped = False
+            self.started = False  # past the leading whitespace / "Assistant: " prefix
+            self.whitespace = ""  # held back until followed by more text
+        
+        def put(self, value: Any) -> None:
+            # The first put() is the prompt; the second is the first generated token
+            self.puts += 1
+            if self.puts == 2:
+                self.first_token_at = time.perf_counter()
+            if on_delta is None or self.puts == 1 or self.stopped:
+                return
+            self.tokens.extend(value.reshape(-1).tolist())
+            self._emit(final=False)
+        
+        def end(self) -> None:
+            # Generation is over: send what was held back in case it started a stop sequence or the prefix
+            if on_delta is not None and not self.stopped and self.tokens:
+                self._emit(final=True)
+        
+        def _emit(self, final: bool) -> None:
+            # Decode the tokens since the last line break (like transformers' TextStreamer)
+            text = tokenizer.decode(self.tokens, skip_special_tokens=True)
+            if text.endswith("\ufffd") and not final:  # incomplete multi-byte character
+                return
+            ready = len(guard.trim(text)) if guard is not None else len(text)
+            if ready < len(text):
+                self.stopped = final = True
+            elif not final:
+                ready -= held_back(text, stops)
+            if not self.started and not self._start(text[:ready], final):
+                if text.endswith("\n") and not text.strip():
+                    self.tokens = []
+                return
+            if ready > self.emitted:
+                chunk = text[self.emitted:ready]
+                visible = chunk.rstrip()
+                if visible:
+                    on_delta(self.whitespace + visible)
+                    self.whitespace = ""
+                self.whitespace += chunk[len(visible):]
+                self.emitted = ready
+            if self.emitted == len(text) and text.endswith("\n"):
+                self.tokens, self.emitted = [], 0
+        
+        def _start(self, text: str, final: bool) -> bool:
+            """Skip what the final content strips from the front; False while that isn't known yet."""
+            rest = text.lstrip()
+            if not rest or (not final and len(rest) < len(_ASSISTANT_PREFIX) and _ASSISTANT_PREFIX.startswith(rest)):
+                return False
+            skip = len(text) - len(rest)
+            if rest.startswith(_ASSISTANT_PREFIX):
+                skip += len(_ASSISTANT_PREFIX)
+            self.emitted, self.started = skip, True
+            return True
+    
+    return _FirstTokenTimer()
+
+class HuggingFaceProvider(AIProvider):
+    """Hugging Face models provider"""
+    
+    def __init__(self):
+        super().__init__("huggingface")
+        self._device: Optional[str] = None
+        self.default_model = os.getenv('HF_MODEL', 'mistralai/Mistral-7B-Instruct-v0.2')
+        self.available_models = os.getenv('HF_MODELS', 'mistralai/Mistral-7B-Instruct-v0.2,meta-llama/Llama-2-7b-chat-hf').split(',')
+        self.models = []
+        self.model_cache = {}  # Cache for loaded models and tokenizers
+        self.use_chat_template = os.getenv('HF_CHAT_TEMPLATE', 'true').lower() in ('1', 'true', 'yes', 'on')
+        self.segment_cache_size = int(os.getenv('HF_SEGMENT_CACHE_SIZE', '4096'))
+        self.prompt_assemblers: Dict[str, TokenAssembler] = {}
+        self._builtin_templates: Dict[str, CompiledTemplate] = {}
+        # Inference engine per model: torch (default), onnx or onnx-int8
+        self.default_engine = os.getenv('HF_ENGINE', 'torch').lower()
+        self.model_engines = parse_model_engines(os.getenv('HF_MODEL_ENGINES', ''))
+        self._engines: Dict[str, InferenceEngine] = {}
+        self.loaded_engines: Dict[str, str] = {}
+        # Concurrent requests for an unloaded model wait on one load instead of each loading a copy
+        self.model_loads = SingleFlight(cancel_abandoned=False)
+        # Stop decoding at end-of-turn/role markers and on repetition loops instead of at max_new_tokens
+        self.stop_guards = os.getenv('HF_STOP_GUARDS', 'true').lower() in ('1', 'true', 'yes', 'on')
+        self.extra_stop_sequences = [stop.replace('\\n', '\n') for stop in os.getenv('HF_STOP_SEQUENCES', '').split(',') if stop]
+        self.repetition_ngram = int(os.getenv('HF_REPETITION_NGRAM', '16'))
+        self.repetition_limit = int(os.getenv('HF_REPETITION_LIMIT', '3'))
+        self.guard_metrics = GuardMetrics()
+        # Optional core partitioning: one executor thread per CPU slot
+        self.cpu = CPUResourceManager.from_env()
+        if self.cpu is not None:
+            self.executor = configure_executor(self.name, self.cpu.slot_count, self.cpu.bind_thread)
+        self._check_availability()
+    
+    def _check_availability(self):
+        """Check if Hugging Face is available"""
+        try:
+            if HUGGINGFACE_AVAILABLE:
+                # Filter models that are actually available in the Hugging Face Hub
+                self.models = [model.strip() for model in self.available_models]
+                self.available = len(self.models) > 0
+                if self.available:
+                    logger.info(f"huggingface_models_found", count=len(self.models), models=self.models)
+            else:
+                self.available = False
+                logger.warning("huggingface_not_available", error="transformers or torch not installed")
+        except Exception as e:
+            logger.warning(f"huggingface_init_failed", error=str(e))
+            self.available = False
+            self.models = []
+    
+    def refresh_availability(self) -> None:
+        """Refresh Hugging Face availability"""
+        self._check_availability()
+    
+    @property
+    def device(self) -> str:
+        """Inference device, resolved on first use (importing torch)."""
+        if self._device is None:
+            import torch
+            self._device = "cuda" if torch.cuda.is_available() else "cpu"
+        return self._device
+    
+    def engine_for(self, model_name: str) -> InferenceEngine:
+        """Configured inference engine for a model (instances shared across models)."""
+        name = self.model_engines.get(model_name, self.default_engine)
+        engine = self._engines.get(name)
+        if engine is None:
+            engine = self._engines[name] = create_engine(name)
+        return engine
+    
+    def _load_model(self, model_name: str) -> Any:
+        """Load a model and tokenizer into the cache (blocking)."""
+        from transformers import AutoTokenizer
+        
+        preloaded = shared_weights.preloaded(model_name)
+        if preloaded is not None:
+            # Loaded by the prefork master: weights are shared copy-on-write pages
+            model_instance, tokenizer = preloaded
+            engine_name = "torch-mmap"
+        else:
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            engine = self.engine_for(model_name)
+            model_instance = engine.load(model_name, self.device)
+            engine_name = engine.name
+        self.model_cache[model_name] = (model_instance, tokenizer)
+        self.loaded_engines[model_name] = engine_name
+        self.prompt_assemblers[model_name] = TokenAssembler.for_model(
+            model_name, tokenizer, self.use_chat_template, self.segment_cache_size
+        )
+        return model_instance, tokenizer
+    
+    def _template(self, model: str) -> CompiledTemplate:
+        """Built-in compiled template for a model (cached per model name)."""
+        template = self._builtin_templates.get(model)
+        if template is None:
+            template = self._builtin_templates[model] = builtin_template(model)
+        return template
+
+    def _format_chat_to_prompt(self, messages: List[Dict[str, str]], model: str) -> str:
+        """Format chat messages into a prompt string based on the model architecture"""
+        assembler = self.prompt_assemblers.get(model)
+        if assembler is not None:
+            return assembler.render(messages)
+        return self._template(model).render(messages)
+
+    async def chat(self, messages: List[Dict[str, str]], model: str, **kwargs) -> Dict[str, Any]:
+        """Generate chat response using Hugging Face models"""
+        if not self.available:
+            raise HTTPException(status_code=500, detail="Hugging Face not available")
+        
+        cancel_token: Optional[CancellationToken] = kwargs.get('cancel_token')
+        start = time.perf_counter()
+        try:
+            model_name = model or self.default_model
+            
+            import torch
+            from transformers import StoppingCriteriaList
+            
+            # Check if model is already loaded in cache
+            if model_name not in self.model_cache:
+                (model_instance, tokenizer), _ = await self.model_loads.do(
+                    model_name, lambda _token: self.executor.run(self._load_model, model_name)
+                )
+            else:
+                model_instance, tokenizer = self.model_cache[model_name]
+            
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            
+            # Assemble prompt token IDs from cached pre-tokenized segments
+            input_ids = self.prompt_assemblers[model_name].input_ids(messages)
+            input_tensor = torch.tensor([input_ids], device=model_instance.device)
+            
+            guard = self._guard(model_name, tokenizer)
+            
+            # Generate response
+            generation_kwargs = {
+                "max_new_tokens": kwargs.get('max_tokens', 512),
+                "temperature": kwargs.get('temperature', 0.7),
+                "do_sample": True,
+                "top_p": 0.95,
+                "pad_token_id": tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id,
+                "streamer": _first_token_timer(tokenizer, kwargs.get('on_delta'), guard),
+            }
+            
+            stopping_criteria = StoppingCriteriaList()
+            if cancel_token is not None:
+                # Checked every decode step, so abandoned requests stop burning CPU
+                stopping_criteria.append(cancel_stopping_criteria(cancel_token))
+            if guard is not None:
+                stopping_criteria.append(guard_stopping_criteria(guard))
+            if stopping_criteria:
+                generation_kwargs["stopping_criteria"] = stopping_criteria
+            
+            # Run generation on this provider's executor to avoid blocking
+            output = await self.executor.run(
+                self._generate,
+                model_instance,
+                input_tensor,
+                generation_kwargs,
+                cancel_token
+            )
+            
+            completion_tokens = output.shape[-1] - len(input_ids)
+            if guard is not None and not (cancel_token is not None and cancel_token.cancelled):
+                tokens_saved = generation_kwargs["max_new_tokens"] - completion_tokens if guard.reason else 0
+                self.guard_metrics.record(guard.reason, tokens_saved)
+            
+            # Decode only the new tokens (not including the prompt)
+            assistant_response = tokenizer.decode(output[0][len(input_ids):], skip_special_tokens=True)
+            if guard is not None:
+                assistant_response = guard.trim(assistant_response)
+            assistant_response = assistant_response.strip()
+            
+            # Clean up response formatting
+            if assistant_response.startswith(_ASSISTANT_PREFIX):
+                assistant_response = assistant_response[len(_ASSISTANT_PREFIX):]
+            
+            first_token_at = generation_kwargs["streamer"].first_token_at
+            return {
+                "content": assistant_response,
+                "model": model_name,
+                "provider": "huggingface",
+                "total_tokens": len(input_ids) + completion_tokens,
+                # Counted with the model's own tokenizer
+                "usage": {"prompt_tokens": len(input_ids), "completion_tokens": completion_tokens, "source": "tokenizer"},
+                "ttft": first_token_at - start if first_token_at is not None else None
+            }
+        except GenerationCancelled:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Hugging Face error: {str(e)}")
+
+    def _guard(self, model_name: str, tokenizer: Any) -> Optional[RunawayGuard]:
+        """Early-stopping guard for one generation (None when HF_STOP_GUARDS is off)."""
+        if not self.stop_guards:
+            return None
+        stops = self.prompt_assemblers[model_name].template.stop_sequences() + self.extra_stop_sequences
+        return RunawayGuard(tokenizer, stops, self.repetition_ngram, self.repetition_limit)
+    
+    def _generate(self, model_instance: Any, input_tensor: Any, generation_kwargs: Dict[str, Any],
+                  cancel_token: Optional[CancellationToken]) -> Any:
+        """Run generate() (worker thread), reporting the decode work a cancellation saved."""
+        import torch
+        
+        start = time.perf_counter()
+        with self.cpu.busy() if self.cpu is not None else nullcontext():
+            output = model_instance.generate(
+                input_ids=input_tensor,
+                attention_mask=torch.ones_like(input_tensor),
+                **generation_kwargs
+            )
+        if cancel_token is not None and cancel_token.cancelled:
+            generated = output.shape[-1] - input_tensor.shape[-1]
+            tokens_saved = max(generation_kwargs["max_new_tokens"] - generated, 0)
+            seconds_per_token = (time.perf_counter() - start) / generated if generated else 0.0
+            cancel_token.report_saved("huggingface", tokens_saved, tokens_saved * seconds_per_token)
+        return output
+
+    def prompt_stats(self) -> Dict[str, Any]:
+        """Per-model prompt template and segment cache statistics."""
+        return {name: assembler.stats() for name, assembler in self.prompt_assemblers.items()}
+
+    def guard_stats(self) -> Dict[str, Any]:
+        """Generations stopped early by stop sequences or repetition, and the tokens saved."""
+        return self.guard_metrics.snapshot()
+
+    def cpu_stats(self) -> Dict[str, Any]:
+        """CPU slot layout and per-slot utilization (empty when SPECTRA_CPU_SLOTS is unset)."""
+        return self.cpu.snapshot() if self.cpu is not None else {}
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """Parameter and buffer bytes of each cached model."""
+        return {name: model_memory(model) for name, (model, _) in list(self.model_cache.items())}
+
+    def engine_stats(self) -> Dict[str, Any]:
+        """Configured default engine and the engine each loaded model runs on."""
+        return {"default": self.default_engine, "overrides": self.model_engines, "loaded": dict(self.loaded_engines)}
@@ -0,0 +1,193 @@
+"""Inference engines behind the Hugging Face provider.
+
+An engine turns a model name into a loaded model exposing transformers'
+``generate()`` (so stopping criteria, streamers and sampling work the same):
+ - ``torch``: eager PyTorch via AutoModelForCausalLM (the default).
+ - ``onnx``: ONNX Runtime via optimum, exported once with KV-cache inputs
+   and cached on disk keyed by model revision.
+ - ``onnx-int8``: the ONNX export with dynamic int8 weight quantization.
+
+The engine is chosen per model with HF_MODEL_ENGINES
+(``model=onnx,other/model=onnx-int8``), falling back to HF_ENGINE.
+torch, transformers and optimum are imported only when a model is loaded.
+"""
+import hashlib
+import importlib.util
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import structlog
+
+ONNX_AVAILABLE = (
+    importlib.util.find_spec("onnxruntime") is not None
+    and importlib.util.find_spec("optimum") is not None
+)
+
+ENGINE_NAMES = ("torch", "onnx", "onnx-int8")
+
+logger = structlog.get_logger()
+
+
+def parse_model_engines(spec: str) -> Dict[str, str]:
+    """Parse ``model=engine,model=engine`` into a table (unknown engines are skipped)."""
+    engines: Dict[str, str] = {}
+    for item in (spec or "").split(","):
+        model, sep, engine = item.rpartition("=")
+        if sep and model.strip() and engine.strip().lower() in ENGINE_NAMES:
+            engines[model.strip()] = engine.strip().lower()
+    return engines
+
+
+def model_revision(model_name: str) -> str:
+    """Revision the exported graph is keyed by.
+
+    Local directories hash their config and weight files (name, size, mtime);
+    hub models use the commit hash of the locally cached snapshot, or the
+    hub's current commit when nothing is cached yet.
+    """
+    path = Path(model_name)
+    if path.is_dir():
+        digest = hashlib.sha1()
+        for file in sorted(path.iterdir()):
+            if file.suffix in (".json", ".safetensors", ".bin"):
+                stat = file.stat()
+                digest.update(f"{file.name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return digest.hexdigest()[:16]
+
+    from huggingface_hub import constants
+    ref = Path(constants.HF_HUB_CACHE) / f"models--{model_name.replace('/', '--')}" / "refs" / "main"
+    if ref.is_file():
+        return ref.read_text().strip()
+    try:
+        from huggingface_hub import model_info
+        return model_info(model_name).sha or "unknown"
+    except Exception as e:  # noqa: BLE001 - offline: still cache, under a fixed key
+        logger.warning("model_revision_unavailable", model=model_name, error=str(e))
+        return "unknown"
+
+
+class InferenceEngine:
+    """Loads models for one backend."""
+
+    name = "base"
+
+    def load(self, model_name: str, device: str) -> Any:
+        """Return a model with transformers' generate() interface (blocking)."""
+        raise NotImplementedError
+
+
+class TorchEngine(InferenceEngine):
+    """Eager PyTorch models.
+
+    With HF_MMAP_WEIGHTS=true, CPU models are built directly on mmapped
+    safetensors (see shared_weights.py) so several workers share one copy.
+    """
+
+    name = "torch"
+
+    def __init__(self, mmap_weights: Optional[bool] = None):
+        if mmap_weights is None:
+            mmap_weights = os.getenv('HF_MMAP_WEIGHTS', 'false').lower() == 'true'
+        self.mmap_weights = mmap_weights
+
+    def load(self, model_name: str, device: str) -> Any:
+        import torch
+        from transformers import AutoModelForCausalLM
+
+        if self.mmap_weights and device == "cpu":
+            import shared_weights
+            try:
+                return shared_weights.load_mmap_model(model_name)
+            except ValueError as e:
+                logger.warning("mmap_load_fallback", model=model_name, error=str(e))
+
+        return AutoModelForCausalLM.from_pretrained(
+            model_name,
+            torch_dtype=torch.float16 if device == "cuda" else torch.float32,
+            low_cpu_mem_usage=True,
+            device_map="auto"
+        )
+
+
+class OnnxRuntimeEngine(InferenceEngine):
+    """ONNX Runtime models exported through optimum, cached on disk."""
+
+    def __init__(self, cache_dir: Optional[str] = None, quantize: bool = False):
+        self.cache_dir = Path(cache_dir or os.getenv(
+            'HF_ONNX_CACHE', os.path.join(Path.home(), '.cache', 'spectra', 'onnx')))
+        self.quantize = quantize
+        self.name = "onnx-int8" if quantize else "onnx"
+
+    def revision_dir(self, model_name: str) -> Path:
+        """Cache directory for a model revision: <cache>/<model>/<revision>/{fp32,int8}."""
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "--", model_name.strip("/"))
+        return self.cache_dir / safe_name / model_revision(model_name)
+
+    def load(self, model_name: str, device: str) -> Any:
+        from optimum.onnxruntime import ORTModelForCausalLM
+
+        revision_dir = self.revision_dir(model_name)
+        fp32_dir = revision_dir / "fp32"
+        if not (fp32_dir / "model.onnx").exists():
+            self._export(model_name, fp32_dir)
+        if not self.quantize:
+            return ORTModelForCausalLM.from_pretrained(fp32_dir, use_cache=True)
+
+        int8_dir = revision_dir / "int8"
+        if not (int8_dir / "model_quantized.onnx").exists():
+            self._quantize(fp32_dir, int8_dir)
+        return ORTModelForCausalLM.from_pretrained(int8_dir, file_name="model_quantized.onnx", use_cache=True)
+
+    def _export(self, model_name: str, target: Path) -> None:
+        """Export with KV-cache inputs/outputs; written to a temp dir and renamed into place."""
+        from optimum.onnxruntime import ORTModelForCausalLM
+
+        logger.info("onnx_export_started", model=model_name, target=str(target))
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(dir=target.parent, prefix=".export-"))
+        try:
+            ORTModelForCausalLM.from_pretrained(model_name, export=True, use_cache=True).save_pretrained(tmp)
+            self._publish(tmp, target)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        logger.info("onnx_export_finished", model=model_name)
+
+    def _quantize(self, source: Path, target: Path) -> None:
+        """Dynamic int8 quantization of the exported graph (no calibration data needed)."""
+        from optimum.onnxruntime import ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        tmp = Path(tempfile.mkdtemp(dir=target.parent, prefix=".quantize-"))
+        try:
+            quantizer = ORTQuantizer.from_pretrained(source, file_name="model.onnx")
+            quantizer.quantize(save_dir=tmp, quantization_config=AutoQuantizationConfig.avx2(is_static=False))
+            for file in source.iterdir():
+                if file.suffix == ".json" and not (tmp / file.name).exists():
+                    shutil.copy2(file, tmp / file.name)
+            self._publish(tmp, target)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    @staticmethod
+    def _publish(tmp: Path, target: Path) -> None:
+        try:
+            tmp.rename(target)
+        except OSError:
+            # Another worker published the same graph first
+            if not target.exists():
+                raise
+
+
+def create_engine(name: str) -> InferenceEngine:
+    """Engine instance for a configured name."""
+    if name == "torch":
+        return TorchEngine()
+    if name in ("onnx", "onnx-int8"):
+        if not ONNX_AVAILABLE:
+            raise RuntimeError("onnxruntime and optimum are required for the ONNX engine")
+        return OnnxRuntimeEngine(quantize=name == "onnx-int8")
+    raise ValueError(f"unknown inference engine: {name}")
@@ -0,0 +1,484 @@
+"""Asynchronous chat jobs (`/api/jobs`) for generations that outlive an HTTP request.
+
+A job is submitted and answered with its id at once; clients then poll
+``GET /api/jobs/{id}`` or subscribe to ``/api/jobs/{id}/events`` (server-sent
+events) for status, partial output and the final result.
+
+ - A bounded queue (SPECTRA_JOBS_QUEUE) feeds SPECTRA_JOB_WORKERS workers
+   that run jobs through the chat runner, each with its own deadline
+   (SPECTRA_JOB_TIMEOUT, longer than an HTTP request's) and cancellation
+   token. A full queue rejects new jobs instead of growing.
+ - Jobs are persisted to SQLite (SPECTRA_JOBS_DB). Workers claim a job
+   atomically before running it, so several server processes can share one
+   database file. Each job belongs to the process it was submitted to; the
+   queued jobs of a process that stopped or died, and the jobs it was
+   running, are queued again by the next process to start and, every
+   SPECTRA_JOB_RECOVER_INTERVAL seconds, by the live ones.
+ - A requeued job runs again from the start. Its partial output stays
+   readable until the new run begins, which resets it; subscribers get a
+   ``requeued`` status event and should discard the text received so far.
+ - Finished jobs are kept for SPECTRA_JOB_TTL seconds, then purged.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import structlog
+from fastapi import HTTPException
+
+from cancellation import (
+    CLIENT_CANCELLED,
+    CancellationMetrics,
+    CancellationToken,
+    GenerationCancelled,
+    run_cancellable,
+)
+from executors import get_executor
+from rate_limit import RateLimited
+
+logger = structlog.get_logger()
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL = (SUCCEEDED, FAILED, CANCELLED)
+
+# (request payload, cancel token, on_delta) -> the generate_response result
+JobRunner = Callable[[Dict[str, Any], CancellationToken, Callable[[str], None]], Awaitable[Dict[str, Any]]]
+
+
+class JobQueueFull(Exception):
+    """The job queue is at capacity."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("job queue is full")
+        self.retry_after = retry_after
+
+
+@dataclass
+class Job:
+    id: str
+    request: Dict[str, Any]
+    status: str = QUEUED
+    partial: str = ""
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[Dict[str, Any]] = None
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    expires: Optional[float] = None
+    owner: Optional[int] = None
+
+    def public(self) -> Dict[str, Any]:
+        """The job as returned by the API."""
+        def iso(ts: Optional[float]) -> Optional[str]:
+            return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts is not None else None
+
+        return {
+            "id": self.id,
+            "status": self.status,
+            "partial": self.partial,
+            "result": self.result,
+            "error": self.error,
+            "created_at": iso(self.created),
+            "started_at": iso(self.started),
+            "finished_at": iso(self.finished),
+            "expires_at": iso(self.expires),
+        }
+
+
+_COLUMNS = [name for name in Job.__dataclass_fields__]
+_JSON_COLUMNS = ("request", "result", "error")
+
+
+class JobStore:
+    """Jobs in a SQLite file (or in memory for an empty path)."""
+
+    def __init__(self, path: str):
+        self.path = path or ":memory:"
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0, isolation_level=None)
+        if self.path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, request TEXT, status TEXT, partial TEXT,"
+            " result TEXT, error TEXT, created REAL, started REAL, finished REAL, expires REAL, owner INTEGER)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+    @staticmethod
+    def _row(job: Job) -> List[Any]:
+        values = asdict(job)
+        return [json.dumps(values[c]) if c in _JSON_COLUMNS else values[c] for c in _COLUMNS]
+
+    @staticmethod
+    def _job(row: Any) -> Job:
+        values = dict(zip(_COLUMNS, row))
+        for column in _JSON_COLUMNS:
+            values[column] = json.loads(values[column]) if values[column] is not None else None
+        return Job(**values)
+
+    def save(self, job: Job) -> None:
+        placeholders = ", ".join("?" for _ in _COLUMNS)
+        with self._lock:
+            self._db.execute(f"INSERT OR REPLACE INTO jobs ({', '.join(_COLUMNS)}) VALUES ({placeholders})",
+                             self._row(job))
+
+    def save_partial(self, job_id: str, partial: str) -> bool:
+        """Store a running job's partial output; False (no write) once the job has finished."""
+        with self._lock:
+            cursor = self._db.execute("UPDATE jobs SET partial = ? WHERE id = ? AND status = ?",
+                                      (partial, job_id, RUNNING))
+        return cursor.rowcount == 1
+
+    def load(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._db.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row is not None else None
+
+    def claim(self, job_id: str, owner: int, started: float) -> bool:
+        """Mark a queued job running for `owner`, clearing the output of an earlier run.
+
+        False when another worker got it first (or it was cancelled).
+        """
+        with self._lock:
+            cursor = self._db.execute("UPDATE jobs SET status = ?, owner = ?, started = ?, partial = ''"
+                                      " WHERE id = ? AND status = ?", (RUNNING, owner, started, job_id, QUEUED))
+        return cursor.rowcount == 1
+
+    def cancel_queued(self, job_id: str, finished: float, expires: float) -> bool:
+        with self._lock:
+            cursor = self._db.execute("UPDATE jobs SET status = ?, finished = ?, expires = ? WHERE id = ? AND status = ?",
+                                      (CANCELLED, finished, expires, job_id, QUEUED))
+        return cursor.rowcount == 1
+
+    def recover(self, owner: int, limit: int, restarting: bool = False) -> List[Job]:
+        """Adopt for `owner` up to `limit` unfinished jobs whose process is gone, oldest first.
+
+        Running jobs among them are queued again. Jobs already owned by `owner`
+        count as abandoned only when `restarting` (the pid is from before a restart).
+        """
+        adopted: List[str] = []
+        with self._lock:
+            rows = self._db.execute("SELECT id, status, owner FROM jobs WHERE status IN (?, ?) ORDER BY created",
+                                    (QUEUED, RUNNING)).fetchall()
+            for job_id, status, job_owner in rows:
+                if len(adopted) >= limit:
+                    break
+                if (job_owner == owner and not restarting) or (job_owner != owner and _process_alive(job_owner)):
+                    continue
+                # Conditional on the owner read above: two processes never adopt the same job
+                cursor = self._db.execute("UPDATE jobs SET status = ?, owner = ?, started = NULL"
+                                          " WHERE id = ? AND status = ? AND owner IS ?",
+                                          (QUEUED, owner, job_id, status, job_owner))
+                if cursor.rowcount == 1:
+                    adopted.append(job_id)
+            jobs = [self._db.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                    for job_id in adopted]
+        return [self._job(row) for row in jobs]
+
+    def purge(self, now: float) -> int:
+        with self._lock:
+            return self._db.execute("DELETE FROM jobs WHERE expires IS NOT NULL AND expires < ?", (now,)).rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobManager:
+    """Bounded job queue, its workers, retention and persistence."""
+
+    def __init__(self, runner: JobRunner, db_path: str, *, workers: int = 2, max_queued: int = 100,
+                 timeout: Optional[float] = 600.0, ttl: float = 3600.0, flush_interval: float = 1.0,
+                 recover_interval: float = 30.0, cancellation_metrics: Optional[CancellationMetrics] = None):
+        self.runner = runner
+        self.db_path = db_path
+        self.store: Optional[JobStore] = None
+        self.workers = workers
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.recover_interval = recover_interval
+        self.cancellation_metrics = cancellation_metrics
+        self.executor = get_executor("jobs")
+        self.jobs: Dict[str, Job] = {}
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=max_queued)
+        self.running: Dict[str, tuple[asyncio.Task, CancellationToken]] = {}
+        # Per job: a change counter, and one event per round of waiters (replaced on every change)
+        self._versions: Dict[str, int] = {}
+        self._changed: Dict[str, asyncio.Event] = {}
+        self._flushed: Dict[str, float] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._flushes: set[asyncio.Task] = set()
+        self._stopping = False
+        self.pid = os.getpid()
+        self.submitted = 0
+        self.rejected = 0
+        self.recovered = 0
+        self.completed: Dict[str, int] = {}
+        self.durations: List[float] = []
+
+    @classmethod
+    def from_env(cls, runner: JobRunner, cancellation_metrics: Optional[CancellationMetrics] = None) -> "JobManager":
+        timeout = float(os.getenv('SPECTRA_JOB_TIMEOUT', '600'))
+        return cls(
+            runner,
+            os.getenv('SPECTRA_JOBS_DB', '.spectra_jobs.db'),
+            workers=int(os.getenv('SPECTRA_JOB_WORKERS', '2')),
+            max_queued=int(os.getenv('SPECTRA_JOBS_QUEUE', '100')),
+            timeout=timeout if timeout > 0 else None,
+            ttl=float(os.getenv('SPECTRA_JOB_TTL', '3600')),
+            recover_interval=float(os.getenv('SPECTRA_JOB_RECOVER_INTERVAL', '30')),
+            cancellation_metrics=cancellation_metrics,
+        )
+
+    async def start(self) -> None:
+        """Open the database, requeue persisted jobs and start the workers and the retention sweeper."""
+        self.store = await self.executor.run(JobStore, self.db_path)
+        self.jobs, self._versions, self._changed, self._flushed = {}, {}, {}, {}
+        self.queue = asyncio.Queue(maxsize=self.max_queued)
+        self._stopping = False
+        await self.recover(restarting=True)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def stop(self) -> None:
+        """Stop the workers; jobs they were running go back to the queue (output kept until they rerun)."""
+        self._stopping = True
+        for task, token in list(self.running.values()):
+            token.cancel(CLIENT_CANCELLED)
+            task.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._flushes, return_exceptions=True)
+        for job in self.jobs.values():
+            if job.status == RUNNING:
+                job.status, job.owner, job.started = QUEUED, None, None
+                await self.executor.run(self.store.save, job)
+        await self.executor.run(self.store.close)
+
+    async def submit(self, request: Dict[str, Any]) -> Job:
+        if self.queue.full():
+            self.rejected += 1
+            # A slot frees roughly when a running job finishes
+            average = sum(self.durations) / len(self.durations) if self.durations else 30.0
+            raise JobQueueFull(retry_after=average / max(self.workers, 1))
+        job = Job(id=uuid.uuid4().hex, request=request, owner=self.pid)
+        await self.executor.run(self.store.save, job)
+        self.jobs[job.id] = job
+        self.queue.put_nowait(job.id)
+        self.submitted += 1
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """A job run by this process, or one from the database (another worker's)."""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        return await self.executor.run(self.store.load, job_id)
+
+    def position(self, job: Job) -> Optional[int]:
+        """1-based place of a queued job in this process's queue."""
+        if job.status != QUEUED:
+            return None
+        return sum(1 for other in self.jobs.values() if other.status == QUEUED and other.created <= job.created)
+
+    async def cancel(self, job_id: str) -> Optional[Job]:
+        job = await self.get(job_id)
+        if job is None or job.status in TERMINAL:
+            return job
+        running = self.running.get(job_id)
+        if running is not None:
+            running[1].cancel(CLIENT_CANCELLED)
+            running[0].cancel()
+            return job
+        now = time.time()
+        if job.status == QUEUED and await self.executor.run(self.store.cancel_queued, job_id, now, now + self.ttl):
+            job.status, job.finished, job.expires = CANCELLED, now, now + self.ttl
+            self._notify(job_id)
+            return job
+        # Running on another worker process
+        raise HTTPException(status_code=409, detail="job is running on another worker")
+
+    def version(self, job_id: str) -> int:
+        """Change counter of a local job; read it before the job, then wait_for_change from it."""
+        return self._versions.get(job_id, 0)
+
+    async def wait_for_change(self, job_id: str, seen: int, timeout: float) -> None:
+        """Wait until a local job changes after version `seen` (or `timeout` passes).
+
+        Every waiter wakes on a change, and one that happened since `seen` returns at once.
+        """
+        if self.version(job_id) != seen:
+            return
+        event = self._changed.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _notify(self, job_id: str) -> None:
+        self._versions[job_id] = self._versions.get(job_id, 0) + 1
+        event = self._changed.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def _worker(self) -> None:
+        while not self._stopping:
+            job_id = await self.queue.get()
+            try:
+                job = self.jobs.get(job_id)
+                if job is None or job.status != QUEUED:
+                    continue
+                started = time.time()
+                if not await self.executor.run(self.store.claim, job_id, self.pid, started):
+                    # Cancelled, or claimed by another process sharing the database
+                    self.jobs.pop(job_id, None)
+                    continue
+                job.status, job.owner, job.started, job.partial = RUNNING, self.pid, started, ""
+                self._notify(job_id)
+                token = CancellationToken.with_timeout(self.timeout, self.cancellation_metrics)
+                task = asyncio.create_task(self._run(job, token))
+                self.running[job_id] = (task, token)
+                try:
+                    await task
+                finally:
+                    self.running.pop(job_id, None)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job: Job, token: CancellationToken) -> None:
+        loop = asyncio.get_running_loop()
+
+        def on_delta(text: str) -> None:  # called from generation threads too
+            loop.call_soon_threadsafe(self._append, job, text)
+
+        try:
+            result = await run_cancellable(self.runner(job.request, token, on_delta), token)
+            job.result = {
+                "response": result["response"],
+                "model": result["model"],
+                "processing_time": result["processing_time"],
+                "usage": result.get("usage"),
+            }
+            job.status = SUCCEEDED
+        except (GenerationCancelled, asyncio.CancelledError):
+            if self._stopping:
+                raise  # stop() puts the job back in the queue
+            job.status = CANCELLED
+            job.error = {"status": 504 if token.reason != CLIENT_CANCELLED else 499, "error": token.reason}
+        except RateLimited as e:
+            job.status = FAILED
+            job.error = {"status": 429, "error": str(e), "retry_after": round(e.retry_after, 2)}
+        except HTTPException as e:
+            job.status = FAILED
+            job.error = {"status": e.status_code, "error": e.detail}
+        except Exception as e:  # noqa: BLE001 - record the failure on the job
+            logger.error("job_failed", job_id=job.id, error=str(e))
+            job.status = FAILED
+            job.error = {"status": 500, "error": str(e)}
+        job.finished = time.time()
+        job.expires = job.finished + self.ttl
+        self.completed[job.status] = self.completed.get(job.status, 0) + 1
+        if job.started is not None:
+            self.durations = (self.durations + [job.finished - job.started])[-50:]
+        self._flushed.pop(job.id, None)
+        await self.executor.run(self.store.save, job)
+        self._notify(job.id)
+        logger.info("job_finished", job_id=job.id, status=job.status,
+                    seconds=round(job.finished - (job.started or job.created), 3))
+
+    def _append(self, job: Job, text: str) -> None:
+        if job.status != RUNNING:
+            return
+        job.partial += text
+        self._notify(job.id)
+        # Partial output reaches the database (and other workers' pollers) at most once per flush interval
+        now = time.monotonic()
+        if now - self._flushed.get(job.id, 0.0) >= self.flush_interval:
+            self._flushed[job.id] = now
+            # Conditional on the row still being RUNNING: a flush that runs after the final save (on
+            # another executor thread) must not bring a finished job back to life
+            task = asyncio.create_task(self.executor.run(self.store.save_partial, job.id, job.partial))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def recover(self, restarting: bool = False) -> int:
+        """Queue jobs left behind by stopped or dead processes, as many as the queue has room for.
+
+        The rest stay in the database for a later round.
+        """
+        room = self.max_queued - self.queue.qsize()
+        if room <= 0:
+            return 0
+        jobs = await self.executor.run(self.store.recover, self.pid, room, restarting)
+        for job in jobs:
+            self.jobs[job.id] = job
+            self.queue.put_nowait(job.id)
+        self.recovered += len(jobs)
+        if jobs:
+            logger.info("jobs_recovered", jobs=len(jobs))
+        return len(jobs)
+
+    async def _sweeper(self) -> None:
+        while True:
+            await asyncio.sleep(min(self.ttl, self.recover_interval, 60.0))
+            try:
+                await self.purge()
+            except Exception as e:  # noqa: BLE001 - keep the sweeper alive
+                logger.warning("job_purge_failed", error=str(e))
+            try:
+                await self.recover()
+            except Exception as e:  # noqa: BLE001 - keep the sweeper alive
+                logger.warning("job_recover_failed", error=str(e))
+
+    async def purge(self) -> int:
+        """Drop expired jobs from memory and the database."""
+        now = time.time()
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.expires is not None and job.expires < now]:
+            del self.jobs[job_id]
+            self._versions.pop(job_id, None)
+            self._changed.pop(job_id, None)
+        return await self.executor.run(self.store.purge, now)
+
+    def snapshot(self) -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        for job in self.jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "worker_pid": self.pid,
+            "workers": self.workers,
+            "queued": self.queue.qsize(),
+            "max_queued": self.max_queued,
+            "running": len(self.running),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "recovered": self.recovered,
+            "completed": dict(self.completed),
+            "retained": statuses,
+            "avg_job_seconds": round(sum(self.durations) / len(self.durations), 3) if self.durations else None,
+            "database": self.db_path or ":memory:",
+        }
@@ -0,0 +1,150 @@
+"""Rolling latency statistics for latency-aware auto-model selection.
+
+Each provider:model keeps fixed-size ring buffers of recent end-to-end
+latencies and times-to-first-token, plus EWMAs that react faster than the
+percentiles. Auto-model orders the candidates of an intent tier by latency
+EWMA, demotes those over the latency SLO, and occasionally explores a
+non-preferred candidate so a slow model that recovers is noticed.
+"""
+import random
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+Candidate = Tuple[str, str]
+
+
+def _key(candidate: Candidate) -> str:
+    return f"{candidate[0]}:{candidate[1]}"
+
+
+class RollingWindow:
+    """Fixed-size ring buffer of samples with an EWMA."""
+
+    def __init__(self, size: int = 100, alpha: float = 0.2):
+        self.size = max(size, 1)
+        self.alpha = alpha
+        self.samples: List[float] = [0.0] * self.size
+        self.count = 0
+        self.ewma: Optional[float] = None
+
+    def record(self, value: float) -> None:
+        self.samples[self.count % self.size] = value
+        self.count += 1
+        self.ewma = value if self.ewma is None else self.alpha * value + (1 - self.alpha) * self.ewma
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Nearest-rank percentile over the samples in the window."""
+        n = min(self.count, self.size)
+        if n == 0:
+            return None
+        ordered = sorted(self.samples[:n])
+        return ordered[min(int(p / 100 * n), n - 1)]
+
+    def snapshot(self) -> Dict[str, Any]:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 1) if value is not None else None
+        return {
+            "ewma_ms": ms(self.ewma),
+            "p50_ms": ms(self.percentile(50)),
+            "p95_ms": ms(self.percentile(95)),
+            "p99_ms": ms(self.percentile(99)),
+        }
+
+
+class LatencyTracker:
+    """Per provider:model latency/TTFT windows and the tier ordering built on them."""
+
+    def __init__(self, window: int = 100, alpha: float = 0.2, slo: Optional[float] = None,
+                 exploration_rate: float = 0.0, min_samples: int = 1,
+                 rng: Optional[Callable[[], float]] = None, failure_penalty: float = 2.0):
+        self.window = window
+        self.alpha = alpha
+        self.slo = slo
+        self.failure_penalty = failure_penalty
+        self.exploration_rate = exploration_rate
+        self.min_samples = min_samples
+        self._random = rng or random.random
+        self._lock = threading.Lock()
+        self.latency: Dict[str, RollingWindow] = {}
+        self.ttft: Dict[str, RollingWindow] = {}
+        self.explorations = 0
+        self.failures: Dict[str, int] = {}
+
+    def record(self, key: str, latency: float, ttft: Optional[float] = None) -> None:
+        """Record one successful call (ttft defaults to the latency for non-streamed calls)."""
+        with self._lock:
+            for windows, value in ((self.latency, latency), (self.ttft, latency if ttft is None else ttft)):
+                if key not in windows:
+                    windows[key] = RollingWindow(self.window, self.alpha)
+                windows[key].record(value)
+
+    def record_failure(self, key: str, elapsed: float, floor: Optional[float] = None) -> None:
+        """Record a timed-out or failed call as a penalty sample.
+
+        Without one, a model that never succeeds never gets a sample and keeps
+        sorting first in its tier. The penalty is `failure_penalty` times the
+        SLO, or `floor` (e.g. the request deadline) without one; never less
+        than the time the call took.
+        """
+        penalty = self.slo * self.failure_penalty if self.slo is not None else floor
+        self.record(key, max(elapsed, penalty or 0.0))
+        with self._lock:
+            self.failures[key] = self.failures.get(key, 0) + 1
+
+    def estimate(self, key: str) -> Optional[float]:
+        """Latency EWMA, or None until the model has enough samples."""
+        window = self.latency.get(key)
+        if window is None or window.count < self.min_samples:
+            return None
+        return window.ewma
+
+    def within_slo(self, key: str) -> bool:
+        estimate = self.estimate(key)
+        return self.slo is None or estimate is None or estimate <= self.slo
+
+    def order(self, tiers: Sequence[Sequence[Candidate]]) -> List[Candidate]:
+        """Flatten intent tiers into a candidate order.
+
+        Within a tier, candidates without data come first (in preference
+        order, so each gets measured) and the rest by latency EWMA. Candidates
+        over the SLO drop behind every healthy one. With probability
+        `exploration_rate` a random other candidate of the first tier is tried first.
+        """
+        def rank(candidate: Candidate) -> Tuple[bool, float]:
+            estimate = self.estimate(_key(candidate))
+            return estimate is not None, estimate or 0.0
+
+        healthy: List[Candidate] = []
+        slow: List[Candidate] = []
+        for tier in tiers:
+            for candidate in sorted(tier, key=rank):
+                (healthy if self.within_slo(_key(candidate)) else slow).append(candidate)
+        ordered = healthy + sorted(slow, key=rank)
+
+        others = [c for c in tiers[0] if c != ordered[0]] if tiers and ordered else []
+        if others and self.exploration_rate > 0 and self._random() < self.exploration_rate:
+            explored = others[min(int(self._random() * len(others)), len(others) - 1)]
+            ordered.remove(explored)
+            ordered.insert(0, explored)
+            with self._lock:
+                self.explorations += 1
+        return ordered
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            keys = sorted(self.latency)
+            return {
+                "slo_ms": round(self.slo * 1000, 1) if self.slo is not None else None,
+                "exploration_rate": self.exploration_rate,
+                "explorations": self.explorations,
+                "models": {
+                    key: {
+                        "count": self.latency[key].count,
+                        "failures": self.failures.get(key, 0),
+                        "within_slo": self.within_slo(key),
+                        "latency": self.latency[key].snapshot(),
+                        "ttft": self.ttft[key].snapshot(),
+                    }
+                    for key in keys
+                },
+            }
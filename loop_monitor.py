@@ -0,0 +1,179 @@
+"""Event-loop lag monitor and blocking-call detector.
+
+A heartbeat coroutine sleeps for a fixed interval and records how late it
+wakes up: that lateness is the time the loop spent running something else
+without yielding. A watchdog thread watches the heartbeat; when it is
+overdue by more than the budget, the loop is stuck inside one callback, so
+the watchdog captures the loop thread's stack at that moment (the blocking
+code itself) and the endpoint of the task being run, which
+`EndpointTagMiddleware` records per request task.
+
+Lag percentiles and the most recent stalls are exported in `/api/metrics`
+under ``event_loop``. With SPECTRA_LOOP_LAG_WARN, each stall is also logged.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+import structlog
+
+from latency_stats import RollingWindow
+
+logger = structlog.get_logger()
+
+MAX_STACK_FRAMES = 30
+
+
+class LoopMonitor:
+    """Heartbeat-based loop lag measurement with stack capture for stalls."""
+
+    def __init__(self, interval: float = 0.05, budget: float = 0.1, warn: bool = True,
+                 window: int = 1000, max_stalls: int = 50):
+        self.interval = interval
+        self.budget = budget
+        self.warn = warn
+        self.lag = RollingWindow(window)
+        self.max_lag = 0.0
+        self.stall_count = 0
+        self.stalled_seconds = 0.0
+        self.stalls: Deque[Dict[str, Any]] = deque(maxlen=max_stalls)
+        self._routes: Dict[asyncio.Task, str] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._expected: Optional[float] = None
+        self._captured: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls) -> Optional["LoopMonitor"]:
+        if os.getenv('SPECTRA_LOOP_MONITOR', 'true').lower() not in ('1', 'true', 'yes', 'on'):
+            return None
+        return cls(
+            interval=float(os.getenv('SPECTRA_LOOP_MONITOR_INTERVAL_MS', '50')) / 1000,
+            budget=float(os.getenv('SPECTRA_LOOP_LAG_BUDGET_MS', '100')) / 1000,
+            warn=os.getenv('SPECTRA_LOOP_LAG_WARN', 'true').lower() in ('1', 'true', 'yes', 'on'),
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def tag(self, task: Optional[asyncio.Task], route: str) -> None:
+        if task is not None:
+            self._routes[task] = route
+
+    def untag(self, task: Optional[asyncio.Task]) -> None:
+        self._routes.pop(task, None)
+
+    def start(self) -> None:
+        """Start the heartbeat on the running loop and the watchdog thread."""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stop.clear()
+        self._task = self._loop.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="spectra-loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            self._expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(time.perf_counter() - self._expected, 0.0)
+            captured, self._captured = self._captured, None
+            self.lag.record(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.budget:
+                self._record_stall(lag, captured)
+
+    def _watch(self) -> None:
+        """Watchdog thread: capture what the loop is running when the heartbeat is overdue."""
+        poll = min(self.interval, self.budget) / 2
+        captured_for = None
+        while not self._stop.wait(poll):
+            expected = self._expected
+            if expected is None or captured_for == expected:
+                continue
+            if time.perf_counter() - expected > self.budget:
+                captured_for = expected
+                self._captured = self._capture()
+
+    def _capture(self) -> Dict[str, Any]:
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = traceback.format_list(traceback.extract_stack(frame, limit=MAX_STACK_FRAMES)) if frame else []
+        task = asyncio.current_task(self._loop) if self._loop is not None else None
+        return {
+            "endpoint": self._routes.get(task) if task is not None else None,
+            "task": task.get_name() if task is not None else None,
+            "stack": [line.rstrip() for line in stack],
+        }
+
+    def _record_stall(self, lag: float, captured: Optional[Dict[str, Any]]) -> None:
+        self.stall_count += 1
+        self.stalled_seconds += lag
+        stall = {
+            "lag_ms": round(lag * 1000, 1),
+            "at": datetime.now(timezone.utc).isoformat(),
+            "endpoint": None,
+            "task": None,
+            "stack": [],
+            **(captured or {}),
+        }
+        self.stalls.append(stall)
+        if self.warn:
+            logger.warning("event_loop_blocked", lag_ms=stall["lag_ms"], budget_ms=round(self.budget * 1000),
+                           endpoint=stall["endpoint"], task=stall["task"], stack=stall["stack"][-3:])
+
+    def snapshot(self, recent: int = 10) -> Dict[str, Any]:
+        stalls: List[Dict[str, Any]] = list(self.stalls)[-recent:] if recent else []
+        return {
+            "running": self.running,
+            "interval_ms": round(self.interval * 1000),
+            "budget_ms": round(self.budget * 1000),
+            "lag": self.lag.snapshot(),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls": self.stall_count,
+            "stalled_seconds": round(self.stalled_seconds, 3),
+            "recent_stalls": stalls,
+        }
+
+
+class EndpointTagMiddleware:
+    """ASGI middleware recording which endpoint each request task serves (for stall reports)."""
+
+    def __init__(self, app: Any, monitor: Optional[LoopMonitor]):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if self.monitor is None or scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        task = asyncio.current_task()
+        self.monitor.tag(task, f"{scope.get('method', 'WS')} {scope['path']}")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.monitor.untag(task)
@@ -6,13 +6,23 @@ Key protocol (enforced in code):
  - Personality prompt hot-reloads on file change.
  - All runtime state is ephemeral and recomputed when needed.
 """
+import time
+
+# Origin for the startup timing report (see startup.py)
+_IMPORT_START = time.perf_counter()
+
 import asyncio
+import atexit
+import email.message
 import hashlib
+import hmac
+import json
+import math
 import os
-import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone  # updated to include timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional, TYPE_CHECKING
+from typing import Any, Callable, Dict, List, Optional, TYPE_CHECKING
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
@@ -20,55 +30,63 @@ load_dotenv()
 
 import structlog
 import uvicorn
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, Field
-
-# Conditional imports for AI providers
-try:
-    import openai
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 
-try:
-    import anthropic
-    ANTHROPIC_AVAILABLE = True
-except ImportError:
-    ANTHROPIC_AVAILABLE = False
+import shared_weights
+from cancellation import (
+    DEADLINE_EXCEEDED,
+    CancellationMetrics,
+    CancellationToken,
+    GenerationCancelled,
+    run_cancellable,
+)
+from executors import executor_stats, get_executor, shutdown_executors
+from hf_provider import HuggingFaceProvider
+from jobs import TERMINAL, Job, JobManager, JobQueueFull
+from latency_stats import LatencyTracker
+from loop_monitor import EndpointTagMiddleware, LoopMonitor
+from memory_tracker import MemoryTracker
+from profiler import ProfileBusy, SamplingProfiler
+from prompt_templates import estimate_tokens, minify_markdown
+from providers import (
+    AIProvider,
+    AnthropicProvider,
+    LocalOpenAIProvider,
+    OpenAIProvider,
+)
+from rate_limit import ProviderRateLimited, RateLimited, RateLimitRegistry, parse_rate_limit_headers
+from singleflight import SingleFlight
+from startup import StartupReport
+from summarizer import ConversationSummarizer
+from token_usage import UsageTracker
+from structured_logging import configure_logging
+from ws_chat import ChatSession, ChatSocketStats
 
 try:
-    import torch
-    from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
-    HUGGINGFACE_AVAILABLE = True
+    import orjson
+    ORJSON_AVAILABLE = True
 except ImportError:
-    HUGGINGFACE_AVAILABLE = False
+    ORJSON_AVAILABLE = False
 
 if TYPE_CHECKING:
     from typing import Any as _Any
     structlog: _Any
+    from memory_store import ConversationMemory
 
 # Configure structured logging
 LOG_FORMAT = os.getenv('SPECTRA_LOG_FORMAT', 'json')
-structlog.configure(
-    processors=[
-        structlog.stdlib.filter_by_level,
-        structlog.stdlib.add_logger_name,
-        structlog.stdlib.add_log_level,
-        structlog.stdlib.PositionalArgumentsFormatter(),
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.StackInfoRenderer(),
-        structlog.processors.format_exc_info,
-        structlog.processors.UnicodeDecoder(),
-        structlog.processors.JSONRenderer() if LOG_FORMAT == 'json' 
-        else structlog.dev.ConsoleRenderer()
-    ],
-    context_class=dict,
-    logger_factory=structlog.stdlib.LoggerFactory(),
-    wrapper_class=structlog.stdlib.BoundLogger,
-    cache_logger_on_first_use=True,
+log_pipeline = configure_logging(
+    log_format=LOG_FORMAT,
+    mode=os.getenv('SPECTRA_LOG_MODE', 'sync').lower(),
+    sampling=os.getenv('SPECTRA_LOG_SAMPLING', ''),
+    queue_size=int(os.getenv('SPECTRA_LOG_QUEUE_SIZE', '10000')),
+    level=os.getenv('LOG_LEVEL', 'INFO'),
 )
+atexit.register(log_pipeline.stop)
 
 logger = structlog.get_logger()
 
@@ -82,6 +100,17 @@ class ChatRequest(BaseModel):
     message: str = Field(..., min_length=1, max_length=8192)
     # max_items deprecated in Pydantic v2; use max_length instead
     history: Optional[List[ChatMessage]] = Field(default_factory=list, max_length=50)
+    # Signed user id (memory_store.sign_user_id) from an authenticated session: the long-term
+    # memory namespace (SPECTRA_MEMORY). Without a valid signature memory is not used at all.
+    user_id: Optional[str] = Field(default=None, max_length=256)
+
+class TokenUsage(BaseModel):
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    tokens_per_second: Optional[float] = None
+    cached_tokens: Optional[int] = None  # prompt tokens read from the provider's prompt cache
+    source: str  # provider (API usage block), tokenizer (local model) or estimate
 
 class ChatResponse(BaseModel):
     response: str
@@ -89,9 +118,11 @@ class ChatResponse(BaseModel):
     model_used: str  # backward compatible duplicate of 'model'
     timestamp: str
     processing_time: float
+    usage: Optional[TokenUsage] = None
 
     @classmethod
-    def build(cls, *, response: str, model: str, processing_time: float) -> "ChatResponse":
+    def build(cls, *, response: str, model: str, processing_time: float,
+              usage: Optional[Dict[str, Any]] = None) -> "ChatResponse":
         """Factory ensuring UTC timestamp and model_used duplication."""
         return cls(
             response=response,
@@ -99,6 +130,7 @@ class ChatResponse(BaseModel):
             model_used=model,
             timestamp=datetime.now(timezone.utc).isoformat(),
             processing_time=processing_time,
+            usage=usage,
         )
 
 class StatusResponse(BaseModel):
@@ -131,290 +163,262 @@ class ModelSelectResponse(BaseModel):
 class ToggleAutoModelRequest(BaseModel):
     enabled: Optional[bool] = None
 
-class AIProvider:
-    """Abstract base for AI providers"""
-    
-    def __init__(self, name: str):
-        self.name = name
-        self.available = False
-        self.models: List[str] = []
-    
-    async def chat(self, messages: List[Dict[str, str]], model: str, **kwargs) -> Dict[str, Any]:
-        """Generate chat response"""
-        raise NotImplementedError
-    
-    def get_models(self) -> List[str]:
-        """Get available models"""
-        return self.models
-    
-    def is_available(self) -> bool:
-        """Check if provider is available"""
-        return self.available
-    
-    def refresh_availability(self) -> None:
-        """Refresh provider availability - override in subclasses"""
-        pass
+# Fast-path codec: decode/validate the chat body in one pass and encode responses
+# without FastAPI's re-validation. Validation rules and 422 shapes are unchanged.
+FAST_CODEC_ENABLED = os.getenv('SPECTRA_FAST_CODEC', 'false').lower() in ('1', 'true', 'yes', 'on')
 
-class HuggingFaceProvider(AIProvider):
-    """Hugging Face models provider"""
-    
-    def __init__(self):
-        super().__init__("huggingface")
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.default_model = os.getenv('HF_MODEL', 'mistralai/Mistral-7B-Instruct-v0.2')
-        self.available_models = os.getenv('HF_MODELS', 'mistralai/Mistral-7B-Instruct-v0.2,meta-llama/Llama-2-7b-chat-hf').split(',')
-        self.models = []
-        self.model_cache = {}  # Cache for loaded models and tokenizers
-        self._check_availability()
-    
-    def _check_availability(self):
-        """Check if Hugging Face is available"""
+def _json_dumps(content: Any) -> bytes:
+    """Compact JSON encoding (orjson when installed)."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the fast codec."""
+
+    def render(self, content: Any) -> bytes:
+        return _json_dumps(content)
+
+def _is_json_content_type(content_type: Optional[str]) -> bool:
+    """Mirror FastAPI's rule for when a request body is parsed as JSON."""
+    if not content_type:
+        return True
+    message = email.message.Message()
+    message["content-type"] = content_type
+    if message.get_content_maintype() != "application":
+        return False
+    subtype = message.get_content_subtype()
+    return subtype == "json" or subtype.endswith("+json")
+
+def decode_chat_request(body: bytes, content_type: Optional[str] = "application/json") -> ChatRequest:
+    """Decode and validate a raw /api/chat body.
+
+    Raises RequestValidationError with exactly the errors FastAPI's own body
+    handling would produce, so the 422 payload is identical on both paths.
+    """
+    if not body:
+        raise RequestValidationError(
+            [{"type": "missing", "loc": ("body",), "msg": "Field required", "input": None}]
+        )
+    if not _is_json_content_type(content_type):
+        payload: Any = body
+    else:
         try:
-            if HUGGINGFACE_AVAILABLE:
-                # Filter models that are actually available in the Hugging Face Hub
-                self.models = [model.strip() for model in self.available_models]
-                self.available = len(self.models) > 0
-                if self.available:
-                    logger.info(f"huggingface_models_found", count=len(self.models), models=self.models)
-            else:
-                self.available = False
-                logger.warning("huggingface_not_available", error="transformers or torch not installed")
-        except Exception as e:
-            logger.warning(f"huggingface_init_failed", error=str(e))
-            self.available = False
-            self.models = []
-    
-    def refresh_availability(self) -> None:
-        """Refresh Hugging Face availability"""
-        self._check_availability()
-    
-    def _format_chat_to_prompt(self, messages: List[Dict[str, str]], model: str) -> str:
-        """Format chat messages into a prompt string based on the model architecture"""
-        prompt = ""
-        system_prompt = None
-
-        for message in messages:
-            role = message.get("role", "")
-            content = message.get("content", "")
-            
-            if role == "system":
-                system_prompt = content
-            elif role == "user":
-                if "mistral" in model.lower():
-                    prompt += f"<s>[INST] {content} [/INST]"
-                elif "llama" in model.lower():
-                    prompt += f"<s>[INST] {content} [/INST]"
-                else:
-                    # Default format
-                    prompt += f"User: {content}\n"
-            elif role == "assistant":
-                if "mistral" in model.lower() or "llama" in model.lower():
-                    prompt += f" {content} </s>"
-                else:
-                    # Default format
-                    prompt += f"Assistant: {content}\n"
-        
-        # Add system prompt at the beginning if available
-        if system_prompt and prompt:
-            if "mistral" in model.lower():
-                # Insert system prompt at the beginning of the first user message
-                prompt = prompt.replace("[INST]", f"[INST] {system_prompt}\n\n", 1)
-            elif "llama" in model.lower():
-                prompt = prompt.replace("[INST]", f"[INST] <<SYS>>\n{system_prompt}\n<</SYS>>\n\n", 1)
-            else:
-                # Default format
-                prompt = f"System: {system_prompt}\n" + prompt
-        
-        return prompt
-    
-    async def chat(self, messages: List[Dict[str, str]], model: str, **kwargs) -> Dict[str, Any]:
-        """Generate chat response using Hugging Face models"""
-        if not self.available:
-            raise HTTPException(status_code=500, detail="Hugging Face not available")
-        
+            # Hot path: JSON parsing and validation happen in a single Rust pass.
+            return ChatRequest.model_validate_json(body)
+        except ValidationError:
+            pass
+        # Cold path: re-run the canonical decode so error shapes match FastAPI.
         try:
-            model_name = model or self.default_model
-            
-            # Format the chat messages into a prompt
-            prompt = self._format_chat_to_prompt(messages, model_name)
-            
-            # Check if model is already loaded in cache
-            if model_name not in self.model_cache:
-                # Load model and tokenizer
-                tokenizer = AutoTokenizer.from_pretrained(model_name)
-                model_instance = AutoModelForCausalLM.from_pretrained(
-                    model_name, 
-                    torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                    low_cpu_mem_usage=True,
-                    device_map="auto"
-                )
-                self.model_cache[model_name] = (model_instance, tokenizer)
-            else:
-                model_instance, tokenizer = self.model_cache[model_name]
-            
-            # Create text generation pipeline
-            pipe = pipeline(
-                "text-generation",
-                model=model_instance,
-                tokenizer=tokenizer,
-                device=self.device
-            )
-            
-            # Generate response
-            generation_kwargs = {
-                "max_new_tokens": kwargs.get('max_tokens', 512),
-                "temperature": kwargs.get('temperature', 0.7),
-                "do_sample": True,
-                "top_p": 0.95,
-            }
-            
-            # Run generation in a separate thread to avoid blocking
-            response = await asyncio.to_thread(
-                pipe,
-                prompt,
-                **generation_kwargs
-            )
-            
-            # Extract generated text
-            generated_text = response[0]['generated_text']
-            
-            # Extract only the new content (not including the prompt)
-            assistant_response = generated_text[len(prompt):].strip()
-            
-            # Clean up response formatting
-            if assistant_response.startswith("Assistant: "):
-                assistant_response = assistant_response[len("Assistant: "):]
-            
-            return {
-                "content": assistant_response,
-                "model": model_name,
-                "provider": "huggingface"
-            }
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Hugging Face error: {str(e)}")
+            payload = json.loads(body)
+        except json.JSONDecodeError as e:
+            raise RequestValidationError(
+                [{
+                    "type": "json_invalid",
+                    "loc": ("body", e.pos),
+                    "msg": "JSON decode error",
+                    "input": {},
+                    "ctx": {"error": e.msg},
+                }],
+                body=e.doc,
+            ) from e
+    try:
+        return ChatRequest.model_validate(payload, from_attributes=True)
+    except ValidationError as e:
+        errors = [{**err, "loc": ("body",) + tuple(err.get("loc", ()))} for err in e.errors(include_url=False)]
+        raise RequestValidationError(errors, body=payload) from e
 
-class OpenAIProvider(AIProvider):
-    """OpenAI ChatGPT provider"""
-    
-    def __init__(self):
-        super().__init__("openai")
-        self.api_key = os.getenv('OPENAI_API_KEY')
-        self.default_model = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
-        self.models = ['gpt-4o', 'gpt-4o-mini', 'gpt-4', 'gpt-3.5-turbo']
-        self.available = OPENAI_AVAILABLE and bool(self.api_key)
-        if self.available:
-            self.client = openai.OpenAI(api_key=self.api_key)
-    
-    async def chat(self, messages: List[Dict[str, str]], model: str, **kwargs) -> Dict[str, Any]:
-        """Generate chat response using OpenAI"""
-        if not self.available:
-            raise HTTPException(status_code=500, detail="OpenAI not available")
-        
-        try:
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
-                model=model or self.default_model,
-                messages=messages,
-                temperature=kwargs.get('temperature', 0.7),
-                max_tokens=kwargs.get('max_tokens', 2048)
-            )
-            return {
-                "content": response.choices[0].message.content,
-                "model": model or self.default_model,
-                "provider": "openai"
-            }
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"OpenAI error: {str(e)}")
+def encode_chat_response(*, response: str, model: str, processing_time: float,
+                         usage: Optional[Dict[str, Any]] = None) -> bytes:
+    """Encode a ChatResponse payload without building and re-validating the model."""
+    return _json_dumps({
+        "response": response,
+        "model": model,
+        "model_used": model,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "processing_time": processing_time,
+        "usage": usage,
+    })
 
-class AnthropicProvider(AIProvider):
-    """Anthropic Claude provider"""
-    
-    def __init__(self):
-        super().__init__("anthropic")
-        self.api_key = os.getenv('ANTHROPIC_API_KEY')
-        self.default_model = os.getenv('CLAUDE_MODEL', 'claude-3-haiku-20240307')
-        self.models = ['claude-3-5-sonnet-20241022', 'claude-3-haiku-20240307', 'claude-3-sonnet-20240229']
-        self.available = ANTHROPIC_AVAILABLE and bool(self.api_key)
-        if self.available:
-            self.client = anthropic.Anthropic(api_key=self.api_key)
+# Provider constructors in default priority order. Providers are built in the
+# FastAPI lifespan (concurrently), not at import time.
+PROVIDER_FACTORIES: Dict[str, Callable[[], AIProvider]] = {
+    'local': LocalOpenAIProvider,
+    'huggingface': HuggingFaceProvider,
+    'openai': OpenAIProvider,
+    'anthropic': AnthropicProvider,
+}
+
+# Generation parameters for chat requests
+CHAT_TEMPERATURE = 0.7
+CHAT_MAX_TOKENS = 2048
+
+def _rate_limit_defaults() -> Dict[str, Dict[str, Any]]:
+    """Per-provider RPM/TPM budgets; unset budgets are learned from response headers."""
+    def env_int(name: str) -> Optional[int]:
+        value = os.getenv(name)
+        return int(value) if value else None
     
-    async def chat(self, messages: List[Dict[str, str]], model: str, **kwargs) -> Dict[str, Any]:
-        """Generate chat response using Anthropic Claude"""
-        if not self.available:
-            raise HTTPException(status_code=500, detail="Anthropic not available")
-        
-        try:
-            # Convert messages format for Claude
-            system_message = ""
-            claude_messages = []
-            
-            for msg in messages:
-                if msg["role"] == "system":
-                    system_message = msg["content"]
-                else:
-                    claude_messages.append(msg)
-            
-            response = await asyncio.to_thread(
-                self.client.messages.create,
-                model=model or self.default_model,
-                max_tokens=kwargs.get('max_tokens', 2048),
-                temperature=kwargs.get('temperature', 0.7),
-                system=system_message,
-                messages=claude_messages
-            )
-            return {
-                "content": response.content[0].text,
-                "model": model or self.default_model,
-                "provider": "anthropic"
-            }
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Claude error: {str(e)}")
+    max_concurrency = int(os.getenv('SPECTRA_RATE_MAX_CONCURRENCY', '16'))
+    return {
+        provider: {"rpm": env_int(f"{prefix}_RPM"), "tpm": env_int(f"{prefix}_TPM"), "max_concurrency": max_concurrency}
+        for provider, prefix in (('openai', 'OPENAI'), ('anthropic', 'ANTHROPIC'))
+    }
 
 class SpectraAI:
-    def __init__(self) -> None:
-        """Initialize with multiple AI providers."""
+    def __init__(self, startup: Optional[StartupReport] = None) -> None:
+        """Read configuration; providers and personality are loaded by start()."""
+        self.startup = startup or StartupReport()
+        
         # Environment configuration
         self.model_cache_ttl = int(os.getenv('MODEL_CACHE_TTL', '300'))
         self.personality_check_interval = int(os.getenv('PERSONALITY_CHECK_INTERVAL', '5'))
+        self.provider_priority = os.getenv('AI_PROVIDERS', 'local,huggingface,openai,anthropic').split(',')
+        self.preferred_model = os.getenv('HF_MODEL', 'mistralai/Mistral-7B-Instruct-v0.2')
         
         # Runtime state (initialize early)
         self.failed_models: set[str] = set()
         self.auto_model_enabled = os.getenv('SPECTRA_AUTO_MODEL', 'true').lower() in ('1', 'true', 'yes', 'on')
         self.request_count = 0
         self.total_processing_time = 0.0
+        self.cancellation_metrics = CancellationMetrics()
         
-        # Initialize AI providers
-        self.providers: Dict[str, AIProvider] = {
-            'huggingface': HuggingFaceProvider(),
-            'openai': OpenAIProvider(),
-            'anthropic': AnthropicProvider()
-        }
+        # Client-side rate governors for the cloud providers
+        self.rate_limits = RateLimitRegistry(_rate_limit_defaults())
+        self.rate_limit_max_wait = float(os.getenv('SPECTRA_RATE_MAX_WAIT', '10'))
+        self.rate_limit_reroute_wait = float(os.getenv('SPECTRA_RATE_REROUTE_WAIT', '0.25'))
         
-        # Get available providers and models
-        self.available_providers = [name for name, provider in self.providers.items() if provider.is_available()]
-        self.available_models = self._get_all_available_models()
+        # Identical in-flight requests (double-submits) share one generation
+        self.coalesce_requests = os.getenv('SPECTRA_COALESCE', 'true').lower() in ('1', 'true', 'yes', 'on')
+        self.generations = SingleFlight()
         
-        # Set default provider and model
-        provider_priority = os.getenv('AI_PROVIDERS', 'huggingface,openai,anthropic').split(',')
-        self.current_provider = self._select_best_provider(provider_priority)
-        self.preferred_model = os.getenv('HF_MODEL', 'mistralai/Mistral-7B-Instruct-v0.2')
+        # Rolling per-model latency stats steering auto-model within an intent tier
+        latency_slo = float(os.getenv('SPECTRA_LATENCY_SLO', '10'))
+        self.latency = LatencyTracker(
+            window=int(os.getenv('SPECTRA_LATENCY_WINDOW', '100')),
+            slo=latency_slo if latency_slo > 0 else None,
+            exploration_rate=float(os.getenv('SPECTRA_EXPLORATION_RATE', '0.05')),
+        )
+        # Prompt/completion tokens and generation time per provider:model
+        self.usage = UsageTracker()
+        # Mark the static personality prefix for OpenAI/Anthropic prompt caching
+        self.provider_prompt_cache = os.getenv('SPECTRA_PROVIDER_PROMPT_CACHE', 'true').lower() in ('1', 'true', 'yes', 'on')
+        
+        # Long-term memory: relevant past exchanges retrieved from a vector index (numpy loaded only if enabled)
+        self.memory: Optional["ConversationMemory"] = None
+        if os.getenv('SPECTRA_MEMORY', 'false').lower() in ('1', 'true', 'yes', 'on'):
+            import memory_store
+            self.memory = memory_store.ConversationMemory.from_env()
+        
+        # Rolling summaries replace the oldest turns of long histories (otherwise: last 10 messages)
+        self.summarizer: Optional[ConversationSummarizer] = None
+        if os.getenv('SPECTRA_SUMMARIZE', 'false').lower() in ('1', 'true', 'yes', 'on'):
+            self.summarizer = ConversationSummarizer(
+                self._summarize,
+                threshold_tokens=int(os.getenv('SPECTRA_SUMMARY_THRESHOLD', '1500')),
+                keep_recent=int(os.getenv('SPECTRA_SUMMARY_KEEP_RECENT', '6')),
+                max_summary_tokens=int(os.getenv('SPECTRA_SUMMARY_MAX_TOKENS', '300')),
+            )
+        
+        # Populated by start()
+        self.ready = False
+        self._start_lock = asyncio.Lock()
+        self._background_tasks: set[asyncio.Task] = set()
+        self.providers: Dict[str, AIProvider] = {}
+        self.available_providers: List[str] = []
+        self.available_models: List[str] = []
+        self.current_provider = self._select_best_provider(self.provider_priority)
         self.model = self._select_best_model()
         
         # Personality management
         self._personality_path = Path(__file__).parent / 'spectra_prompt.md'
         self._personality_mtime: Optional[float] = None
         self._last_personality_check: Optional[float] = None
-        self.personality_prompt = self._load_personality()
+        self.minify_personality = os.getenv('SPECTRA_PROMPT_MINIFY', 'false').lower() in ('1', 'true', 'yes', 'on')
+        self.personality_minify_stats: Dict[str, int] = {}
+        self.personality_prompt = "You are Spectra AI, an emotionally intelligent assistant."
         self.personality_hash = self._hash_personality(self.personality_prompt)
+
+    async def start(self) -> None:
+        """Build providers and load the personality concurrently, timing each phase."""
+        async with self._start_lock:
+            if self.ready:
+                return
+            
+            def build(name: str, factory: Callable[[], AIProvider]) -> AIProvider:
+                with self.startup.phase(f"provider:{name}"):
+                    return factory()
+            
+            def load_personality() -> str:
+                with self.startup.phase("personality"):
+                    return self._load_personality()
+            
+            def open_memory() -> bool:
+                with self.startup.phase("memory"):
+                    try:
+                        self.memory.store.open()
+                        return True
+                    except Exception as e:  # noqa: BLE001 - chat works without memory
+                        logger.warning("memory_open_failed", error=str(e))
+                        return False
+            
+            phase_start = time.perf_counter()
+            names = list(PROVIDER_FACTORIES)
+            results = await asyncio.gather(
+                asyncio.to_thread(load_personality),
+                *(asyncio.to_thread(build, name, PROVIDER_FACTORIES[name]) for name in names),
+                *([asyncio.to_thread(open_memory)] if self.memory is not None else []),
+            )
+            self.startup.record("providers_and_personality", phase_start, time.perf_counter())
+            
+            personality_source = results[0]
+            self.personality_prompt = self._prepare_personality(personality_source)
+            self.personality_hash = self._hash_personality(personality_source)
+            
+            with self.startup.phase("model_selection"):
+                self.providers = dict(zip(names, results[1:]))
+                self.available_providers = [name for name, provider in self.providers.items() if provider.is_available()]
+                self.available_models = self._get_all_available_models()
+                self.current_provider = self._select_best_provider(self.provider_priority)
+                self.model = self._select_best_model()
+            
+            self.ready = True
+            self.startup.mark_ready()
+            logger.info(
+                "spectra_initialized",
+                providers=self.available_providers,
+                current_provider=self.current_provider,
+                model=self.model,
+                available_models=len(self.available_models),
+                auto_model=self.auto_model_enabled
+            )
+            logger.info("startup_report", **self.startup.snapshot())
+            
+            # Warm SDK clients off the request path; not part of time-to-ready
+            task = asyncio.create_task(self._prewarm_providers())
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+            
+            if self.memory is not None:
+                if results[-1]:
+                    task = asyncio.create_task(self.memory.run())
+                    self._background_tasks.add(task)
+                    task.add_done_callback(self._background_tasks.discard)
+                else:
+                    self.memory = None
+
+    async def _prewarm_providers(self) -> None:
+        """Create provider SDK clients in the background after startup."""
+        async def prewarm(name: str, provider: AIProvider) -> None:
+            def run() -> None:
+                with self.startup.phase(f"prewarm:{name}", blocking=False):
+                    provider.prewarm()
+            try:
+                await provider.executor.run(run)
+            except Exception as e:  # noqa: BLE001 - the first request will retry
+                logger.warning("provider_prewarm_failed", provider=name, error=str(e))
         
-        logger.info(
-            "spectra_initialized",
-            providers=self.available_providers,
-            current_provider=self.current_provider,
-            model=self.model,
-            available_models=len(self.available_models),
-            auto_model=self.auto_model_enabled
-        )
+        await asyncio.gather(*(prewarm(name, p) for name, p in self.providers.items() if p.is_available()))
 
     def _get_all_available_models(self) -> List[str]:
         """Get all available models from all providers"""
@@ -470,11 +474,10 @@ class SpectraAI:
         # Last resort
         return self.available_models[0] if self.available_models else f"{self.current_provider}:{self.preferred_model}"
 
-    def refresh_models(self) -> None:
+    async def refresh_models(self) -> None:
         """Force refresh of model cache from all providers."""
-        # Refresh all providers
-        for provider in self.providers.values():
-            provider.refresh_availability()
+        # Refresh all providers; local servers are queried concurrently on the async client
+        await asyncio.gather(*(provider.refresh() for provider in self.providers.values()))
         
         # Update available providers and models
         self.available_providers = [name for name, provider in self.providers.items() if provider.is_available()]
@@ -526,7 +529,7 @@ class SpectraAI:
             new_hash = self._hash_personality(content)
             
             if new_hash != self.personality_hash:
-                self.personality_prompt = content.strip()
+                self.personality_prompt = self._prepare_personality(content)
                 self.personality_hash = new_hash
                 self._personality_mtime = current_mtime
                 logger.info("personality_reloaded", hash=self.personality_hash)
@@ -534,6 +537,24 @@ class SpectraAI:
         except Exception as e:
             logger.warning("personality_reload_failed", error=str(e))
 
+    def _prepare_personality(self, content: str) -> str:
+        """Apply optional markdown minification, recording the token savings."""
+        prompt = content.strip()
+        if not self.minify_personality:
+            return prompt
+        minified = minify_markdown(prompt)
+        original_tokens = estimate_tokens(prompt)
+        minified_tokens = estimate_tokens(minified)
+        self.personality_minify_stats = {
+            "original_chars": len(prompt),
+            "minified_chars": len(minified),
+            "original_tokens_est": original_tokens,
+            "minified_tokens_est": minified_tokens,
+            "saved_tokens_est": original_tokens - minified_tokens,
+        }
+        logger.info("personality_minified", **self.personality_minify_stats)
+        return minified
+
     def _hash_personality(self, text: str) -> str:
         """Generate hash for personality content."""
         return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
@@ -554,45 +575,74 @@ class SpectraAI:
 
     def _choose_context_model(self, message: str) -> tuple[str, str]:
         """Choose optimal provider and model based on context."""
+        return self._candidate_models(message)[0]
+
+    def _candidate_models(self, message: str) -> List[tuple[str, str]]:
+        """Provider/model candidates for a message, best first (rate-limit reroute order)."""
         if not self.auto_model_enabled:
-            provider, model = self._parse_model_string(self.model)
-            return provider, model
+            return [self._parse_model_string(self.model)]
         
         intent = self._classify_intent(message)
         
-        # Provider and model preferences by intent
+        # Acceptable tiers by intent; within a tier the fastest healthy model wins.
+        # ('local', '') matches the local server's default (first discovered) model.
         preferences = {
             'creative': [
-                ('anthropic', 'claude-3-5-sonnet-20241022'),
-                ('openai', 'gpt-4o'),
-                ('huggingface', 'mistralai/Mistral-7B-Instruct-v0.2'),
-                ('huggingface', 'meta-llama/Llama-2-7b-chat-hf')
+                [('anthropic', 'claude-3-5-sonnet-20241022'), ('openai', 'gpt-4o')],
+                [('local', ''), ('huggingface', 'mistralai/Mistral-7B-Instruct-v0.2'), ('huggingface', 'meta-llama/Llama-2-7b-chat-hf')]
             ],
             'technical': [
-                ('openai', 'gpt-4o'),
-                ('anthropic', 'claude-3-haiku-20240307'),
-                ('huggingface', 'mistralai/Mistral-7B-Instruct-v0.2'),
-                ('huggingface', 'meta-llama/Llama-2-7b-chat-hf')
+                [('openai', 'gpt-4o'), ('anthropic', 'claude-3-haiku-20240307')],
+                [('local', ''), ('huggingface', 'mistralai/Mistral-7B-Instruct-v0.2'), ('huggingface', 'meta-llama/Llama-2-7b-chat-hf')]
             ],
             'concise': [
-                ('openai', 'gpt-4o-mini'),
-                ('anthropic', 'claude-3-haiku-20240307'),
-                ('huggingface', 'mistralai/Mistral-7B-Instruct-v0.2')
+                [('openai', 'gpt-4o-mini'), ('anthropic', 'claude-3-haiku-20240307')],
+                [('local', ''), ('huggingface', 'mistralai/Mistral-7B-Instruct-v0.2')]
             ]
         }
         
-        # Try preferred combinations for this intent
-        for provider_name, model_pattern in preferences.get(intent, []):
-            if provider_name in self.available_providers:
-                provider = self.providers[provider_name]
-                for model in provider.get_models():
-                    if model_pattern.lower() in model.lower():
-                        full_model_name = f"{provider_name}:{model}"
-                        if full_model_name not in self.failed_models:
-                            return provider_name, model
+        # Resolve each tier's preferred combinations to available, non-failed models
+        tiers: List[List[tuple[str, str]]] = []
+        seen: set[tuple[str, str]] = set()
+        for tier in preferences.get(intent, []):
+            resolved = self._resolve_tier(tier, seen)
+            if resolved:
+                tiers.append(resolved)
+        candidates = self.latency.order(tiers)
         
         # Fallback to current model
-        return self._parse_model_string(self.model)
+        current = self._parse_model_string(self.model)
+        if current not in candidates:
+            candidates.append(current)
+        return candidates
+
+    def _resolve_tier(self, tier: List[tuple[str, str]], seen: set[tuple[str, str]]) -> List[tuple[str, str]]:
+        """First available, non-failed model matching each (provider, pattern) of a tier."""
+        resolved = []
+        for provider_name, model_pattern in tier:
+            if provider_name not in self.available_providers:
+                continue
+            for model in self.providers[provider_name].get_models():
+                if model_pattern.lower() in model.lower():
+                    if f"{provider_name}:{model}" not in self.failed_models:
+                        if (provider_name, model) not in seen:
+                            seen.add((provider_name, model))
+                            resolved.append((provider_name, model))
+                        break
+        return resolved
+
+    async def _summarize(self, messages: List[Dict[str, str]]) -> str:
+        """Run a summarization prompt on the cheapest available model."""
+        # Cheapest first: a local server, then the small cloud models, then the current model
+        cheap = [('local', ''), ('openai', 'gpt-4o-mini'), ('anthropic', 'claude-3-haiku')]
+        candidates = self._resolve_tier(cheap, set())
+        current = self._parse_model_string(self.model)
+        if current not in candidates:
+            candidates.append(current)
+        # Not recorded: a short summary prompt would skew the chat model's latency and token stats
+        response, _, _ = await self._dispatch(candidates, messages, None,
+                                              max_tokens=self.summarizer.max_summary_tokens * 2, record=False)
+        return response['content']
 
     def _parse_model_string(self, model_string: str) -> tuple[str, str]:
         """Parse 'provider:model' string into provider and model components."""
@@ -603,31 +653,46 @@ class SpectraAI:
             # Assume ollama if no provider specified
             return self.current_provider, model_string
 
-    async def generate_response(self, message: str, history: Optional[List[ChatMessage]] = None) -> Dict[str, Any]:
-        """Generate AI response using available providers."""
+    async def generate_response(self, message: str, history: Optional[List[ChatMessage]] = None,
+                                cancel_token: Optional[CancellationToken] = None,
+                                user_id: Optional[str] = None,
+                                on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """Generate AI response using available providers.
+        
+        `on_delta` receives generated text as streaming providers produce it.
+        """
         start_time = time.time()
+        if not self.ready:
+            await self.start()
         
         try:
             self._maybe_reload_personality()
-            provider_name, model_name = self._choose_context_model(message)
+            candidates = self._candidate_models(message)
+            provider_name, model_name = candidates[0]
             
             # Build conversation context
             messages = [{"role": "system", "content": self.personality_prompt}]
             
-            if history:
-                for msg in history[-10:]:  # Limit context window
-                    messages.append({"role": msg.role, "content": msg.content})
+            turns = [{"role": msg.role, "content": msg.content} for msg in history or []]
+            if self.summarizer is not None:
+                summary, turns = self.summarizer.compact(turns)
+                if summary:
+                    # In place of the turns it covers; after the personality so the prompt prefix stays stable
+                    messages[0]["content"] += f"\n\nSummary of the earlier conversation:\n{summary}"
+            else:
+                turns = turns[-10:]  # Limit context window
+            messages.extend(turns)
+            
+            # Only a verified user has a memory namespace: never a shared or client-chosen one
+            memory_namespace = self.memory.namespace(user_id) if self.memory is not None else None
+            if memory_namespace is not None:
+                await self._inject_memories(messages, memory_namespace, message)
             
             messages.append({"role": "user", "content": message})
             
-            # Generate response using selected provider
-            provider = self.providers[provider_name]
-            response = await provider.chat(
-                messages=messages,
-                model=model_name,
-                temperature=0.7,
-                max_tokens=2048
-            )
+            # Generate response using the first candidate with rate-limit headroom
+            response, provider_name, model_name = await self._dispatch_coalesced(candidates, messages, cancel_token,
+                                                                                 on_delta)
             
             processing_time = time.time() - start_time
             
@@ -639,13 +704,19 @@ class SpectraAI:
             full_model_name = f"{provider_name}:{model_name}"
             self.failed_models.discard(full_model_name)
             
+            if memory_namespace is not None:
+                self.memory.remember(memory_namespace, message, response['content'])
+            
             logger.info(
                 "response_generated",
                 provider=provider_name,
                 model=model_name,
                 processing_time=processing_time,
                 message_length=len(message),
-                response_length=len(response['content'])
+                response_length=len(response['content']),
+                prompt_tokens=response['usage']['prompt_tokens'],
+                completion_tokens=response['usage']['completion_tokens'],
+                tokens_per_second=response['usage']['tokens_per_second'],
             )
             
             return {
@@ -654,9 +725,16 @@ class SpectraAI:
                 "model_used": full_model_name,
                 "provider": provider_name,
                 "timestamp": datetime.now(timezone.utc).isoformat(),
-                "processing_time": processing_time
+                "processing_time": processing_time,
+                "usage": response['usage'],
             }
             
+        except GenerationCancelled:
+            raise
+        except RateLimited as e:
+            logger.warning("response_rate_limited", provider=provider_name, model=model_name,
+                           retry_after=round(e.retry_after, 2))
+            raise
         except Exception as e:
             processing_time = time.time() - start_time
             
@@ -687,6 +765,126 @@ class SpectraAI:
                 }
             )
 
+    async def _inject_memories(self, messages: List[Dict[str, str]], namespace: str, message: str) -> None:
+        """Append the most relevant past exchanges (not already in the history) to the system prompt."""
+        if self.memory is None:
+            return
+        try:
+            recalled = await self.memory.recall(namespace, message, exclude=[m["content"] for m in messages[1:]])
+        except Exception as e:  # noqa: BLE001 - answer without memories rather than fail
+            logger.warning("memory_recall_failed", error=str(e))
+            return
+        if recalled:
+            # Appended after the personality so the cacheable system-prompt prefix is unchanged
+            messages[0] = {"role": "system", "content": f"{messages[0]['content']}\n\n{self.memory.render(recalled)}"}
+
+    async def _dispatch_coalesced(self, candidates: List[tuple[str, str]], messages: List[Dict[str, str]],
+                                  cancel_token: Optional[CancellationToken],
+                                  on_delta: Optional[Callable[[str], None]] = None) -> tuple[Dict[str, Any], str, str]:
+        """_dispatch, shared with identical requests already in flight."""
+        if not self.coalesce_requests or on_delta is not None:
+            # Streamed generations aren't shared: the deltas go to one caller
+            return await self._dispatch(candidates, messages, cancel_token, on_delta=on_delta)
+        key = hashlib.sha256(json.dumps(
+            [self.personality_hash, candidates[0], messages, CHAT_TEMPERATURE, CHAT_MAX_TOKENS],
+            separators=(',', ':'),
+        ).encode('utf-8')).hexdigest()
+        result, shared = await self.generations.do(
+            key, lambda token: self._dispatch(candidates, messages, token), cancel_token
+        )
+        if shared:
+            logger.info("request_coalesced", model=f"{result[1]}:{result[2]}")
+        return result
+
+    async def _dispatch(self, candidates: List[tuple[str, str]], messages: List[Dict[str, str]],
+                        cancel_token: Optional[CancellationToken],
+                        max_tokens: int = CHAT_MAX_TOKENS,
+                        on_delta: Optional[Callable[[str], None]] = None,
+                        record: bool = True) -> tuple[Dict[str, Any], str, str]:
+        """Call the first candidate whose rate governor admits the request.
+        
+        Earlier candidates are skipped (rerouted) when they would need more than
+        a short wait; the last one is queued for up to the max wait. A provider
+        429 shrinks that governor and moves on to the next candidate. With
+        `record` off (background work such as summaries) the call is kept out
+        of the chat latency and token-usage statistics.
+        """
+        estimated_tokens = sum(estimate_tokens(m["content"]) for m in messages) + max_tokens
+        limited: Optional[RateLimited] = None
+        for index, (provider_name, model_name) in enumerate(candidates):
+            permit = None
+            if self.rate_limits.governed(provider_name):
+                governor = self.rate_limits.governor(provider_name, model_name)
+                last = index == len(candidates) - 1
+                try:
+                    permit = await governor.acquire(
+                        estimated_tokens,
+                        max_wait=self.rate_limit_max_wait if last else self.rate_limit_reroute_wait,
+                    )
+                except RateLimited as e:
+                    limited = e
+                    logger.info("rate_limit_reroute", model=e.key, retry_after=round(e.retry_after, 2))
+                    continue
+            
+            provider = self.providers[provider_name]
+            call_start = time.perf_counter()
+            try:
+                response = await provider.chat(
+                    messages=messages,
+                    model=model_name,
+                    temperature=CHAT_TEMPERATURE,
+                    max_tokens=max_tokens,
+                    cancel_token=cancel_token,
+                    **({"on_delta": on_delta} if on_delta is not None else {}),
+                    **self._prompt_cache_kwargs()
+                )
+            except ProviderRateLimited as e:
+                key = f"{provider_name}:{model_name}"
+                if permit is not None:
+                    permit.release(headers=e.headers, rate_limited=True)
+                limited = RateLimited(key, parse_rate_limit_headers(e.headers).get("retry_after", 1.0))
+                logger.warning("provider_rate_limited", model=key)
+                continue
+            except BaseException as e:
+                if permit is not None:
+                    permit.release(ok=False)
+                if record:
+                    self._record_failure(f"{provider_name}:{model_name}", e, cancel_token,
+                                         time.perf_counter() - call_start)
+                raise
+            if permit is not None:
+                permit.release(headers=response.get("rate_limit_headers"), tokens_used=response.get("total_tokens"))
+            elapsed = time.perf_counter() - call_start
+            if record:
+                self.latency.record(f"{provider_name}:{model_name}", elapsed, response.get("ttft"))
+                response["usage"] = self.usage.record(f"{provider_name}:{model_name}", response, messages, elapsed)
+            return response, provider_name, model_name
+        
+        assert limited is not None  # only governed candidates are ever skipped
+        raise limited
+
+    def _record_failure(self, key: str, error: BaseException, cancel_token: Optional[CancellationToken],
+                        elapsed: float) -> None:
+        """Penalize a candidate that timed out or failed, so routing stops preferring it.
+
+        Client cancellations say nothing about the model and are not counted.
+        A deadline hit also marks the model failed, like a timeout error.
+        """
+        timed_out = cancel_token is not None and cancel_token.reason == DEADLINE_EXCEEDED
+        if not timed_out and (isinstance(error, GenerationCancelled) or not isinstance(error, Exception)):
+            return
+        self.latency.record_failure(key, elapsed, floor=REQUEST_TIMEOUT)
+        if timed_out:
+            self.failed_models.add(key)
+            logger.warning("model_marked_failed", model=key, error=DEADLINE_EXCEEDED)
+
+    def _prompt_cache_kwargs(self) -> Dict[str, Any]:
+        """Static system-prompt prefix and its cache key, for providers with prompt caching."""
+        if not self.provider_prompt_cache:
+            return {}
+        # Keyed by the personality hash so a reload starts a new cache entry
+        return {"cache_prefix": self.personality_prompt, "cache_key": f"spectra-{self.personality_hash}"}
+
     def metrics(self) -> Dict[str, Any]:
         """Get comprehensive system metrics."""
         avg_processing_time = (
@@ -704,6 +902,27 @@ class SpectraAI:
             "request_count": self.request_count,
             "avg_processing_time": round(avg_processing_time, 3),
             "cache_ttl": self.model_cache_ttl,
+            "logging": log_pipeline.stats(),
+            "cancellation": self.cancellation_metrics.snapshot(),
+            "rate_limits": self.rate_limits.snapshot(),
+            "latency": self.latency.snapshot(),
+            "personality_minify": self.personality_minify_stats,
+            "prompt_cache": self.providers['huggingface'].prompt_stats() if 'huggingface' in self.providers else {},
+            "inference_engines": self.providers['huggingface'].engine_stats() if 'huggingface' in self.providers else {},
+            "cpu_slots": self.providers['huggingface'].cpu_stats() if 'huggingface' in self.providers else {},
+            "generation_guards": self.providers['huggingface'].guard_stats() if 'huggingface' in self.providers else {},
+            "local_endpoints": self.providers['local'].endpoint_stats() if 'local' in self.providers else {},
+            "memory": self.memory.snapshot() if self.memory is not None else {},
+            "summaries": self.summarizer.snapshot() if self.summarizer is not None else {},
+            "token_usage": self.usage.snapshot(),
+            "executors": executor_stats(),
+            "event_loop": loop_monitor.snapshot() if loop_monitor is not None else {},
+            "websocket": chat_socket_stats.snapshot(),
+            "jobs": jobs.snapshot() if jobs is not None else {},
+            "coalescing": {
+                "generations": self.generations.snapshot(),
+                "model_loads": self.providers['huggingface'].model_loads.snapshot() if 'huggingface' in self.providers else {},
+            },
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
 
@@ -715,14 +934,61 @@ class SpectraAI:
             self.auto_model_enabled = not self.auto_model_enabled
         return self.auto_model_enabled
 
-spectra = SpectraAI()
+spectra = SpectraAI(StartupReport(origin=_IMPORT_START))
+spectra.startup.record("module_import", _IMPORT_START, time.perf_counter())
+
+# Event-loop lag monitor (SPECTRA_LOOP_MONITOR), started with the app
+loop_monitor = LoopMonitor.from_env()
+
+# /ws/chat connection counters for this worker
+chat_socket_stats = ChatSocketStats()
+
+# RSS and long-lived structure sizes, sampled for growth (SPECTRA_MEMORY_SAMPLE_INTERVAL)
+memory_tracker = MemoryTracker.from_env()
+
+def _track_structures() -> None:
+    """Register the structures that live as long as the worker (sizes read on each sample)."""
+    def hf() -> Any:
+        return spectra.providers['huggingface']
+
+    memory_tracker.track("failed_models", lambda: len(spectra.failed_models))
+    memory_tracker.track("available_models", lambda: len(spectra.available_models))
+    memory_tracker.track("model_cache", lambda: len(hf().model_cache))
+    memory_tracker.track("prompt_segments",
+                         lambda: sum(stats["cached_segments"] for stats in hf().prompt_stats().values()))
+    memory_tracker.track("rate_governors", lambda: len(spectra.rate_limits.governors))
+    memory_tracker.track("latency_routes", lambda: len(spectra.latency.latency))
+    memory_tracker.track("token_usage_routes", lambda: len(spectra.usage.routes))
+    memory_tracker.track("generations_in_flight", lambda: spectra.generations.snapshot()["in_flight"])
+    memory_tracker.track("memory_records", lambda: len(spectra.memory.store) if spectra.memory is not None else 0)
+    memory_tracker.track("summaries", lambda: len(spectra.summarizer.cache) if spectra.summarizer is not None else 0)
+    memory_tracker.track("jobs", lambda: len(jobs.jobs) if jobs is not None else 0)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Provider construction happens here, concurrently, before serving."""
+    if loop_monitor is not None:
+        loop_monitor.start()
+    await spectra.start()
+    if jobs is not None:
+        await jobs.start()
+    _track_structures()
+    memory_tracker.start()
+    yield
+    await memory_tracker.stop()
+    if jobs is not None:
+        await jobs.stop()
+    if loop_monitor is not None:
+        await loop_monitor.stop()
+    shutdown_executors()
 
 app = FastAPI(
     title="Spectra AI API",
     description="Emotionally intelligent AI assistant backend",
     version="2.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 from fastapi.middleware.cors import CORSMiddleware
@@ -739,11 +1005,18 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 ) 
+app.add_middleware(EndpointTagMiddleware, monitor=loop_monitor)
+
+def _read_response(payload: Dict[str, Any], model: Optional[type] = None) -> Any:
+    """Return a read-endpoint payload; pre-encoded (no re-validation) with the fast codec."""
+    if FAST_CODEC_ENABLED:
+        return FastJSONResponse(payload)
+    return model(**payload) if model else payload
 
 @app.get('/', response_model=Dict[str, Any])
 async def root():
     """API info endpoint"""
-    return {
+    return _read_response({
         "service": "Spectra AI Backend API",
         "status": "running",
         "timestamp": datetime.now(timezone.utc).isoformat(),
@@ -752,12 +1025,12 @@ async def root():
         "available_models": spectra.available_models,
         "docs": "/docs",
         "health": "/health"
-    }
+    })
 
 @app.get('/health')
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.now(timezone.utc).isoformat(), "personality_hash": spectra.personality_hash}
+    return _read_response({"status": "healthy", "timestamp": datetime.now(timezone.utc).isoformat(), "personality_hash": spectra.personality_hash})
 
 @app.get('/api/status', response_model=StatusResponse)
 async def get_status():
@@ -766,28 +1039,28 @@ async def get_status():
         current_models = spectra.available_models
         ai_status = "connected" if spectra.available_providers else "disconnected"
         
-        return StatusResponse(
-            status="healthy",
-            ai_provider=f"multi-provider ({','.join(spectra.available_providers)})",
-            ollama_status=ai_status,
-            model=spectra.model,
-            available_models=current_models,
-            timestamp=datetime.now(timezone.utc).isoformat(),
-            host=os.getenv('HOST', '127.0.0.1'),
-            port=int(os.getenv('PORT', 8000))
-        )
+        return _read_response({
+            "status": "healthy",
+            "ai_provider": f"multi-provider ({','.join(spectra.available_providers)})",
+            "ollama_status": ai_status,
+            "model": spectra.model,
+            "available_models": current_models,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "host": os.getenv('HOST', '127.0.0.1'),
+            "port": int(os.getenv('PORT', 8000))
+        }, StatusResponse)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get('/api/models', response_model=ModelListResponse)
 async def list_models():
-    spectra.refresh_models()
-    return ModelListResponse(
-        current=spectra.model,
-        available=spectra.available_models,
-        preferred=spectra.preferred_model,
-        timestamp=datetime.now(timezone.utc).isoformat()
-    )
+    await spectra.refresh_models()
+    return _read_response({
+        "current": spectra.model,
+        "available": spectra.available_models,
+        "preferred": spectra.preferred_model,
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }, ModelListResponse)
 
 @app.post('/api/models/select', response_model=ModelSelectResponse)
 async def select_model(payload: ModelSelectRequest):
@@ -806,7 +1079,7 @@ async def select_model(payload: ModelSelectRequest):
 @app.post('/api/models/refresh', response_model=ModelListResponse)
 async def refresh_models_endpoint():
     """Force a refresh of the model list (dynamic, no static caching)."""
-    spectra.refresh_models()
+    await spectra.refresh_models()
     return ModelListResponse(
         current=spectra.model,
         available=spectra.available_models,
@@ -814,9 +1087,11 @@ async def refresh_models_endpoint():
         timestamp=datetime.now(timezone.utc).isoformat()
     )
 
-@app.post('/api/chat', response_model=ChatResponse)
-async def chat_endpoint(chat_request: ChatRequest):
-    """Chat with Spectra AI"""
+# Per-request deadline; matches the frontend's 120s axios timeout by default.
+REQUEST_TIMEOUT = float(os.getenv('SPECTRA_REQUEST_TIMEOUT', '120'))
+
+async def _chat(chat_request: ChatRequest, request: Request) -> Dict[str, Any]:
+    """Shared chat handling for the standard and fast-codec endpoints."""
     try:
         # history is Optional[List[ChatMessage]] (default_factory ensures list), guard for type checkers
         logger.info(
@@ -824,11 +1099,37 @@ async def chat_endpoint(chat_request: ChatRequest):
             preview=chat_request.message[:50],
             history=len(chat_request.history or []),
         )
-        result = await spectra.generate_response(chat_request.message, chat_request.history)
-        return ChatResponse.build(
-            response=result["response"],
-            model=result["model"],
-            processing_time=result["processing_time"],
+        cancel_token = CancellationToken.with_timeout(REQUEST_TIMEOUT, spectra.cancellation_metrics)
+        return await run_cancellable(
+            spectra.generate_response(chat_request.message, chat_request.history, cancel_token=cancel_token,
+                                      user_id=chat_request.user_id),
+            cancel_token,
+            request.is_disconnected,
+        )
+    except GenerationCancelled as e:
+        logger.warning("chat_cancelled", reason=e.reason)
+        raise HTTPException(
+            # 499 (client closed request) is never seen by the client; it marks the access log
+            status_code=504 if e.reason == DEADLINE_EXCEEDED else 499,
+            detail={
+                "response": "That took longer than expected, so I stopped. Please try again. 💜",
+                "status": "cancelled",
+                "error": e.reason,
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }
+        )
+    except RateLimited as e:
+        retry_after = max(1, math.ceil(e.retry_after))
+        raise HTTPException(
+            status_code=429,
+            detail={
+                "response": "I'm getting a lot of messages right now. Please try again in a moment. 💜",
+                "status": "rate_limited",
+                "error": str(e),
+                "retry_after": retry_after,
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            },
+            headers={"Retry-After": str(retry_after)},
         )
     except Exception as e:  # noqa: BLE001
         logger.error("chat_error", error=str(e))
@@ -842,9 +1143,187 @@ async def chat_endpoint(chat_request: ChatRequest):
             }
         )
 
+async def chat_endpoint(chat_request: ChatRequest, request: Request):
+    """Chat with Spectra AI"""
+    result = await _chat(chat_request, request)
+    return ChatResponse.build(
+        response=result["response"],
+        model=result["model"],
+        processing_time=result["processing_time"],
+        usage=result.get("usage"),
+    )
+
+async def chat_endpoint_fast(request: Request):
+    """Chat with Spectra AI (fast codec path)"""
+    chat_request = decode_chat_request(await request.body(), request.headers.get("content-type"))
+    result = await _chat(chat_request, request)
+    return Response(
+        content=encode_chat_response(
+            response=result["response"],
+            model=result["model"],
+            processing_time=result["processing_time"],
+            usage=result.get("usage"),
+        ),
+        media_type="application/json",
+    )
+
+def _inline_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Resolve local $defs references so a model schema can be embedded inline."""
+    defs = schema.pop("$defs", {})
+
+    def resolve(node: Any) -> Any:
+        if isinstance(node, dict):
+            ref = node.get("$ref", "")
+            if ref.startswith("#/$defs/"):
+                return resolve(defs[ref.split("/")[-1]])
+            return {key: resolve(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [resolve(item) for item in node]
+        return node
+
+    return resolve(schema)
+
+# The fast endpoint reads the raw body, so describe it for /docs explicitly.
+_CHAT_REQUEST_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": _inline_schema(ChatRequest.model_json_schema())}},
+    }
+}
+
+if FAST_CODEC_ENABLED:
+    app.post('/api/chat', response_model=ChatResponse, openapi_extra=_CHAT_REQUEST_OPENAPI)(chat_endpoint_fast)
+else:
+    app.post('/api/chat', response_model=ChatResponse)(chat_endpoint)
+
+# /ws/chat: heartbeat ping interval and silence before disconnect, concurrent
+# requests per connection, and how long one frame may wait on a slow reader
+WS_HEARTBEAT = float(os.getenv('SPECTRA_WS_HEARTBEAT', '20'))
+WS_HEARTBEAT_TIMEOUT = float(os.getenv('SPECTRA_WS_HEARTBEAT_TIMEOUT', '60'))
+WS_MAX_STREAMS = int(os.getenv('SPECTRA_WS_MAX_STREAMS', '8'))
+WS_SEND_TIMEOUT = float(os.getenv('SPECTRA_WS_SEND_TIMEOUT', '10'))
+
+async def _stream_chat(payload: Dict[str, Any], cancel_token: CancellationToken,
+                       on_delta: Callable[[str], None]) -> Dict[str, Any]:
+    """One chat request from /ws/chat or a job; text is streamed through on_delta."""
+    try:
+        chat_request = ChatRequest.model_validate(payload)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json(include_url=False)))
+    logger.info("stream_chat_request", preview=chat_request.message[:50], history=len(chat_request.history or []))
+    return await spectra.generate_response(chat_request.message, chat_request.history, cancel_token=cancel_token,
+                                           user_id=chat_request.user_id, on_delta=on_delta)
+
+@app.websocket('/ws/chat')
+async def chat_websocket(websocket: WebSocket):
+    """Multiplexed, cancellable, streaming chat (frame protocol in ws_chat.py)"""
+    await ChatSession(
+        websocket, _stream_chat, chat_socket_stats,
+        heartbeat_interval=WS_HEARTBEAT,
+        heartbeat_timeout=WS_HEARTBEAT_TIMEOUT,
+        max_streams=WS_MAX_STREAMS,
+        send_timeout=WS_SEND_TIMEOUT,
+        request_timeout=REQUEST_TIMEOUT,
+        cancellation_metrics=spectra.cancellation_metrics,
+    ).run()
+
+# Queued chat jobs for long generations (SPECTRA_JOBS), started with the app
+jobs: Optional[JobManager] = (
+    JobManager.from_env(_stream_chat, spectra.cancellation_metrics)
+    if os.getenv('SPECTRA_JOBS', 'true').lower() in ('1', 'true', 'yes', 'on') else None
+)
+
+def _job_manager() -> JobManager:
+    if jobs is None:
+        raise HTTPException(status_code=404, detail="Jobs are disabled (SPECTRA_JOBS)")
+    return jobs
+
+async def _job(job_id: str) -> Job:
+    job = await _job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
+@app.post('/api/jobs', status_code=202, response_model=Dict[str, Any])
+async def submit_job(chat_request: ChatRequest):
+    """Queue a chat; returns a job id to poll or subscribe to"""
+    manager = _job_manager()
+    try:
+        job = await manager.submit(chat_request.model_dump())
+    except JobQueueFull as e:
+        retry_after = max(1, math.ceil(e.retry_after))
+        raise HTTPException(status_code=503, detail="Job queue is full, please retry later",
+                            headers={"Retry-After": str(retry_after)})
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "position": manager.position(job),
+        "poll": f"/api/jobs/{job.id}",
+        "events": f"/api/jobs/{job.id}/events",
+    }
+
+@app.get('/api/jobs/{job_id}', response_model=Dict[str, Any])
+async def get_job(job_id: str):
+    """Job status, partial output so far, and the result or error once finished"""
+    job = await _job(job_id)
+    return {**job.public(), "position": _job_manager().position(job)}
+
+@app.delete('/api/jobs/{job_id}', response_model=Dict[str, Any])
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    await _job(job_id)
+    job = await _job_manager().cancel(job_id)
+    return job.public() if job is not None else {}
+
+@app.get('/api/jobs/{job_id}/events')
+async def job_events(job_id: str):
+    """Server-sent events: `status` changes, `delta` output, then `done` with the finished job
+    
+    A job that is requeued (its worker stopped) runs again from the start: a
+    `status` event with status `requeued` means the text received so far is
+    discarded and the `delta` events that follow start over.
+    """
+    manager = _job_manager()
+    await _job(job_id)
+
+    def event(name: str, data: Dict[str, Any]) -> str:
+        return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+    async def stream():
+        sent, status, run = 0, None, None
+        while True:
+            seen = manager.version(job_id)
+            job = await manager.get(job_id)
+            if job is None:
+                return
+            # Read once: the job can change while an event is being sent
+            started, current, partial = job.started, job.status, job.partial
+            changed = False
+            if sent and started is not None and started != run:
+                # A new run of the job (`started` is per run) replaces the output sent so far
+                yield event("status", {"id": job.id, "status": "requeued"})
+                sent, status = 0, None
+            if current != status:
+                status, changed = current, True
+                yield event("status", {"id": job.id, "status": current})
+            if len(partial) > sent:
+                yield event("delta", {"id": job.id, "text": partial[sent:]})
+                sent, run, changed = len(partial), started, True
+            if current in TERMINAL:
+                yield event("done", job.public())
+                return
+            if not changed:
+                yield ": keep-alive\n\n"
+            if job_id in manager.jobs:
+                await manager.wait_for_change(job_id, seen, 15)
+            else:
+                await asyncio.sleep(1)  # running on another worker: follow the database
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.get('/api/metrics', response_model=Dict[str, Any])
 async def metrics_endpoint():
-    return spectra.metrics()
+    return _read_response(spectra.metrics())
 
 @app.post('/api/auto-model', response_model=Dict[str, Any])
 async def toggle_auto_model(req: ToggleAutoModelRequest):
@@ -864,17 +1343,63 @@ async def personality_reload():
     return {"personality_hash": spectra.personality_hash, "changed": str(changed).lower()}
 
 @app.get('/api/debug/state', response_model=Dict[str, Any])
-async def debug_state():
-    """Debug snapshot (no static caches – all values are current)."""
-    spectra.refresh_models()
+async def debug_state(allocations: int = Query(0, ge=0, le=100)):
+    """Debug snapshot (no static caches – all values are current).
+
+    `allocations` adds the top N tracemalloc allocation sites (SPECTRA_TRACEMALLOC_FRAMES).
+    """
+    await spectra.refresh_models()
     spectra._maybe_reload_personality()  # noqa: SLF001
     base = spectra.metrics()
     base.update({
         "auto_model_enabled": spectra.auto_model_enabled,
         "failed_models_count": len(spectra.failed_models),
         "preferred_model": spectra.preferred_model,
+        "startup": spectra.startup.snapshot(),
+        "worker_memory": shared_weights.worker_memory(),
     })
-    return base
+    accounting = memory_tracker.snapshot()
+    accounting["models"] = spectra.providers['huggingface'].memory_stats() if 'huggingface' in spectra.providers else {}
+    if allocations:
+        # A tracemalloc snapshot walks every traced block: keep it off the event loop
+        accounting["allocations"] = await get_executor("debug").run(memory_tracker.allocations, allocations)
+    base["memory_accounting"] = accounting
+    return _read_response(base)
+
+# Sampling profiler: disabled unless SPECTRA_PROFILE_TOKEN is set (sent as X-Debug-Token)
+PROFILE_TOKEN = os.getenv('SPECTRA_PROFILE_TOKEN', '')
+profiler = SamplingProfiler(
+    max_seconds=float(os.getenv('SPECTRA_PROFILE_MAX_SECONDS', '30')),
+    max_overhead=float(os.getenv('SPECTRA_PROFILE_MAX_OVERHEAD', '0.05')),
+)
+
+@app.get('/api/debug/profile')
+async def debug_profile(
+    request: Request,
+    seconds: float = Query(5.0, gt=0),
+    format: str = Query('collapsed', pattern='^(collapsed|speedscope)$'),
+    interval_ms: float = Query(10.0, ge=1, le=1000),
+    include_torch: bool = Query(False, alias='torch'),
+):
+    """Sample every thread's stack for `seconds`; collapsed stacks or speedscope JSON."""
+    if not PROFILE_TOKEN:
+        raise HTTPException(status_code=404, detail="profiling is disabled")
+    if not hmac.compare_digest(request.headers.get('x-debug-token', ''), PROFILE_TOKEN):
+        raise HTTPException(status_code=403, detail="invalid debug token")
+    # Own single-thread executor, so a capture never takes a provider's worker. Checked
+    # and submitted without an await in between: a second request fails instead of queueing.
+    executor = get_executor("profiler")
+    try:
+        if profiler.busy or executor.active or executor.queued:
+            raise ProfileBusy("a profile capture is already running")
+        profile = await executor.run(profiler.capture, seconds, interval_ms / 1000, include_torch)
+    except ProfileBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    summary = profile.summary()
+    headers = {"X-Profile-Samples": str(summary["samples"]), "X-Profile-Overhead": str(summary["overhead"])}
+    if format == 'speedscope':
+        return JSONResponse(profile.speedscope(), headers=headers)
+    return PlainTextResponse(profile.collapsed(), headers=headers)
 
 # Exception handlers
 @app.exception_handler(404)
@@ -897,17 +1422,25 @@ if __name__ == '__main__':
     
     print(f"🚀 Starting Spectra AI on {HOST}:{PORT}")
     print(f"🔧 Environment: {os.getenv('ENVIRONMENT', 'production')}")
-    print(f"🤖 Available providers: {spectra.available_providers}")
+    print(f"🤖 Provider priority: {spectra.provider_priority}")
     
-    logger.info("startup", host=HOST, port=PORT, available_providers=spectra.available_providers, log_format=os.getenv('SPECTRA_LOG_FORMAT', 'json'))
+    # Providers are built in the app lifespan (inside uvicorn), not here
+    logger.info("startup", host=HOST, port=PORT, provider_priority=spectra.provider_priority, log_format=os.getenv('SPECTRA_LOG_FORMAT', 'json'))
     
-    uvicorn.run(
-        "main:app",
-        host=HOST,
-        port=PORT,
-        reload=os.getenv('ENVIRONMENT') == 'development',
-        log_level="info"
-    )
+    WORKERS = int(os.getenv('SPECTRA_WORKERS', '1'))
+    if WORKERS > 1:
+        # Preload local models once, then fork workers that share the weight pages
+        import prefork
+        PRELOAD = [m.strip() for m in os.getenv('SPECTRA_PRELOAD_MODELS', '').split(',') if m.strip()]
+        prefork.serve("main:app", host=HOST, port=PORT, workers=WORKERS, preload_models=PRELOAD, log_level="info")
+    else:
+        uvicorn.run(
+            "main:app",
+            host=HOST,
+            port=PORT,
+            reload=os.getenv('ENVIRONMENT') == 'development',
+            log_level="info"
+        )
 
 # For Vercel deployment
 handler = app
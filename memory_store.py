@@ -0,0 +1,557 @@
+"""Retrieval-based long-term conversation memory.
+
+Every exchange (user message + reply) is embedded on the CPU and stored in
+an array-backed vector index; ``generate_response`` then injects only the
+few past exchanges most relevant to the new message, under a token budget,
+instead of relying on the last 10 history messages alone.
+
+ - Embedders: a small local sentence-embedding model (mean-pooled
+   transformers encoder, batched) or a dependency-free hashing embedder.
+ - Index: exact NumPy brute force (a matrix-vector product), switching to
+   an approximate index past SPECTRA_MEMORY_ANN_THRESHOLD vectors: HNSW
+   when hnswlib is installed, otherwise a NumPy IVF (spherical k-means
+   inverted lists). ANN structures are rebuilt from the vectors on open.
+ - Persistence: float32 vectors in a memory-mapped file, exchanges in an
+   append-only JSONL file, and the embedder name in meta.json (a different
+   embedder re-embeds the stored exchanges).
+ - Ingestion runs off the request path, in batches from a bounded queue.
+ - Namespaces are per user and only for verified users: ``user_id`` is
+   ``<id>.<signature>``, an HMAC-SHA256 of the id under
+   SPECTRA_MEMORY_USER_SECRET, issued by the authenticating service
+   (``sign_user_id``). Requests without a valid one neither recall nor
+   remember anything; there is no shared fallback namespace.
+
+numpy is imported here, so main.py imports this module only when
+SPECTRA_MEMORY is enabled; torch/transformers load with the embedding model.
+"""
+import asyncio
+import hashlib
+import hmac
+import importlib.util
+import json
+import math
+import os
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import structlog
+
+from executors import get_executor
+from latency_stats import RollingWindow
+from prompt_templates import estimate_tokens
+
+HNSWLIB_AVAILABLE = importlib.util.find_spec("hnswlib") is not None
+TRANSFORMERS_AVAILABLE = (
+    importlib.util.find_spec("torch") is not None
+    and importlib.util.find_spec("transformers") is not None
+)
+
+INDEX_KINDS = ("auto", "flat", "ivf", "hnsw")
+
+logger = structlog.get_logger()
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float32, copy=False)
+
+
+class HashingEmbedder:
+    """Signed feature hashing of words and word bigrams (no model, no dependencies)."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> Iterable[str]:
+        words = re.findall(r"\w+", text.lower())
+        yield from words
+        yield from (f"{a} {b}" for a, b in zip(words, words[1:]))
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+                vectors[row, h % self.dim] += 1.0 if h >> 63 else -1.0
+        return _normalize(vectors)
+
+
+class TransformerEmbedder:
+    """Mean-pooled sentence embeddings from a small local encoder, on the CPU."""
+
+    def __init__(self, model_name: str, batch_size: int = 32, max_length: int = 256):
+        self.name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self._lock = threading.Lock()
+        self._model: Any = None
+        self._tokenizer: Any = None
+
+    def _load(self) -> None:
+        with self._lock:
+            if self._model is None:
+                from transformers import AutoModel, AutoTokenizer
+                self._tokenizer = AutoTokenizer.from_pretrained(self.name)
+                self._model = AutoModel.from_pretrained(self.name).eval()
+
+    @property
+    def dim(self) -> int:
+        self._load()
+        return self._model.config.hidden_size
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        import torch
+
+        self._load()
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        # Similar lengths per batch keep padding (wasted compute) low
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            rows = order[start:start + self.batch_size]
+            encoded = self._tokenizer([texts[i] for i in rows], padding=True, truncation=True,
+                                      max_length=self.max_length, return_tensors="pt")
+            with torch.inference_mode():
+                hidden = self._model(**encoded).last_hidden_state
+            mask = encoded["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            vectors[rows] = pooled.float().numpy()
+        return _normalize(vectors)
+
+
+def create_embedder(spec: str) -> Any:
+    """``hashing`` / ``hashing:<dim>`` or a Hugging Face encoder model name."""
+    name, _, dim = spec.partition(":")
+    if name == "hashing":
+        return HashingEmbedder(int(dim) if dim else 384)
+    if not TRANSFORMERS_AVAILABLE:
+        logger.warning("memory_embedder_fallback", model=spec, reason="torch/transformers not installed")
+        return HashingEmbedder()
+    return TransformerEmbedder(spec)
+
+
+class VectorArray:
+    """Growable float32 row array; memory-mapped to a file when a path is given."""
+
+    def __init__(self, dim: int, path: Optional[Path] = None, capacity: int = 1024):
+        self.dim = dim
+        self.path = path
+        row_bytes = dim * 4
+        if path is not None and path.exists() and path.stat().st_size >= row_bytes:
+            self.rows: np.ndarray = np.memmap(path, dtype=np.float32, mode="r+",
+                                              shape=(path.stat().st_size // row_bytes, dim))
+        else:
+            self.rows = np.zeros((0, dim), dtype=np.float32)
+            self._resize(capacity)
+
+    def _resize(self, capacity: int) -> None:
+        if self.path is None:
+            rows = np.zeros((capacity, self.dim), dtype=np.float32)
+            rows[:len(self.rows)] = self.rows
+            self.rows = rows
+            return
+        if isinstance(self.rows, np.memmap):
+            self.rows.flush()
+        self.rows = np.zeros((0, self.dim), dtype=np.float32)  # drop the old mapping before growing the file
+        with open(self.path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self.rows = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def write(self, start: int, vectors: np.ndarray) -> None:
+        end = start + len(vectors)
+        if end > len(self.rows):
+            self._resize(max(end, 2 * len(self.rows)))
+        self.rows[start:end] = vectors
+        if isinstance(self.rows, np.memmap):
+            self.rows.flush()
+
+
+def _kmeans(data: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means (cosine) centroids of unit vectors."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        empty = np.flatnonzero(np.bincount(assign, minlength=k) == 0)
+        sums[empty] = data[rng.choice(len(data), len(empty))]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index: vectors bucketed by nearest k-means centroid, `nprobe` buckets searched."""
+
+    kind = "ivf"
+
+    def __init__(self, nprobe: int = 8, sample_size: int = 20000):
+        self.nprobe = nprobe
+        self.sample_size = sample_size
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.lists: List[List[int]] = []
+        self.size = 0
+        self.trained_size = 0
+
+    def build(self, vectors: np.ndarray) -> None:
+        n = len(vectors)
+        nlist = max(1, min(int(math.sqrt(n)), 4096))
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(n, min(n, self.sample_size), replace=False)] if n > self.sample_size else vectors
+        self.centroids = _kmeans(np.asarray(sample), nlist)
+        self.lists = [[] for _ in range(nlist)]
+        self.size = self.trained_size = 0
+        for start in range(0, n, 65536):
+            self.add(np.asarray(vectors[start:start + 65536]), range(start, min(start + 65536, n)))
+        self.trained_size = n
+
+    def add(self, vectors: np.ndarray, ids: Iterable[int]) -> None:
+        for row, centroid in zip(ids, np.argmax(vectors @ self.centroids.T, axis=1)):
+            self.lists[centroid].append(row)
+        self.size += len(vectors)
+
+    def needs_rebuild(self) -> bool:
+        # Centroids trained on a much smaller store leave the lists unbalanced
+        return self.size > 4 * self.trained_size
+
+    def search(self, vectors: np.ndarray, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        nprobe = min(self.nprobe, len(self.lists))
+        probe = np.argpartition(self.centroids @ query, -nprobe)[-nprobe:]
+        ids = np.fromiter((row for c in probe for row in self.lists[c]), dtype=np.int64)
+        if not len(ids):
+            return ids, np.zeros(0, dtype=np.float32)
+        scores = vectors[ids] @ query
+        top = np.argsort(-scores)[:k]
+        return ids[top], scores[top]
+
+
+class HNSWIndex:
+    """hnswlib HNSW graph over inner product (vectors are unit length, so cosine)."""
+
+    kind = "hnsw"
+
+    def __init__(self, dim: int, m: int = 16, ef_construction: int = 200, ef: int = 64):
+        self.dim = dim
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef = ef
+        self.index: Any = None
+        self.size = 0
+
+    def build(self, vectors: np.ndarray) -> None:
+        import hnswlib
+
+        self.index = hnswlib.Index(space="ip", dim=self.dim)
+        self.index.init_index(max_elements=max(2 * len(vectors), 1024), ef_construction=self.ef_construction, M=self.m)
+        self.index.set_ef(self.ef)
+        self.size = 0
+        self.add(np.asarray(vectors), range(len(vectors)))
+
+    def add(self, vectors: np.ndarray, ids: Iterable[int]) -> None:
+        needed = self.size + len(vectors)
+        if needed > self.index.get_max_elements():
+            self.index.resize_index(2 * needed)
+        self.index.add_items(vectors, np.fromiter(ids, dtype=np.int64))
+        self.size = needed
+
+    def needs_rebuild(self) -> bool:
+        return False
+
+    def search(self, vectors: np.ndarray, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, self.size)
+        if k == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        self.index.set_ef(max(self.ef, k))
+        labels, distances = self.index.knn_query(query, k=k)
+        return labels[0].astype(np.int64), 1.0 - distances[0]
+
+
+@dataclass
+class MemoryRecord:
+    namespace: str
+    user: str
+    assistant: str
+    created: float
+
+    def text(self) -> str:
+        return f"User: {self.user}\nAssistant: {self.assistant}"
+
+
+class MemoryStore:
+    """Exchanges and their embeddings, with exact or approximate top-k search per namespace."""
+
+    def __init__(self, embedder: Any, path: Optional[str] = None, index: str = "auto",
+                 ann_threshold: int = 20000, nprobe: int = 8):
+        if index not in INDEX_KINDS:
+            raise ValueError(f"unknown memory index: {index}")
+        self.embedder = embedder
+        self.path = Path(path) if path else None
+        self.index_kind = index
+        self.ann_threshold = ann_threshold
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self.records: List[MemoryRecord] = []
+        self._namespace_ids: Dict[str, int] = {}
+        self._namespaces = np.zeros(0, dtype=np.int32)
+        self.vectors: Optional[VectorArray] = None
+        self.ann: Any = None
+        self.reembedded = 0
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def open(self) -> None:
+        """Load persisted exchanges (re-embedding them if the embedder changed)."""
+        with self._lock:
+            if self.vectors is not None:
+                return
+            dim = self.embedder.dim
+            if self.path is None:
+                self.vectors = VectorArray(dim)
+                return
+            self.path.mkdir(parents=True, exist_ok=True)
+            meta_path = self.path / "meta.json"
+            meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+            records = self._read_records()
+            vectors_path = self.path / "vectors.f32"
+            stale = meta.get("embedder") != self.embedder.name or meta.get("dim") != dim
+            if stale and vectors_path.exists():
+                vectors_path.unlink()
+            self.vectors = VectorArray(dim, vectors_path)
+            if records and (stale or len(self.vectors.rows) < len(records)):
+                # Written by another embedder (or a torn write): rebuild the vectors from the text
+                for start in range(0, len(records), 256):
+                    batch = records[start:start + 256]
+                    self.vectors.write(start, self.embedder.embed([r.text() for r in batch]))
+                self.reembedded = len(records)
+                logger.info("memory_reembedded", records=len(records), embedder=self.embedder.name)
+            meta_path.write_text(json.dumps({"embedder": self.embedder.name, "dim": dim}))
+            self._append_index(records)
+            logger.info("memory_opened", path=str(self.path), records=len(records), index=self.active_index())
+
+    def _read_records(self) -> List[MemoryRecord]:
+        path = self.path / "records.jsonl"
+        if not path.exists():
+            return []
+        records = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(MemoryRecord(**json.loads(line)))
+                except (ValueError, TypeError):
+                    break  # torn final line
+        return records
+
+    def _append_index(self, records: List[MemoryRecord]) -> None:
+        start = len(self.records)
+        self.records.extend(records)
+        ids = [self._namespace_ids.setdefault(r.namespace, len(self._namespace_ids)) for r in records]
+        self._namespaces = np.concatenate([self._namespaces, np.asarray(ids, dtype=np.int32)])
+
+        n = len(self.records)
+        kind = self._wanted_index(n)
+        if kind == "flat":
+            self.ann = None
+        elif self.ann is None or self.ann.kind != kind or self.ann.needs_rebuild():
+            self.ann = HNSWIndex(self.vectors.dim) if kind == "hnsw" else IVFIndex(self.nprobe)
+            self.ann.build(self.vectors.rows[:n])
+        elif records:
+            self.ann.add(np.asarray(self.vectors.rows[start:n]), range(start, n))
+
+    def _wanted_index(self, n: int) -> str:
+        if self.index_kind == "auto":
+            if n < self.ann_threshold:
+                return "flat"
+            return "hnsw" if HNSWLIB_AVAILABLE else "ivf"
+        if self.index_kind == "hnsw" and not HNSWLIB_AVAILABLE:
+            return "ivf"
+        return self.index_kind
+
+    def active_index(self) -> str:
+        return self.ann.kind if self.ann is not None else "flat"
+
+    def add(self, records: List[MemoryRecord]) -> None:
+        """Embed (as one batch) and store exchanges."""
+        if not records:
+            return
+        self.open()
+        vectors = self.embedder.embed([r.text() for r in records])
+        with self._lock:
+            self.vectors.write(len(self.records), vectors)
+            if self.path is not None:
+                # Vectors first: a crash before this line only loses the unreferenced rows
+                with open(self.path / "records.jsonl", "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(asdict(r)) + "\n" for r in records))
+            self._append_index(records)
+
+    def search(self, namespace: str, query: str, k: int = 5) -> List[Tuple[MemoryRecord, float]]:
+        """Top-k exchanges in a namespace by cosine similarity to `query`."""
+        self.open()
+        if not self.records:
+            return []
+        q = self.embedder.embed([query])[0]
+        with self._lock:
+            namespace_id = self._namespace_ids.get(namespace)
+            if namespace_id is None:
+                return []
+            n = len(self.records)
+            rows = self.vectors.rows
+            if self.ann is not None:
+                # Oversample, then keep this namespace; fall back to exact search if that leaves too few
+                ids, scores = self.ann.search(rows, q, 4 * k)
+                keep = self._namespaces[ids] == namespace_id
+                ids, scores = ids[keep][:k], scores[keep][:k]
+                if len(ids) == k or len(ids) == np.count_nonzero(self._namespaces == namespace_id):
+                    return [(self.records[i], float(s)) for i, s in zip(ids, scores)]
+            scores = np.asarray(rows[:n] @ q)
+            scores[self._namespaces != namespace_id] = -np.inf
+            k = min(k, n)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self.records[i], float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+
+def sign_user_id(user_id: str, secret: str) -> str:
+    """The `user_id` value an authenticated session gets for `user_id`: ``<id>.<signature>``."""
+    signature = hmac.new(secret.encode("utf-8"), user_id.encode("utf-8"), hashlib.sha256).hexdigest()
+    return f"{user_id}.{signature}"
+
+
+def verified_user(signed: Optional[str], secret: str) -> Optional[str]:
+    """The user id from a value made by sign_user_id with `secret`; None when missing, unsigned or forged."""
+    if not signed or not secret:
+        return None
+    user_id, _, _ = signed.rpartition(".")
+    if user_id and hmac.compare_digest(sign_user_id(user_id, secret), signed):
+        return user_id
+    return None
+
+
+class ConversationMemory:
+    """Memory store plus background ingestion, budgeted recall and metrics."""
+
+    def __init__(self, store: MemoryStore, top_k: int = 5, token_budget: int = 400, min_score: float = 0.3,
+                 queue_size: int = 1000, batch_size: int = 32, max_chars: int = 1000, user_secret: str = ""):
+        self.store = store
+        self.user_secret = user_secret
+        self.unverified = 0
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self.min_score = min_score
+        self.batch_size = batch_size
+        self.max_chars = max_chars
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.executor = get_executor("memory")
+        self.retrieval = RollingWindow(200)
+        self.ingestion = RollingWindow(200)
+        self.recalls = 0
+        self.injected = 0
+        self.injected_tokens = 0
+        self.ingested = 0
+        self.dropped = 0
+        self.failed = 0
+
+    @classmethod
+    def from_env(cls) -> "ConversationMemory":
+        store = MemoryStore(
+            create_embedder(os.getenv('SPECTRA_MEMORY_EMBEDDER', 'sentence-transformers/all-MiniLM-L6-v2')),
+            path=os.getenv('SPECTRA_MEMORY_DIR', '.spectra_memory') or None,
+            index=os.getenv('SPECTRA_MEMORY_INDEX', 'auto').lower(),
+            ann_threshold=int(os.getenv('SPECTRA_MEMORY_ANN_THRESHOLD', '20000')),
+        )
+        if not os.getenv('SPECTRA_MEMORY_USER_SECRET'):
+            logger.warning("memory_user_secret_missing",
+                           detail="SPECTRA_MEMORY_USER_SECRET is unset: no request can use long-term memory")
+        return cls(
+            store,
+            top_k=int(os.getenv('SPECTRA_MEMORY_TOP_K', '5')),
+            token_budget=int(os.getenv('SPECTRA_MEMORY_TOKEN_BUDGET', '400')),
+            min_score=float(os.getenv('SPECTRA_MEMORY_MIN_SCORE', '0.3')),
+            user_secret=os.getenv('SPECTRA_MEMORY_USER_SECRET', ''),
+        )
+
+    def namespace(self, user_id: Optional[str]) -> Optional[str]:
+        """Memory namespace for a request's signed `user_id`; None (no memory) unless it verifies."""
+        namespace = verified_user(user_id, self.user_secret)
+        if namespace is None:
+            self.unverified += 1
+        return namespace
+
+    def remember(self, namespace: str, user: str, assistant: str) -> bool:
+        """Queue an exchange for ingestion; never blocks the request (drops when full)."""
+        record = MemoryRecord(namespace, user[:self.max_chars], assistant[:self.max_chars], time.time())
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def run(self) -> None:
+        """Ingestion worker: embeds queued exchanges in batches, in a thread."""
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            start = time.perf_counter()
+            try:
+                await self.executor.run(self.store.add, batch)
+                self.ingested += len(batch)
+                self.ingestion.record(time.perf_counter() - start)
+            except Exception as e:  # noqa: BLE001 - keep the worker alive
+                self.failed += len(batch)
+                logger.warning("memory_ingest_failed", records=len(batch), error=str(e))
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def recall(self, namespace: str, query: str, exclude: Iterable[str] = ()) -> List[MemoryRecord]:
+        """Most relevant past exchanges that fit the token budget (skipping ones already in `exclude`)."""
+        start = time.perf_counter()
+        hits = await self.executor.run(self.store.search, namespace, query, self.top_k)
+        self.retrieval.record(time.perf_counter() - start)
+        self.recalls += 1
+
+        excluded = set(exclude)
+        selected, used = [], 0
+        for record, score in hits:
+            if score < self.min_score or record.user in excluded:
+                continue
+            tokens = estimate_tokens(record.text())
+            if used + tokens > self.token_budget:
+                continue
+            selected.append(record)
+            used += tokens
+        self.injected += len(selected)
+        self.injected_tokens += used
+        return selected
+
+    @staticmethod
+    def render(records: List[MemoryRecord]) -> str:
+        lines = ["Relevant moments from earlier conversations with the user (use them naturally, if they help):"]
+        for record in records:
+            day = time.strftime("%Y-%m-%d", time.gmtime(record.created))
+            lines.append(f"- [{day}] User: {record.user}\n  You: {record.assistant}")
+        return "\n".join(lines)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "records": len(self.store),
+            "embedder": self.store.embedder.name,
+            "index": self.store.active_index(),
+            "queue_depth": self.queue.qsize(),
+            "ingested": self.ingested,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "unverified_requests": self.unverified,
+            "recalls": self.recalls,
+            "injected": self.injected,
+            "injected_tokens": self.injected_tokens,
+            "retrieval": self.retrieval.snapshot(),
+            "ingestion_batch": self.ingestion.snapshot(),
+        }
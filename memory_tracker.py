@@ -0,0 +1,260 @@
+"""Memory accounting and growth tracking for long-running workers.
+
+``/api/debug/state`` reports under ``memory_accounting``:
+
+ - process RSS and peak RSS (and CUDA allocator totals when torch is in use);
+ - bytes held by each cached model's parameters and buffers;
+ - the size of long-lived structures (failed models, caches, job and route
+   tables), each registered with ``MemoryTracker.track``, against the size
+   seen at startup;
+ - with SPECTRA_TRACEMALLOC_FRAMES set, the top allocating lines and the
+   lines whose allocations grew most since tracing started
+   (``?allocations=N``).
+
+A sampler reads RSS and the structure sizes every
+SPECTRA_MEMORY_SAMPLE_INTERVAL seconds (a procfs read and a few ``len()``
+calls) and logs ``memory_growth`` when RSS grows by SPECTRA_MEMORY_GROWTH_MB
+or a structure by SPECTRA_MEMORY_GROWTH_ITEMS since the last warning.
+"""
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+MB = 1024 * 1024
+
+
+def _mb(size: float) -> float:
+    return round(size / MB, 1)
+
+
+def process_memory() -> Dict[str, Optional[float]]:
+    """Resident set size and its peak, in MB (peak only where procfs is missing)."""
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return {"rss_mb": _mb(int(fields["VmRSS"].split()[0]) * 1024),
+                "peak_rss_mb": _mb(int(fields["VmHWM"].split()[0]) * 1024)}
+    except (OSError, KeyError, ValueError):
+        import resource  # Unix only
+
+        # ru_maxrss is in KB on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"rss_mb": None, "peak_rss_mb": _mb(peak if sys.platform == "darwin" else peak * 1024)}
+
+
+def cuda_memory() -> Dict[str, Any]:
+    """CUDA allocator totals per device; empty unless torch is already imported and sees a GPU."""
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_available():
+        return {}
+    return {
+        f"cuda:{device}": {
+            "allocated_mb": _mb(torch.cuda.memory_allocated(device)),
+            "reserved_mb": _mb(torch.cuda.memory_reserved(device)),
+            "peak_allocated_mb": _mb(torch.cuda.max_memory_allocated(device)),
+        }
+        for device in range(torch.cuda.device_count())
+    }
+
+
+def model_memory(model: Any) -> Dict[str, Any]:
+    """Bytes held by a torch module's parameters and buffers (tied weights counted once).
+
+    Models without ``parameters()`` (ONNX Runtime sessions) report only their type.
+    """
+    if not callable(getattr(model, "parameters", None)):
+        return {"type": type(model).__name__}
+    parameters = parameter_bytes = buffer_bytes = 0
+    dtypes: Dict[str, int] = {}
+    devices = set()
+    for tensor in model.parameters():
+        size = tensor.numel() * tensor.element_size()
+        parameters += tensor.numel()
+        parameter_bytes += size
+        dtype = str(tensor.dtype).replace("torch.", "")
+        dtypes[dtype] = dtypes.get(dtype, 0) + size
+        devices.add(str(tensor.device))
+    for tensor in model.buffers():
+        buffer_bytes += tensor.numel() * tensor.element_size()
+    return {
+        "type": type(model).__name__,
+        "parameters": parameters,
+        "parameter_bytes": parameter_bytes,
+        "buffer_bytes": buffer_bytes,
+        "total_mb": _mb(parameter_bytes + buffer_bytes),
+        "dtypes_mb": {dtype: _mb(size) for dtype, size in sorted(dtypes.items())},
+        "devices": sorted(devices),
+    }
+
+
+def _traceback(stat: Any) -> str:
+    frame = stat.traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+class MemoryTracker:
+    """Structure sizes and RSS, sampled periodically, with growth warnings and tracemalloc reports."""
+
+    def __init__(self, interval: float = 60.0, growth_mb: float = 256.0, growth_items: int = 1000,
+                 tracemalloc_frames: int = 0, history: int = 60,
+                 reader: Callable[[], Dict[str, Optional[float]]] = process_memory):
+        self.interval = interval
+        self.growth_mb = growth_mb
+        self.growth_items = growth_items
+        self.tracemalloc_frames = tracemalloc_frames
+        self.reader = reader
+        self.structures: Dict[str, Callable[[], int]] = {}
+        self.initial: Dict[str, int] = {}
+        self.peak: Dict[str, int] = {}
+        self._baseline: Dict[str, float] = {}
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self.warnings: Deque[Dict[str, Any]] = deque(maxlen=20)
+        self.samples = 0
+        self.warning_count = 0
+        self.sample_seconds = 0.0
+        self._tracemalloc_base: Optional[tracemalloc.Snapshot] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls) -> "MemoryTracker":
+        return cls(
+            interval=float(os.getenv('SPECTRA_MEMORY_SAMPLE_INTERVAL', '60')),
+            growth_mb=float(os.getenv('SPECTRA_MEMORY_GROWTH_MB', '256')),
+            growth_items=int(os.getenv('SPECTRA_MEMORY_GROWTH_ITEMS', '1000')),
+            tracemalloc_frames=int(os.getenv('SPECTRA_TRACEMALLOC_FRAMES', '0')),
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def track(self, name: str, size: Callable[[], int]) -> None:
+        """Register a long-lived structure by a callable returning its current size."""
+        self.structures[name] = size
+
+    def start(self) -> None:
+        """Take the first sample and start the sampler (interval <= 0 samples on demand only)."""
+        if self.tracemalloc_frames > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(self.tracemalloc_frames)
+            self._tracemalloc_base = tracemalloc.take_snapshot()
+        self.sample()
+        if self.interval > 0 and not self.running:
+            self._task = asyncio.get_running_loop().create_task(self._sampler())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._tracemalloc_base is not None:
+            tracemalloc.stop()
+            self._tracemalloc_base = None
+
+    async def _sampler(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.sample()
+            except Exception as e:  # noqa: BLE001 - keep the sampler alive
+                logger.warning("memory_sample_failed", error=str(e))
+
+    def _sizes(self) -> Dict[str, int]:
+        sizes = {}
+        for name, size in self.structures.items():
+            try:
+                sizes[name] = size()
+            except Exception:  # noqa: BLE001 - a structure that went away reads as empty
+                sizes[name] = 0
+        return sizes
+
+    def sample(self) -> Dict[str, Any]:
+        """Record RSS and structure sizes; warn on growth past the thresholds since the last warning."""
+        start = time.perf_counter()
+        rss = self.reader().get("rss_mb")
+        sizes = self._sizes()
+        for name, size in sizes.items():
+            self.initial.setdefault(name, size)
+            self._baseline.setdefault(name, size)
+            self.peak[name] = max(self.peak.get(name, 0), size)
+        grown: Dict[str, float] = {}
+        if rss is not None:
+            self._baseline.setdefault("rss_mb", rss)
+            if rss - self._baseline["rss_mb"] >= self.growth_mb:
+                grown["rss_mb"] = round(rss - self._baseline["rss_mb"], 1)
+                self._baseline["rss_mb"] = rss
+        for name, size in sizes.items():
+            if size - self._baseline[name] >= self.growth_items:
+                grown[name] = size - self._baseline[name]
+                self._baseline[name] = size
+        sample = {"at": datetime.now(timezone.utc).isoformat(), "rss_mb": rss, "sizes": sizes}
+        self.history.append(sample)
+        self.samples += 1
+        if grown:
+            self.warning_count += 1
+            self.warnings.append({"at": sample["at"], "rss_mb": rss, "grown": grown})
+            logger.warning("memory_growth", rss_mb=rss, grown=grown)
+        self.sample_seconds += time.perf_counter() - start
+        return sample
+
+    def allocations(self, limit: int = 10) -> Dict[str, Any]:
+        """Top allocating lines now, and the lines that grew most since tracing started.
+
+        Taking a snapshot walks every traced block: run it off the event loop.
+        """
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        report: Dict[str, Any] = {
+            "tracing": True,
+            "traced_mb": _mb(current),
+            "traced_peak_mb": _mb(peak),
+            "top": [{"line": _traceback(stat), "size_kb": round(stat.size / 1024, 1), "blocks": stat.count}
+                    for stat in snapshot.statistics("lineno")[:limit]],
+        }
+        if self._tracemalloc_base is not None:
+            diff = snapshot.compare_to(self._tracemalloc_base, "lineno")
+            report["growth"] = [{"line": _traceback(stat), "size_diff_kb": round(stat.size_diff / 1024, 1),
+                                 "blocks_diff": stat.count_diff}
+                                for stat in diff[:limit] if stat.size_diff > 0]
+        return report
+
+    def snapshot(self) -> Dict[str, Any]:
+        sizes = self._sizes()
+        recent: List[Dict[str, Any]] = list(self.warnings)[-5:]
+        return {
+            "process": self.reader(),
+            "cuda": cuda_memory(),
+            "structures": {
+                name: {"size": size, "initial": self.initial.get(name, size),
+                       "growth": size - self.initial.get(name, size), "peak": max(self.peak.get(name, 0), size)}
+                for name, size in sizes.items()
+            },
+            "sampler": {
+                "running": self.running,
+                "interval_s": self.interval,
+                "samples": self.samples,
+                "avg_sample_ms": round(self.sample_seconds / self.samples * 1000, 3) if self.samples else None,
+                "rss_trend_mb": [sample["rss_mb"] for sample in self.history],
+                "growth_mb": self.growth_mb,
+                "growth_items": self.growth_items,
+                "warnings": self.warning_count,
+                "recent_warnings": recent,
+            },
+            "tracemalloc": tracemalloc.is_tracing(),
+        }
@@ -0,0 +1,88 @@
+"""Preload-then-fork server for running several uvicorn workers on shared weights.
+
+uvicorn's own ``workers=N`` spawns fresh interpreters, so each worker loads
+its own copy of every local model. Here the master process preloads the
+models in SPECTRA_PRELOAD_MODELS (mmapped safetensors, see shared_weights.py),
+binds the listening socket, and then forks the workers. Each worker serves
+the same ``main:app`` on the inherited socket, and HuggingFaceProvider
+picks up the preloaded models instead of loading them again.
+
+The master only supervises: it forwards SIGINT/SIGTERM to the workers and
+re-forks any worker that dies unexpectedly.
+"""
+import os
+import signal
+import time
+from typing import Dict, List
+
+import structlog
+import uvicorn
+
+import shared_weights
+
+logger = structlog.get_logger()
+
+
+def _run_worker(config: uvicorn.Config, sock, index: int) -> None:
+    """Worker process body: never returns."""
+    code = 0
+    try:
+        os.environ["SPECTRA_WORKER_INDEX"] = str(index)  # selects this worker's cores (cpu_slots.py)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        shared_weights.after_fork()
+        uvicorn.Server(config).run(sockets=[sock])
+    except BaseException:  # noqa: BLE001 - a worker must never fall back into the master loop
+        logger.exception("prefork_worker_crashed", pid=os.getpid())
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def serve(app: str, host: str, port: int, workers: int, preload_models: List[str],
+          log_level: str = "info") -> None:
+    """Preload models, bind, fork `workers` uvicorn workers and supervise them."""
+    if preload_models:
+        shared_weights.preload(preload_models)
+
+    config = uvicorn.Config(app, host=host, port=port, log_level=log_level)
+    sock = config.bind_socket()
+    children: Dict[int, int] = {}  # pid -> worker index
+    stopping = False
+
+    def fork(index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(config, sock, index)
+        children[pid] = index
+        logger.info("prefork_worker_started", worker=index, pid=pid)
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for index in range(workers):
+        fork(index)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = children.pop(pid, None)
+        if index is None:
+            continue
+        if not stopping:
+            logger.warning("prefork_worker_exited", worker=index, pid=pid, status=status)
+            time.sleep(0.5)  # don't spin if workers crash on start
+            fork(index)
+    sock.close()
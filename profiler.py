@@ -0,0 +1,224 @@
+"""On-demand sampling profiler for live instances (`/api/debug/profile`).
+
+A capture samples every thread's Python stack (``sys._current_frames``) for
+a few seconds: the event loop, the per-provider executor threads running
+local generation and any ``asyncio.to_thread`` workers. Stacks are
+aggregated per thread and exported as collapsed stacks (flamegraph.pl,
+speedscope, inferno) or speedscope JSON, weighted in microseconds.
+
+Overhead is bounded: the sampler measures its own CPU time and doubles its
+interval whenever it exceeds the overhead budget, captures are capped in
+length, and only one capture runs at a time. Optionally the torch profiler
+records ATen operators on all threads for the same window (only when torch
+is already loaded); operators are added as extra stacks weighted by their
+self CPU time.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+Frame = Tuple[str, str, int]  # function, file, first line
+
+MIN_INTERVAL = 0.001
+MAX_STACK_DEPTH = 128
+MAX_TORCH_EVENTS = 500_000
+
+
+class ProfileBusy(RuntimeError):
+    """Another capture is already running."""
+
+
+def _frame(code: Any) -> Frame:
+    path = code.co_filename
+    short = os.sep.join(path.split(os.sep)[-2:]) if os.sep in path else path
+    return code.co_name, short, code.co_firstlineno
+
+
+def _stack(frame: Any) -> Tuple[Frame, ...]:
+    """Stack from the outermost frame to `frame`."""
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        stack.append(_frame(frame.f_code))
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+class Profile:
+    """Aggregated stacks of one capture, weighted in microseconds."""
+
+    def __init__(self) -> None:
+        self.stacks: Counter = Counter()  # (thread, frames) -> microseconds
+        self.samples = 0
+        self.duration = 0.0
+        self.interval = 0.0
+        self.overhead = 0.0
+        self.torch: Dict[str, Any] = {"included": False}
+
+    def add(self, thread: str, stack: Tuple[Frame, ...], weight_us: float) -> None:
+        self.stacks[(thread, stack)] += weight_us
+
+    @staticmethod
+    def _name(frame: Frame) -> str:
+        function, path, line = frame
+        return f"{function} ({path}:{line})" if path else function
+
+    def collapsed(self) -> str:
+        """``thread;outer;...;inner <microseconds>`` lines."""
+        lines = []
+        for (thread, stack), weight in sorted(self.stacks.items(), key=lambda item: -item[1]):
+            names = [thread.replace(";", ":")] + [self._name(frame).replace(";", ":") for frame in stack]
+            lines.append(f"{';'.join(names)} {round(weight)}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self) -> Dict[str, Any]:
+        """speedscope file format: one sampled profile per thread."""
+        frames: List[Dict[str, Any]] = []
+        index: Dict[Frame, int] = {}
+        profiles: Dict[str, Dict[str, Any]] = {}
+        for (thread, stack), weight in self.stacks.items():
+            ids = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    function, path, line = frame
+                    frames.append({"name": function, "file": path, "line": line} if path else {"name": function})
+                ids.append(index[frame])
+            profile = profiles.setdefault(thread, {
+                "type": "sampled", "name": thread, "unit": "microseconds",
+                "startValue": 0, "endValue": 0, "samples": [], "weights": [],
+            })
+            profile["samples"].append(ids)
+            profile["weights"].append(round(weight))
+            profile["endValue"] += round(weight)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"spectra {self.duration:.1f}s profile",
+            "exporter": "spectra-profiler",
+            "shared": {"frames": frames},
+            "profiles": sorted(profiles.values(), key=lambda p: -p["endValue"]),
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "samples": self.samples,
+            "duration_s": round(self.duration, 3),
+            "final_interval_ms": round(self.interval * 1000, 2),
+            "overhead": round(self.overhead, 4),
+            "threads": len({thread for thread, _ in self.stacks}),
+            "torch": self.torch,
+        }
+
+
+class SamplingProfiler:
+    """Samples all threads' stacks; one capture at a time."""
+
+    def __init__(self, max_seconds: float = 30.0, max_overhead: float = 0.05):
+        self.max_seconds = max_seconds
+        self.max_overhead = max_overhead
+        self._lock = threading.Lock()
+        self.captures = 0
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def capture(self, seconds: float, interval: float = 0.01, include_torch: bool = False) -> Profile:
+        """Profile for `seconds` (blocking: run it on a worker thread)."""
+        if not self._lock.acquire(blocking=False):
+            raise ProfileBusy("a profile capture is already running")
+        try:
+            self.captures += 1
+            seconds = min(max(seconds, 0.0), self.max_seconds)
+            interval = max(interval, MIN_INTERVAL)
+            torch_profile = self._start_torch() if include_torch else None
+            try:
+                profile = self._sample(seconds, interval)
+            finally:
+                if torch_profile is not None:
+                    torch_profile.__exit__(None, None, None)
+            if include_torch:
+                self._add_torch(profile, torch_profile)
+            logger.info("profile_captured", **{k: v for k, v in profile.summary().items() if k != "torch"})
+            return profile
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds: float, interval: float) -> Profile:
+        profile = Profile()
+        me = threading.get_ident()
+        start = last = time.perf_counter()
+        cpu_start = time.thread_time()
+        deadline = start + seconds
+        while True:
+            time.sleep(min(interval, max(deadline - time.perf_counter(), 0.0)))
+            now = time.perf_counter()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            weight = (now - last) * 1e6
+            last = now
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    profile.add(names.get(ident, f"thread-{ident}"), _stack(frame), weight)
+            profile.samples += 1
+            elapsed = now - start
+            overhead = (time.thread_time() - cpu_start) / elapsed
+            if overhead > self.max_overhead:
+                interval = min(interval * 2, 1.0)
+            if now >= deadline:
+                break
+        profile.duration = time.perf_counter() - start
+        profile.interval = interval
+        profile.overhead = (time.thread_time() - cpu_start) / profile.duration
+        return profile
+
+    @staticmethod
+    def _start_torch() -> Optional[Any]:
+        if "torch" not in sys.modules:  # don't pay for importing torch just to find nothing
+            return None
+        from torch.profiler import ProfilerActivity, _ExperimentalConfig, profile
+
+        try:
+            config = _ExperimentalConfig(profile_all_threads=True)
+        except TypeError:  # older torch: would only see this (idle) thread
+            return None
+        torch_profile = profile(activities=[ProfilerActivity.CPU], experimental_config=config)
+        torch_profile.__enter__()
+        return torch_profile
+
+    @staticmethod
+    def _add_torch(profile: Profile, torch_profile: Optional[Any]) -> None:
+        if torch_profile is None:
+            profile.torch = {"included": False, "reason": "torch not loaded or too old"}
+            return
+        # Raw kineto events: building FunctionEvents is ~30x slower on long captures
+        events = torch_profile.profiler.kineto_results.events()
+        by_thread: Dict[int, List[Tuple[int, int, str]]] = defaultdict(list)
+        for event in events[:MAX_TORCH_EVENTS]:
+            by_thread[event.start_thread_id()].append((event.start_ns(), event.end_ns(), event.name()))
+        for thread, spans in by_thread.items():
+            # Rebuild nesting per thread; each operator is weighted by its self time
+            spans.sort(key=lambda span: (span[0], -span[1]))
+            open_spans: List[List[Any]] = []  # [end, name, child_ns, duration]
+
+            def close() -> None:
+                end, name, child_ns, duration = open_spans[-1]
+                stack = tuple((span[1], "", 0) for span in open_spans)
+                open_spans.pop()
+                if duration > child_ns:
+                    profile.add(f"torch ops (thread {thread})", stack, (duration - child_ns) / 1000)
+
+            for start, end, name in spans:
+                while open_spans and open_spans[-1][0] <= start:
+                    close()
+                if open_spans:
+                    open_spans[-1][2] += end - start
+                open_spans.append([end, name, 0, end - start])
+            while open_spans:
+                close()
+        profile.torch = {"included": True, "events": len(events), "truncated": len(events) > MAX_TORCH_EVENTS}
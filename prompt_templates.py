@@ -0,0 +1,318 @@
+"""Compiled prompt templates for local (Hugging Face) models.
+
+A template is compiled once per model (from the tokenizer's chat template
+when it has one, otherwise from the built-in per-family format) into fixed
+role markers. Prompts are then rendered with a single join, and token IDs
+are assembled from cached, pre-tokenized turn segments instead of
+re-tokenizing the whole prompt on every request.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Probe strings used to discover a chat template's role markers.
+_SYS, _USER, _USER2, _ASSISTANT = "SPECTRAPROBESYS", "SPECTRAPROBEUSER", "SPECTRAPROBESECOND", "SPECTRAPROBEASSISTANT"
+
+# Conversation used to verify that a compiled template reproduces its source.
+_VERIFY_MESSAGES = [
+    {"role": "system", "content": "You are Spectra."},
+    {"role": "user", "content": "Hello there"},
+    {"role": "assistant", "content": "Hi! How are you feeling?"},
+    {"role": "user", "content": "A little tired, honestly."},
+    {"role": "assistant", "content": "That makes sense."},
+    {"role": "user", "content": "Can you write me a short poem?"},
+]
+
+
+def model_family(model: str) -> str:
+    """Map a model name to a built-in prompt family."""
+    name = model.lower()
+    if "mistral" in name:
+        return "mistral"
+    if "llama" in name:
+        return "llama"
+    return "default"
+
+
+class CompiledTemplate:
+    """A prompt format reduced to constant role markers.
+
+    ``first_user_prefix`` opens the conversation, and when a system prompt is
+    present it is wrapped as ``system_prefix + system + system_infix`` in
+    front of the first user message. Every message becomes one turn segment.
+    """
+
+    def __init__(self, name: str, *, first_user_prefix: str, user_prefix: str, user_suffix: str,
+                 assistant_prefix: str, assistant_suffix: str,
+                 system_prefix: Optional[str] = None, system_infix: str = "",
+                 generation_prompt: str = "", system_in_user: Optional[str] = None,
+                 system_standalone: Optional[str] = None):
+        self.name = name
+        self.first_user_prefix = first_user_prefix
+        self.user_prefix = user_prefix
+        self.user_suffix = user_suffix
+        self.assistant_prefix = assistant_prefix
+        self.assistant_suffix = assistant_suffix
+        self.system_prefix = system_prefix
+        self.system_infix = system_infix
+        self.generation_prompt = generation_prompt
+        # Templates without a system role get the system prompt merged into the
+        # first user message using this separator.
+        self.system_in_user = system_in_user
+        # Formats with a standalone system line put it in its own leading segment.
+        self.system_standalone = system_standalone
+
+    def segments(self, messages: Sequence[Dict[str, str]], add_generation_prompt: bool = True) -> List[str]:
+        """Render messages into independent turn segments."""
+        system = None
+        turns: List[Tuple[str, str]] = []
+        for message in messages:
+            role = message.get("role", "")
+            if role == "system":
+                system = message.get("content", "")
+            elif role in ("user", "assistant"):
+                turns.append((role, message.get("content", "")))
+
+        segments: List[str] = []
+        first_user = True
+        for role, content in turns:
+            if role == "user":
+                if first_user:
+                    first_user = False
+                    if system and self.system_standalone is not None:
+                        segments.append(f"{self.first_user_prefix}{content}{self.user_suffix}")
+                    elif system and self.system_in_user is not None:
+                        segments.append(f"{self.first_user_prefix}{system}{self.system_in_user}{content}{self.user_suffix}")
+                    elif system and self.system_prefix is not None:
+                        segments.append(f"{self.system_prefix}{system}{self.system_infix}{content}{self.user_suffix}")
+                    else:
+                        segments.append(f"{self.first_user_prefix}{content}{self.user_suffix}")
+                else:
+                    segments.append(f"{self.user_prefix}{content}{self.user_suffix}")
+            else:
+                segments.append(f"{self.assistant_prefix}{content}{self.assistant_suffix}")
+
+        if system and self.system_standalone is not None and segments:
+            segments.insert(0, self.system_standalone.format(system=system))
+        if add_generation_prompt and self.generation_prompt and segments:
+            segments.append(self.generation_prompt)
+        return segments
+
+    def render(self, messages: Sequence[Dict[str, str]], add_generation_prompt: bool = True) -> str:
+        """Render messages into a single prompt string."""
+        return "".join(self.segments(messages, add_generation_prompt))
+
+    def stop_sequences(self) -> List[str]:
+        """Text marking the end of the assistant's turn: its end-of-turn marker and the next turn's opener."""
+        stops = {self.assistant_suffix.strip(), (self.assistant_suffix + self.user_prefix).lstrip(" ").rstrip()}
+        # Plain-text role lines that models invent after their answer, whatever the format
+        stops.update(_ROLE_LINES)
+        stops.discard("")
+        # A stop containing another stop never matches first
+        return sorted(stop for stop in stops if not any(other != stop and other in stop for other in stops))
+
+
+_ROLE_LINES = ("\nUser:", "\nSystem:")
+
+# Built-in formats (identical output to the historical string-building code).
+_BUILTIN = {
+    "mistral": dict(first_user_prefix="<s>[INST] ", user_prefix="<s>[INST] ", user_suffix=" [/INST]",
+                    assistant_prefix=" ", assistant_suffix=" </s>",
+                    system_prefix="<s>[INST] ", system_infix="\n\n "),
+    "llama": dict(first_user_prefix="<s>[INST] ", user_prefix="<s>[INST] ", user_suffix=" [/INST]",
+                  assistant_prefix=" ", assistant_suffix=" </s>",
+                  system_prefix="<s>[INST] <<SYS>>\n", system_infix="\n<</SYS>>\n\n "),
+    "default": dict(first_user_prefix="User: ", user_prefix="User: ", user_suffix="\n",
+                    assistant_prefix="Assistant: ", assistant_suffix="\n",
+                    system_standalone="System: {system}\n"),
+}
+
+
+def builtin_template(model: str) -> CompiledTemplate:
+    """Built-in template for a model's family."""
+    family = model_family(model)
+    return CompiledTemplate(f"builtin:{family}", **_BUILTIN[family])
+
+
+def _render_chat_template(tokenizer: Any, messages: List[Dict[str, str]], add_generation_prompt: bool) -> str:
+    return tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=add_generation_prompt)
+
+
+def _after(text: str, marker: str) -> str:
+    return text[text.index(marker) + len(marker):]
+
+
+def compile_chat_template(tokenizer: Any) -> Optional[CompiledTemplate]:
+    """Compile a tokenizer's chat template into constant role markers.
+
+    Returns None when the tokenizer has no chat template or its template is
+    not expressible as constant markers (verified against a probe conversation).
+    """
+    if not getattr(tokenizer, "chat_template", None):
+        return None
+    try:
+        user = [{"role": "user", "content": _USER}]
+        t_u = _render_chat_template(tokenizer, user, False)
+        t_ua = _render_chat_template(tokenizer, user + [{"role": "assistant", "content": _ASSISTANT}], False)
+        t_uau = _render_chat_template(tokenizer, user + [
+            {"role": "assistant", "content": _ASSISTANT}, {"role": "user", "content": _USER2}], False)
+        t_u_gen = _render_chat_template(tokenizer, user, True)
+
+        first_user_prefix = t_u[:t_u.index(_USER)]
+        user_suffix = _after(t_u, _USER)
+        after_user = _after(t_ua, _USER)
+        if not after_user.startswith(user_suffix):
+            return None
+        assistant_prefix = after_user[len(user_suffix):after_user.index(_ASSISTANT)]
+        assistant_suffix = _after(t_ua, _ASSISTANT)
+        after_assistant = _after(t_uau, _ASSISTANT)
+        if not after_assistant.startswith(assistant_suffix):
+            return None
+        user_prefix = after_assistant[len(assistant_suffix):after_assistant.index(_USER2)]
+        generation_prompt = t_u_gen[len(t_u):] if t_u_gen.startswith(t_u) else ""
+
+        system_prefix: Optional[str] = None
+        system_infix = ""
+        system_in_user: Optional[str] = None
+        try:
+            t_su = _render_chat_template(tokenizer, [{"role": "system", "content": _SYS}] + user, False)
+            system_prefix = t_su[:t_su.index(_SYS)]
+            system_infix = t_su[t_su.index(_SYS) + len(_SYS):t_su.index(_USER)]
+        except Exception:  # noqa: BLE001 - template rejects the system role
+            system_in_user = "\n\n"
+
+        compiled = CompiledTemplate(
+            "chat_template",
+            first_user_prefix=first_user_prefix, user_prefix=user_prefix, user_suffix=user_suffix,
+            assistant_prefix=assistant_prefix, assistant_suffix=assistant_suffix,
+            system_prefix=system_prefix, system_infix=system_infix,
+            generation_prompt=generation_prompt, system_in_user=system_in_user,
+        )
+        expected = _render_chat_template(tokenizer, _template_messages(_VERIFY_MESSAGES, compiled), True)
+        if compiled.render(_VERIFY_MESSAGES) != expected:
+            return None
+        return compiled
+    except Exception:  # noqa: BLE001 - any probe failure means "not compilable"
+        return None
+
+
+def _template_messages(messages: Sequence[Dict[str, str]], compiled: Optional[CompiledTemplate]) -> List[Dict[str, str]]:
+    """Messages as the source chat template should see them (system merged if unsupported)."""
+    result = [dict(m) for m in messages if m.get("role") in ("system", "user", "assistant")]
+    if compiled is None or compiled.system_in_user is None:
+        return result
+    system = None
+    merged: List[Dict[str, str]] = []
+    for message in result:
+        if message["role"] == "system":
+            system = message["content"]
+        else:
+            merged.append(message)
+    for message in merged:
+        if message["role"] == "user" and system:
+            message["content"] = f"{system}{compiled.system_in_user}{message['content']}"
+            break
+    return merged
+
+
+class TokenAssembler:
+    """Assemble prompt token IDs from cached, pre-tokenized turn segments.
+
+    The cache is keyed by a hash of each segment's text, so the system prompt,
+    role markers and previously seen messages are tokenized once. On creation
+    the assembler checks that segment-wise tokenization matches whole-prompt
+    tokenization for this tokenizer; if it does not, it falls back to
+    tokenizing the rendered prompt in one call.
+    """
+
+    def __init__(self, tokenizer: Any, template: CompiledTemplate, cache_size: int = 4096):
+        self.tokenizer = tokenizer
+        self.template = template
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[int, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.segmented = self._verify()
+
+    @classmethod
+    def for_model(cls, model: str, tokenizer: Any, use_chat_template: bool = True,
+                  cache_size: int = 4096) -> "TokenAssembler":
+        """Pick the tokenizer's chat template when compilable, else the family built-in."""
+        template = compile_chat_template(tokenizer) if use_chat_template else None
+        return cls(tokenizer, template or builtin_template(model), cache_size)
+
+    def _encode(self, text: str) -> List[int]:
+        return list(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def _verify(self) -> bool:
+        try:
+            segmented = [t for seg in self.template.segments(_VERIFY_MESSAGES) for t in self._encode(seg)]
+            return segmented == self._encode(self.template.render(_VERIFY_MESSAGES))
+        except Exception:  # noqa: BLE001
+            return False
+
+    def _segment_ids(self, segment: str) -> Tuple[int, ...]:
+        key = hashlib.sha1(segment.encode("utf-8")).hexdigest()
+        with self._lock:
+            ids = self._cache.get(key)
+            if ids is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return ids
+        ids = tuple(self._encode(segment))
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = ids
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return ids
+
+    def render(self, messages: Sequence[Dict[str, str]]) -> str:
+        return self.template.render(messages)
+
+    def input_ids(self, messages: Sequence[Dict[str, str]]) -> List[int]:
+        """Token IDs for the prompt (generation prompt included)."""
+        if not self.segmented:
+            return self._encode(self.template.render(messages))
+        ids: List[int] = []
+        for segment in self.template.segments(messages):
+            ids.extend(self._segment_ids(segment))
+        return ids
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "template": self.template.name,
+            "segmented": self.segmented,
+            "cached_segments": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Markdown minification for the personality prompt.
+_MD_RULES = [
+    (re.compile(r"^[ \t]{0,3}#{1,6}[ \t]*", re.M), ""),                  # headings
+    (re.compile(r"^[ \t]{0,3}([-*_])([ \t]*\1){2,}[ \t]*$", re.M), ""),  # horizontal rules
+    (re.compile(r"^([ \t]*)[-*+][ \t]+", re.M), r"\1- "),                # normalise bullets
+    (re.compile(r"(\*\*|__)(.+?)\1"), r"\2"),                            # bold
+    (re.compile(r"(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])"), r"\1"),   # italics
+    (re.compile(r"`{1,3}([^`]*)`{1,3}"), r"\1"),                         # inline code
+    (re.compile(r"[ \t]+$", re.M), ""),                                  # trailing whitespace
+    (re.compile(r"\n{3,}"), "\n\n"),                                     # blank-line runs
+]
+_TOKEN_ESTIMATE = re.compile(r"\w+|[^\w\s]")
+
+
+def minify_markdown(text: str) -> str:
+    """Strip markdown formatting that costs tokens but carries no instruction."""
+    for pattern, replacement in _MD_RULES:
+        text = pattern.sub(replacement, text)
+    return text.strip()
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap tokenizer-free token estimate (words + punctuation)."""
+    return len(_TOKEN_ESTIMATE.findall(text))
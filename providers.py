@@ -0,0 +1,579 @@
+"""AI provider implementations for Spectra AI (cloud providers).
+
+Kept free of torch/transformers so lightweight entry points (the Vercel
+function in api/index.py) can import the cloud providers without paying
+for the local-model stack. The Hugging Face provider lives in hf_provider.py.
+"""
+import asyncio
+import importlib.util
+import inspect
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import structlog
+from fastapi import HTTPException
+
+from cancellation import CancellationToken
+from executors import BlockingExecutor, get_executor
+from rate_limit import ProviderRateLimited, rate_limit_headers
+
+# SDK presence is checked without importing; the SDKs are imported when a
+# provider's client is first used.
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
+ANTHROPIC_AVAILABLE = importlib.util.find_spec("anthropic") is not None
+HTTPX_AVAILABLE = importlib.util.find_spec("httpx") is not None
+
+logger = structlog.get_logger()
+
+class AIProvider:
+    """Abstract base for AI providers"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.available = False
+        self.models: List[str] = []
+        # Blocking work runs on the provider's own pool so it can't queue behind another provider's
+        self.executor: BlockingExecutor = get_executor(name)
+    
+    async def chat(self, messages: List[Dict[str, str]], model: str, **kwargs) -> Dict[str, Any]:
+        """Generate chat response
+        
+        Providers that stream pass each piece of generated text to the optional
+        `on_delta` callback (possibly from a worker thread) as it arrives.
+        Providers with prompt caching use `cache_prefix` (the static start of
+        the system prompt) and `cache_key` to keep that prefix cached.
+        """
+        raise NotImplementedError
+    
+    def get_models(self) -> List[str]:
+        """Get available models"""
+        return self.models
+    
+    def is_available(self) -> bool:
+        """Check if provider is available"""
+        return self.available
+    
+    def refresh_availability(self) -> None:
+        """Refresh provider availability - override in subclasses"""
+        pass
+    
+    async def refresh(self) -> None:
+        """Refresh availability from the event loop - providers that do network I/O override this"""
+        self.refresh_availability()
+    
+    def prewarm(self) -> None:
+        """Create expensive clients ahead of the first request - override in subclasses"""
+        pass
+
+# Headroom past the request deadline, so run_cancellable (not the SDK) reports a deadline hit
+DEADLINE_TIMEOUT_MARGIN = 0.5
+
+def _deadline_timeout(cancel_token: Optional[CancellationToken]) -> Dict[str, float]:
+    """SDK request timeout just past the request deadline (empty when there is none)."""
+    remaining = cancel_token.remaining() if cancel_token is not None else None
+    return {"timeout": remaining + DEADLINE_TIMEOUT_MARGIN} if remaining is not None else {}
+
+def _is_rate_limit_error(e: Exception) -> bool:
+    """True for the SDKs' 429 errors (openai/anthropic RateLimitError)."""
+    return getattr(e, 'status_code', None) == 429
+
+async def _parse_raw(raw: Any) -> Any:
+    """Parse an SDK raw response (parse() is a coroutine in newer async SDKs)."""
+    parsed = raw.parse()
+    return await parsed if inspect.isawaitable(parsed) else parsed
+
+def _split_cache_prefix(system: str, prefix: Optional[str]) -> tuple[str, str]:
+    """Split a system prompt into its static cacheable prefix and the per-request rest.
+    
+    The prefix is empty when the prompt doesn't start with `prefix`.
+    """
+    if prefix and system.startswith(prefix):
+        return prefix, system[len(prefix):].strip()
+    return "", system
+
+async def _client_off_loop(provider: Any) -> Any:
+    """The provider's SDK client; the first call imports the SDK and builds it on the provider's executor.
+
+    The import takes a second or more and holds the import lock, so it must never
+    run on the event loop (the background prewarm may not have finished yet).
+    """
+    if provider._client is not None:
+        return provider._client
+    return await provider.executor.run(lambda: provider.client)
+
+def _error_headers(e: Exception) -> Dict[str, str]:
+    response = getattr(e, 'response', None)
+    return dict(getattr(response, 'headers', None) or {})
+
+class OpenAIProvider(AIProvider):
+    """OpenAI ChatGPT provider"""
+    
+    def __init__(self):
+        super().__init__("openai")
+        self.api_key = os.getenv('OPENAI_API_KEY')
+        self.default_model = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+        self.models = ['gpt-4o', 'gpt-4o-mini', 'gpt-4', 'gpt-3.5-turbo']
+        self.available = OPENAI_AVAILABLE and bool(self.api_key)
+        self._client: Any = None
+    
+    @property
+    def client(self) -> Any:
+        """SDK client, created (and the SDK imported) on first use."""
+        if self._client is None:
+            import openai
+            # Async client so cancelling the request task aborts the HTTP call
+            self._client = openai.AsyncOpenAI(api_key=self.api_key)
+        return self._client
+    
+    @client.setter
+    def client(self, value: Any) -> None:
+        self._client = value
+    
+    def prewarm(self) -> None:
+        """Import the SDK and build the client"""
+        if self.available:
+            self.client
+    
+    async def chat(self, messages: List[Dict[str, str]], model: str, **kwargs) -> Dict[str, Any]:
+        """Generate chat response using OpenAI (streamed through `on_delta` when given)"""
+        if not self.available:
+            raise HTTPException(status_code=500, detail="OpenAI not available")
+        
+        cancel_token: Optional[CancellationToken] = kwargs.get('cancel_token')
+        on_delta: Optional[Callable[[str], None]] = kwargs.get('on_delta')
+        start = time.perf_counter()
+        first_token_at: Optional[float] = None
+        try:
+            messages, cache_key = self._cache_friendly(messages, kwargs.get('cache_prefix'), kwargs.get('cache_key'))
+            # Raw response so the rate-limit headers reach the governor (streamed or not)
+            client = await _client_off_loop(self)
+            raw = await client.chat.completions.with_raw_response.create(
+                model=model or self.default_model,
+                messages=messages,
+                temperature=kwargs.get('temperature', 0.7),
+                max_tokens=kwargs.get('max_tokens', 2048),
+                # Raw body field: older SDKs don't know the argument
+                **({"extra_body": {"prompt_cache_key": cache_key}} if cache_key else {}),
+                **({"stream": True, "stream_options": {"include_usage": True}} if on_delta is not None else {}),
+                **_deadline_timeout(cancel_token)
+            )
+            if on_delta is None:
+                response = await _parse_raw(raw)
+                content = response.choices[0].message.content
+                usage = response.usage
+            else:
+                parts: List[str] = []
+                usage = None
+                async with await _parse_raw(raw) as stream:
+                    async for chunk in stream:
+                        for choice in chunk.choices:
+                            if choice.delta.content:
+                                if first_token_at is None:
+                                    first_token_at = time.perf_counter()
+                                parts.append(choice.delta.content)
+                                on_delta(choice.delta.content)
+                        # The last chunk carries the usage and no choices
+                        if chunk.usage:
+                            usage = chunk.usage
+                content = "".join(parts)
+            details = getattr(usage, 'prompt_tokens_details', None)
+            return {
+                "content": content,
+                "model": model or self.default_model,
+                "provider": "openai",
+                "total_tokens": usage.total_tokens if usage else None,
+                "usage": {
+                    "prompt_tokens": usage.prompt_tokens,
+                    "completion_tokens": usage.completion_tokens,
+                    "cached_tokens": getattr(details, 'cached_tokens', None) or 0,
+                } if usage else None,
+                "rate_limit_headers": rate_limit_headers(raw.headers),
+                "ttft": first_token_at - start if first_token_at is not None else None
+            }
+        except asyncio.CancelledError:
+            if cancel_token is not None:
+                cancel_token.report_saved("openai")
+            raise
+        except Exception as e:
+            if _is_rate_limit_error(e):
+                raise ProviderRateLimited("openai", str(e), _error_headers(e)) from e
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()  # an SDK timeout at the deadline is a deadline hit
+            raise HTTPException(status_code=500, detail=f"OpenAI error: {str(e)}")
+    
+    @staticmethod
+    def _cache_friendly(messages: List[Dict[str, str]], cache_prefix: Optional[str],
+                        cache_key: Optional[str]) -> tuple[List[Dict[str, str]], Optional[str]]:
+        """Order messages for OpenAI's automatic prefix caching.
+        
+        The cache matches on the longest identical prompt prefix, so the static
+        personality goes first and the per-request context (summary, recalled
+        memories) moves to a system message just before the new user turn;
+        the history in between then stays cacheable across turns. The cache
+        key (set only when the prefix is static) routes requests sharing the
+        personality to the same cache.
+        """
+        if len(messages) < 2 or messages[0]["role"] != "system":
+            return messages, None
+        static, dynamic = _split_cache_prefix(messages[0]["content"], cache_prefix)
+        if not static:
+            return messages, None
+        ordered = [{"role": "system", "content": static}, *messages[1:-1]]
+        if dynamic:
+            ordered.append({"role": "system", "content": dynamic})
+        ordered.append(messages[-1])
+        return ordered, cache_key
+
+class AnthropicProvider(AIProvider):
+    """Anthropic Claude provider"""
+    
+    def __init__(self):
+        super().__init__("anthropic")
+        self.api_key = os.getenv('ANTHROPIC_API_KEY')
+        self.default_model = os.getenv('CLAUDE_MODEL', 'claude-3-haiku-20240307')
+        self.models = ['claude-3-5-sonnet-20241022', 'claude-3-haiku-20240307', 'claude-3-sonnet-20240229']
+        self.available = ANTHROPIC_AVAILABLE and bool(self.api_key)
+        self._client: Any = None
+    
+    @property
+    def client(self) -> Any:
+        """SDK client, created (and the SDK imported) on first use."""
+        if self._client is None:
+            import anthropic
+            # Async client so cancelling the request task aborts the HTTP call
+            self._client = anthropic.AsyncAnthropic(api_key=self.api_key)
+        return self._client
+    
+    @client.setter
+    def client(self, value: Any) -> None:
+        self._client = value
+    
+    def prewarm(self) -> None:
+        """Import the SDK and build the client"""
+        if self.available:
+            self.client
+    
+    async def chat(self, messages: List[Dict[str, str]], model: str, **kwargs) -> Dict[str, Any]:
+        """Generate chat response using Anthropic Claude (streamed through `on_delta` when given)"""
+        if not self.available:
+            raise HTTPException(status_code=500, detail="Anthropic not available")
+        
+        cancel_token: Optional[CancellationToken] = kwargs.get('cancel_token')
+        on_delta: Optional[Callable[[str], None]] = kwargs.get('on_delta')
+        start = time.perf_counter()
+        first_token_at: Optional[float] = None
+        try:
+            # Convert messages format for Claude
+            system_message = ""
+            claude_messages = []
+            
+            for msg in messages:
+                if msg["role"] == "system":
+                    system_message = msg["content"]
+                else:
+                    claude_messages.append(msg)
+            
+            client = await _client_off_loop(self)
+            raw = await client.messages.with_raw_response.create(
+                model=model or self.default_model,
+                max_tokens=kwargs.get('max_tokens', 2048),
+                system=self._cached_system(system_message, kwargs.get('cache_prefix')),
+                messages=claude_messages,
+                # Sent as a raw body field: recent SDKs dropped the typed argument
+                extra_body={"temperature": kwargs.get('temperature', 0.7)},
+                **({"stream": True} if on_delta is not None else {}),
+                **_deadline_timeout(cancel_token)
+            )
+            if on_delta is None:
+                response = await _parse_raw(raw)
+                content = response.content[0].text
+                usage = response.usage
+                output_tokens = usage.output_tokens
+            else:
+                parts: List[str] = []
+                usage = None
+                output_tokens = 0
+                async with await _parse_raw(raw) as stream:
+                    async for event in stream:
+                        if event.type == "message_start":
+                            usage = event.message.usage  # prompt side, with the cache counts
+                        elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                            parts.append(event.delta.text)
+                            on_delta(event.delta.text)
+                        elif event.type == "message_delta":
+                            output_tokens = event.usage.output_tokens  # cumulative
+                content = "".join(parts)
+            # input_tokens excludes the prompt tokens read from or written to the cache
+            cache_read = getattr(usage, 'cache_read_input_tokens', None) or 0
+            cache_write = getattr(usage, 'cache_creation_input_tokens', None) or 0
+            prompt_tokens = (usage.input_tokens if usage else 0) + cache_read + cache_write
+            return {
+                "content": content,
+                "model": model or self.default_model,
+                "provider": "anthropic",
+                "total_tokens": prompt_tokens + output_tokens,
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": output_tokens,
+                    "cached_tokens": cache_read,
+                    "cache_write_tokens": cache_write,
+                },
+                "rate_limit_headers": rate_limit_headers(raw.headers),
+                "ttft": first_token_at - start if first_token_at is not None else None
+            }
+        except asyncio.CancelledError:
+            if cancel_token is not None:
+                cancel_token.report_saved("anthropic")
+            raise
+        except Exception as e:
+            if _is_rate_limit_error(e):
+                raise ProviderRateLimited("anthropic", str(e), _error_headers(e)) from e
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()  # an SDK timeout at the deadline is a deadline hit
+            raise HTTPException(status_code=500, detail=f"Claude error: {str(e)}")
+    
+    @staticmethod
+    def _cached_system(system_message: str, cache_prefix: Optional[str]) -> Any:
+        """System prompt with a cache breakpoint after the static personality prefix.
+        
+        Per-request context follows as a second, uncached block. Prompts that
+        don't start with the prefix are sent as plain text.
+        """
+        static, dynamic = _split_cache_prefix(system_message, cache_prefix)
+        if not static:
+            return system_message
+        blocks: List[Dict[str, Any]] = [{"type": "text", "text": static, "cache_control": {"type": "ephemeral"}}]
+        if dynamic:
+            blocks.append({"type": "text", "text": dynamic})
+        return blocks
+
+class LocalEndpoint:
+    """One OpenAI-compatible server behind the local provider."""
+    
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+        self.models: List[str] = []
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.down_until = 0.0
+    
+    def is_up(self) -> bool:
+        return time.monotonic() >= self.down_until
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "models": self.models,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "up": self.is_up(),
+        }
+
+class LocalOpenAIProvider(AIProvider):
+    """Local OpenAI-compatible servers (llama.cpp server, vLLM, ...)"""
+    
+    def __init__(self):
+        super().__init__("local")
+        urls = [url.strip() for url in os.getenv('LOCAL_OPENAI_URLS', '').split(',') if url.strip()]
+        self.endpoints = [LocalEndpoint(url) for url in urls]
+        self.api_key = os.getenv('LOCAL_OPENAI_API_KEY', '')
+        self.default_model = os.getenv('LOCAL_OPENAI_MODEL', '')
+        self.max_connections = int(os.getenv('LOCAL_OPENAI_MAX_CONNECTIONS', '32'))
+        self.timeout = float(os.getenv('LOCAL_OPENAI_TIMEOUT', '300'))
+        # Seconds an endpoint is skipped after a connection failure
+        self.retry_down_after = 5.0
+        self._client: Any = None
+        self._check_availability()
+    
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+    
+    def _check_availability(self) -> None:
+        """Discover models from each endpoint's /models (blocking; runs in a worker thread at startup)."""
+        if not HTTPX_AVAILABLE or not self.endpoints:
+            self.available = False
+            return
+        import httpx
+        
+        for endpoint in self.endpoints:
+            try:
+                response = httpx.get(f"{endpoint.base_url}/models", headers=self._headers(), timeout=5.0)
+                self._discovered(endpoint, response)
+            except Exception as e:
+                self._discovery_failed(endpoint, e)
+        self._update_models()
+    
+    async def refresh(self) -> None:
+        """Re-run model discovery on the pooled async client, all endpoints at once"""
+        if not HTTPX_AVAILABLE or not self.endpoints:
+            self.available = False
+            return
+        
+        async def discover(endpoint: LocalEndpoint) -> None:
+            try:
+                self._discovered(endpoint, await self.client.get(f"{endpoint.base_url}/models", timeout=5.0))
+            except Exception as e:
+                self._discovery_failed(endpoint, e)
+        
+        await asyncio.gather(*(discover(endpoint) for endpoint in self.endpoints))
+        self._update_models()
+    
+    @staticmethod
+    def _discovered(endpoint: LocalEndpoint, response: Any) -> None:
+        response.raise_for_status()
+        endpoint.models = [m["id"] for m in response.json().get("data", [])]
+        endpoint.down_until = 0.0
+    
+    @staticmethod
+    def _discovery_failed(endpoint: LocalEndpoint, error: Exception) -> None:
+        endpoint.models = []
+        logger.warning("local_endpoint_discovery_failed", endpoint=endpoint.base_url, error=str(error))
+    
+    def _update_models(self) -> None:
+        self.models = list(dict.fromkeys(m for endpoint in self.endpoints for m in endpoint.models))
+        if self.default_model in self.models:
+            # The configured default is what auto-model picks for this provider
+            self.models.remove(self.default_model)
+            self.models.insert(0, self.default_model)
+        self.available = bool(self.models)
+        if self.available:
+            logger.info("local_models_found", count=len(self.models), models=self.models,
+                        endpoints=[e.base_url for e in self.endpoints if e.models])
+    
+    def refresh_availability(self) -> None:
+        """Re-run model discovery (blocking; from the event loop use refresh())"""
+        self._check_availability()
+    
+    @property
+    def client(self) -> Any:
+        """Pooled keep-alive HTTP client shared by all endpoints."""
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                headers=self._headers(),
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections,
+                                    keepalive_expiry=60.0),
+            )
+        return self._client
+    
+    def prewarm(self) -> None:
+        """Build the pooled client"""
+        if self.available:
+            self.client
+    
+    def _resolve_model(self, model: str) -> str:
+        return model or self.default_model or (self.models[0] if self.models else '')
+    
+    def _pick_endpoint(self, model: str, exclude: List[LocalEndpoint]) -> Optional[LocalEndpoint]:
+        """Least-outstanding-requests choice among up endpoints serving `model`."""
+        candidates = [e for e in self.endpoints if model in e.models and e.is_up() and e not in exclude]
+        if not candidates:
+            return None
+        # Ties go to the endpoint that has served fewer requests so far
+        return min(candidates, key=lambda e: (e.outstanding, e.requests))
+    
+    async def stream(self, messages: List[Dict[str, str]], model: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """Stream chat completion chunks (parsed SSE events) from the least busy endpoint.
+        
+        Endpoints that refuse the connection are marked down and the next one
+        is tried, as long as nothing has been streamed yet.
+        """
+        import httpx
+        
+        model = self._resolve_model(model)
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": kwargs.get('temperature', 0.7),
+            "max_tokens": kwargs.get('max_tokens', 2048),
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+        tried: List[LocalEndpoint] = []
+        while True:
+            endpoint = self._pick_endpoint(model, tried)
+            if endpoint is None:
+                raise HTTPException(status_code=500, detail=f"Local model error: no endpoint available for {model}")
+            tried.append(endpoint)
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            try:
+                async with self.client.stream("POST", f"{endpoint.base_url}/chat/completions",
+                                              json=payload, **_deadline_timeout(kwargs.get('cancel_token'))) as response:
+                    if response.status_code >= 400:
+                        await response.aread()
+                        raise HTTPException(status_code=500,
+                                            detail=f"Local model error: {response.status_code} {response.text}")
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        # Read through [DONE] to the end so the connection returns to the pool
+                        if data != "[DONE]":
+                            yield json.loads(data)
+                return
+            except httpx.ConnectError as e:
+                endpoint.errors += 1
+                endpoint.down_until = time.monotonic() + self.retry_down_after
+                logger.warning("local_endpoint_down", endpoint=endpoint.base_url, error=str(e))
+            except Exception:
+                endpoint.errors += 1
+                raise
+            finally:
+                endpoint.outstanding -= 1
+    
+    async def chat(self, messages: List[Dict[str, str]], model: str, **kwargs) -> Dict[str, Any]:
+        """Generate chat response from a local OpenAI-compatible server (streamed, for TTFT)"""
+        if not self.available:
+            raise HTTPException(status_code=500, detail="Local models not available")
+        
+        cancel_token: Optional[CancellationToken] = kwargs.get('cancel_token')
+        start = time.perf_counter()
+        first_token_at: Optional[float] = None
+        parts: List[str] = []
+        usage: Optional[Dict[str, Any]] = None
+        on_delta: Optional[Callable[[str], None]] = kwargs.get('on_delta')
+        try:
+            async for chunk in self.stream(messages, model, **kwargs):
+                for choice in chunk.get("choices") or []:
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        parts.append(content)
+                        if on_delta is not None:
+                            on_delta(content)
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+            return {
+                "content": "".join(parts),
+                "model": self._resolve_model(model),
+                "provider": "local",
+                "total_tokens": usage.get("total_tokens") if usage else None,
+                "usage": {
+                    "prompt_tokens": usage.get("prompt_tokens"),
+                    "completion_tokens": usage.get("completion_tokens"),
+                } if usage else None,
+                "ttft": first_token_at - start if first_token_at is not None else None
+            }
+        except asyncio.CancelledError:
+            if cancel_token is not None:
+                cancel_token.report_saved("local")
+            raise
+        except HTTPException:
+            raise
+        except Exception as e:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()  # a read timeout at the deadline is a deadline hit
+            raise HTTPException(status_code=500, detail=f"Local model error: {str(e)}")
+    
+    def endpoint_stats(self) -> Dict[str, Any]:
+        """Per-endpoint load and discovery state."""
+        return {endpoint.base_url: endpoint.stats() for endpoint in self.endpoints}
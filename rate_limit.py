@@ -0,0 +1,268 @@
+"""Client-side rate governors for the cloud providers.
+
+One RateGovernor per provider:model keeps requests-per-minute and
+tokens-per-minute token buckets plus an AIMD concurrency limit. Budgets
+start from configuration and are corrected from the providers' rate-limit
+response headers; a 429 halves the concurrency limit and pauses the
+governor for the advertised retry interval, each success grows it again by
+1/limit. Callers acquire a permit before the request, so bursts are queued
+(up to a bounded wait) or rerouted before the provider starts returning 429s.
+"""
+import asyncio
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional
+
+# OpenAI-style durations: "1s", "6m0s", "20ms", "1h2m3.5s"
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+class RateLimited(Exception):
+    """No capacity for this provider:model within the allowed wait."""
+
+    def __init__(self, key: str, retry_after: float):
+        super().__init__(f"rate limited: {key} (retry after {retry_after:.2f}s)")
+        self.key = key
+        self.retry_after = retry_after
+
+
+class ProviderRateLimited(Exception):
+    """The provider answered 429."""
+
+    def __init__(self, provider: str, message: str, headers: Optional[Mapping[str, str]] = None):
+        super().__init__(f"{provider} rate limit: {message}")
+        self.provider = provider
+        self.headers = dict(headers or {})
+
+
+def _parse_reset(value: Optional[str]) -> Optional[float]:
+    """Seconds until reset from a duration ("6m0s"), a number, or an RFC 3339 timestamp."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if parts and "".join(a + b for a, b in parts) == value:
+        return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            reset_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+    if reset_at.tzinfo is None:
+        reset_at = reset_at.replace(tzinfo=timezone.utc)
+    return max((reset_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def parse_rate_limit_headers(headers: Mapping[str, str]) -> Dict[str, Any]:
+    """Normalise OpenAI (x-ratelimit-*) and Anthropic (anthropic-ratelimit-*) headers."""
+    h = {k.lower(): v for k, v in headers.items()}
+    info: Dict[str, Any] = {}
+    for kind in ("requests", "tokens"):
+        limit = h.get(f"x-ratelimit-limit-{kind}") or h.get(f"anthropic-ratelimit-{kind}-limit")
+        remaining = h.get(f"x-ratelimit-remaining-{kind}") or h.get(f"anthropic-ratelimit-{kind}-remaining")
+        reset = h.get(f"x-ratelimit-reset-{kind}") or h.get(f"anthropic-ratelimit-{kind}-reset")
+        if limit is not None:
+            info[f"limit_{kind}"] = _parse_int(limit)
+        if remaining is not None:
+            info[f"remaining_{kind}"] = _parse_int(remaining)
+        if reset is not None:
+            info[f"reset_{kind}"] = _parse_reset(reset)
+    if "retry-after-ms" in h:
+        info["retry_after"] = (_parse_reset(h["retry-after-ms"]) or 0.0) / 1000
+    elif "retry-after" in h:
+        info["retry_after"] = _parse_reset(h["retry-after"])
+    return {k: v for k, v in info.items() if v is not None}
+
+
+def rate_limit_headers(headers: Mapping[str, str]) -> Dict[str, str]:
+    """The subset of response headers the governors learn from."""
+    return {k.lower(): v for k, v in headers.items()
+            if "ratelimit" in k.lower() or k.lower().startswith("retry-after")}
+
+
+class TokenBucket:
+    """Continuously refilling bucket: `capacity` units per `period` seconds."""
+
+    def __init__(self, capacity: Optional[float], period: float = 60.0):
+        self.capacity = capacity
+        self.period = period
+        self.tokens = capacity or 0.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.capacity:
+            rate = self.capacity / self.period
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (0 when unlimited)."""
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / (self.capacity / self.period)
+
+    def take(self, amount: float) -> None:
+        if self.capacity:
+            self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float) -> None:
+        if self.capacity:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    def observe(self, limit: Optional[int], remaining: Optional[int], now: float) -> None:
+        """Adopt the provider's view of this budget."""
+        self._refill(now)
+        if limit:
+            if not self.capacity:
+                self.tokens = float(limit)  # first sighting of this budget
+            self.capacity = float(limit)
+        if remaining is not None and self.capacity:
+            self.tokens = min(self.tokens, float(remaining))
+
+
+class Permit:
+    """Capacity reserved for one request; must be released exactly once."""
+
+    def __init__(self, governor: "RateGovernor", tokens: float):
+        self.governor = governor
+        self.tokens = tokens
+        self._released = False
+
+    def release(self, *, headers: Optional[Mapping[str, str]] = None, rate_limited: bool = False,
+                ok: bool = True, tokens_used: Optional[int] = None) -> None:
+        """Return the slot; `ok` requests grow the concurrency limit, 429s shrink it."""
+        if self._released:
+            return
+        self._released = True
+        self.governor._release(self, headers, rate_limited, ok, tokens_used)
+
+
+class RateGovernor:
+    """RPM/TPM buckets plus an AIMD concurrency limit for one provider:model."""
+
+    def __init__(self, key: str, rpm: Optional[int] = None, tpm: Optional[int] = None,
+                 max_concurrency: int = 16, period: float = 60.0):
+        self.key = key
+        self.requests = TokenBucket(rpm, period)
+        self.tokens = TokenBucket(tpm, period)
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"acquired": 0, "queued": 0, "rejected": 0, "rate_limited": 0, "wait_seconds": 0.0}
+
+    def _wait_time(self, tokens: float, now: float) -> float:
+        wait = max(self.paused_until - now, 0.0,
+                   self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+        if wait == 0.0 and self.in_flight >= int(self.concurrency_limit):
+            return -1.0  # waiting on a concurrency slot: duration unknown
+        return wait
+
+    async def acquire(self, tokens: float = 0.0, max_wait: float = 0.0, poll: float = 0.05) -> Permit:
+        """Reserve capacity, waiting up to `max_wait` seconds, else raise RateLimited."""
+        start = time.monotonic()
+        deadline = start + max_wait
+        queued = False
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                wait = self._wait_time(tokens, now)
+                if wait == 0.0:
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    self.in_flight += 1
+                    self.stats["acquired"] += 1
+                    self.stats["wait_seconds"] += now - start
+                    return Permit(self, tokens)
+                if wait > 0 and now + wait > deadline or wait < 0 and now >= deadline:
+                    self.stats["rejected"] += 1
+                    raise RateLimited(self.key, wait if wait > 0 else poll)
+                if not queued:
+                    queued = True
+                    self.stats["queued"] += 1
+            await asyncio.sleep(min(wait if wait > 0 else poll, max(deadline - now, 0.001)))
+
+    def _release(self, permit: Permit, headers: Optional[Mapping[str, str]], rate_limited: bool,
+                 ok: bool, tokens_used: Optional[int]) -> None:
+        now = time.monotonic()
+        info = parse_rate_limit_headers(headers or {})
+        with self._lock:
+            self.in_flight = max(self.in_flight - 1, 0)
+            self.requests.observe(info.get("limit_requests"), info.get("remaining_requests"), now)
+            self.tokens.observe(info.get("limit_tokens"), info.get("remaining_tokens"), now)
+            if tokens_used is not None and tokens_used < permit.tokens:
+                self.tokens.refund(permit.tokens - tokens_used)
+            if rate_limited:
+                # Multiplicative decrease, and back off for the advertised interval
+                self.stats["rate_limited"] += 1
+                self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+                pause = info.get("retry_after") or max(info.get("reset_requests", 0.0), info.get("reset_tokens", 0.0)) or 1.0
+                self.paused_until = max(self.paused_until, now + pause)
+            elif ok:
+                # Additive increase
+                self.concurrency_limit = min(float(self.max_concurrency),
+                                             self.concurrency_limit + 1.0 / self.concurrency_limit)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "rpm_limit": self.requests.capacity,
+                "tpm_limit": self.tokens.capacity,
+                "concurrency_limit": round(self.concurrency_limit, 2),
+                "in_flight": self.in_flight,
+                "paused_for": round(max(self.paused_until - now, 0.0), 2),
+                **{k: round(v, 3) if isinstance(v, float) else v for k, v in self.stats.items()},
+            }
+
+
+class RateLimitRegistry:
+    """Governors keyed by provider:model, with per-provider default budgets."""
+
+    def __init__(self, defaults: Optional[Dict[str, Dict[str, Any]]] = None, period: float = 60.0):
+        self.defaults = defaults or {}
+        self.period = period
+        self.governors: Dict[str, RateGovernor] = {}
+        self._lock = threading.Lock()
+
+    def governed(self, provider: str) -> bool:
+        return provider in self.defaults
+
+    def governor(self, provider: str, model: str) -> RateGovernor:
+        key = f"{provider}:{model}"
+        with self._lock:
+            governor = self.governors.get(key)
+            if governor is None:
+                config = self.defaults.get(provider, {})
+                governor = self.governors[key] = RateGovernor(
+                    key, rpm=config.get("rpm"), tpm=config.get("tpm"),
+                    max_concurrency=config.get("max_concurrency", 16), period=self.period,
+                )
+            return governor
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            governors = dict(self.governors)
+        return {key: governor.snapshot() for key, governor in governors.items()}
@@ -0,0 +1,194 @@
+"""Memory-mapped model weights shared across worker processes.
+
+Weights are loaded straight from ``*.safetensors`` files into tensors that
+point into a private (copy-on-write) mmap of the file. Unmodified pages stay
+backed by the page cache, so every process mapping the same file, whether
+forked from a preloading master or started separately, uses one physical
+copy. Inference never writes to the weights, so nothing is ever copied.
+
+``preload()`` runs in the master before workers fork (see prefork.py) and
+registers the models; HuggingFaceProvider picks them up from ``preloaded()``
+instead of loading its own copy. ``worker_memory()`` reports RSS/PSS and the
+shared vs private split for the weight mappings, from /proc/self/smaps.
+"""
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+# safetensors dtype names -> torch dtype attribute names
+_DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+
+_lock = threading.Lock()
+_preloaded: Dict[str, Tuple[Any, Any]] = {}
+_mappings: List[mmap.mmap] = []
+
+
+def resolve_model_dir(model_name: str) -> str:
+    """Local directory holding a model's config, tokenizer and safetensors files."""
+    if os.path.isdir(model_name):
+        return model_name
+    from huggingface_hub import snapshot_download
+    return snapshot_download(model_name, allow_patterns=["*.json", "*.safetensors", "*.model", "*.txt"])
+
+
+def populate(mapping: mmap.mmap) -> None:
+    """Fault every page of a mapping into this process (one byte read per page)."""
+    bytes(memoryview(mapping)[::mmap.PAGESIZE])
+
+
+def mmap_safetensors(path: str) -> Dict[str, Any]:
+    """Tensors of one safetensors file, backed by a copy-on-write mmap of it."""
+    import torch
+
+    with open(path, "rb") as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    header_len = struct.unpack("<Q", mapping[:8])[0]
+    header = json.loads(mapping[8:8 + header_len])
+    header.pop("__metadata__", None)
+    base = 8 + header_len
+
+    tensors = {}
+    for name, info in header.items():
+        dtype = getattr(torch, _DTYPES[info["dtype"]])
+        start, end = info["data_offsets"]
+        if end == start:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        count = (end - start) // torch.empty((), dtype=dtype).element_size()
+        tensors[name] = torch.frombuffer(mapping, dtype=dtype, count=count, offset=base + start).view(info["shape"])
+    with _lock:
+        _mappings.append(mapping)
+    return tensors
+
+
+def load_mmap_model(model_name: str) -> Any:
+    """Build a causal LM whose parameters live in mmapped safetensors pages.
+
+    The checkpoint dtype is kept (a dtype conversion would copy every
+    weight). Raises ValueError when the checkpoint can't be mapped 1:1 onto
+    the model, so callers can fall back to a regular load.
+    """
+    import torch
+    from transformers import AutoConfig, AutoModelForCausalLM
+    from transformers.modeling_utils import no_init_weights
+
+    model_dir = resolve_model_dir(model_name)
+    files = sorted(glob.glob(os.path.join(model_dir, "*.safetensors")))
+    if not files:
+        raise ValueError(f"no safetensors weights for {model_name}")
+
+    state: Dict[str, Any] = {}
+    for path in files:
+        state.update(mmap_safetensors(path))
+    dtype = next((t.dtype for t in state.values() if t.is_floating_point()), torch.float32)
+
+    config = AutoConfig.from_pretrained(model_dir)
+    with no_init_weights():
+        # Parameters are allocated but never initialised (untouched pages), then replaced
+        model = AutoModelForCausalLM.from_config(config, torch_dtype=dtype)
+    tied = set(getattr(model, "_tied_weights_keys", None) or [])
+    missing, unexpected = model.load_state_dict(state, strict=False, assign=True)
+    missing = [key for key in missing if key not in tied]
+    if missing or unexpected:
+        raise ValueError(f"checkpoint keys don't match {type(model).__name__}: "
+                         f"missing={missing[:5]} unexpected={unexpected[:5]}")
+    model.tie_weights()
+    return model.eval()
+
+
+def preload(model_names: List[str]) -> None:
+    """Load models (mmapped weights + tokenizer) in this process and register them.
+
+    Meant for the master before forking: it does no tensor computation, so
+    torch's thread pools are still uninitialised when workers fork.
+    """
+    from transformers import AutoTokenizer
+
+    for name in model_names:
+        with _lock:
+            first_mapping = len(_mappings)
+        model = load_mmap_model(name)
+        tokenizer = AutoTokenizer.from_pretrained(resolve_model_dir(name))
+        with _lock:
+            _preloaded[name] = (model, tokenizer)
+            mappings = _mappings[first_mapping:]
+        # Read the weights into the page cache now rather than on the first request
+        for mapping in mappings:
+            populate(mapping)
+        logger.info("model_preloaded", model=name, weight_mb=round(weight_bytes() / 2**20, 1))
+
+
+def after_fork() -> None:
+    """Map the shared weight pages into a freshly forked worker (no copying)."""
+    with _lock:
+        mappings = list(_mappings)
+    for mapping in mappings:
+        populate(mapping)
+
+
+def preloaded(model_name: str) -> Optional[Tuple[Any, Any]]:
+    """(model, tokenizer) preloaded in the master process, if any."""
+    with _lock:
+        return _preloaded.get(model_name)
+
+
+def preloaded_models() -> List[str]:
+    with _lock:
+        return list(_preloaded)
+
+
+def weight_bytes() -> int:
+    """Total size of the mmapped weight files."""
+    with _lock:
+        return sum(len(mapping) for mapping in _mappings)
+
+
+def _parse_smaps(text: str, path_suffix: Optional[str] = None) -> Dict[str, int]:
+    """Sum the kB fields of smaps entries (optionally only mappings of files ending in `path_suffix`)."""
+    totals: Dict[str, int] = {}
+    include = path_suffix is None
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        if not fields[0].endswith(":"):
+            # Mapping header: "start-end perms offset dev inode [path]"
+            include = path_suffix is None or (len(fields) >= 6 and fields[-1].endswith(path_suffix))
+        elif include and len(fields) == 3 and fields[2] == "kB":
+            totals[fields[0][:-1]] = totals.get(fields[0][:-1], 0) + int(fields[1])
+    return totals
+
+
+def _mb(totals: Dict[str, int]) -> Dict[str, float]:
+    shared = totals.get("Shared_Clean", 0) + totals.get("Shared_Dirty", 0)
+    private = totals.get("Private_Clean", 0) + totals.get("Private_Dirty", 0)
+    return {
+        "rss_mb": round(totals.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(totals.get("Pss", 0) / 1024, 1),
+        "shared_mb": round(shared / 1024, 1),
+        "private_mb": round(private / 1024, 1),
+    }
+
+
+def worker_memory() -> Dict[str, Any]:
+    """This process's memory, overall and for the mmapped weights (Linux only)."""
+    report: Dict[str, Any] = {"pid": os.getpid(), "preloaded_models": preloaded_models()}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            report["process"] = _mb(_parse_smaps(f.read()))
+        with open("/proc/self/smaps") as f:
+            report["weights"] = _mb(_parse_smaps(f.read(), ".safetensors"))
+    except OSError:
+        pass  # no procfs: pid and model list only
+    return report
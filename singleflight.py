@@ -0,0 +1,79 @@
+"""Single-flight execution: concurrent calls with the same key share one run.
+
+Used for model loads (two requests for an unloaded 7B model must not both
+call from_pretrained) and for identical in-flight chat requests, such as a
+double-submit, which share one generation.
+
+Each flight gets a JointCancellationToken holding every caller's token, so
+shared work is only cancelled (HF stopping criterion, task cancellation)
+once every caller has given up, not when the first one does.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+from cancellation import CancellationToken, JointCancellationToken
+
+T = TypeVar("T")
+
+
+class _Flight:
+    def __init__(self, task: "asyncio.Task[Any]", token: JointCancellationToken):
+        self.task = task
+        self.token = token
+        self.waiters = 0
+        self.fanout = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent ``do(key, fn)`` calls into one execution of ``fn`` per key."""
+
+    def __init__(self, cancel_abandoned: bool = True):
+        # Loads keep going when every waiter leaves (the model is cached for the next request)
+        self.cancel_abandoned = cancel_abandoned
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.abandoned = 0
+        self.max_fanout = 0
+
+    async def do(self, key: Hashable, fn: Callable[[CancellationToken], Awaitable[T]],
+                 cancel_token: Optional[CancellationToken] = None) -> Tuple[T, bool]:
+        """(result, shared): `shared` is True when another caller's execution was joined."""
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            token = JointCancellationToken()
+            flight = _Flight(asyncio.ensure_future(fn(token)), token)
+            self._flights[key] = flight
+            self.executions += 1
+            flight.task.add_done_callback(lambda task: self._finish(key, flight))
+        else:
+            self.coalesced += 1
+        flight.token.add(cancel_token)
+        flight.waiters += 1
+        flight.fanout += 1
+        self.max_fanout = max(self.max_fanout, flight.fanout)
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done() and self.cancel_abandoned:
+                self.abandoned += 1
+                flight.task.cancel()
+
+    def _finish(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled():
+            flight.task.exception()  # retrieved here too, in case every waiter was cancelled
+
+    def snapshot(self) -> Dict[str, Any]:
+        calls = self.executions + self.coalesced
+        return {
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._flights),
+            "abandoned": self.abandoned,
+            "max_fanout": self.max_fanout,
+            "avg_fanout": round(calls / self.executions, 2) if self.executions else 0.0,
+        }
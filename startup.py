@@ -0,0 +1,55 @@
+"""Startup phase timing for Spectra AI.
+
+Records how long each startup phase took (relative to when main.py began
+importing) so time-to-first-request can be tracked and budgeted. The report
+is logged once the app is ready and exposed at /api/debug/state.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class StartupReport:
+    """Phase-by-phase startup timings."""
+
+    def __init__(self, origin: Optional[float] = None):
+        # perf_counter() value all offsets are measured from
+        self.origin = origin if origin is not None else time.perf_counter()
+        self.phases: List[Dict[str, Any]] = []
+        self.ready_ms: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _ms(self, value: float) -> float:
+        return round((value - self.origin) * 1000, 2)
+
+    def record(self, name: str, start: float, end: float, blocking: bool = True, **extra: Any) -> None:
+        with self._lock:
+            self.phases.append({
+                "phase": name,
+                "start_ms": self._ms(start),
+                "duration_ms": round((end - start) * 1000, 2),
+                "blocking": blocking,
+                **extra,
+            })
+
+    @contextmanager
+    def phase(self, name: str, blocking: bool = True, **extra: Any) -> Iterator[None]:
+        """Time a block as a named phase (safe to use from worker threads)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter(), blocking, **extra)
+
+    def mark_ready(self) -> None:
+        self.ready_ms = self._ms(time.perf_counter())
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            phases = sorted(self.phases, key=lambda p: p["start_ms"])
+        return {
+            "ready": self.ready_ms is not None,
+            "time_to_ready_ms": self.ready_ms,
+            "phases": phases,
+        }
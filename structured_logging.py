@@ -0,0 +1,245 @@
+"""Structured logging setup for Spectra AI.
+
+Two modes, selected with SPECTRA_LOG_MODE:
+ - sync (default): events are rendered and written on the calling thread
+   through the stdlib logging integration.
+ - async: the caller only builds the event dict and appends it to a bounded
+   buffer; a background writer thread renders and writes it. A full buffer
+   drops (and counts) events instead of blocking the event loop.
+
+Both modes honour per-event sampling (SPECTRA_LOG_SAMPLING), e.g.
+``chat_request=0.01,response_generated=0.1``. Warnings and errors are
+never sampled out.
+"""
+import collections
+import logging
+import random
+import sys
+import threading
+from typing import Any, Callable, Deque, Dict, List, Optional, TextIO
+
+import structlog
+
+# Levels that are always kept regardless of the sampling rate of their event.
+_UNSAMPLED_METHODS = frozenset({"warning", "warn", "error", "critical", "exception", "fatal"})
+
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """Parse ``event=rate,event=rate`` into a rate table (rates clamped to [0, 1])."""
+    rates: Dict[str, float] = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        event, _, rate = item.partition("=")
+        try:
+            rates[event.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
+
+
+class EventSampler:
+    """structlog processor keeping only a fraction of selected events."""
+
+    def __init__(self, rates: Dict[str, float], rng: Optional[Callable[[], float]] = None):
+        self.rates = dict(rates)
+        self._random = rng or random.random
+        self._lock = threading.Lock()
+        self.sampled_out: Dict[str, int] = {}
+
+    def __call__(self, logger: Any, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+        rate = self.rates.get(event_dict.get("event"))
+        if rate is None or rate >= 1.0 or method_name in _UNSAMPLED_METHODS:
+            return event_dict
+        if self._random() < rate:
+            return event_dict
+        with self._lock:
+            event = event_dict.get("event")
+            self.sampled_out[event] = self.sampled_out.get(event, 0) + 1
+        raise structlog.DropEvent
+
+
+class LogBuffer:
+    """Bounded buffer drained by a background writer thread.
+
+    Appending never waits for the writer: when the buffer is full the event is
+    dropped and counted. The writer renders events off the calling thread.
+    The counters are updated under a lock shared by producers and the writer.
+    """
+
+    def __init__(self, renderer: Callable[..., Any], stream: Optional[TextIO] = None,
+                 maxsize: int = 10000, flush_interval: float = 0.05):
+        self.renderer = renderer
+        self.stream = stream or sys.stdout
+        self.maxsize = max(maxsize, 1)
+        self.flush_interval = flush_interval
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self._events: Deque[Dict[str, Any]] = collections.deque()
+        # Producers and the writer thread all update the counters
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def put(self, event_dict: Dict[str, Any]) -> None:
+        with self._lock:
+            if len(self._events) >= self.maxsize:
+                self.dropped += 1
+                return
+            self._events.append(event_dict)
+            self.enqueued += 1
+
+    def depth(self) -> int:
+        return len(self._events)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "buffer_size": self.maxsize,
+                "buffer_depth": len(self._events),
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "dropped": self.dropped,
+            }
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="spectra-log-writer", daemon=True)
+            self._thread.start()
+
+    def drain(self) -> None:
+        """Render and write everything currently buffered."""
+        lines: List[str] = []
+        while self._events:
+            event_dict = self._events.popleft()
+            try:
+                lines.append(str(self.renderer(None, event_dict.get("level", "info"), event_dict)))
+            except Exception as e:  # noqa: BLE001 - a bad event must not kill the writer
+                lines.append(f"log_render_failed: {e!r}")
+        if lines:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+            with self._lock:
+                self.written += len(lines)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.drain()
+        self.drain()
+
+    def stop(self) -> None:
+        """Stop the writer after flushing buffered events."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.drain()
+
+
+class BufferLogger:
+    """Minimal structlog logger that hands event dicts to a LogBuffer."""
+
+    def __init__(self, buffer: LogBuffer, name: Optional[str] = None):
+        self._buffer = buffer
+        self.name = name or "root"
+
+    def msg(self, **event_dict: Any) -> None:
+        self._buffer.put(event_dict)
+
+    debug = info = warning = warn = error = critical = exception = fatal = log = msg
+
+
+class BufferLoggerFactory:
+    """structlog logger factory producing BufferLoggers bound to one buffer."""
+
+    def __init__(self, buffer: LogBuffer):
+        self.buffer = buffer
+
+    def __call__(self, *args: Any) -> BufferLogger:
+        return BufferLogger(self.buffer, args[0] if args else None)
+
+
+class LoggingPipeline:
+    """Handle on the configured logging pipeline (stats + shutdown)."""
+
+    def __init__(self, mode: str, sampler: EventSampler, buffer: Optional[LogBuffer] = None):
+        self.mode = mode
+        self.sampler = sampler
+        self.buffer = buffer
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for /api/metrics."""
+        stats: Dict[str, Any] = {
+            "mode": self.mode,
+            "sampling": self.sampler.rates,
+            "sampled_out": dict(self.sampler.sampled_out),
+        }
+        if self.buffer is not None:
+            stats.update(self.buffer.stats())
+        return stats
+
+    def stop(self) -> None:
+        """Flush buffered events and stop the writer thread."""
+        if self.buffer is not None:
+            self.buffer.stop()
+
+
+def _renderer(log_format: str) -> Any:
+    return structlog.processors.JSONRenderer() if log_format == 'json' else structlog.dev.ConsoleRenderer()
+
+
+def configure_logging(log_format: str = 'json', mode: str = 'sync', sampling: str = '',
+                      queue_size: int = 10000, level: str = 'INFO',
+                      stream: Optional[TextIO] = None) -> LoggingPipeline:
+    """Configure structlog and return the pipeline handle."""
+    sampler = EventSampler(parse_sampling(sampling))
+
+    if mode != 'async':
+        # filter_by_level defers to the stdlib logger, so the level goes on the root logger
+        root = logging.getLogger()
+        if not root.handlers:
+            handler = logging.StreamHandler(stream or sys.stdout)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            root.addHandler(handler)
+        root.setLevel(level.upper())
+        structlog.configure(
+            processors=[
+                structlog.stdlib.filter_by_level,
+                sampler,
+                structlog.stdlib.add_logger_name,
+                structlog.stdlib.add_log_level,
+                structlog.stdlib.PositionalArgumentsFormatter(),
+                structlog.processors.TimeStamper(fmt="iso"),
+                structlog.processors.StackInfoRenderer(),
+                structlog.processors.format_exc_info,
+                structlog.processors.UnicodeDecoder(),
+                _renderer(log_format),
+            ],
+            context_class=dict,
+            logger_factory=structlog.stdlib.LoggerFactory(),
+            wrapper_class=structlog.stdlib.BoundLogger,
+            cache_logger_on_first_use=True,
+        )
+        return LoggingPipeline('sync', sampler)
+
+    # Async: the caller only filters, samples and stamps the event dict;
+    # exceptions are formatted eagerly because tracebacks can't outlive the call.
+    buffer = LogBuffer(_renderer(log_format), stream=stream, maxsize=queue_size)
+    structlog.configure(
+        processors=[
+            sampler,
+            structlog.stdlib.add_logger_name,
+            structlog.processors.add_log_level,
+            structlog.processors.TimeStamper(fmt="iso"),
+            structlog.processors.StackInfoRenderer(),
+            structlog.processors.format_exc_info,
+            structlog.processors.UnicodeDecoder(),
+        ],
+        context_class=dict,
+        logger_factory=BufferLoggerFactory(buffer),
+        wrapper_class=structlog.make_filtering_bound_logger(logging.getLevelName(level.upper())),
+        cache_logger_on_first_use=True,
+    )
+    buffer.start()
+    return LoggingPipeline('async', sampler, buffer)
@@ -0,0 +1,168 @@
+"""Rolling conversation summaries that keep long-history prompts bounded.
+
+Once a conversation's history crosses a token threshold, the turns before
+the most recent few are summarized in the background by a cheap model, and
+later requests send that summary in place of the turns it covers.
+
+Summaries are cached by a chained digest of the turns they cover, so the
+digest of every history prefix can be computed in one pass and the longest
+already-summarized prefix found without any model call. A new summary
+extends the best cached one with the turns after it. The request path never
+waits for a summary: until one is ready, the oldest turns are dropped to
+stay under the threshold (what the fixed 10-message window did before).
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import structlog
+
+from latency_stats import RollingWindow
+from prompt_templates import estimate_tokens
+
+logger = structlog.get_logger()
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain the running summary of a conversation between a user and Spectra, "
+    "an emotionally intelligent assistant. Update the summary with the new messages. "
+    "Keep names, facts about the user, preferences, decisions, open questions and the "
+    "emotional context; drop small talk. Write plain prose in the third person, at most "
+    "{words} words. Reply with the summary only."
+)
+
+Turn = Dict[str, str]
+
+
+@dataclass
+class Summary:
+    text: str
+    covered: int  # number of leading turns the summary replaces
+    tokens: int
+
+
+def prefix_digests(turns: List[Turn]) -> List[str]:
+    """digests[i] identifies turns[:i] (chained, so every prefix costs one hash)."""
+    digests = [""]
+    for turn in turns:
+        h = hashlib.sha256(digests[-1].encode())
+        h.update(f"{turn['role']}\0{turn['content']}".encode("utf-8"))
+        digests.append(h.hexdigest())
+    return digests
+
+
+def _transcript(turns: List[Turn]) -> str:
+    names = {"user": "User", "assistant": "Spectra", "system": "System"}
+    return "\n".join(f"{names.get(t['role'], t['role'])}: {t['content']}" for t in turns)
+
+
+class ConversationSummarizer:
+    """Digest-keyed summary cache plus background summarization."""
+
+    def __init__(self, summarize: Callable[[List[Turn]], Awaitable[str]], threshold_tokens: int = 1500,
+                 keep_recent: int = 6, max_summary_tokens: int = 300, cache_size: int = 256,
+                 max_pending: int = 4):
+        self.summarize = summarize
+        self.threshold_tokens = threshold_tokens
+        self.keep_recent = keep_recent
+        self.max_summary_tokens = max_summary_tokens
+        self.cache_size = cache_size
+        self.max_pending = max_pending
+        self.cache: "OrderedDict[str, Summary]" = OrderedDict()
+        self.pending: Dict[str, asyncio.Task] = {}
+        self.latency = RollingWindow(100)
+        self.stats = {"compacted": 0, "summary_hits": 0, "summary_misses": 0, "scheduled": 0,
+                      "completed": 0, "failed": 0, "skipped": 0, "tokens_saved": 0}
+
+    def _cached(self, digests: List[str], upto: int) -> Optional[Summary]:
+        """Summary of the longest prefix of turns[:upto] in the cache."""
+        for covered in range(upto, 0, -1):
+            summary = self.cache.get(digests[covered])
+            if summary is not None:
+                self.cache.move_to_end(digests[covered])
+                return summary
+        return None
+
+    def compact(self, turns: List[Turn]) -> Tuple[Optional[str], List[Turn]]:
+        """(summary text or None, turns to send) for a history, bounded by the token threshold."""
+        tokens = [estimate_tokens(t["content"]) for t in turns]
+        total = sum(tokens)
+        if total <= self.threshold_tokens:
+            return None, turns
+
+        self.stats["compacted"] += 1
+        split = max(len(turns) - self.keep_recent, 0)
+        digests = prefix_digests(turns)
+        summary = self._cached(digests, split)
+        covered = summary.covered if summary is not None else 0
+        self.stats["summary_hits" if summary is not None else "summary_misses"] += 1
+
+        # Summarize the older turns once enough of them are uncovered
+        uncovered = sum(tokens[covered:split])
+        if split > covered and (summary is None or uncovered >= self.threshold_tokens // 2):
+            self._schedule(digests[split], turns[covered:split], summary, split)
+
+        # Drop the oldest remaining turns until the prompt fits (always keeping the recent ones)
+        start = covered
+        budget = self.threshold_tokens - (summary.tokens if summary is not None else 0)
+        sent = sum(tokens[start:])
+        while sent > budget and len(turns) - start > self.keep_recent:
+            sent -= tokens[start]
+            start += 1
+        # A summary longer than the turns it replaces saves nothing (the cost shows in prompt tokens)
+        self.stats["tokens_saved"] += max(total - sent - (summary.tokens if summary is not None else 0), 0)
+        return (summary.text if summary is not None else None), turns[start:]
+
+    def _schedule(self, digest: str, turns: List[Turn], base: Optional[Summary], covered: int) -> None:
+        if digest in self.pending or digest in self.cache:
+            return
+        if len(self.pending) >= self.max_pending:
+            self.stats["skipped"] += 1
+            return
+        self.stats["scheduled"] += 1
+        task = asyncio.create_task(self._run(digest, turns, base, covered))
+        self.pending[digest] = task
+        task.add_done_callback(lambda _: self.pending.pop(digest, None))
+
+    async def _run(self, digest: str, turns: List[Turn], base: Optional[Summary], covered: int) -> None:
+        words = max(self.max_summary_tokens * 3 // 4, 20)
+        content = _transcript(turns)
+        if base is not None:
+            content = f"Summary so far:\n{base.text}\n\nNew messages:\n{content}"
+        messages = [
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS.format(words=words)},
+            {"role": "user", "content": content},
+        ]
+        start = time.perf_counter()
+        try:
+            text = (await self.summarize(messages)).strip()
+        except Exception as e:  # noqa: BLE001 - the request path falls back to trimming
+            self.stats["failed"] += 1
+            logger.warning("summary_failed", turns=covered, error=str(e))
+            return
+        self.latency.record(time.perf_counter() - start)
+        if not text:
+            self.stats["failed"] += 1
+            return
+        self.cache[digest] = Summary(text, covered, estimate_tokens(text))
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        self.stats["completed"] += 1
+        logger.info("summary_cached", turns=covered, tokens=self.cache[digest].tokens,
+                    extended=base is not None)
+
+    async def drain(self) -> None:
+        """Wait for the summaries in flight."""
+        while self.pending:
+            await asyncio.gather(*list(self.pending.values()), return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "cached": len(self.cache),
+            "pending": len(self.pending),
+            "threshold_tokens": self.threshold_tokens,
+            "latency": self.latency.snapshot(),
+        }
@@ -0,0 +1,140 @@
+"""Tests for per-request deadlines and generation cancellation."""
+import asyncio
+
+import pytest
+
+from cancellation import (
+    CLIENT_DISCONNECTED,
+    DEADLINE_EXCEEDED,
+    CancellationMetrics,
+    CancellationToken,
+    GenerationCancelled,
+    cancel_stopping_criteria,
+    run_cancellable,
+)
+
+
+async def test_deadline_cancels_work():
+    metrics = CancellationMetrics()
+    token = CancellationToken.with_timeout(0.05, metrics)
+    cancelled = asyncio.Event()
+
+    async def slow_cloud_call():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            token.report_saved("openai")
+            cancelled.set()
+            raise
+
+    with pytest.raises(GenerationCancelled) as exc:
+        await run_cancellable(slow_cloud_call(), token, poll_interval=0.01)
+    assert exc.value.reason == DEADLINE_EXCEEDED
+    await asyncio.wait_for(cancelled.wait(), 1)
+    snapshot = metrics.snapshot()
+    assert snapshot["cancelled"] == {DEADLINE_EXCEEDED: 1}
+    assert snapshot["cloud_calls_cancelled"] == snapshot["cancelled_remote"] == 1
+    # No savings sample: the remote call's progress is unknown
+    assert snapshot["savings_samples"] == 0 and snapshot["avg_tokens_saved"] is None
+
+
+def test_remote_cancellations_do_not_dilute_savings():
+    metrics = CancellationMetrics()
+    for provider in ("openai", "anthropic", "local"):
+        CancellationToken(metrics=metrics).report_saved(provider)
+    CancellationToken(metrics=metrics).report_saved("huggingface", 40, 2.0)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["cancelled_remote"] == 3
+    assert snapshot["savings_samples"] == 1
+    assert snapshot["avg_tokens_saved"] == 40.0 and snapshot["avg_compute_seconds_saved"] == 2.0
+
+
+async def test_client_disconnect_cancels_work():
+    token = CancellationToken()
+    polls = []
+
+    async def is_disconnected():
+        polls.append(1)
+        return len(polls) >= 2
+
+    with pytest.raises(GenerationCancelled) as exc:
+        await run_cancellable(asyncio.sleep(10), token, is_disconnected, poll_interval=0.01)
+    assert exc.value.reason == CLIENT_DISCONNECTED
+    assert token.cancelled
+
+
+async def test_completed_work_returns_result():
+    token = CancellationToken.with_timeout(5)
+
+    async def quick():
+        return "done"
+
+    assert await run_cancellable(quick(), token, poll_interval=0.01) == "done"
+    assert not token.cancelled
+
+
+def test_hf_generation_stops_when_cancelled():
+    """A cancelled token halts decoding at the next step and reports the saved tokens."""
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    from hf_provider import HuggingFaceProvider
+
+    model = transformers.GPT2LMHeadModel(transformers.GPT2Config(
+        vocab_size=64, n_layer=1, n_head=2, n_embd=16, n_positions=128, bos_token_id=0, eos_token_id=1))
+    provider = HuggingFaceProvider()
+    metrics = CancellationMetrics()
+    token = CancellationToken(metrics=metrics)
+    token.cancel(CLIENT_DISCONNECTED)
+
+    input_ids = torch.tensor([[2, 3, 4, 5]])
+    generation_kwargs = {
+        "max_new_tokens": 50,
+        "do_sample": False,
+        "pad_token_id": 1,
+        "stopping_criteria": transformers.StoppingCriteriaList([cancel_stopping_criteria(token)]),
+    }
+    output = provider._generate(model, input_ids, generation_kwargs, token)
+    generated = output.shape[-1] - input_ids.shape[-1]
+    assert generated == 1
+    assert metrics.snapshot()["tokens_saved"] == 49
+
+
+def test_chat_endpoint_returns_504_past_deadline(monkeypatch):
+    from fastapi.testclient import TestClient
+    import main
+
+    seen = {}
+
+    async def slow_generate(message, history=None, cancel_token=None, user_id=None):
+        seen["token"] = cancel_token
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(main, "REQUEST_TIMEOUT", 0.05)
+    monkeypatch.setattr(main.spectra, "generate_response", slow_generate)
+    response = TestClient(main.app).post('/api/chat', json={"message": "hello"})
+    assert response.status_code == 504
+    assert response.json()["detail"]["error"] == DEADLINE_EXCEEDED
+    assert seen["token"].cancelled
+
+
+async def test_sdk_timeout_at_the_deadline_is_a_deadline_hit(serve_app):
+    import openai
+    from fastapi import FastAPI
+
+    from providers import DEADLINE_TIMEOUT_MARGIN, OpenAIProvider
+
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def never_answers():
+        await asyncio.sleep(1)
+
+    provider = OpenAIProvider()
+    provider.available = True
+    provider.client = openai.AsyncOpenAI(api_key="test", base_url=f"{serve_app(app)}/v1", max_retries=0)
+    token = CancellationToken.with_timeout(0.1)
+    # Called without run_cancellable, the SDK's own timeout (deadline + margin) ends the request
+    with pytest.raises(GenerationCancelled) as exc:
+        await provider.chat([{"role": "user", "content": "hi"}], "gpt-4o-mini", cancel_token=token)
+    assert exc.value.reason == DEADLINE_EXCEEDED and DEADLINE_TIMEOUT_MARGIN > 0
@@ -0,0 +1,56 @@
+"""Fast-path codec tests: the fast /api/chat must match the standard one."""
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def codec_client(monkeypatch):
+    """App exposing both chat endpoints side by side with a stubbed generator."""
+    async def fake_generate(message, history=None, **kwargs):
+        return {"response": f"echo:{message}:{len(history or [])}", "model": "openai:gpt-4o-mini", "processing_time": 0.01}
+
+    monkeypatch.setattr(main.spectra, "generate_response", fake_generate)
+    app = FastAPI()
+    app.post('/standard', response_model=main.ChatResponse)(main.chat_endpoint)
+    app.post('/fast', response_model=main.ChatResponse)(main.chat_endpoint_fast)
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("body,headers", [
+    (b'', {}),
+    (b'{bad', {"content-type": "application/json"}),
+    (b'{"message": ""}', {"content-type": "application/json"}),
+    (b'{"message": "x", "history": [{"role": "robot", "content": ""}]}', {"content-type": "application/json"}),
+    (json.dumps({"message": "x", "history": [{"role": "user", "content": "a"}] * 51}).encode(), {"content-type": "application/json"}),
+    (b'[]', {"content-type": "application/json"}),
+    (b'message=hi', {"content-type": "text/plain"}),
+])
+def test_fast_codec_error_shapes_match(codec_client, body, headers):
+    """Invalid bodies produce identical 422 payloads on both paths."""
+    standard = codec_client.post('/standard', content=body, headers=headers)
+    fast = codec_client.post('/fast', content=body, headers=headers)
+    assert standard.status_code == 422
+    assert fast.status_code == standard.status_code
+    assert fast.json() == standard.json()
+
+
+def test_fast_codec_success_matches(codec_client):
+    """Valid requests produce the same response fields on both paths."""
+    payload = {"message": "hello", "history": [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hey"}]}
+    standard = codec_client.post('/standard', json=payload).json()
+    fast = codec_client.post('/fast', json=payload).json()
+    assert set(fast) == set(standard)
+    for key in ("response", "model", "model_used", "processing_time"):
+        assert fast[key] == standard[key]
+
+
+def test_decode_chat_request_roundtrip():
+    """The decoder returns a validated ChatRequest."""
+    request = main.decode_chat_request(b'{"message": "hi", "history": [{"role": "user", "content": "a", "timestamp": null}]}')
+    assert request.message == "hi"
+    assert request.history[0].role == "user"
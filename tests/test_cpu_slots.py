@@ -0,0 +1,107 @@
+"""Tests for CPU slot partitioning of local inference."""
+import asyncio
+import os
+import threading
+
+import pytest
+import torch
+
+import cpu_slots
+import executors
+from cpu_slots import CPUResourceManager, parse_cpulist, plan_slots
+from executors import BlockingExecutor
+
+
+@pytest.fixture(autouse=True)
+def _restore_torch_threads():
+    threads = torch.get_num_threads()
+    yield
+    torch.set_num_threads(threads)
+
+
+def test_parse_cpulist():
+    assert parse_cpulist("0-3,8,10-11\n") == [0, 1, 2, 3, 8, 10, 11]
+    assert parse_cpulist("") == []
+
+
+def test_slots_stay_inside_numa_nodes():
+    nodes = [list(range(0, 8)), list(range(8, 16))]
+    cpus = list(range(16))
+    # Two slots: one per node, not both on node 0
+    assert plan_slots(cpus, 2, 4, nodes) == [[0, 1, 2, 3], [8, 9, 10, 11]]
+    # Equal share by default, and no slot straddles a node
+    four = plan_slots(cpus, 4, 0, nodes)
+    assert all(len(slot) == 4 for slot in four)
+    assert all(set(slot) <= set(nodes[0]) or set(slot) <= set(nodes[1]) for slot in four)
+    assert sorted(cpu for slot in four for cpu in slot) == cpus
+
+
+def test_oversubscribed_layouts_share_cores():
+    plan = plan_slots([0, 1, 2, 3], 3, 2)
+    assert plan == [[0, 1], [2, 3], [0, 1]]
+    assert plan_slots([0, 1], 1, 8) == [[0, 1]]  # capped at the cores that exist
+    manager = CPUResourceManager(3, 2, cpus=[0, 1, 2, 3], nodes=[[0, 1, 2, 3]])
+    assert manager.oversubscribed and manager.threads_per_slot == 2
+
+
+def test_unknown_pin_mode_is_rejected():
+    with pytest.raises(ValueError):
+        CPUResourceManager(1, pin="sockets")
+
+
+def test_prefork_workers_get_disjoint_cores(monkeypatch):
+    monkeypatch.setattr(cpu_slots, "available_cpus", lambda: list(range(8)))
+    monkeypatch.setattr(cpu_slots, "numa_nodes", lambda cpus=None: [[0, 1, 2, 3], [4, 5, 6, 7]])
+    monkeypatch.setenv("SPECTRA_CPU_SLOTS", "2")
+    monkeypatch.setenv("SPECTRA_WORKERS", "2")
+    monkeypatch.setenv("SPECTRA_WORKER_INDEX", "1")
+    manager = CPUResourceManager.from_env()
+    assert [slot.cpus for slot in manager.slots] == [[4, 5], [6, 7]]
+    assert manager.snapshot()["numa_nodes"] == 1
+
+    monkeypatch.setenv("SPECTRA_CPU_SLOTS", "0")
+    assert CPUResourceManager.from_env() is None
+
+
+async def test_executor_threads_are_bound_and_pinned():
+    cpus = cpu_slots.available_cpus()
+    manager = CPUResourceManager(1, pin="cores", cpus=cpus[:1], nodes=[cpus[:1]])
+    executor = BlockingExecutor("cpu-test", manager.slot_count, manager.bind_thread)
+
+    def work():
+        with manager.busy() as slot:
+            return slot.index, sorted(os.sched_getaffinity(0)), torch.get_num_threads()
+
+    assert await executor.run(work) == (0, cpus[:1], 1)
+    assert sorted(os.sched_getaffinity(0)) == cpus  # only the worker thread was pinned
+    snapshot = manager.snapshot()["slots"][0]
+    assert snapshot["bound"] and snapshot["jobs"] == 1 and not snapshot["active"]
+    executor.shutdown()
+
+
+async def test_torch_threads_are_sized_once_per_process(monkeypatch):
+    calls = []
+    monkeypatch.setattr(torch, "set_num_threads", calls.append)
+    manager = CPUResourceManager(2, cpus=[0, 1, 2, 3], nodes=[[0, 1, 2, 3]])
+    executor = BlockingExecutor("cpu-test", manager.slot_count, manager.bind_thread)
+    barrier = threading.Barrier(2)
+
+    def work():
+        barrier.wait(timeout=5)  # both slots bound at once
+        return manager.bind_thread().index
+
+    assert sorted(await asyncio.gather(executor.run(work), executor.run(work))) == [0, 1]
+    assert calls == [2]  # the cores divided by the slots, set by whichever slot bound first
+    executor.shutdown()
+
+
+async def test_huggingface_generation_runs_in_a_slot(tiny_chat_model_dir, monkeypatch):
+    from hf_provider import HuggingFaceProvider
+
+    monkeypatch.setattr(executors, "_executors", dict(executors._executors))  # keep the slot pool local
+    monkeypatch.setenv("SPECTRA_CPU_SLOTS", "1")
+    provider = HuggingFaceProvider()
+    assert provider.executor.max_workers == 1
+    await provider.chat([{"role": "user", "content": "w1 w2"}], tiny_chat_model_dir, max_tokens=4)
+    stats = provider.cpu_stats()
+    assert stats["slots"][0]["jobs"] == 1 and stats["slots"][0]["busy_seconds"] > 0
@@ -0,0 +1,69 @@
+"""Tests for per-provider executors."""
+import asyncio
+import threading
+import time
+
+from executors import BlockingExecutor, get_executor, parse_executor_sizes
+
+
+def test_parse_executor_sizes():
+    assert parse_executor_sizes("huggingface=1, Memory=3,bad=0,worse=x,noequals") == {"huggingface": 1, "memory": 3}
+    assert parse_executor_sizes("") == {}
+
+
+def test_sizes_come_from_env(monkeypatch):
+    monkeypatch.setenv("SPECTRA_EXECUTORS", "sized-for-test=3")
+    assert get_executor("sized-for-test").max_workers == 3
+    assert get_executor("sized-for-test") is get_executor("sized-for-test")
+    assert get_executor("unsized-for-test").max_workers == 4
+
+
+async def test_saturation_is_reported():
+    executor = BlockingExecutor("test", 1)
+    names = await asyncio.gather(*(executor.run(lambda: (time.sleep(0.05), threading.current_thread().name)[1])
+                                   for _ in range(3)))
+    assert all(name.startswith("spectra-test") for name in names)
+    snapshot = executor.snapshot()
+    assert snapshot["completed"] == 3 and snapshot["saturated"] == 2
+    assert snapshot["active"] == snapshot["queued"] == 0
+    assert snapshot["queue_wait"]["p99_ms"] >= 90
+    assert snapshot["utilization"] > 0
+    executor.shutdown()
+
+
+async def test_cancelled_queued_job_never_runs():
+    executor = BlockingExecutor("test", 1)
+    ran = []
+    blocker = asyncio.ensure_future(executor.run(time.sleep, 0.1))
+    queued = asyncio.ensure_future(executor.run(ran.append, 1))
+    await asyncio.sleep(0.01)
+    assert executor.snapshot()["queued"] == 1
+    queued.cancel()
+    await blocker
+    await asyncio.sleep(0.01)
+    assert ran == [] and executor.snapshot()["queued"] == 0
+    executor.shutdown()
+
+
+async def test_local_backlog_does_not_delay_other_work():
+    local = BlockingExecutor("huggingface-test", 2)
+    cloud = BlockingExecutor("openai-test", 2)
+    # Four 0.5s "generations" on two workers: the local pool is saturated for ~1s
+    backlog = [asyncio.ensure_future(local.run(time.sleep, 0.5)) for _ in range(4)]
+    await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    await cloud.run(time.sleep, 0.01)
+    await asyncio.to_thread(time.sleep, 0.01)  # the default executor is untouched too
+    await asyncio.sleep(0.01)  # and so is the event loop
+    assert time.perf_counter() - start < 0.2
+    assert local.snapshot()["queued"] == 2
+
+    await asyncio.gather(*backlog)
+    local.shutdown()
+    cloud.shutdown()
+
+
+def test_metrics_expose_executors(client):
+    executors = client.get("/api/metrics").json()["executors"]
+    assert all({"workers", "active", "queued", "saturated", "queue_wait"} <= set(v) for v in executors.values())
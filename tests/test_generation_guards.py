@@ -0,0 +1,76 @@
+"""Tests for stop sequences and the repetition guard in local generation."""
+import pytest
+
+from generation_guards import REPETITION, STOP_SEQUENCE, GuardMetrics, RunawayGuard, held_back
+from prompt_templates import builtin_template
+
+
+class _Tokenizer:
+    """Decodes token ids from a fixed vocabulary by concatenation."""
+
+    vocab = {1: "Hello", 2: " there", 3: "\n", 4: "User", 5: ":", 6: " la", 7: "</s>"}
+
+    def decode(self, ids, skip_special_tokens=False):
+        return "".join(self.vocab[i] for i in ids if not (skip_special_tokens and i == 7))
+
+
+def test_stop_sequences_come_from_the_model_family():
+    assert builtin_template("mistralai/Mistral-7B-Instruct-v0.2").stop_sequences() == ["\nSystem:", "\nUser:", "</s>"]
+    assert builtin_template("gpt2").stop_sequences() == ["\nSystem:", "\nUser:"]
+
+
+def test_invented_role_line_stops_generation_and_is_trimmed():
+    guard = RunawayGuard(_Tokenizer(), ["\nUser:"], ngram=0)
+    assert [guard.push(token) for token in (1, 2, 3, 4)] == [False] * 4
+    assert guard.push(5) and guard.reason == STOP_SEQUENCE
+    assert guard.trim("Hello there\nUser:") == "Hello there"
+
+    guard = RunawayGuard(_Tokenizer(), ["</s>"], ngram=0)
+    assert not guard.push(1) and guard.push(7)
+
+
+def test_repeated_ngram_stops_generation():
+    guard = RunawayGuard(_Tokenizer(), [], ngram=2, max_repeats=3)
+    # " la la" is the third (6, 6) bigram once five tokens are in
+    pushed = [guard.push(token) for token in (1, 6, 6, 6, 6)]
+    assert pushed == [False, False, False, False, True] and guard.reason == REPETITION
+
+
+def test_partial_stop_sequences_are_held_back():
+    assert held_back("Hello there\n", ["\nUser:"]) == 1
+    assert held_back("Hello there\nUs", ["\nUser:", "</s>"]) == 3
+    assert held_back("Hello there", ["\nUser:"]) == 0
+
+
+def test_streamer_never_sends_a_stop_sequence():
+    torch = pytest.importorskip("torch")
+    from hf_provider import _first_token_timer
+
+    deltas = []
+    streamer = _first_token_timer(_Tokenizer(), deltas.append, RunawayGuard(_Tokenizer(), ["\nUser:"]))
+    for ids in ([9, 9], [1], [2], [3], [4], [5], [1]):
+        streamer.put(torch.tensor(ids))
+    assert "".join(deltas) == "Hello there"
+
+
+def test_metrics_average_tokens_saved_over_all_requests():
+    metrics = GuardMetrics()
+    metrics.record(STOP_SEQUENCE, 90)
+    metrics.record(None)
+    metrics.record(REPETITION, 30)
+    assert metrics.snapshot() == {"requests": 3, "stopped_early": {STOP_SEQUENCE: 1, REPETITION: 1},
+                                  "tokens_saved": 120, "avg_tokens_saved_per_request": 40.0}
+
+
+async def test_huggingface_generation_halts_at_a_stop_sequence(tiny_chat_model_dir):
+    torch = pytest.importorskip("torch")
+    from hf_provider import HuggingFaceProvider
+
+    torch.manual_seed(0)
+    provider = HuggingFaceProvider()
+    provider.extra_stop_sequences = ["w"]  # every word of the tiny vocabulary starts with "w"
+    response = await provider.chat([{"role": "user", "content": "w1 w2"}], tiny_chat_model_dir, max_tokens=20)
+
+    assert response["usage"]["completion_tokens"] == 1 and response["content"] == ""
+    assert provider.guard_stats() == {"requests": 1, "stopped_early": {STOP_SEQUENCE: 1}, "tokens_saved": 19,
+                                      "avg_tokens_saved_per_request": 19.0}
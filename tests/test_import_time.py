@@ -0,0 +1,49 @@
+"""Cold-import budget for the serverless and main entry points.
+
+Runs `python -X importtime` in a fresh interpreter and fails when an entry
+point pulls in heavy modules at import time or exceeds its time budget
+(override with SPECTRA_IMPORT_BUDGET_MS).
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = {"torch", "transformers", "openai", "anthropic"}
+
+
+def import_profile(statement: str, module: str):
+    """Return (cumulative_ms, imported top-level packages) for a cold import."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT, capture_output=True, text=True, timeout=120,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    cumulative_us = None
+    packages = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        packages.add(name.strip().split(".")[0])
+        if name.rstrip() == f" {module}":
+            cumulative_us = int(cumulative)
+    assert cumulative_us is not None, f"{module} not found in importtime output"
+    return cumulative_us / 1000, packages
+
+
+@pytest.mark.parametrize("statement,module,budget_ms", [
+    ("import sys; sys.path.insert(0, 'api'); import index", "index", 1500),
+    ("import main", "main", 2500),
+])
+def test_cold_import_budget(statement, module, budget_ms):
+    budget_ms = float(os.getenv("SPECTRA_IMPORT_BUDGET_MS", budget_ms))
+    elapsed_ms, packages = import_profile(statement, module)
+    assert not packages & HEAVY_MODULES, f"{module} imports {sorted(packages & HEAVY_MODULES)} at import time"
+    assert elapsed_ms <= budget_ms, f"cold import of {module} took {elapsed_ms:.0f}ms (budget {budget_ms:.0f}ms)"
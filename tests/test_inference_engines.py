@@ -0,0 +1,69 @@
+"""Tests for the pluggable Hugging Face inference engines."""
+import pytest
+
+from inference_engines import ONNX_AVAILABLE, OnnxRuntimeEngine, TorchEngine, model_revision, parse_model_engines
+
+
+def test_parse_model_engines():
+    assert parse_model_engines("org/model-a=onnx, ./local=ONNX-INT8,bad=tpu,noequals") == {
+        "org/model-a": "onnx",
+        "./local": "onnx-int8",
+    }
+    assert parse_model_engines("") == {}
+
+
+@pytest.fixture
+def tiny_model_dir(tmp_path):
+    transformers = pytest.importorskip("transformers")
+    model = transformers.GPT2LMHeadModel(transformers.GPT2Config(
+        vocab_size=64, n_layer=1, n_head=2, n_embd=16, n_positions=128, bos_token_id=0, eos_token_id=1))
+    model.save_pretrained(tmp_path / "model")
+    return tmp_path / "model"
+
+
+def test_model_revision_tracks_local_weights(tiny_model_dir):
+    revision = model_revision(str(tiny_model_dir))
+    assert revision == model_revision(str(tiny_model_dir))
+    (tiny_model_dir / "config.json").write_text((tiny_model_dir / "config.json").read_text() + "\n")
+    assert model_revision(str(tiny_model_dir)) != revision
+
+
+@pytest.mark.parametrize("quantize", [False, True])
+def test_onnx_engine_matches_torch_and_caches_export(tiny_model_dir, tmp_path, monkeypatch, quantize):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("optimum.onnxruntime")
+    import torch
+
+    engine = OnnxRuntimeEngine(cache_dir=str(tmp_path / "cache"), quantize=quantize)
+    onnx_model = engine.load(str(tiny_model_dir), "cpu")
+    revision_dir = engine.revision_dir(str(tiny_model_dir))
+    assert (revision_dir / "fp32" / "model.onnx").exists()
+    assert (revision_dir / "int8" / "model_quantized.onnx").exists() == quantize
+
+    input_ids = torch.tensor([[2, 3, 4]])
+    kwargs = {"attention_mask": torch.ones_like(input_ids), "max_new_tokens": 6, "min_new_tokens": 6,
+              "do_sample": False, "pad_token_id": 1}
+    onnx_output = onnx_model.generate(input_ids=input_ids, **kwargs)
+    assert onnx_output.shape == (1, 9)
+    if not quantize:
+        torch_output = TorchEngine().load(str(tiny_model_dir), "cpu").generate(input_ids=input_ids, **kwargs)
+        assert torch.equal(onnx_output, torch_output)
+
+    # A second load reuses the graph cached for this revision
+    def no_export(*args):
+        raise AssertionError("graph re-exported")
+    monkeypatch.setattr(engine, "_export", no_export)
+    monkeypatch.setattr(engine, "_quantize", no_export)
+    engine.load(str(tiny_model_dir), "cpu")
+
+
+def test_provider_selects_engine_per_model(monkeypatch):
+    monkeypatch.setenv("HF_ENGINE", "torch")
+    monkeypatch.setenv("HF_MODEL_ENGINES", "tiny/model=onnx-int8")
+    from hf_provider import HuggingFaceProvider
+
+    provider = HuggingFaceProvider()
+    assert provider.engine_for("other/model").name == "torch"
+    if ONNX_AVAILABLE:
+        assert provider.engine_for("tiny/model").name == "onnx-int8"
+    assert provider.engine_stats() == {"default": "torch", "overrides": {"tiny/model": "onnx-int8"}, "loaded": {}}
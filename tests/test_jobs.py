@@ -0,0 +1,246 @@
+"""Tests for the asynchronous job API."""
+import asyncio
+import json
+import time
+
+import pytest
+
+import main
+from cancellation import CLIENT_CANCELLED
+from jobs import CANCELLED, QUEUED, RUNNING, SUCCEEDED, JobManager, JobQueueFull
+
+
+async def _fake_generate(message, history=None, *, cancel_token=None, user_id=None, on_delta=None):
+    for word in message.split():
+        on_delta(word + " ")
+        await asyncio.sleep(0.01)
+    return {"response": message, "model": "openai:gpt-4o-mini", "processing_time": 0.05}
+
+
+def _wait_for(client, job_id, status, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/jobs/{job_id}").json()
+        if job["status"] == status:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} never reached {status}: {job}")
+
+
+def test_submit_then_poll_and_subscribe(client, monkeypatch):
+    monkeypatch.setattr(main.spectra, "generate_response", _fake_generate)
+    submitted = client.post("/api/jobs", json={"message": "a long poem please"})
+    assert submitted.status_code == 202
+    job_id = submitted.json()["job_id"]
+
+    job = _wait_for(client, job_id, SUCCEEDED)
+    assert job["partial"] == "a long poem please "
+    assert job["result"]["response"] == "a long poem please" and job["result"]["model"] == "openai:gpt-4o-mini"
+    assert job["finished_at"] is not None and job["expires_at"] is not None
+
+    # Subscribing to a finished job replays its output and ends with the result
+    with client.stream("GET", f"/api/jobs/{job_id}/events") as response:
+        events = [line.split(": ", 1)[1] for line in response.iter_lines() if line.startswith("event: ")]
+    assert events == ["status", "delta", "done"]
+    assert client.get("/api/metrics").json()["jobs"]["completed"][SUCCEEDED] >= 1
+    assert client.get("/api/jobs/unknown").status_code == 404
+
+
+@pytest.mark.parametrize("model", ["openai:gpt-4o-mini", "anthropic:claude-3-haiku-20240307"])
+def test_cloud_jobs_report_partial_output_while_running(client, monkeypatch, streaming_cloud, model):
+    monkeypatch.setattr(main.spectra, "providers", streaming_cloud.providers)
+    monkeypatch.setattr(main.spectra, "auto_model_enabled", False)
+    monkeypatch.setattr(main.spectra, "model", model)
+    streaming_cloud.hold = True
+    job_id = client.post("/api/jobs", json={"message": "first then the rest"}).json()["job_id"]
+
+    deadline = time.monotonic() + 5
+    while (job := client.get(f"/api/jobs/{job_id}").json())["partial"] != "first":
+        assert time.monotonic() < deadline, job
+        time.sleep(0.02)
+    assert job["status"] == RUNNING
+    streaming_cloud.release.set()
+    assert _wait_for(client, job_id, SUCCEEDED)["partial"] == "first then the rest"
+
+
+def _runner(release: asyncio.Event, calls: list):
+    async def run(request, token, on_delta):
+        calls.append(request["message"])
+        on_delta("partial ")
+        await release.wait()
+        return {"response": request["message"], "model": "stub:model", "processing_time": 0.01}
+    return run
+
+
+async def _until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        await asyncio.sleep(0.01)
+
+
+async def test_full_queue_rejects_new_jobs(tmp_path):
+    manager = JobManager(_runner(asyncio.Event(), []), str(tmp_path / "jobs.db"), workers=0, max_queued=2)
+    await manager.start()
+    await manager.submit({"message": "one"})
+    await manager.submit({"message": "two"})
+    with pytest.raises(JobQueueFull):
+        await manager.submit({"message": "three"})
+    assert manager.snapshot()["rejected"] == 1
+    await manager.stop()
+
+
+async def test_queued_and_interrupted_jobs_survive_a_restart(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    release, calls = asyncio.Event(), []
+    first = JobManager(_runner(release, calls), path, workers=1)
+    await first.start()
+    running = await first.submit({"message": "first"})
+    queued = await first.submit({"message": "second"})
+    await _until(lambda: running.status == RUNNING)
+    await first.stop()
+    assert calls == ["first"]
+    # The interrupted job's output stays readable until it runs again
+    assert first.jobs[running.id].partial == "partial "
+
+    second = JobManager(_runner(release, calls), path, workers=1)
+    await second.start()
+    assert second.recovered == 2
+    release.set()
+    await _until(lambda: all(second.jobs[job.id].status == SUCCEEDED for job in (running, queued)))
+    assert calls == ["first", "first", "second"]
+    assert (await second.get(queued.id)).result["response"] == "second"
+    # The rerun started over instead of appending to the first run's output
+    assert (await second.get(running.id)).partial == "partial "
+    await second.stop()
+
+
+async def test_subscribers_are_told_when_a_requeued_job_starts_over(tmp_path, monkeypatch):
+    manager = JobManager(_runner(asyncio.Event(), []), str(tmp_path / "jobs.db"), workers=0)
+    await manager.start()
+    monkeypatch.setattr(main, "jobs", manager)
+    job = await manager.submit({"message": "hi"})
+    events = (await main.job_events(job.id)).body_iterator
+
+    async def receive(count):
+        frames = []
+        while len(frames) < count:
+            frame = await asyncio.wait_for(events.__anext__(), 1)
+            if frame.startswith("event: "):
+                name, data = frame.split("\n")[:2]
+                data = json.loads(data[len("data: "):])
+                frames.append((name[len("event: "):], data.get("status", data.get("text"))))
+        return frames
+
+    def change(**fields):
+        for name, value in fields.items():
+            setattr(job, name, value)
+        manager._notify(job.id)
+
+    assert await receive(1) == [("status", QUEUED)]
+    change(status=RUNNING, started=1.0, partial="first run")
+    assert await receive(2) == [("status", RUNNING), ("delta", "first run")]
+    # Its worker stopped: queued again with the output kept, then a new run starts over
+    change(status=QUEUED, started=None)
+    assert await receive(1) == [("status", QUEUED)]
+    change(status=RUNNING, started=2.0, partial="")
+    assert await receive(2) == [("status", "requeued"), ("status", RUNNING)]
+    change(partial="second")
+    assert await receive(1) == [("delta", "second")]
+    change(status=SUCCEEDED)
+    assert await receive(2) == [("status", SUCCEEDED), ("done", SUCCEEDED)]
+    await manager.stop()
+
+
+async def test_live_workers_adopt_the_jobs_of_a_dead_one(tmp_path):
+    import os
+    import subprocess
+
+    from jobs import Job
+
+    exited = subprocess.Popen(["true"])
+    exited.wait()  # a worker process that died
+    path = str(tmp_path / "jobs.db")
+    release, calls = asyncio.Event(), []
+    manager = JobManager(_runner(release, calls), path, workers=1, recover_interval=0.05)
+    await manager.start()
+    assert manager.recovered == 0
+    release.set()
+
+    now = time.time()
+    manager.store.save(Job(id="was-running", request={"message": "was running"}, status=RUNNING,
+                           partial="lost ", created=now, started=now, owner=exited.pid))
+    manager.store.save(Job(id="was-queued", request={"message": "was queued"}, created=now + 1, owner=exited.pid))
+    # Queued on a worker that is still alive: left to it
+    manager.store.save(Job(id="alive", request={"message": "alive"}, created=now + 2, owner=os.getppid()))
+
+    await _until(lambda: all(job_id in manager.jobs and manager.jobs[job_id].status == SUCCEEDED
+                             for job_id in ("was-running", "was-queued")))
+    assert calls == ["was running", "was queued"] and manager.recovered == 2
+    assert "alive" not in manager.jobs and manager.store.load("alive").status == QUEUED
+    await manager.stop()
+
+
+async def test_cancel_and_ttl_retention(tmp_path):
+    release, calls = asyncio.Event(), []
+    manager = JobManager(_runner(release, calls), str(tmp_path / "jobs.db"), workers=1, ttl=0.05)
+    await manager.start()
+    running = await manager.submit({"message": "first"})
+    queued = await manager.submit({"message": "second"})
+    await _until(lambda: running.status == RUNNING and running.partial == "partial ")
+
+    assert (await manager.cancel(queued.id)).status == CANCELLED
+    await manager.cancel(running.id)
+    await _until(lambda: running.status == CANCELLED)
+    assert running.error == {"status": 499, "error": CLIENT_CANCELLED}
+    assert calls == ["first"]  # the cancelled queued job never ran
+
+    # Expired jobs leave memory and the database (the sweeper may already have run)
+    await asyncio.sleep(0.1)
+    await manager.purge()
+    assert await manager.get(running.id) is None and await manager.get(queued.id) is None
+    await manager.stop()
+
+
+async def test_every_subscriber_sees_each_change(tmp_path):
+    manager = JobManager(_runner(asyncio.Event(), []), str(tmp_path / "jobs.db"), workers=0)
+    await manager.start()
+    job = await manager.submit({"message": "one"})
+    seen = manager.version(job.id)
+    subscribers = [asyncio.create_task(manager.wait_for_change(job.id, seen, 5)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+
+    await manager.cancel(job.id)
+    # Both wake on the one (terminal) change, well before the timeout
+    await asyncio.wait_for(asyncio.gather(*subscribers), 1)
+    # A change since the version a subscriber read is not missed
+    await asyncio.wait_for(manager.wait_for_change(job.id, seen, 5), 0.1)
+    await manager.stop()
+
+
+def test_jobs_are_persisted_as_json(tmp_path):
+    from jobs import Job, JobStore
+
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job = Job(id="abc", request={"message": "hi", "history": [{"role": "user", "content": "x"}]})
+    store.save(job)
+    loaded = store.load("abc")
+    assert loaded == job and loaded.status == QUEUED
+    assert json.loads(store._db.execute("SELECT request FROM jobs").fetchone()[0])["message"] == "hi"
+    store.close()
+
+
+def test_partial_flush_never_overwrites_a_finished_job(tmp_path):
+    from jobs import Job, JobStore
+
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job = Job(id="abc", request={"message": "hi"}, status=RUNNING, owner=1)
+    store.save(job)
+    assert store.save_partial("abc", "hel")
+    job.status, job.partial, job.result = SUCCEEDED, "hello", {"response": "hello"}
+    store.save(job)
+    # A flush still queued on another executor thread when the job finished
+    assert not store.save_partial("abc", "hell")
+    loaded = store.load("abc")
+    assert loaded.status == SUCCEEDED and loaded.partial == "hello"
+    store.close()
@@ -0,0 +1,176 @@
+"""Tests for rolling latency statistics and latency-aware auto-model ordering."""
+import asyncio
+
+import pytest
+
+import main
+from cancellation import CLIENT_CANCELLED, CancellationToken, GenerationCancelled, run_cancellable
+from latency_stats import LatencyTracker, RollingWindow
+
+SONNET = ("anthropic", "claude-3-5-sonnet-20241022")
+GPT4O = ("openai", "gpt-4o")
+MISTRAL = ("huggingface", "mistralai/Mistral-7B-Instruct-v0.2")
+
+
+def _record(tracker, candidate, *latencies):
+    for latency in latencies:
+        tracker.record(f"{candidate[0]}:{candidate[1]}", latency)
+
+
+def test_rolling_window_ring_buffer_and_ewma():
+    window = RollingWindow(size=4, alpha=0.5)
+    for value in (1.0, 2.0, 3.0, 4.0, 10.0, 10.0):
+        window.record(value)
+    # Only the last four samples are kept
+    assert sorted(window.samples) == [3.0, 4.0, 10.0, 10.0]
+    assert window.count == 6
+    assert window.percentile(50) == 10.0
+    assert window.percentile(0) == 3.0
+    assert window.ewma == pytest.approx(8.28125)
+    assert window.snapshot()["p99_ms"] == 10000.0
+
+
+def test_order_prefers_fastest_within_tier():
+    tracker = LatencyTracker(slo=10.0)
+    tiers = [[SONNET, GPT4O], [MISTRAL]]
+    # No data yet: static preference order
+    assert tracker.order(tiers) == [SONNET, GPT4O, MISTRAL]
+
+    _record(tracker, SONNET, 6.0, 6.0)
+    _record(tracker, GPT4O, 2.0, 2.0)
+    assert tracker.order(tiers) == [GPT4O, SONNET, MISTRAL]
+
+
+def test_order_unmeasured_candidates_are_tried_first():
+    tracker = LatencyTracker(slo=10.0)
+    _record(tracker, SONNET, 1.0)
+    assert tracker.order([[SONNET, GPT4O]]) == [GPT4O, SONNET]
+
+
+def test_order_demotes_models_over_slo():
+    tracker = LatencyTracker(slo=3.0)
+    _record(tracker, SONNET, 9.0)
+    _record(tracker, GPT4O, 5.0)
+    _record(tracker, MISTRAL, 1.0)
+    assert tracker.order([[SONNET, GPT4O], [MISTRAL]]) == [MISTRAL, GPT4O, SONNET]
+    assert tracker.snapshot()["models"]["openai:gpt-4o"]["within_slo"] is False
+
+
+def test_exploration_tries_another_first_tier_model():
+    draws = iter([0.01, 0.0])
+    tracker = LatencyTracker(slo=None, exploration_rate=0.05, rng=lambda: next(draws))
+    _record(tracker, SONNET, 9.0)
+    _record(tracker, GPT4O, 1.0)
+    assert tracker.order([[SONNET, GPT4O], [MISTRAL]]) == [SONNET, GPT4O, MISTRAL]
+    assert tracker.snapshot()["explorations"] == 1
+
+
+class _FakeProvider:
+    def __init__(self, models):
+        self.models = models
+
+    def get_models(self):
+        return self.models
+
+    def is_available(self):
+        return True
+
+
+def test_auto_model_uses_live_latency():
+    ai = main.SpectraAI()
+    ai.providers = {
+        "anthropic": _FakeProvider(["claude-3-5-sonnet-20241022", "claude-3-haiku-20240307"]),
+        "openai": _FakeProvider(["gpt-4o", "gpt-4o-mini"]),
+    }
+    ai.available_providers = list(ai.providers)
+    ai.available_models = ai._get_all_available_models()
+    ai.model = "openai:gpt-4o-mini"
+    ai.latency = LatencyTracker(slo=10.0)
+
+    assert ai._choose_context_model("write me a poem") == SONNET
+    ai.latency.record("anthropic:claude-3-5-sonnet-20241022", 9.0)
+    ai.latency.record("openai:gpt-4o", 3.0)
+    assert ai._choose_context_model("write me a poem") == GPT4O
+    assert ai._candidate_models("write me a poem") == [GPT4O, SONNET, ("openai", "gpt-4o-mini")]
+
+    # A failed model is replaced by the next match for its pattern (unmeasured, so tried first)
+    ai.failed_models.add("openai:gpt-4o")
+    assert ai._choose_context_model("write me a poem") == ("openai", "gpt-4o-mini")
+
+
+class _FailingProvider(_FakeProvider):
+    def __init__(self, models, error=None):
+        super().__init__(models)
+        self.error = error
+
+    async def chat(self, messages, model, **kwargs):
+        if self.error is not None:
+            raise self.error
+        await asyncio.sleep(10)  # never answers within the deadline
+
+
+def _failing_spectra():
+    ai = main.SpectraAI()
+    ai.providers = {
+        "anthropic": _FailingProvider(["claude-3-5-sonnet-20241022"]),
+        "openai": _FailingProvider(["gpt-4o"], error=RuntimeError("invalid response")),
+    }
+    ai.latency = LatencyTracker(slo=10.0)
+    return ai
+
+
+async def test_timeouts_and_errors_are_penalty_samples():
+    ai = _failing_spectra()
+    messages = [{"role": "user", "content": "hi"}]
+    for _ in range(3):
+        token = CancellationToken.with_timeout(0.02)
+        with pytest.raises(GenerationCancelled):
+            await run_cancellable(ai._dispatch([SONNET], messages, token), token, poll_interval=0.01)
+    await asyncio.sleep(0.01)  # run_cancellable doesn't wait for the cancelled call to unwind
+    with pytest.raises(RuntimeError):
+        await ai._dispatch([GPT4O], messages, CancellationToken())
+
+    models = ai.latency.snapshot()["models"]
+    assert models["anthropic:claude-3-5-sonnet-20241022"]["failures"] == 3
+    assert ai.latency.estimate("anthropic:claude-3-5-sonnet-20241022") == pytest.approx(20.0)
+    assert models["openai:gpt-4o"]["failures"] == 1
+    # Deadline hits mark the model failed; other errors only cost it its place
+    assert ai.failed_models == {"anthropic:claude-3-5-sonnet-20241022"}
+
+    # The always-timing-out model no longer sorts first as "unmeasured"
+    ai.latency.record("huggingface:mistralai/Mistral-7B-Instruct-v0.2", 4.0)
+    assert ai.latency.order([[SONNET, MISTRAL]]) == [MISTRAL, SONNET]
+
+
+async def test_client_cancellation_is_not_a_penalty():
+    ai = _failing_spectra()
+    token = CancellationToken()
+    task = asyncio.create_task(ai._dispatch([SONNET], [{"role": "user", "content": "hi"}], token))
+    await asyncio.sleep(0.01)
+    token.cancel(CLIENT_CANCELLED)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert ai.latency.snapshot()["models"] == {} and not ai.failed_models
+
+
+def test_failure_penalty_without_slo_uses_the_floor():
+    tracker = LatencyTracker(slo=None)
+    tracker.record_failure("openai:gpt-4o", 0.1, floor=120.0)
+    tracker.record_failure("openai:gpt-4o-mini", 0.1)
+    assert tracker.estimate("openai:gpt-4o") == 120.0 and tracker.estimate("openai:gpt-4o-mini") == 0.1
+
+
+def test_hf_first_token_timer():
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    from hf_provider import HuggingFaceProvider, _first_token_timer
+
+    model = transformers.GPT2LMHeadModel(transformers.GPT2Config(
+        vocab_size=64, n_layer=1, n_head=2, n_embd=16, n_positions=128, bos_token_id=0, eos_token_id=1))
+    timer = _first_token_timer()
+    generation_kwargs = {"max_new_tokens": 5, "min_new_tokens": 5, "do_sample": False,
+                         "pad_token_id": 1, "streamer": timer}
+    HuggingFaceProvider()._generate(model, torch.tensor([[2, 3, 4]]), generation_kwargs, None)
+    assert timer.puts == 6  # prompt + one per generated token
+    assert timer.first_token_at is not None
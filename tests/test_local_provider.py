@@ -0,0 +1,152 @@
+"""Tests for the local OpenAI-compatible provider against stand-in servers."""
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+import main
+from providers import LocalOpenAIProvider
+
+
+def _server_app(name, models, delay=0.0, models_delay=0.0):
+    """Minimal llama.cpp/vLLM-style server: /v1/models and streamed /v1/chat/completions."""
+    app = FastAPI()
+    app.state.active = 0
+    app.state.peak = 0
+    app.state.served = 0
+    app.state.client_ports = set()
+
+    @app.get("/v1/models")
+    async def list_models():
+        await asyncio.sleep(models_delay)
+        return {"object": "list", "data": [{"id": model, "object": "model"} for model in models]}
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        body = await request.json()
+        assert body["stream"] is True
+        app.state.client_ports.add(request.client.port)
+
+        async def events():
+            app.state.active += 1
+            app.state.peak = max(app.state.peak, app.state.active)
+            try:
+                for piece in (f"hello ", f"from {name}"):
+                    await asyncio.sleep(delay)
+                    chunk = {"choices": [{"index": 0, "delta": {"content": piece}}], "model": body["model"]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                usage = {"choices": [], "usage": {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}}
+                yield f"data: {json.dumps(usage)}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                app.state.active -= 1
+                app.state.served += 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def _provider(monkeypatch, urls, model=""):
+    monkeypatch.setenv("LOCAL_OPENAI_URLS", ",".join(urls))
+    monkeypatch.setenv("LOCAL_OPENAI_MODEL", model)
+    return LocalOpenAIProvider()
+
+
+def test_discovers_models_from_all_endpoints(serve_app, monkeypatch):
+    a = serve_app(_server_app("a", ["llama-3-8b", "qwen-7b"]))
+    b = serve_app(_server_app("b", ["qwen-7b", "phi-3"]))
+    provider = _provider(monkeypatch, [f"{a}/v1", f"{b}/v1", "http://127.0.0.1:9/v1"], model="phi-3")
+    assert provider.is_available()
+    assert provider.get_models() == ["phi-3", "llama-3-8b", "qwen-7b"]
+    assert provider.endpoint_stats()["http://127.0.0.1:9/v1"]["models"] == []
+
+
+async def test_refresh_discovers_without_blocking_the_loop(serve_app, monkeypatch):
+    a = serve_app(_server_app("a", ["llama-3-8b"], models_delay=0.3))
+    b = serve_app(_server_app("b", ["phi-3"], models_delay=0.3))
+    provider = _provider(monkeypatch, [f"{a}/v1", f"{b}/v1"])
+    provider.endpoints[0].models = []  # forget what the blocking startup discovery found
+
+    ticks = 0
+
+    async def heartbeat():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    beating = asyncio.create_task(heartbeat())
+    start = asyncio.get_running_loop().time()
+    await provider.refresh()
+    elapsed = asyncio.get_running_loop().time() - start
+    beating.cancel()
+    # Both endpoints were queried at once, and the loop kept running meanwhile
+    assert elapsed < 0.55 and ticks >= 10
+    assert provider.endpoints[0].models == ["llama-3-8b"] and provider.models == ["llama-3-8b", "phi-3"]
+    await provider.client.aclose()
+
+
+def test_unavailable_without_endpoints(monkeypatch):
+    provider = _provider(monkeypatch, [])
+    assert not provider.is_available()
+
+
+async def test_streams_and_reports_usage(serve_app, monkeypatch):
+    url = serve_app(_server_app("a", ["llama-3-8b"]))
+    provider = _provider(monkeypatch, [f"{url}/v1"])
+    response = await provider.chat([{"role": "user", "content": "hi"}], "")
+    assert response["content"] == "hello from a"
+    assert response["model"] == "llama-3-8b"
+    assert response["total_tokens"] == 7
+    assert response["ttft"] is not None
+
+    chunks = [chunk async for chunk in provider.stream([{"role": "user", "content": "hi"}], "llama-3-8b")]
+    assert [c["choices"][0]["delta"]["content"] for c in chunks if c["choices"]] == ["hello ", "from a"]
+
+
+async def test_least_outstanding_balancing(serve_app, monkeypatch):
+    apps = [_server_app("a", ["qwen-7b"], delay=0.1), _server_app("b", ["qwen-7b"], delay=0.1)]
+    urls = [serve_app(app) for app in apps]
+    provider = _provider(monkeypatch, [f"{url}/v1" for url in urls])
+
+    messages = [{"role": "user", "content": "hi"}]
+    results = await asyncio.gather(*(provider.chat(messages, "qwen-7b") for _ in range(8)))
+    assert sorted(r["content"] for r in results) == ["hello from a"] * 4 + ["hello from b"] * 4
+    assert [app.state.peak for app in apps] == [4, 4]
+    assert all(stats["outstanding"] == 0 for stats in provider.endpoint_stats().values())
+
+
+async def test_keep_alive_connections_are_reused(serve_app, monkeypatch):
+    app = _server_app("a", ["qwen-7b"])
+    provider = _provider(monkeypatch, [f"{serve_app(app)}/v1"])
+    for _ in range(3):
+        await provider.chat([{"role": "user", "content": "hi"}], "qwen-7b")
+    assert app.state.served == 3
+    assert len(app.state.client_ports) == 1
+
+
+async def test_connection_failure_fails_over(serve_app, monkeypatch):
+    url = serve_app(_server_app("a", ["qwen-7b"]))
+    provider = _provider(monkeypatch, [f"{url}/v1"])
+    dead = provider.endpoints[0].__class__("http://127.0.0.1:9/v1")
+    dead.models = ["qwen-7b"]
+    provider.endpoints.insert(0, dead)
+
+    response = await provider.chat([{"role": "user", "content": "hi"}], "qwen-7b")
+    assert response["content"] == "hello from a"
+    assert dead.errors == 1 and not dead.is_up()
+
+
+def test_auto_model_routes_to_local(serve_app, monkeypatch):
+    url = serve_app(_server_app("a", ["llama-3-8b"]))
+    ai = main.SpectraAI()
+    ai.providers = {"local": _provider(monkeypatch, [f"{url}/v1"])}
+    ai.available_providers = ["local"]
+    ai.available_models = ai._get_all_available_models()
+    ai.current_provider = ai._select_best_provider(ai.provider_priority)
+    ai.model = ai._select_best_model()
+    assert ai.model == "local:llama-3-8b"
+    assert ai._choose_context_model("write me a poem") == ("local", "llama-3-8b")
@@ -0,0 +1,98 @@
+"""Tests for the sampled / queued structured logging pipeline."""
+import io
+import json
+import logging
+import sys
+import threading
+
+import pytest
+import structlog
+
+from structured_logging import EventSampler, LogBuffer, configure_logging, parse_sampling
+
+
+@pytest.fixture
+def restore_logging():
+    """Put the default sync configuration back after a test reconfigures logging."""
+    root = logging.getLogger()
+    level, handlers = root.level, list(root.handlers)
+    yield
+    configure_logging(mode='sync')
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+def test_parse_sampling():
+    assert parse_sampling("chat_request=0.01, response_generated=2,bad,x=y") == {
+        "chat_request": 0.01,
+        "response_generated": 1.0,
+    }
+
+
+def test_sampler_drops_info_but_keeps_errors():
+    sampler = EventSampler({"chat_request": 0.0}, rng=lambda: 0.5)
+    with pytest.raises(structlog.DropEvent):
+        sampler(None, "info", {"event": "chat_request"})
+    assert sampler(None, "error", {"event": "chat_request"}) == {"event": "chat_request"}
+    assert sampler(None, "info", {"event": "other"}) == {"event": "other"}
+    assert sampler.sampled_out == {"chat_request": 1}
+
+
+def test_buffer_drops_instead_of_blocking():
+    stream = io.StringIO()
+    buffer = LogBuffer(structlog.processors.JSONRenderer(), stream=stream, maxsize=2)
+    for i in range(5):
+        buffer.put({"event": "x", "i": i})
+    assert buffer.enqueued == 2
+    assert buffer.dropped == 3
+    buffer.drain()
+    assert [json.loads(line)["i"] for line in stream.getvalue().splitlines()] == [0, 1]
+
+
+def test_async_pipeline_renders_on_writer_thread(restore_logging):
+    stream = io.StringIO()
+    pipeline = configure_logging(mode='async', sampling="chat_request=0", stream=stream)
+    log = structlog.get_logger("test")
+    log.info("chat_request", preview="hi")
+    log.info("response_generated", provider="openai")
+    log.error("chat_error", error="boom")
+    pipeline.stop()
+
+    events = [json.loads(line)["event"] for line in stream.getvalue().splitlines()]
+    assert events == ["response_generated", "chat_error"]
+    stats = pipeline.stats()
+    assert stats["mode"] == "async"
+    assert stats["sampled_out"] == {"chat_request": 1}
+    assert stats["dropped"] == 0
+
+
+def test_buffer_counters_survive_concurrent_producers():
+    buffer = LogBuffer(structlog.processors.JSONRenderer(), stream=io.StringIO(), maxsize=500)
+    switch = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=lambda: [buffer.put({"event": "x"}) for _ in range(2000)])
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch)
+    buffer.drain()
+    stats = buffer.stats()
+    assert stats["enqueued"] + stats["dropped"] == 16000
+    assert stats["enqueued"] == stats["written"] == 500
+
+
+def test_sync_mode_applies_level(restore_logging):
+    stream = io.StringIO()
+    logging.getLogger().addHandler(logging.StreamHandler(stream))
+    configure_logging(mode='sync', level='debug')
+    structlog.get_logger("test").debug("cache_probe")
+    configure_logging(mode='sync', level='warning')
+    log = structlog.get_logger("test")
+    log.info("chat_request")
+    log.warning("chat_error")
+
+    assert [json.loads(line)["event"] for line in stream.getvalue().splitlines()] == ["cache_probe", "chat_error"]
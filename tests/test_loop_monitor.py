@@ -0,0 +1,61 @@
+"""Tests for the event-loop lag monitor."""
+import asyncio
+import time
+
+import pytest
+
+import main
+from loop_monitor import LoopMonitor
+
+
+def _block_the_loop_for_test(seconds):
+    time.sleep(seconds)
+
+
+async def test_stall_is_measured_with_stack_and_endpoint():
+    monitor = LoopMonitor(interval=0.02, budget=0.05, warn=False)
+    monitor.start()
+    await asyncio.sleep(0.1)
+    assert monitor.stall_count == 0
+
+    async def handler():
+        monitor.tag(asyncio.current_task(), "GET /slow")
+        _block_the_loop_for_test(0.2)
+
+    await asyncio.create_task(handler())
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+
+    snapshot = monitor.snapshot()
+    assert snapshot["stalls"] == 1 and not snapshot["running"]
+    stall = snapshot["recent_stalls"][0]
+    assert 150 < stall["lag_ms"] < 400
+    assert stall["endpoint"] == "GET /slow"
+    assert "in _block_the_loop_for_test" in stall["stack"][-1]
+    assert snapshot["lag"]["p99_ms"] >= 150 and snapshot["max_lag_ms"] == stall["lag_ms"]
+
+
+async def test_short_blocks_count_as_lag_only():
+    monitor = LoopMonitor(interval=0.02, budget=0.2, warn=False)
+    monitor.start()
+    await asyncio.sleep(0.03)
+    _block_the_loop_for_test(0.05)
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+    assert monitor.stall_count == 0 and monitor.max_lag >= 0.03
+
+
+def test_blocking_endpoint_is_reported_in_metrics(client, monkeypatch):
+    if main.loop_monitor is None:
+        pytest.skip("SPECTRA_LOOP_MONITOR is off")
+    monkeypatch.setattr(main.loop_monitor, "budget", 0.05)
+    async def blocking_refresh():
+        _block_the_loop_for_test(0.3)
+
+    monkeypatch.setattr(main.spectra, "refresh_models", blocking_refresh)
+    client.get("/api/models")
+    time.sleep(0.1)
+    event_loop = client.get("/api/metrics").json()["event_loop"]
+    stall = event_loop["recent_stalls"][-1]
+    assert stall["endpoint"] == "GET /api/models"
+    assert any("_block_the_loop_for_test" in line for line in stall["stack"])
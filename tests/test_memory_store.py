@@ -0,0 +1,217 @@
+"""Tests for retrieval-based long-term conversation memory."""
+import asyncio
+
+import numpy as np
+import pytest
+
+import main
+from memory_store import (
+    HNSWLIB_AVAILABLE,
+    ConversationMemory,
+    HashingEmbedder,
+    HNSWIndex,
+    IVFIndex,
+    MemoryRecord,
+    MemoryStore,
+    TransformerEmbedder,
+    sign_user_id,
+    verified_user,
+)
+
+SECRET = "test-memory-secret"
+
+EXCHANGES = [
+    ("My dog Biscuit is a golden retriever", "Biscuit sounds adorable!"),
+    ("I work as a nurse on night shifts", "Night shifts are tough, take care of yourself."),
+    ("My favourite band is Radiohead", "Great taste, OK Computer is a classic."),
+    ("I'm learning to play the piano", "That's wonderful, what are you practising?"),
+]
+
+
+def _records(namespace="default"):
+    return [MemoryRecord(namespace, user, assistant, 0.0) for user, assistant in EXCHANGES]
+
+
+def test_flat_search_ranks_relevant_exchange_first():
+    store = MemoryStore(HashingEmbedder())
+    store.add(_records())
+    store.add([MemoryRecord("someone-else", "My dog Rex is a golden retriever", "Nice!", 0.0)])
+
+    hits = store.search("default", "how is my golden retriever dog doing?", k=2)
+    assert hits[0][0].user == EXCHANGES[0][0]
+    assert hits[0][1] > hits[1][1]
+    assert all(record.namespace == "default" for record, _ in hits)
+    assert store.search("nobody", "dog") == []
+
+
+def test_persisted_store_reopens_from_mmapped_vectors(tmp_path):
+    store = MemoryStore(HashingEmbedder(), path=str(tmp_path))
+    store.add(_records())
+    before = store.search("default", "remind me of my favourite band", k=1)
+
+    reopened = MemoryStore(HashingEmbedder(), path=str(tmp_path))
+    reopened.open()
+    assert len(reopened) == len(EXCHANGES) and reopened.reembedded == 0
+    assert isinstance(reopened.vectors.rows, np.memmap)
+    assert reopened.search("default", "remind me of my favourite band", k=1) == before
+
+    # Another embedder can't use the stored vectors: the exchanges are re-embedded
+    other = MemoryStore(HashingEmbedder(dim=128), path=str(tmp_path))
+    other.open()
+    assert other.reembedded == len(EXCHANGES)
+    assert other.search("default", "remind me of my favourite band", k=1)[0][0].user == EXCHANGES[2][0]
+
+
+def _clustered(n, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(50, dim))
+    data = centers[rng.integers(0, 50, n)] + 0.3 * rng.normal(size=(n, dim))
+    return (data / np.linalg.norm(data, axis=1, keepdims=True)).astype(np.float32)
+
+
+@pytest.mark.parametrize("kind", ["ivf", "hnsw"])
+def test_ann_index_recall_against_brute_force(kind):
+    if kind == "hnsw" and not HNSWLIB_AVAILABLE:
+        pytest.skip("hnswlib not installed")
+    vectors = _clustered(5000, 64)
+    queries = _clustered(50, 64, seed=1)
+    index = IVFIndex(nprobe=8) if kind == "ivf" else HNSWIndex(64)
+    index.build(vectors[:4000])
+    index.add(vectors[4000:], range(4000, 5000))
+
+    recall = []
+    for query in queries:
+        exact = set(np.argsort(-(vectors @ query))[:10])
+        ids, _ = index.search(vectors, query, 10)
+        recall.append(len(exact & set(ids.tolist())) / 10)
+    assert np.mean(recall) >= 0.9
+
+
+def test_store_switches_to_ann_past_threshold():
+    store = MemoryStore(HashingEmbedder(), index="auto", ann_threshold=len(EXCHANGES) + 1)
+    store.add(_records())
+    assert store.active_index() == "flat"
+    store.add([MemoryRecord("default", "I just adopted a kitten", "Congratulations!", 0.0)])
+    assert store.active_index() == ("hnsw" if HNSWLIB_AVAILABLE else "ivf")
+    assert store.search("default", "tell me about my golden retriever", k=1)[0][0].user == EXCHANGES[0][0]
+
+
+def test_transformer_embedder_batches_preserve_order(tmp_path):
+    transformers = pytest.importorskip("transformers")
+    from tokenizers import Tokenizer, models, pre_tokenizers
+
+    words = sorted({w.lower() for user, _ in EXCHANGES for w in user.split()})
+    vocab = {"[PAD]": 0, "[UNK]": 1, "[CLS]": 2, "[SEP]": 3, **{w: i + 4 for i, w in enumerate(words)}}
+    backend = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    backend.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer = transformers.PreTrainedTokenizerFast(tokenizer_object=backend, pad_token="[PAD]", unk_token="[UNK]")
+    model = transformers.BertModel(transformers.BertConfig(
+        vocab_size=len(vocab), hidden_size=32, num_hidden_layers=1, num_attention_heads=2, intermediate_size=64))
+    model.save_pretrained(tmp_path)
+    tokenizer.save_pretrained(tmp_path)
+
+    texts = [user.lower() for user, _ in EXCHANGES]
+    embedder = TransformerEmbedder(str(tmp_path), batch_size=3)
+    batched = embedder.embed(texts)
+    single = np.vstack([embedder.embed([text]) for text in texts])
+    assert batched.shape == (len(texts), 32)
+    np.testing.assert_allclose(batched, single, atol=1e-5)
+    np.testing.assert_allclose(np.linalg.norm(batched, axis=1), 1.0, rtol=1e-5)
+
+
+async def test_recall_respects_budget_and_exclusions():
+    store = MemoryStore(HashingEmbedder())
+    store.add(_records())
+    memory = ConversationMemory(store, top_k=4, token_budget=1000, min_score=-1.0)
+
+    assert len(await memory.recall("default", "dog")) == 4
+    excluded = await memory.recall("default", "dog", exclude=[EXCHANGES[0][0]])
+    assert EXCHANGES[0][0] not in [r.user for r in excluded]
+
+    memory.token_budget = 20
+    budgeted = await memory.recall("default", "my golden retriever dog Biscuit")
+    assert [r.user for r in budgeted] == [EXCHANGES[0][0]]
+    assert memory.snapshot()["retrieval"]["p50_ms"] is not None
+
+
+async def test_background_ingestion_batches_and_drops_when_full():
+    memory = ConversationMemory(MemoryStore(HashingEmbedder()), queue_size=3, batch_size=8)
+    accepted = [memory.remember("default", user, assistant) for user, assistant in EXCHANGES]
+    assert accepted == [True, True, True, False]
+
+    worker = asyncio.create_task(memory.run())
+    try:
+        await asyncio.wait_for(memory.queue.join(), 5)
+    finally:
+        worker.cancel()
+    snapshot = memory.snapshot()
+    assert snapshot["records"] == snapshot["ingested"] == 3
+    assert snapshot["dropped"] == 1
+    assert snapshot["ingestion_batch"]["p50_ms"] is not None
+
+
+class _RecordingProvider:
+    def __init__(self):
+        self.calls = []
+
+    def get_models(self):
+        return ["gpt-4o-mini"]
+
+    def is_available(self):
+        return True
+
+    async def chat(self, messages, model, **kwargs):
+        self.calls.append(messages)
+        return {"content": f"reply {len(self.calls)}", "model": model}
+
+
+def _memory_spectra(provider):
+    ai = main.SpectraAI()
+    ai.providers = {"openai": provider}
+    ai.available_providers = ["openai"]
+    ai.available_models = ai._get_all_available_models()
+    ai.model = "openai:gpt-4o-mini"
+    ai.auto_model_enabled = False
+    ai.ready = True
+    ai.memory = ConversationMemory(MemoryStore(HashingEmbedder()), min_score=0.2, user_secret=SECRET)
+    return ai
+
+
+async def test_generate_response_injects_relevant_memories():
+    provider = _RecordingProvider()
+    ai = _memory_spectra(provider)
+    worker = asyncio.create_task(ai.memory.run())
+    try:
+        await ai.generate_response("My dog Biscuit is a golden retriever", user_id=sign_user_id("alice", SECRET))
+        await ai.generate_response("I work as a nurse on night shifts", user_id=sign_user_id("bob", SECRET))
+        await asyncio.wait_for(ai.memory.queue.join(), 5)
+
+        await ai.generate_response("What breed is my dog Biscuit?", user_id=sign_user_id("alice", SECRET))
+    finally:
+        worker.cancel()
+
+    system = provider.calls[-1][0]["content"]
+    assert system.startswith(ai.personality_prompt)
+    assert "My dog Biscuit is a golden retriever" in system and "reply 1" in system
+    assert "nurse" not in system
+    assert ai.metrics()["memory"]["injected"] == 1
+
+
+async def test_memory_needs_a_verified_user():
+    provider = _RecordingProvider()
+    ai = _memory_spectra(provider)
+    worker = asyncio.create_task(ai.memory.run())
+    try:
+        await ai.generate_response("My dog Biscuit is a golden retriever", user_id=sign_user_id("alice", SECRET))
+        await asyncio.wait_for(ai.memory.queue.join(), 5)
+        # No id, alice's bare id, and a signature made with another secret: no recall, nothing remembered
+        for user_id in (None, "alice", sign_user_id("alice", "guessed")):
+            await ai.generate_response("What breed is my dog Biscuit?", user_id=user_id)
+            assert "golden retriever" not in provider.calls[-1][0]["content"]
+    finally:
+        worker.cancel()
+
+    assert ai.memory.queue.qsize() == 0 and len(ai.memory.store) == 1
+    assert ai.metrics()["memory"]["unverified_requests"] == 3
+    assert verified_user(sign_user_id("a.b", SECRET), SECRET) == "a.b"
+    assert verified_user(sign_user_id("alice", SECRET), "") is None
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""Tests for memory accounting and growth tracking."""
+import tracemalloc
+
+import pytest
+
+import main
+from memory_tracker import MemoryTracker, model_memory, process_memory
+
+
+def test_model_memory_counts_parameters_and_buffers():
+    torch = pytest.importorskip("torch")
+
+    model = torch.nn.Sequential(torch.nn.Linear(4, 2), torch.nn.BatchNorm1d(2))
+    report = model_memory(model)
+    # Linear: 8 weights + 2 biases; BatchNorm: weight + bias (2 each) as parameters
+    assert report["parameters"] == 14 and report["parameter_bytes"] == 14 * 4
+    # running mean/var (2 float32 each) and num_batches_tracked (one int64)
+    assert report["buffer_bytes"] == 4 * 4 + 8
+    assert report["dtypes_mb"] == {"float32": 0.0} and report["devices"] == ["cpu"]
+    assert model_memory(object()) == {"type": "object"}
+
+
+def test_process_memory_reports_rss_and_peak():
+    memory = process_memory()
+    assert memory["peak_rss_mb"] > 0
+    if memory["rss_mb"] is not None:
+        assert memory["peak_rss_mb"] >= memory["rss_mb"]
+
+
+def test_sampler_warns_on_growth_and_resets_its_baseline():
+    rss = {"rss_mb": 100.0, "peak_rss_mb": 100.0}
+    cache: list = []
+    tracker = MemoryTracker(interval=0, growth_mb=50, growth_items=3, reader=lambda: dict(rss))
+    tracker.track("cache", lambda: len(cache))
+    tracker.sample()
+
+    cache.extend(range(2))
+    rss["rss_mb"] = 140.0
+    tracker.sample()
+    assert tracker.warning_count == 0
+
+    cache.extend(range(2))
+    rss["rss_mb"] = 160.0
+    tracker.sample()
+    assert tracker.warning_count == 1 and tracker.warnings[-1]["grown"] == {"rss_mb": 60.0, "cache": 4}
+
+    # Growth is measured from the last warning, not from startup
+    cache.append(0)
+    tracker.sample()
+    assert tracker.warning_count == 1
+    structures = tracker.snapshot()["structures"]
+    assert structures["cache"] == {"size": 5, "initial": 0, "growth": 5, "peak": 5}
+    assert tracker.snapshot()["sampler"]["rss_trend_mb"] == [100.0, 140.0, 160.0, 160.0]
+
+
+async def test_allocations_report_growth_since_tracing_started():
+    tracker = MemoryTracker(interval=0, tracemalloc_frames=1)
+    assert tracker.allocations() == {"tracing": False}
+    tracker.start()
+    try:
+        retained = [bytearray(1024) for _ in range(1000)]  # noqa: F841 - alive during the snapshot
+        report = tracker.allocations(limit=5)
+        assert report["tracing"] and len(report["top"]) <= 5
+        assert any(entry["line"].startswith(__file__) and entry["size_diff_kb"] >= 1000 for entry in report["growth"])
+    finally:
+        await tracker.stop()
+    assert not tracemalloc.is_tracing()
+
+
+def test_debug_state_includes_memory_accounting(client):
+    main.spectra.failed_models.add("ollama:broken")
+    try:
+        accounting = client.get("/api/debug/state").json()["memory_accounting"]
+        assert accounting["structures"]["failed_models"]["size"] >= 1
+        assert "model_cache" in accounting["structures"] and "jobs" in accounting["structures"]
+        assert accounting["process"]["peak_rss_mb"] > 0 and accounting["sampler"]["samples"] >= 1
+        assert "models" in accounting and "allocations" not in accounting
+        assert client.get("/api/debug/state?allocations=5").json()["memory_accounting"]["allocations"] == {
+            "tracing": False}
+    finally:
+        main.spectra.failed_models.discard("ollama:broken")
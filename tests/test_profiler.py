@@ -0,0 +1,91 @@
+"""Tests for the on-demand sampling profiler."""
+import threading
+import time
+
+import pytest
+
+import main
+from profiler import ProfileBusy, SamplingProfiler
+
+
+def _spin_for_test(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+@pytest.fixture
+def busy_thread():
+    stop = threading.Event()
+    thread = threading.Thread(target=_spin_for_test, args=(stop,), name="spinner")
+    thread.start()
+    yield thread
+    stop.set()
+    thread.join()
+
+
+def test_capture_sees_other_threads(busy_thread):
+    profile = SamplingProfiler().capture(0.3, interval=0.005)
+    assert profile.samples >= 10
+    spinner = [line for line in profile.collapsed().splitlines() if line.startswith("spinner;")]
+    assert spinner and all("_spin_for_test (tests/test_profiler.py:" in line for line in spinner)
+    total_us = sum(int(line.rsplit(" ", 1)[1]) for line in spinner)
+    assert 0.2e6 < total_us < 0.5e6  # weighted by elapsed time, not sample count
+
+    speedscope = profile.speedscope()
+    frames = speedscope["shared"]["frames"]
+    thread = next(p for p in speedscope["profiles"] if p["name"] == "spinner")
+    assert thread["type"] == "sampled" and len(thread["samples"]) == len(thread["weights"])
+    assert any(frames[i]["name"] == "_spin_for_test" for sample in thread["samples"] for i in sample)
+
+
+def test_interval_backs_off_past_the_overhead_budget(busy_thread):
+    profile = SamplingProfiler(max_overhead=0.0).capture(0.2, interval=0.001)
+    assert profile.interval > 0.001
+    assert profile.samples < 200
+
+
+def test_only_one_capture_at_a_time():
+    profiler = SamplingProfiler()
+    first = threading.Thread(target=profiler.capture, args=(0.3,))
+    first.start()
+    time.sleep(0.05)
+    with pytest.raises(ProfileBusy):
+        profiler.capture(0.1)
+    first.join()
+    assert profiler.capture(0.01).samples >= 1
+
+
+def test_torch_operators_are_included():
+    torch = pytest.importorskip("torch")
+    stop = threading.Event()
+
+    def matmuls():
+        a = torch.randn(64, 64)
+        while not stop.is_set():
+            torch.mm(a, a)
+
+    thread = threading.Thread(target=matmuls)
+    thread.start()
+    try:
+        profile = SamplingProfiler().capture(0.3, include_torch=True)
+    finally:
+        stop.set()
+        thread.join()
+    assert profile.torch["included"] and profile.torch["events"] > 0
+    assert "aten::mm" in profile.collapsed()
+
+
+def test_endpoint_is_guarded(client, monkeypatch):
+    monkeypatch.setattr(main, "PROFILE_TOKEN", "")
+    assert client.get("/api/debug/profile").status_code == 404
+    monkeypatch.setattr(main, "PROFILE_TOKEN", "secret")
+    assert client.get("/api/debug/profile", headers={"X-Debug-Token": "wrong"}).status_code == 403
+
+    response = client.get("/api/debug/profile?seconds=0.1&format=speedscope", headers={"X-Debug-Token": "secret"})
+    assert response.status_code == 200
+    assert response.json()["profiles"] and int(response.headers["X-Profile-Samples"]) >= 1
+    response = client.get("/api/debug/profile?seconds=0.1", headers={"X-Debug-Token": "secret"})
+    assert response.headers["content-type"].startswith("text/plain") and ";" in response.text
+
+    with main.profiler._lock:
+        assert client.get("/api/debug/profile?seconds=0.1", headers={"X-Debug-Token": "secret"}).status_code == 409
@@ -0,0 +1,117 @@
+"""Tests for provider-side prompt caching of the personality prefix."""
+from types import SimpleNamespace
+
+from fastapi import FastAPI, Request
+
+import main
+from main import ChatMessage
+from providers import AnthropicProvider, OpenAIProvider
+
+
+def _stand_in_app(requests):
+    """OpenAI/Anthropic stand-ins that record request bodies and report cache hits."""
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        body = await request.json()
+        requests.append(body)
+        return {
+            "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "hi"}}],
+            "usage": {"prompt_tokens": 1200, "completion_tokens": 2, "total_tokens": 1202,
+                      "prompt_tokens_details": {"cached_tokens": 1024}},
+        }
+
+    @app.post("/v1/messages")
+    async def anthropic_messages(request: Request):
+        body = await request.json()
+        requests.append(body)
+        return {
+            "id": "msg_1", "type": "message", "role": "assistant", "model": body["model"],
+            "content": [{"type": "text", "text": "hello"}], "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": 30, "output_tokens": 4, "cache_read_input_tokens": 1500,
+                      "cache_creation_input_tokens": 0},
+        }
+
+    return app
+
+
+def _spectra(base_url, memories="Relevant memories: likes tea"):
+    import anthropic
+    import openai
+
+    openai_provider = OpenAIProvider()
+    openai_provider.available = True
+    openai_provider.client = openai.AsyncOpenAI(api_key="test", base_url=f"{base_url}/v1", max_retries=0)
+    anthropic_provider = AnthropicProvider()
+    anthropic_provider.available = True
+    anthropic_provider.client = anthropic.AsyncAnthropic(api_key="test", base_url=base_url, max_retries=0)
+
+    ai = main.SpectraAI()
+    ai.providers = {"openai": openai_provider, "anthropic": anthropic_provider}
+    ai.available_providers = list(ai.providers)
+    ai.available_models = ai._get_all_available_models()
+    ai.auto_model_enabled = False
+    ai.ready = True
+
+    async def inject(messages, namespace, message):
+        # Per-request context, appended to the system prompt like recalled memories
+        messages[0] = {"role": "system", "content": f"{messages[0]['content']}\n\n{memories}"}
+
+    ai._inject_memories = inject
+    # Recall runs only for a verified user
+    ai.memory = SimpleNamespace(namespace=lambda user_id: "user", remember=lambda *args: True, snapshot=dict)
+    return ai
+
+
+HISTORY = [ChatMessage(role="user", content="earlier question"), ChatMessage(role="assistant", content="earlier answer")]
+
+
+async def test_openai_gets_static_prefix_first_and_a_cache_key(serve_app):
+    requests = []
+    ai = _spectra(serve_app(_stand_in_app(requests)))
+    ai.model = "openai:gpt-4o-mini"
+    result = await ai.generate_response("new question", HISTORY)
+
+    body = requests[0]
+    assert body["prompt_cache_key"] == f"spectra-{ai.personality_hash}"
+    assert [(m["role"], m["content"]) for m in body["messages"]] == [
+        ("system", ai.personality_prompt),
+        ("user", "earlier question"),
+        ("assistant", "earlier answer"),
+        ("system", "Relevant memories: likes tea"),
+        ("user", "new question"),
+    ]
+    assert result["usage"]["cached_tokens"] == 1024
+    route = ai.metrics()["token_usage"]["routes"]["openai:gpt-4o-mini"]
+    assert route["cached_tokens"] == 1024 and route["cache_hit_ratio"] == round(1024 / 1200, 3)
+
+
+async def test_anthropic_marks_a_cache_breakpoint_after_the_personality(serve_app):
+    requests = []
+    ai = _spectra(serve_app(_stand_in_app(requests)))
+    ai.model = "anthropic:claude-3-haiku-20240307"
+    result = await ai.generate_response("new question", HISTORY)
+
+    assert requests[0]["system"] == [
+        {"type": "text", "text": ai.personality_prompt, "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": "Relevant memories: likes tea"},
+    ]
+    assert [m["content"] for m in requests[0]["messages"]] == ["earlier question", "earlier answer", "new question"]
+    # input_tokens excludes cache reads; prompt_tokens is the whole prompt
+    assert result["usage"]["prompt_tokens"] == 1530 and result["usage"]["cached_tokens"] == 1500
+    assert ai.metrics()["token_usage"]["totals"]["cached_tokens"] == 1500
+
+
+async def test_disabled_prompt_cache_sends_requests_unchanged(serve_app):
+    requests = []
+    ai = _spectra(serve_app(_stand_in_app(requests)))
+    ai.provider_prompt_cache = False
+    ai.model = "anthropic:claude-3-haiku-20240307"
+    await ai.generate_response("new question")
+    ai.model = "openai:gpt-4o-mini"
+    await ai.generate_response("new question")
+
+    assert isinstance(requests[0]["system"], str)
+    assert "prompt_cache_key" not in requests[1] and len(requests[1]["messages"]) == 2
@@ -0,0 +1,126 @@
+"""Tests for compiled prompt templates and segment-cached tokenization."""
+import pytest
+
+from prompt_templates import (
+    TokenAssembler,
+    builtin_template,
+    compile_chat_template,
+    estimate_tokens,
+    minify_markdown,
+)
+
+CHATML = (
+    "{% for m in messages %}<|im_start|>{{ m['role'] }}\n{{ m['content'] }}<|im_end|>\n{% endfor %}"
+    "{% if add_generation_prompt %}<|im_start|>assistant\n{% endif %}"
+)
+NO_SYSTEM = (
+    "{{ bos_token }}{% for m in messages %}{% if m['role'] == 'system' %}{{ raise_exception('no system role') }}"
+    "{% elif m['role'] == 'user' %}[INST] {{ m['content'] }} [/INST]{% else %}{{ m['content'] }}{{ eos_token }}"
+    "{% endif %}{% endfor %}"
+)
+
+CONVERSATIONS = [
+    [{"role": "user", "content": "hi"}],
+    [{"role": "system", "content": "Be kind."}, {"role": "user", "content": "hi"}],
+    [{"role": "system", "content": "Be kind."}, {"role": "user", "content": "hi"},
+     {"role": "assistant", "content": "hello"}, {"role": "user", "content": "write a poem"}],
+    [{"role": "system", "content": "Be kind."}, {"role": "assistant", "content": "earlier reply"},
+     {"role": "user", "content": "and now?"}],
+    [{"role": "system", "content": "Be kind."}],
+]
+
+
+def legacy_format(messages, model):
+    """The original string-building implementation, kept as the reference."""
+    prompt = ""
+    system_prompt = None
+    for message in messages:
+        role = message.get("role", "")
+        content = message.get("content", "")
+        if role == "system":
+            system_prompt = content
+        elif role == "user":
+            if "mistral" in model.lower() or "llama" in model.lower():
+                prompt += f"<s>[INST] {content} [/INST]"
+            else:
+                prompt += f"User: {content}\n"
+        elif role == "assistant":
+            if "mistral" in model.lower() or "llama" in model.lower():
+                prompt += f" {content} </s>"
+            else:
+                prompt += f"Assistant: {content}\n"
+    if system_prompt and prompt:
+        if "mistral" in model.lower():
+            prompt = prompt.replace("[INST]", f"[INST] {system_prompt}\n\n", 1)
+        elif "llama" in model.lower():
+            prompt = prompt.replace("[INST]", f"[INST] <<SYS>>\n{system_prompt}\n<</SYS>>\n\n", 1)
+        else:
+            prompt = f"System: {system_prompt}\n" + prompt
+    return prompt
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    """Tiny byte-level BPE tokenizer trained in-process (no network)."""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    corpus = ["Hello there, how are you feeling today?", "I am a little tired honestly.",
+              "Can you write me a short poem about rain?", "You are Spectra, be kind."] * 10
+    backend = Tokenizer(models.BPE())
+    backend.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    backend.decoder = decoders.ByteLevel()
+    backend.train_from_iterator(corpus, trainers.BpeTrainer(
+        vocab_size=300, special_tokens=["<s>", "</s>", "<|im_start|>", "<|im_end|>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet()))
+    return PreTrainedTokenizerFast(tokenizer_object=backend, bos_token="<s>", eos_token="</s>")
+
+
+@pytest.mark.parametrize("model", ["mistralai/Mistral-7B-Instruct-v0.2", "meta-llama/Llama-2-7b-chat-hf", "gpt2"])
+@pytest.mark.parametrize("messages", CONVERSATIONS)
+def test_builtin_templates_match_legacy_format(model, messages):
+    assert builtin_template(model).render(messages) == legacy_format(messages, model)
+
+
+@pytest.mark.parametrize("template", [CHATML, NO_SYSTEM])
+def test_compiled_chat_template_matches_source(tokenizer, template):
+    tokenizer.chat_template = template
+    compiled = compile_chat_template(tokenizer)
+    assert compiled is not None
+    messages = CONVERSATIONS[2]
+    if template == NO_SYSTEM:
+        # Templates without a system role get it merged into the first user turn.
+        assert compiled.system_in_user is not None
+        source = [{"role": "user", "content": "Be kind.\n\nhi"}] + messages[2:]
+        assert compiled.render(messages, add_generation_prompt=False) == tokenizer.apply_chat_template(source, tokenize=False)
+    else:
+        assert compiled.render(messages) == tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+
+def test_non_constant_template_is_rejected(tokenizer):
+    tokenizer.chat_template = "{% for m in messages %}{{ loop.index }}:{{ m['content'] }}\n{% endfor %}"
+    assert compile_chat_template(tokenizer) is None
+
+
+def test_assembler_ids_match_full_tokenization_and_cache(tokenizer):
+    tokenizer.chat_template = CHATML
+    assembler = TokenAssembler.for_model("tiny", tokenizer)
+    assert assembler.template.name == "chat_template"
+    assert assembler.segmented
+
+    messages = CONVERSATIONS[2]
+    expected = tokenizer.encode(assembler.render(messages), add_special_tokens=False)
+    assert assembler.input_ids(messages) == expected
+    misses = assembler.misses
+    # The follow-up turn only tokenizes the new segments.
+    follow_up = messages + [{"role": "assistant", "content": "rain falls"}, {"role": "user", "content": "thanks"}]
+    assert assembler.input_ids(follow_up) == tokenizer.encode(assembler.render(follow_up), add_special_tokens=False)
+    assert assembler.misses - misses == 2
+    assert assembler.hits >= 4
+
+
+def test_minify_markdown_strips_formatting():
+    text = "# Title\n\n## Traits\n\n- **Warm**: caring\n* *Gentle* voice\n\n---\n\n\nUse `code`."
+    minified = minify_markdown(text)
+    assert minified == "Title\n\nTraits\n\n- Warm: caring\n- Gentle voice\n\nUse code."
+    assert estimate_tokens(minified) < estimate_tokens(text)
@@ -0,0 +1,252 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+import main
+from providers import AnthropicProvider, OpenAIProvider
+from rate_limit import (
+    ProviderRateLimited,
+    RateGovernor,
+    RateLimited,
+    RateLimitRegistry,
+    parse_rate_limit_headers,
+)
+
+
+class StandInLimiter:
+    """Token bucket enforced by the stand-in server, advertised in OpenAI/Anthropic headers."""
+
+    def __init__(self, limit: int, period: float):
+        self.limit = limit
+        self.period = period
+        self.tokens = float(limit)
+        self.updated = time.monotonic()
+        self.accepted = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def admit(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            # 10% slack for client/server timing skew on the refill
+            rate = self.limit / self.period * 1.1
+            self.tokens = min(self.limit, self.tokens + (now - self.updated) * rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.accepted += 1
+                return True
+            self.rejected += 1
+            return False
+
+
+def _stand_in_app(limiters):
+    app = FastAPI()
+
+    def headers(limiter, prefix):
+        remaining = str(max(int(limiter.tokens), 0))
+        if prefix == "openai":
+            return {"x-ratelimit-limit-requests": str(limiter.limit),
+                    "x-ratelimit-remaining-requests": remaining,
+                    "x-ratelimit-reset-requests": f"{limiter.period}s"}
+        return {"anthropic-ratelimit-requests-limit": str(limiter.limit),
+                "anthropic-ratelimit-requests-remaining": remaining}
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        limiter = limiters["openai"]
+        if not limiter.admit():
+            return JSONResponse({"error": {"message": "Rate limit reached", "type": "requests"}}, status_code=429,
+                                headers={**headers(limiter, "openai"), "retry-after": "1"})
+        body = await request.json()
+        return JSONResponse({
+            "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "hello from openai"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13},
+        }, headers=headers(limiter, "openai"))
+
+    @app.post("/v1/messages")
+    async def anthropic_messages(request: Request):
+        limiter = limiters["anthropic"]
+        if not limiter.admit():
+            return JSONResponse({"type": "error", "error": {"type": "rate_limit_error", "message": "slow down"}},
+                                status_code=429, headers={**headers(limiter, "anthropic"), "retry-after": "1"})
+        body = await request.json()
+        return JSONResponse({
+            "id": "msg_1", "type": "message", "role": "assistant", "model": body["model"],
+            "content": [{"type": "text", "text": "hello from anthropic"}],
+            "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": 10, "output_tokens": 3},
+        }, headers=headers(limiter, "anthropic"))
+
+    return app
+
+
+@pytest.fixture
+def stand_in(serve_app):
+    """Local server enforcing request limits like the cloud APIs."""
+    limiters = {"openai": StandInLimiter(5, 1.0), "anthropic": StandInLimiter(5, 1.0)}
+    return serve_app(_stand_in_app(limiters)), limiters
+
+
+def _providers(base_url):
+    import anthropic
+    import openai
+
+    openai_provider = OpenAIProvider()
+    openai_provider.available = True
+    openai_provider.client = openai.AsyncOpenAI(api_key="test", base_url=f"{base_url}/v1", max_retries=0)
+    anthropic_provider = AnthropicProvider()
+    anthropic_provider.available = True
+    anthropic_provider.client = anthropic.AsyncAnthropic(api_key="test", base_url=base_url, max_retries=0)
+    return {"openai": openai_provider, "anthropic": anthropic_provider}
+
+
+def _spectra(providers, registry, auto_model):
+    ai = main.SpectraAI()
+    ai.providers = providers
+    ai.available_providers = list(providers)
+    ai.available_models = ai._get_all_available_models()
+    ai.model = "openai:gpt-4o-mini"
+    ai.auto_model_enabled = auto_model
+    ai.coalesce_requests = False  # identical prompts stand in for distinct requests
+    ai.rate_limits = registry
+    ai.rate_limit_max_wait = 5.0
+    ai.rate_limit_reroute_wait = 0.0
+    ai.ready = True
+    return ai
+
+
+def test_parse_rate_limit_headers():
+    openai_info = parse_rate_limit_headers({
+        "x-ratelimit-limit-requests": "500",
+        "x-ratelimit-remaining-requests": "499",
+        "x-ratelimit-reset-requests": "6m0s",
+        "x-ratelimit-remaining-tokens": "149984",
+        "x-ratelimit-reset-tokens": "20ms",
+        "retry-after": "2",
+    })
+    assert openai_info["limit_requests"] == 500
+    assert openai_info["remaining_requests"] == 499
+    assert openai_info["reset_requests"] == 360.0
+    assert openai_info["reset_tokens"] == pytest.approx(0.02)
+    assert openai_info["remaining_tokens"] == 149984
+    assert openai_info["retry_after"] == 2.0
+
+    anthropic_info = parse_rate_limit_headers({
+        "anthropic-ratelimit-requests-limit": "50",
+        "anthropic-ratelimit-requests-remaining": "0",
+        "anthropic-ratelimit-requests-reset": "2000-01-01T00:00:00Z",
+    })
+    assert anthropic_info == {"limit_requests": 50, "remaining_requests": 0, "reset_requests": 0.0}
+
+
+async def test_governor_queues_then_rejects():
+    governor = RateGovernor("openai:gpt-4o-mini", rpm=2, period=1.0)
+    for _ in range(2):
+        (await governor.acquire(max_wait=0)).release()
+    with pytest.raises(RateLimited) as excinfo:
+        await governor.acquire(max_wait=0)
+    assert 0 < excinfo.value.retry_after <= 0.5
+
+    start = time.monotonic()
+    permit = await governor.acquire(max_wait=1.0)
+    assert time.monotonic() - start > 0.3
+    permit.release()
+    assert governor.snapshot()["rejected"] == 1
+
+
+async def test_governor_aimd_and_header_learning():
+    governor = RateGovernor("anthropic:claude-3-haiku-20240307", max_concurrency=8)
+    permit = await governor.acquire()
+    permit.release(headers={"retry-after": "0.2", "anthropic-ratelimit-requests-limit": "50"}, rate_limited=True)
+    assert governor.concurrency_limit == 4.0
+    assert governor.requests.capacity == 50.0
+    with pytest.raises(RateLimited):
+        await governor.acquire(max_wait=0)  # paused for the retry-after interval
+
+    (await governor.acquire(max_wait=0.5)).release()
+    assert governor.concurrency_limit == 4.25
+
+    # The concurrency limit bounds in-flight requests
+    permits = [await governor.acquire() for _ in range(4)]
+    with pytest.raises(RateLimited):
+        await governor.acquire(max_wait=0.05)
+    for permit in permits:
+        permit.release(ok=False)
+    assert governor.in_flight == 0
+
+
+async def test_ungoverned_burst_hits_provider_429(stand_in):
+    base_url, limiters = stand_in
+    provider = _providers(base_url)["openai"]
+    messages = [{"role": "user", "content": "hi"}]
+    results = await asyncio.gather(*(provider.chat(messages, "gpt-4o-mini") for _ in range(10)),
+                                   return_exceptions=True)
+    limited = [r for r in results if isinstance(r, ProviderRateLimited)]
+    assert limited and limiters["openai"].rejected == len(limited)
+    assert limited[0].headers["retry-after"] == "1"
+
+
+async def test_governed_burst_is_queued_below_the_limit(stand_in):
+    base_url, limiters = stand_in
+    registry = RateLimitRegistry({"openai": {"rpm": 5}, "anthropic": {"rpm": 5}}, period=1.0)
+    ai = _spectra(_providers(base_url), registry, auto_model=False)
+
+    results = await asyncio.gather(*(ai.generate_response("hi") for _ in range(10)))
+    assert all(r["response"] == "hello from openai" for r in results)
+    assert limiters["openai"].rejected == 0
+    snapshot = ai.metrics()["rate_limits"]["openai:gpt-4o-mini"]
+    assert snapshot["queued"] > 0 and snapshot["rate_limited"] == 0
+
+
+async def test_governed_burst_reroutes_to_next_candidate(stand_in):
+    base_url, limiters = stand_in
+    registry = RateLimitRegistry({"openai": {"rpm": 3}, "anthropic": {"rpm": 3}}, period=1.0)
+    ai = _spectra(_providers(base_url), registry, auto_model=True)
+
+    results = await asyncio.gather(*(ai.generate_response("hi") for _ in range(6)))
+    providers = sorted(r["provider"] for r in results)
+    assert providers == ["anthropic"] * 3 + ["openai"] * 3
+    assert limiters["openai"].rejected == limiters["anthropic"].rejected == 0
+
+
+async def test_provider_429_becomes_rate_limited(stand_in):
+    base_url, limiters = stand_in
+    limiters["openai"].tokens = 0
+    limiters["openai"].limit = 1
+    ai = _spectra(_providers(base_url), RateLimitRegistry({"openai": {}}, period=1.0), auto_model=False)
+
+    with pytest.raises(RateLimited) as excinfo:
+        await ai.generate_response("hi")
+    assert excinfo.value.retry_after == 1.0
+    snapshot = ai.rate_limits.snapshot()["openai:gpt-4o-mini"]
+    assert snapshot["rate_limited"] == 1 and snapshot["concurrency_limit"] == 8.0
+    assert snapshot["rpm_limit"] == 1.0
+    assert not ai.failed_models
+
+
+def test_chat_endpoint_returns_429(client, monkeypatch):
+    async def limited(*args, **kwargs):
+        raise RateLimited("openai:gpt-4o-mini", 1.4)
+
+    monkeypatch.setattr(main.spectra, "generate_response", limited)
+    resp = client.post("/api/chat", json={"message": "hi"})
+    assert resp.status_code == 429
+    assert resp.headers["retry-after"] == "2"
+    assert resp.json()["detail"]["status"] == "rate_limited"
+
+
+@pytest.mark.parametrize("provider", ["openai", "anthropic"])
+async def test_streamed_calls_keep_rate_limit_headers_and_usage(streaming_cloud, provider):
+    deltas = []
+    response = await streaming_cloud.providers[provider].chat(
+        [{"role": "user", "content": "two words"}], "", on_delta=deltas.append)
+    assert deltas == ["two", " words"] and response["content"] == "two words"
+    assert response["rate_limit_headers"] == {"x-ratelimit-remaining-requests": "99"}
+    assert response["usage"]["completion_tokens"] == 3 and response["ttft"] is not None
@@ -0,0 +1,111 @@
+"""Tests for mmapped weights and the preload-then-fork server."""
+import os
+import signal
+import subprocess
+import sys
+import textwrap
+import time
+
+import httpx
+import pytest
+
+import shared_weights
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SMAPS = """\
+7f0000000000-7f0000100000 r--p 00000000 08:01 1234    /models/tiny/model.safetensors
+Size:               1024 kB
+Rss:                1024 kB
+Pss:                 512 kB
+Shared_Clean:       1024 kB
+Shared_Dirty:          0 kB
+Private_Clean:         0 kB
+Private_Dirty:         0 kB
+VmFlags: rd mr mw me
+7f0000200000-7f0000300000 rw-p 00000000 00:00 0
+Size:               1024 kB
+Rss:                 256 kB
+Pss:                 256 kB
+Shared_Clean:          0 kB
+Shared_Dirty:          0 kB
+Private_Clean:         0 kB
+Private_Dirty:       256 kB
+VmFlags: rd wr mr mw me ac
+"""
+
+
+def test_parse_smaps():
+    assert shared_weights._parse_smaps(SMAPS, ".safetensors")["Pss"] == 512
+    totals = shared_weights._parse_smaps(SMAPS)
+    assert totals["Rss"] == 1280 and totals["Private_Dirty"] == 256
+    assert shared_weights._mb(totals) == {"rss_mb": 1.2, "pss_mb": 0.8, "shared_mb": 1.0, "private_mb": 0.2}
+
+
+def test_mmap_model_matches_regular_load(tiny_chat_model_dir):
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    model = shared_weights.load_mmap_model(tiny_chat_model_dir)
+    reference = AutoModelForCausalLM.from_pretrained(tiny_chat_model_dir)
+    input_ids = torch.tensor([[2, 3, 4, 5]])
+    kwargs = {"max_new_tokens": 8, "do_sample": False, "pad_token_id": 0}
+    assert torch.equal(model.generate(input_ids, **kwargs), reference.generate(input_ids, **kwargs))
+
+    # Parameters point into the mapping, not into freshly allocated memory
+    assert model.lm_head.weight.data_ptr() == model.transformer.wte.weight.data_ptr()
+    with open("/proc/self/maps") as f:
+        mapped = [line for line in f if line.rstrip().endswith("model.safetensors")]
+    assert mapped
+
+
+def test_torch_engine_mmap_falls_back(tmp_path, tiny_chat_model_dir):
+    from inference_engines import TorchEngine
+
+    model = TorchEngine(mmap_weights=True).load(tiny_chat_model_dir, "cpu")
+    assert model.config.n_layer == 2
+    with pytest.raises(ValueError):
+        shared_weights.load_mmap_model(str(tmp_path))  # no safetensors there
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/smaps"), reason="needs procfs")
+def test_forked_workers_share_weight_pages(tiny_chat_model_dir, tmp_path, free_port):
+    (tmp_path / "mem_app.py").write_text(textwrap.dedent(f"""
+        import torch
+        from fastapi import FastAPI
+        import shared_weights
+
+        app = FastAPI()
+
+        @app.get("/mem")
+        def mem():
+            model, tokenizer = shared_weights.preloaded({tiny_chat_model_dir!r})
+            with torch.no_grad():
+                model(torch.tensor([tokenizer("w1 w2 w3")["input_ids"]]))
+            return shared_weights.worker_memory()
+    """))
+    script = f"import prefork; prefork.serve('mem_app:app', '127.0.0.1', {free_port}, 2, [{tiny_chat_model_dir!r}], 'warning')"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([REPO, str(tmp_path)])}
+    master = subprocess.Popen([sys.executable, "-c", script], env=env, cwd=str(tmp_path))
+    try:
+        reports = {}
+        deadline = time.monotonic() + 60
+        while len(reports) < 2 and time.monotonic() < deadline:
+            try:
+                report = httpx.get(f"http://127.0.0.1:{free_port}/mem", timeout=5).json()
+                reports[report["pid"]] = report
+            except httpx.TransportError:
+                time.sleep(0.2)
+        assert len(reports) == 2
+
+        weight_mb = os.path.getsize(os.path.join(tiny_chat_model_dir, "model.safetensors")) / 2**20
+        for report in reports.values():
+            weights = report["weights"]
+            assert report["preloaded_models"] == [tiny_chat_model_dir]
+            assert weights["rss_mb"] >= weight_mb * 0.9
+            # Master + 2 workers map the same pages: each is charged a fraction
+            assert weights["pss_mb"] < weights["rss_mb"] * 0.6
+            assert weights["private_mb"] < 0.5
+    finally:
+        master.send_signal(signal.SIGTERM)
+        assert master.wait(timeout=20) == 0
@@ -0,0 +1,160 @@
+"""Tests for single-flight model loading and request coalescing."""
+import asyncio
+import time
+
+import pytest
+
+import main
+from cancellation import CancellationToken, JointCancellationToken
+from singleflight import SingleFlight
+
+
+async def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    calls = []
+
+    async def work(token):
+        calls.append(token)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    results = await asyncio.gather(*(flights.do("key", work) for _ in range(3)), flights.do("other", work))
+    assert [shared for _, shared in results] == [False, True, True, False]
+    assert [value for value, _ in results[:3]] == [results[0][0]] * 3
+    assert len(calls) == 2
+    snapshot = flights.snapshot()
+    assert snapshot["executions"] == 2 and snapshot["coalesced"] == 2 and snapshot["max_fanout"] == 3
+    assert snapshot["in_flight"] == 0
+
+    # Finished flights are not reused
+    await flights.do("key", work)
+    assert len(calls) == 3
+
+
+async def test_errors_reach_every_caller_and_are_not_cached():
+    flights = SingleFlight()
+    attempts = []
+
+    async def failing(token):
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("load failed")
+
+    results = await asyncio.gather(flights.do("m", failing), flights.do("m", failing), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results) and len(attempts) == 1
+    with pytest.raises(RuntimeError):
+        await flights.do("m", failing)
+    assert len(attempts) == 2
+
+
+async def test_shared_work_survives_until_every_caller_leaves():
+    flights = SingleFlight()
+    started = asyncio.Event()
+    finished = []
+
+    async def work(token):
+        started.set()
+        await asyncio.sleep(0.1)
+        finished.append(token)
+        return "done"
+
+    first = asyncio.create_task(flights.do("k", work))
+    await started.wait()
+    second = asyncio.create_task(flights.do("k", work))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == ("done", True)
+    assert len(finished) == 1
+
+    # Everyone gone: the shared work is cancelled (unless it is a load)
+    lone = asyncio.create_task(flights.do("k2", work))
+    await asyncio.sleep(0.01)
+    lone.cancel()
+    await asyncio.sleep(0.15)
+    assert len(finished) == 1 and flights.snapshot()["abandoned"] == 1
+
+    loads = SingleFlight(cancel_abandoned=False)
+    lone = asyncio.create_task(loads.do("model", work))
+    await asyncio.sleep(0.01)
+    lone.cancel()
+    await asyncio.sleep(0.15)
+    assert len(finished) == 2
+
+
+def test_joint_token_cancels_when_every_member_does():
+    a, b = CancellationToken(), CancellationToken.with_timeout(60)
+    joint = JointCancellationToken()
+    joint.add(a)
+    joint.add(b)
+    a.cancel("client_disconnected")
+    assert not joint.cancelled
+    assert joint.remaining() is None  # `a` had no deadline
+    b.cancel("deadline_exceeded")
+    assert joint.cancelled and joint.reason == "deadline_exceeded"
+
+
+async def test_concurrent_requests_load_an_unloaded_model_once(tiny_chat_model_dir, monkeypatch):
+    from hf_provider import HuggingFaceProvider
+    from inference_engines import TorchEngine
+
+    loads = []
+    original = TorchEngine.load
+
+    def slow_load(self, model_name, device):
+        loads.append(model_name)
+        time.sleep(0.2)  # widen the window in which both requests miss the cache
+        return original(self, model_name, device)
+
+    monkeypatch.setattr(TorchEngine, "load", slow_load)
+    provider = HuggingFaceProvider()
+    messages = [{"role": "user", "content": "w1 w2 w3"}]
+    results = await asyncio.gather(*(provider.chat(messages, tiny_chat_model_dir, max_tokens=4) for _ in range(3)))
+    assert len(loads) == 1
+    assert all(r["model"] == tiny_chat_model_dir for r in results)
+    assert provider.model_loads.snapshot()["coalesced"] == 2
+
+
+class _SlowProvider:
+    def __init__(self):
+        self.calls = 0
+
+    def get_models(self):
+        return ["gpt-4o-mini"]
+
+    def is_available(self):
+        return True
+
+    async def chat(self, messages, model, **kwargs):
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(0.05)
+        return {"content": f"reply {call}", "model": model}
+
+
+def _spectra(provider):
+    ai = main.SpectraAI()
+    ai.providers = {"openai": provider}
+    ai.available_providers = ["openai"]
+    ai.available_models = ai._get_all_available_models()
+    ai.model = "openai:gpt-4o-mini"
+    ai.auto_model_enabled = False
+    ai.ready = True
+    return ai
+
+
+async def test_identical_requests_share_one_generation():
+    provider = _SlowProvider()
+    ai = _spectra(provider)
+
+    results = await asyncio.gather(
+        ai.generate_response("hello"), ai.generate_response("hello"), ai.generate_response("something else"),
+    )
+    assert provider.calls == 2
+    assert results[0]["response"] == results[1]["response"] != results[2]["response"]
+    assert ai.request_count == 3
+    coalescing = ai.metrics()["coalescing"]["generations"]
+    assert coalescing["coalesced"] == 1 and coalescing["max_fanout"] == 2
+
+    ai.coalesce_requests = False
+    await asyncio.gather(ai.generate_response("hello"), ai.generate_response("hello"))
+    assert provider.calls == 4
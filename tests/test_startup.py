@@ -0,0 +1,100 @@
+"""Tests for lifespan provider construction and the startup timing report."""
+import time
+
+import main
+from providers import AIProvider
+from startup import StartupReport
+
+
+class SlowProvider(AIProvider):
+    """Provider whose constructor blocks, standing in for SDK/network setup."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        time.sleep(0.2)
+        self.available = True
+        self.models = ["m"]
+
+
+async def test_providers_are_built_concurrently(monkeypatch):
+    monkeypatch.setattr(main, "PROVIDER_FACTORIES", {
+        name: (lambda name=name: SlowProvider(name)) for name in ("a", "b", "c")
+    })
+    monkeypatch.setenv("AI_PROVIDERS", "b,a")
+    spectra = main.SpectraAI()
+    assert spectra.providers == {} and not spectra.ready
+
+    started = time.perf_counter()
+    await spectra.start()
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.5  # three 0.2s constructors ran in parallel
+    assert spectra.ready
+    assert spectra.available_providers == ["a", "b", "c"]
+    assert spectra.current_provider == "b"
+    phases = {p["phase"] for p in spectra.startup.snapshot()["phases"]}
+    assert {"provider:a", "provider:b", "provider:c", "personality", "model_selection"} <= phases
+    assert spectra.startup.snapshot()["time_to_ready_ms"] is not None
+
+
+def test_startup_report_orders_phases():
+    report = StartupReport(origin=0.0)
+    report.record("later", 2.0, 3.0)
+    report.record("first", 1.0, 1.5, blocking=False)
+    snapshot = report.snapshot()
+    assert [p["phase"] for p in snapshot["phases"]] == ["first", "later"]
+    assert snapshot["phases"][0] == {"phase": "first", "start_ms": 1000.0, "duration_ms": 500.0, "blocking": False}
+    assert not snapshot["ready"]
+
+
+def test_debug_state_includes_startup_report(client):
+    startup = client.get('/api/debug/state').json()["startup"]
+    assert startup["ready"]
+    assert any(p["phase"] == "module_import" for p in startup["phases"])
+
+
+async def test_first_cloud_call_builds_the_client_off_the_loop(monkeypatch, serve_app):
+    import asyncio
+
+    import openai
+    from fastapi import FastAPI
+
+    from providers import OpenAIProvider
+
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat(body: dict):
+        return {
+            "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "hi"}}],
+        }
+
+    base_url = serve_app(app)
+    real_client = openai.AsyncOpenAI
+
+    def slow_client(**kwargs):
+        time.sleep(0.5)  # stands in for the cold SDK import
+        return real_client(**{**kwargs, "base_url": f"{base_url}/v1", "max_retries": 0})
+
+    monkeypatch.setattr(openai, "AsyncOpenAI", slow_client)
+    provider = OpenAIProvider()
+    provider.api_key, provider.available = "test", True
+
+    lag = 0.0
+
+    async def ticker():
+        nonlocal lag
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lag = max(lag, time.perf_counter() - started - 0.01)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.02)  # the ticker is running before the first call
+    try:
+        response = await provider.chat([{"role": "user", "content": "hi"}], "gpt-4o-mini")
+    finally:
+        task.cancel()
+    assert response["content"] == "hi"
+    assert lag < 0.2  # the 0.5s client build ran on the executor
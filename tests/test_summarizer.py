@@ -0,0 +1,137 @@
+"""Tests for rolling conversation summaries."""
+import main
+from summarizer import ConversationSummarizer, prefix_digests
+
+
+def _turns(n, words=20):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"turn{i} " + "word " * words}
+            for i in range(n)]
+
+
+class _FakeModel:
+    def __init__(self, fail=False, reply=None):
+        self.prompts = []
+        self.fail = fail
+        self.reply = reply
+
+    async def __call__(self, messages):
+        self.prompts.append(messages)
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        return self.reply or f"summary {len(self.prompts)}"
+
+
+def test_prefix_digests_identify_each_prefix():
+    turns = _turns(4)
+    digests = prefix_digests(turns)
+    assert len(digests) == 5
+    assert prefix_digests(turns[:2]) == digests[:3]
+    changed = [dict(turns[0], content="edited")] + turns[1:]
+    assert prefix_digests(changed)[1:] != digests[1:]
+
+
+async def test_short_history_is_untouched():
+    summarizer = ConversationSummarizer(_FakeModel(), threshold_tokens=1000)
+    turns = _turns(6)
+    assert summarizer.compact(turns) == (None, turns)
+    assert summarizer.stats["scheduled"] == 0
+
+
+async def test_summary_replaces_older_turns_once_ready():
+    model = _FakeModel()
+    summarizer = ConversationSummarizer(model, threshold_tokens=200, keep_recent=4)
+    turns = _turns(20)  # ~22 tokens each
+
+    summary, sent = summarizer.compact(turns)
+    assert summary is None
+    assert sum(len(t["content"].split()) for t in sent) <= 200 and sent[-1] == turns[-1]
+    summarizer.compact(turns)
+    assert summarizer.stats["scheduled"] == 1  # in flight: not scheduled twice
+
+    await summarizer.drain()
+    summary, sent = summarizer.compact(turns)
+    assert summary == "summary 1" and sent == turns[-4:]
+    assert "turn0" in model.prompts[0][1]["content"] and "turn15" in model.prompts[0][1]["content"]
+    assert "turn16" not in model.prompts[0][1]["content"]
+
+    # Two more turns: the cached summary still covers the prefix, the gap is sent as-is
+    longer = _turns(22)
+    summary, sent = summarizer.compact(longer)
+    assert summary == "summary 1" and sent == longer[16:]
+    assert summarizer.stats["scheduled"] == 1
+
+    # Once enough turns are uncovered, the summary is extended (not rebuilt from turn 0)
+    longest = _turns(30)
+    summarizer.compact(longest)
+    await summarizer.drain()
+    extension = model.prompts[1][1]["content"]
+    assert extension.startswith("Summary so far:\nsummary 1") and "turn0 " not in extension
+    summary, sent = summarizer.compact(longest)
+    assert summary == "summary 2" and sent == longest[-4:]
+    assert summarizer.snapshot()["cached"] == 2
+
+
+async def test_failed_summary_falls_back_to_trimming():
+    summarizer = ConversationSummarizer(_FakeModel(fail=True), threshold_tokens=200, keep_recent=4)
+    turns = _turns(20)
+    summarizer.compact(turns)
+    await summarizer.drain()
+    summary, sent = summarizer.compact(turns)
+    assert summary is None and sent[-1] == turns[-1]
+    assert summarizer.stats["failed"] == 1
+
+
+async def test_tokens_saved_never_goes_negative():
+    # A summary longer than the turns it covers
+    summarizer = ConversationSummarizer(_FakeModel(reply="long " * 2000), threshold_tokens=200, keep_recent=4)
+    turns = _turns(20)
+    summarizer.compact(turns)
+    saved = summarizer.stats["tokens_saved"]
+    await summarizer.drain()
+    summarizer.compact(turns)
+    assert summarizer.stats["tokens_saved"] == saved
+
+
+class _RecordingProvider:
+    def __init__(self):
+        self.calls = []
+
+    def get_models(self):
+        return ["gpt-4o", "gpt-4o-mini"]
+
+    def is_available(self):
+        return True
+
+    async def chat(self, messages, model, **kwargs):
+        self.calls.append((model, messages))
+        return {"content": f"reply from {model}", "model": model}
+
+
+async def test_generate_response_sends_summary_instead_of_old_turns():
+    provider = _RecordingProvider()
+    ai = main.SpectraAI()
+    ai.providers = {"openai": provider}
+    ai.available_providers = ["openai"]
+    ai.available_models = ai._get_all_available_models()
+    ai.model = "openai:gpt-4o"
+    ai.auto_model_enabled = False
+    ai.ready = True
+    ai.summarizer = ConversationSummarizer(ai._summarize, threshold_tokens=200, keep_recent=4)
+
+    history = [main.ChatMessage(**turn) for turn in _turns(20)]
+    await ai.generate_response("hello again", history)
+    await ai.summarizer.drain()
+    await ai.generate_response("hello again", history)
+
+    summary_model, summary_messages = next(call for call in provider.calls if "running summary" in call[1][0]["content"])
+    assert summary_model == "gpt-4o-mini"  # cheapest available model
+    assert "turn0" in summary_messages[1]["content"]
+
+    model, messages = provider.calls[-1]
+    assert model == "gpt-4o"
+    assert messages[0]["content"].endswith("Summary of the earlier conversation:\nreply from gpt-4o-mini")
+    assert [m["content"] for m in messages[1:-1]] == [t.content for t in history[-4:]]
+    assert ai.metrics()["summaries"]["summary_hits"] == 1
+    # The summary call is not chat traffic: kept out of routing latency and per-route usage
+    assert set(ai.latency.snapshot()["models"]) == {"openai:gpt-4o"}
+    assert set(ai.metrics()["token_usage"]["routes"]) == {"openai:gpt-4o"}
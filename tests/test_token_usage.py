@@ -0,0 +1,110 @@
+"""Tests for token usage and throughput accounting."""
+from fastapi import FastAPI, Request
+
+import main
+from providers import AnthropicProvider, OpenAIProvider
+from token_usage import UsageTracker, normalize_usage
+
+
+def test_reported_usage_is_kept_and_missing_usage_estimated():
+    messages = [{"role": "user", "content": "one two three four"}]
+    reported = normalize_usage({"content": "hi", "usage": {"prompt_tokens": 12, "completion_tokens": 4}}, messages, 2.0)
+    assert reported == {"prompt_tokens": 12, "completion_tokens": 4, "total_tokens": 16,
+                        "tokens_per_second": 2.0, "cached_tokens": None, "source": "provider"}
+    estimated = normalize_usage({"content": "a reply of some length", "usage": None}, messages, 0.5)
+    assert estimated["source"] == "estimate" and estimated["prompt_tokens"] > 0 and estimated["completion_tokens"] > 0
+
+
+def test_routes_are_aggregated_and_ranked_by_cost_per_token():
+    tracker = UsageTracker()
+    messages = [{"role": "user", "content": "x"}]
+    tracker.record("openai:gpt-4o-mini", {"usage": {"prompt_tokens": 10, "completion_tokens": 100}}, messages, 1.0)
+    tracker.record("openai:gpt-4o-mini", {"usage": {"prompt_tokens": 30, "completion_tokens": 100}}, messages, 1.0)
+    tracker.record("huggingface:tiny", {"usage": {"prompt_tokens": 5, "completion_tokens": 10}}, messages, 1.0)
+    snapshot = tracker.snapshot()
+    assert list(snapshot["routes"]) == ["huggingface:tiny", "openai:gpt-4o-mini"]
+    route = snapshot["routes"]["openai:gpt-4o-mini"]
+    assert route["requests"] == 2 and route["avg_prompt_tokens"] == 20
+    assert route["tokens_per_second"] == 100 and route["ms_per_completion_token"] == 10
+    assert snapshot["totals"] == {"requests": 3, "prompt_tokens": 45, "completion_tokens": 210, "cached_tokens": 0}
+
+
+async def test_huggingface_counts_with_its_tokenizer(tiny_chat_model_dir):
+    from hf_provider import HuggingFaceProvider
+
+    provider = HuggingFaceProvider()
+    messages = [{"role": "user", "content": "w1 w2 w3"}]
+    response = await provider.chat(messages, tiny_chat_model_dir, max_tokens=5)
+    prompt_ids = provider.prompt_assemblers[tiny_chat_model_dir].input_ids(messages)
+    usage = response["usage"]
+    assert usage["prompt_tokens"] == len(prompt_ids) and usage["source"] == "tokenizer"
+    assert 1 <= usage["completion_tokens"] <= 5
+    assert response["total_tokens"] == usage["prompt_tokens"] + usage["completion_tokens"]
+
+
+def _stand_in_app():
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        body = await request.json()
+        return {
+            "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "hi"}}],
+            "usage": {"prompt_tokens": 21, "completion_tokens": 2, "total_tokens": 23},
+        }
+
+    @app.post("/v1/messages")
+    async def anthropic_messages(request: Request):
+        body = await request.json()
+        return {
+            "id": "msg_1", "type": "message", "role": "assistant", "model": body["model"],
+            "content": [{"type": "text", "text": "hello"}], "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": 17, "output_tokens": 4},
+        }
+
+    return app
+
+
+async def test_cloud_usage_reaches_the_response_and_metrics(serve_app):
+    import anthropic
+    import openai
+
+    base_url = serve_app(_stand_in_app())
+    openai_provider = OpenAIProvider()
+    openai_provider.available = True
+    openai_provider.client = openai.AsyncOpenAI(api_key="test", base_url=f"{base_url}/v1", max_retries=0)
+    anthropic_provider = AnthropicProvider()
+    anthropic_provider.available = True
+    anthropic_provider.client = anthropic.AsyncAnthropic(api_key="test", base_url=base_url, max_retries=0)
+
+    ai = main.SpectraAI()
+    ai.providers = {"openai": openai_provider, "anthropic": anthropic_provider}
+    ai.available_providers = list(ai.providers)
+    ai.available_models = ai._get_all_available_models()
+    ai.auto_model_enabled = False
+    ai.ready = True
+
+    ai.model = "openai:gpt-4o-mini"
+    result = await ai.generate_response("hello")
+    assert result["usage"]["prompt_tokens"] == 21 and result["usage"]["completion_tokens"] == 2
+    assert result["usage"]["source"] == "provider" and result["usage"]["tokens_per_second"] > 0
+
+    ai.model = "anthropic:claude-3-haiku-20240307"
+    result = await ai.generate_response("hello")
+    assert result["usage"]["prompt_tokens"] == 17 and result["usage"]["total_tokens"] == 21
+
+    routes = ai.metrics()["token_usage"]["routes"]
+    assert routes["openai:gpt-4o-mini"]["completion_tokens"] == 2
+    assert routes["anthropic:claude-3-haiku-20240307"]["prompt_tokens"] == 17
+
+
+def test_chat_response_includes_usage(client, monkeypatch):
+    usage = {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5, "tokens_per_second": 4.0,
+             "cached_tokens": None, "source": "provider"}
+
+    async def fake_generate(message, history=None, **kwargs):
+        return {"response": "ok", "model": "openai:gpt-4o-mini", "processing_time": 0.5, "usage": usage}
+
+    monkeypatch.setattr(main.spectra, "generate_response", fake_generate)
+    assert client.post("/api/chat", json={"message": "hi"}).json()["usage"] == usage
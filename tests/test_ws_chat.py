@@ -0,0 +1,210 @@
+"""Tests for the multiplexed /ws/chat WebSocket."""
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi import WebSocketDisconnect
+
+import main
+from cancellation import CLIENT_CANCELLED
+from rate_limit import RateLimited
+from ws_chat import SLOW_CONSUMER_CODE, ChatSession, ChatSocketStats
+
+
+async def _fake_generate(message, history=None, *, cancel_token=None, user_id=None, on_delta=None):
+    """Streams the words of `message` one per delta; "block" waits until cancelled."""
+    if message == "block":
+        await asyncio.sleep(30)
+    if message == "limited":
+        raise RateLimited("openai:gpt-4o-mini", 2.5)
+    for word in message.split():
+        on_delta(word + " ")
+        await asyncio.sleep(0.01)
+    return {"response": message, "model": "openai:gpt-4o-mini", "processing_time": 0.1}
+
+
+def _receive_until(ws, predicate, limit=200):
+    frames = []
+    for _ in range(limit):
+        frames.append(ws.receive_json())
+        if predicate(frames[-1]):
+            return frames
+    raise AssertionError(f"no matching frame in {frames}")
+
+
+def test_streams_are_multiplexed_on_one_connection(client, monkeypatch):
+    monkeypatch.setattr(main.spectra, "generate_response", _fake_generate)
+    with client.websocket_connect("/ws/chat") as ws:
+        hello = ws.receive_json()
+        assert hello["type"] == "hello" and hello["max_streams"] == main.WS_MAX_STREAMS
+        ws.send_json({"type": "chat", "id": "a", "message": "one two three"})
+        ws.send_json({"type": "chat", "id": "b", "message": "four five"})
+        frames = []
+        while sum(f["type"] == "done" for f in frames) < 2:
+            frames.extend(_receive_until(ws, lambda f: f["type"] == "done"))
+
+    for request_id, message in (("a", "one two three"), ("b", "four five")):
+        text = "".join(f["text"] for f in frames if f["type"] == "delta" and f["id"] == request_id)
+        assert text == message + " "
+        done = next(f for f in frames if f["type"] == "done" and f["id"] == request_id)
+        assert done["response"] == message and done["model"] == "openai:gpt-4o-mini"
+    assert client.get("/api/metrics").json()["websocket"]["streams"] >= 2
+
+
+@pytest.mark.parametrize("model", ["openai:gpt-4o-mini", "anthropic:claude-3-haiku-20240307"])
+def test_cloud_providers_stream_deltas(client, monkeypatch, streaming_cloud, model):
+    monkeypatch.setattr(main.spectra, "providers", streaming_cloud.providers)
+    monkeypatch.setattr(main.spectra, "auto_model_enabled", False)
+    monkeypatch.setattr(main.spectra, "model", model)
+    with client.websocket_connect("/ws/chat") as ws:
+        ws.receive_json()
+        ws.send_json({"type": "chat", "id": "c", "message": "stream these four words"})
+        frames = _receive_until(ws, lambda f: f["type"] in ("done", "error"))
+
+    deltas = [f["text"] for f in frames if f["type"] == "delta"]
+    done = frames[-1]
+    assert done["type"] == "done", done
+    assert len(deltas) > 1  # token by token, not the whole reply at the end
+    assert "".join(deltas) == done["response"] == "stream these four words"
+    assert done["usage"]["completion_tokens"] == 3
+
+
+def test_cancel_stops_one_stream_only(client, monkeypatch):
+    monkeypatch.setattr(main.spectra, "generate_response", _fake_generate)
+    with client.websocket_connect("/ws/chat") as ws:
+        ws.receive_json()
+        ws.send_json({"type": "chat", "id": "slow", "message": "block"})
+        ws.send_json({"type": "cancel", "id": "slow"})
+        cancelled = _receive_until(ws, lambda f: f["type"] == "cancelled")[-1]
+        assert cancelled == {"type": "cancelled", "id": "slow", "reason": CLIENT_CANCELLED}
+
+        ws.send_json({"type": "chat", "id": "next", "message": "still here"})
+        assert _receive_until(ws, lambda f: f["type"] == "done")[-1]["id"] == "next"
+
+
+def test_errors_are_reported_per_request(client, monkeypatch):
+    monkeypatch.setattr(main.spectra, "generate_response", _fake_generate)
+    monkeypatch.setattr(main, "WS_MAX_STREAMS", 1)
+    with client.websocket_connect("/ws/chat") as ws:
+        ws.receive_json()
+        ws.send_json({"type": "chat", "id": "1", "message": "block"})
+        ws.send_json({"type": "chat", "id": "1", "message": "again"})
+        ws.send_json({"type": "chat", "id": "2", "message": "too many"})
+        errors = [ws.receive_json(), ws.receive_json()]
+        assert [(e["id"], e["status"]) for e in errors] == [("1", 409), ("2", 429)]
+        ws.send_json({"type": "cancel", "id": "1"})
+        _receive_until(ws, lambda f: f["type"] == "cancelled")
+
+        ws.send_json({"type": "chat", "id": "3", "message": ""})
+        assert _receive_until(ws, lambda f: f["type"] == "error")[-1]["status"] == 422
+        ws.send_json({"type": "chat", "id": "4", "message": "limited"})
+        error = _receive_until(ws, lambda f: f["type"] == "error")[-1]
+        assert error["status"] == 429 and error["retry_after"] == 2.5
+
+
+def test_heartbeat_pings_and_disconnects_silent_clients(client, monkeypatch):
+    monkeypatch.setattr(main, "WS_HEARTBEAT", 0.05)
+    monkeypatch.setattr(main, "WS_HEARTBEAT_TIMEOUT", 0.2)
+    timeouts = main.chat_socket_stats.heartbeat_timeouts
+    with client.websocket_connect("/ws/chat") as ws:
+        ws.receive_json()
+        assert ws.receive_json()["type"] == "ping"
+        ws.send_json({"type": "pong"})
+        time.sleep(0.4)
+        message = None
+        while message is None or message["type"] == "websocket.send":
+            message = ws.receive()
+        assert message["type"] == "websocket.close" and message["code"] == 4408
+    assert main.chat_socket_stats.heartbeat_timeouts == timeouts + 1
+
+
+async def test_huggingface_streams_decoded_text(tiny_chat_model_dir):
+    from hf_provider import HuggingFaceProvider
+
+    provider = HuggingFaceProvider()
+    deltas = []
+    response = await provider.chat([{"role": "user", "content": "w1 w2"}], tiny_chat_model_dir,
+                                   max_tokens=8, on_delta=deltas.append)
+    assert deltas and "".join(deltas) == response["content"]
+
+
+class _PieceTokenizer:
+    """Decodes token ids to fixed text pieces by concatenation."""
+
+    pieces = {1: " ", 2: "\n", 3: "Assist", 4: "ant: ", 5: "Hello", 6: " there", 7: "  "}
+
+    def decode(self, ids, skip_special_tokens=False):
+        return "".join(self.pieces[i] for i in ids)
+
+
+def _stream(*tokens):
+    torch = pytest.importorskip("torch")
+    from hf_provider import _first_token_timer
+
+    deltas = []
+    streamer = _first_token_timer(_PieceTokenizer(), deltas.append)
+    for ids in ([9], *([token] for token in tokens)):  # the prompt first
+        streamer.put(torch.tensor(ids))
+    streamer.end()
+    return "".join(deltas)
+
+
+def test_streamed_text_matches_the_final_content():
+    # Leading whitespace/newlines, the "Assistant: " prefix and trailing whitespace are dropped, like content
+    assert _stream(2, 1, 3, 4, 5, 6, 7, 2) == "Hello there"
+    assert _stream(5, 2, 7, 6, 1) == "Hello\n   there"
+    # A prefix that never completes is sent once generation ends
+    assert _stream(1, 3) == "Assist"
+
+
+class _SlowSocket:
+    """Just enough of a WebSocket for ChatSession; sends wait until `drain` is set."""
+
+    def __init__(self):
+        self.incoming = asyncio.Queue()
+        self.sent = []
+        self.drain = asyncio.Event()
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def receive_text(self):
+        text = await self.incoming.get()
+        if text is None:
+            raise WebSocketDisconnect(self.closed_with)
+        return text
+
+    async def send_text(self, text):
+        await self.drain.wait()
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000):
+        self.closed_with = code
+        self.incoming.put_nowait(None)
+
+
+async def test_slow_reader_gets_merged_deltas_then_is_disconnected():
+    started = asyncio.Event()
+
+    async def handler(payload, token, on_delta):
+        for i in range(50):
+            on_delta(f"{i} ")
+        started.set()
+        await asyncio.sleep(30)
+
+    socket, stats = _SlowSocket(), ChatSocketStats()
+    session = ChatSession(socket, handler, stats, send_timeout=0.2)
+    run = asyncio.create_task(session.run())
+    socket.incoming.put_nowait(json.dumps({"type": "chat", "id": "a", "message": "hi"}))
+    await asyncio.wait_for(started.wait(), 1)
+    await asyncio.sleep(0)
+    # 50 deltas queued behind the unsent hello frame collapse into one pending frame
+    assert stats.deltas_merged == 49 and session._outbox.qsize() == 1
+
+    await asyncio.wait_for(run, 2)
+    assert socket.closed_with == SLOW_CONSUMER_CODE and stats.slow_consumer_closes == 1
+    await asyncio.sleep(0)
+    # The connection is gone, so its unfinished stream was cancelled
+    assert stats.connections == 0 and stats.cancelled == 1
@@ -0,0 +1,106 @@
+"""Token usage and throughput accounting per provider:model.
+
+Providers report ``usage`` as prompt and completion token counts: OpenAI,
+Anthropic and local servers from their API's usage block, Hugging Face
+models from their own tokenizer. When a provider reports nothing, the
+counts are estimated from the text (``source: "estimate"``).
+
+Each call is aggregated under its provider:model, so /api/metrics shows
+which routes spend the most time per generated token. Prompt tokens served
+from a provider's prompt cache (OpenAI, Anthropic) are counted as
+``cached_tokens`` (None when the provider doesn't say).
+"""
+import threading
+from typing import Any, Dict, List, Optional
+
+from prompt_templates import estimate_tokens
+
+
+def normalize_usage(response: Dict[str, Any], messages: List[Dict[str, str]], seconds: float) -> Dict[str, Any]:
+    """Usage for one call: reported counts when present, otherwise estimated."""
+    reported = response.get("usage") or {}
+    prompt_tokens = reported.get("prompt_tokens")
+    completion_tokens = reported.get("completion_tokens")
+    source = "provider"
+    if prompt_tokens is None or completion_tokens is None:
+        source = "estimate"
+        prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+        completion_tokens = estimate_tokens(response.get("content") or "")
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "tokens_per_second": round(completion_tokens / seconds, 2) if seconds > 0 else None,
+        "cached_tokens": reported.get("cached_tokens") if source == "provider" else None,
+        "source": reported.get("source", source),
+    }
+
+
+class _RouteUsage:
+    def __init__(self) -> None:
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.seconds = 0.0
+        self.estimated = 0
+        self.cached_tokens = 0
+        self.cache_write_tokens = 0
+        self.cacheable_prompt_tokens = 0  # prompt tokens of calls that report cache usage
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "estimated_requests": self.estimated,
+            "cached_tokens": self.cached_tokens,
+            "cache_write_tokens": self.cache_write_tokens,
+            "cache_hit_ratio": (round(self.cached_tokens / self.cacheable_prompt_tokens, 3)
+                                if self.cacheable_prompt_tokens else None),
+            "avg_prompt_tokens": round(self.prompt_tokens / self.requests, 1) if self.requests else None,
+            "avg_completion_tokens": round(self.completion_tokens / self.requests, 1) if self.requests else None,
+            "tokens_per_second": round(self.completion_tokens / self.seconds, 2) if self.seconds else None,
+            "ms_per_completion_token": (round(self.seconds / self.completion_tokens * 1000, 2)
+                                        if self.completion_tokens else None),
+        }
+
+
+class UsageTracker:
+    """Token counts and generation time aggregated per provider:model."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.routes: Dict[str, _RouteUsage] = {}
+
+    def record(self, key: str, response: Dict[str, Any], messages: List[Dict[str, str]],
+               seconds: float) -> Dict[str, Any]:
+        """Account one provider call; returns its normalized usage."""
+        usage = normalize_usage(response, messages, seconds)
+        with self._lock:
+            route = self.routes.get(key)
+            if route is None:
+                route = self.routes[key] = _RouteUsage()
+            route.requests += 1
+            route.prompt_tokens += usage["prompt_tokens"]
+            route.completion_tokens += usage["completion_tokens"]
+            route.seconds += seconds
+            route.estimated += usage["source"] == "estimate"
+            if usage["cached_tokens"] is not None:
+                route.cached_tokens += usage["cached_tokens"]
+                route.cache_write_tokens += (response.get("usage") or {}).get("cache_write_tokens", 0)
+                route.cacheable_prompt_tokens += usage["prompt_tokens"]
+        return usage
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            routes = {key: route.snapshot() for key, route in self.routes.items()}
+        totals: Dict[str, Optional[int]] = {
+            "requests": sum(r["requests"] for r in routes.values()),
+            "prompt_tokens": sum(r["prompt_tokens"] for r in routes.values()),
+            "completion_tokens": sum(r["completion_tokens"] for r in routes.values()),
+            "cached_tokens": sum(r["cached_tokens"] for r in routes.values()),
+        }
+        # Most expensive routes (per generated token of latency) first
+        ordered = dict(sorted(routes.items(), key=lambda item: -(item[1]["ms_per_completion_token"] or 0)))
+        return {"totals": totals, "routes": ordered}
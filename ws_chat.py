@@ -0,0 +1,252 @@
+"""Multiplexed chat over one WebSocket per client (`/ws/chat`).
+
+Frames are JSON text messages. Client to server:
+ - ``{"type": "chat", "id": "r1", "message": "...", "history": [...], "user_id": "..."}``
+ - ``{"type": "cancel", "id": "r1"}``
+ - ``{"type": "ping"}`` / ``{"type": "pong"}``
+Server to client:
+ - ``hello`` on connect (worker pid, heartbeat interval, stream limit)
+ - ``delta`` frames with generated text per request id, then ``done`` with
+   the full response (the same fields as POST /api/chat), or ``error`` /
+   ``cancelled``
+ - ``ping`` heartbeats; a client that sends nothing for the heartbeat
+   timeout is disconnected (close code 4408).
+
+Several requests run concurrently on one connection, each with its own
+cancellation token. Outgoing frames go through a single writer. Text
+produced while the client is still reading earlier frames is merged into
+the request's next delta, so a slow reader gets fewer, larger frames
+instead of an unbounded queue. A client that doesn't take a frame within
+the send timeout is disconnected (1013).
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import structlog
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+
+from cancellation import (
+    CLIENT_CANCELLED,
+    CLIENT_DISCONNECTED,
+    CancellationMetrics,
+    CancellationToken,
+    GenerationCancelled,
+    run_cancellable,
+)
+from rate_limit import RateLimited
+
+logger = structlog.get_logger()
+
+# (payload, cancel token, on_delta) -> the generate_response result
+ChatHandler = Callable[[Dict[str, Any], CancellationToken, Callable[[str], None]], Awaitable[Dict[str, Any]]]
+
+HEARTBEAT_TIMEOUT_CODE = 4408
+SLOW_CONSUMER_CODE = 1013  # "try again later"
+
+
+class ChatSocketStats:
+    """Connection and stream counters for this worker process."""
+
+    def __init__(self) -> None:
+        self.connections = 0
+        self.peak_connections = 0
+        self.total_connections = 0
+        self.active_streams = 0
+        self.streams = 0
+        self.cancelled = 0
+        self.frames_sent = 0
+        self.deltas_merged = 0
+        self.slow_consumer_closes = 0
+        self.heartbeat_timeouts = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"worker_pid": os.getpid(), **vars(self)}
+
+
+class ChatSession:
+    """One `/ws/chat` connection: reader, single writer, heartbeat and the active streams."""
+
+    def __init__(self, websocket: WebSocket, handler: ChatHandler, stats: ChatSocketStats, *,
+                 heartbeat_interval: float = 20.0, heartbeat_timeout: float = 60.0, max_streams: int = 8,
+                 send_timeout: float = 10.0, request_timeout: Optional[float] = None,
+                 cancellation_metrics: Optional[CancellationMetrics] = None):
+        self.websocket = websocket
+        self.handler = handler
+        self.stats = stats
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_streams = max_streams
+        self.send_timeout = send_timeout
+        self.request_timeout = request_timeout
+        self.cancellation_metrics = cancellation_metrics
+        self.streams: Dict[str, Tuple[asyncio.Task, CancellationToken]] = {}
+        self._outbox: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue()
+        self._pending: Dict[str, List[str]] = {}
+        self._streamed: set[str] = set()
+        self._last_seen = time.monotonic()
+
+    async def run(self) -> None:
+        await self.websocket.accept()
+        self.stats.connections += 1
+        self.stats.total_connections += 1
+        self.stats.peak_connections = max(self.stats.peak_connections, self.stats.connections)
+        self._send({"type": "hello", "worker_pid": os.getpid(), "heartbeat_interval": self.heartbeat_interval,
+                    "max_streams": self.max_streams})
+        tasks = [asyncio.create_task(self._reader()), asyncio.create_task(self._writer()),
+                 asyncio.create_task(self._heartbeat())]
+        try:
+            # Whichever ends first (client gone, slow consumer, missed heartbeats) ends the session
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task, token in list(self.streams.values()):
+                token.cancel(CLIENT_DISCONNECTED)
+                task.cancel()
+            # Not awaited: the tasks only need to stop, and the socket is already gone
+            for task in tasks:
+                task.cancel()
+            self.stats.connections -= 1
+
+    # Outgoing frames
+
+    def _send(self, frame: Dict[str, Any]) -> None:
+        self._outbox.put_nowait(("frame", frame))
+
+    def _push_delta(self, request_id: str, text: str) -> None:
+        if request_id not in self.streams or not text:
+            return
+        self._streamed.add(request_id)
+        pending = self._pending.get(request_id)
+        if pending is None:
+            # One queued delta per request; text arriving before it is sent joins it
+            self._pending[request_id] = [text]
+            self._outbox.put_nowait(("delta", request_id))
+        else:
+            pending.append(text)
+            self.stats.deltas_merged += 1
+
+    async def _writer(self) -> None:
+        while True:
+            kind, item = await self._outbox.get()
+            if kind == "delta":
+                parts = self._pending.pop(item, None)
+                if not parts:
+                    continue
+                frame = {"type": "delta", "id": item, "text": "".join(parts)}
+            else:
+                frame = item
+            try:
+                await asyncio.wait_for(self.websocket.send_text(json.dumps(frame)), self.send_timeout)
+            except asyncio.TimeoutError:
+                self.stats.slow_consumer_closes += 1
+                logger.warning("ws_slow_consumer", streams=len(self.streams), queued=self._outbox.qsize())
+                await self._close(SLOW_CONSUMER_CODE)
+                return
+            except (WebSocketDisconnect, RuntimeError):
+                return
+            self.stats.frames_sent += 1
+
+    async def _close(self, code: int) -> None:
+        try:
+            await self.websocket.close(code=code)
+        except (RuntimeError, WebSocketDisconnect):
+            pass
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            if time.monotonic() - self._last_seen > self.heartbeat_timeout:
+                self.stats.heartbeat_timeouts += 1
+                logger.info("ws_heartbeat_timeout", streams=len(self.streams))
+                await self._close(HEARTBEAT_TIMEOUT_CODE)
+                return
+            self._send({"type": "ping", "t": time.time()})
+
+    # Incoming frames
+
+    async def _reader(self) -> None:
+        while True:
+            try:
+                raw = await self.websocket.receive_text()
+            except (WebSocketDisconnect, RuntimeError):
+                return
+            self._last_seen = time.monotonic()
+            try:
+                frame = json.loads(raw)
+                kind = frame.get("type")
+            except (ValueError, AttributeError):
+                self._send({"type": "error", "id": None, "status": 400, "detail": "invalid frame"})
+                continue
+            if kind == "chat":
+                self._start_stream(frame)
+            elif kind == "cancel":
+                stream = self.streams.get(str(frame.get("id")))
+                if stream is not None:
+                    stream[1].cancel(CLIENT_CANCELLED)
+                    stream[0].cancel()
+            elif kind == "ping":
+                self._send({"type": "pong", "t": time.time()})
+            elif kind != "pong":
+                self._send({"type": "error", "id": frame.get("id"), "status": 400,
+                            "detail": f"unknown frame type: {kind}"})
+
+    def _start_stream(self, frame: Dict[str, Any]) -> None:
+        request_id = frame.get("id")
+        if not isinstance(request_id, (str, int)) or request_id == "":
+            self._send({"type": "error", "id": None, "status": 400, "detail": "chat frames need an id"})
+            return
+        request_id = str(request_id)
+        if request_id in self.streams:
+            self._send({"type": "error", "id": request_id, "status": 409, "detail": "id already in use"})
+            return
+        if len(self.streams) >= self.max_streams:
+            self._send({"type": "error", "id": request_id, "status": 429,
+                        "detail": f"at most {self.max_streams} concurrent requests per connection"})
+            return
+        token = CancellationToken.with_timeout(self.request_timeout, self.cancellation_metrics)
+        payload = {key: value for key, value in frame.items() if key not in ("type", "id")}
+        task = asyncio.create_task(self._stream(request_id, payload, token))
+        self.streams[request_id] = (task, token)
+
+    async def _stream(self, request_id: str, payload: Dict[str, Any], token: CancellationToken) -> None:
+        loop = asyncio.get_running_loop()
+
+        def on_delta(text: str) -> None:  # called from generation threads too
+            loop.call_soon_threadsafe(self._push_delta, request_id, text)
+
+        self.stats.streams += 1
+        self.stats.active_streams += 1
+        try:
+            result = await run_cancellable(self.handler(payload, token, on_delta), token)
+            await asyncio.sleep(0)  # let deltas scheduled from a worker thread land first
+            if request_id not in self._streamed:
+                # Non-streaming provider: the whole reply arrives as one delta
+                self._push_delta(request_id, result["response"])
+            self._send({
+                "type": "done",
+                "id": request_id,
+                "response": result["response"],
+                "model": result["model"],
+                "model_used": result["model"],
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "processing_time": result["processing_time"],
+                "usage": result.get("usage"),
+            })
+        except (GenerationCancelled, asyncio.CancelledError):
+            self.stats.cancelled += 1
+            self._send({"type": "cancelled", "id": request_id, "reason": token.reason or CLIENT_CANCELLED})
+        except RateLimited as e:
+            self._send({"type": "error", "id": request_id, "status": 429, "retry_after": round(e.retry_after, 2),
+                        "detail": "I'm getting a lot of messages right now. Please try again in a moment. 💜"})
+        except HTTPException as e:
+            self._send({"type": "error", "id": request_id, "status": e.status_code, "detail": e.detail})
+        except Exception as e:  # noqa: BLE001 - one failed request must not end the connection
+            logger.error("ws_chat_error", error=str(e))
+            self._send({"type": "error", "id": request_id, "status": 500, "detail": str(e)})
+        finally:
+            self.stats.active_streams -= 1
+            self.streams.pop(request_id, None)
+            self._streamed.discard(request_id)